@@ -7,7 +7,7 @@ from .models import (
     OutlookCalendar, OutlookSubAccount,
     WorkspaceSubscription, WorkspaceUsage, FeatureUsage, EndpointFeature, MetaIntegration, 
     WorkspaceInvitation, SIPTrunk, MetaLeadForm, LeadFunnel, WebhookLeadSource,
-    LeadProcessingStats, CallTask, WorkspacePhoneNumber,
+    LeadProcessingStats, CallTask, ReapedCallTask, WorkspacePhoneNumber,
     # New scheduling/router models
     SubAccount, EventType, EventTypeWorkingHour, EventTypeSubAccountMapping,
 )
@@ -745,6 +745,20 @@ class CallTaskAdmin(ShowPkMixin, admin.ModelAdmin):
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'updated_at')
 
+
+@admin.register(ReapedCallTask)
+class ReapedCallTaskAdmin(admin.ModelAdmin):
+    list_display = ('call_task_id', 'status', 'workspace_id', 'agent_id', 'phone', 'threshold_minutes', 'stuck_since', 'reaped_at')
+    list_filter = ('status', 'reaped_at')
+    search_fields = ('call_task_id', 'phone', 'workspace_id', 'agent_id')
+    ordering = ('-reaped_at',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # LiveKitAgent admin removed - no longer using token authentication
 
 @admin.register(WorkspacePhoneNumber)
@@ -0,0 +1,187 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, When
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.models import Agent, CallStatus, CallTask, PhoneNumber, SIPTrunk, Workspace
+
+
+class _Rollback(Exception):
+    """Raised to discard all benchmark rows at the end of a run."""
+
+
+class Command(BaseCommand):
+    help = """
+Benchmark CallTask claiming: the legacy per-task loop vs. the set-based
+claim_due_call_tasks() (FOR UPDATE SKIP LOCKED + active-phone anti-join).
+
+Seeds synthetic CallTasks inside a transaction, drains them with both
+strategies and rolls everything back. Reports claimed tasks/second and
+SQL queries per claimed task.
+
+USAGE:
+python manage.py benchmark_call_claiming --tasks 10000 --batch 100
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=5000, help='Number of due CallTasks to seed')
+        parser.add_argument('--batch', type=int, default=100, help='Tasks claimed per scheduler tick (available slots)')
+        parser.add_argument(
+            '--duplicate-phone-rate',
+            type=float,
+            default=0.05,
+            help='Share of tasks that reuse an already seeded phone number (0.0-1.0)'
+        )
+
+    def handle(self, *args, **options):
+        n_tasks = options['tasks']
+        batch = options['batch']
+        dup_rate = options['duplicate_phone_rate']
+
+        try:
+            with transaction.atomic():
+                task_ids = self._seed(n_tasks, dup_rate)
+                self.stdout.write(f"🌱 Seeded {len(task_ids)} due CallTasks")
+
+                legacy = self._measure("legacy loop", lambda now: self._legacy_claim(now, batch), task_ids)
+                self._reset(task_ids)
+                set_based = self._measure("set-based claim", lambda now: self._set_based_claim(now, batch), task_ids)
+
+                self.stdout.write(self.style.SUCCESS("=" * 60))
+                for name, stats in (("Legacy loop", legacy), ("Set-based claim", set_based)):
+                    self.stdout.write(
+                        f"{name:<16} claimed={stats['claimed']:>6}  "
+                        f"{stats['per_second']:>10.1f} tasks/s  "
+                        f"{stats['queries_per_task']:>6.2f} queries/task"
+                    )
+                if legacy['per_second']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Speed-up: {set_based['per_second'] / legacy['per_second']:.1f}x"
+                    ))
+                self.stdout.write(self.style.SUCCESS("=" * 60))
+                raise _Rollback()
+        except _Rollback:
+            self.stdout.write("🧹 Benchmark data rolled back")
+
+    def _seed(self, n_tasks, dup_rate):
+        workspace = Workspace.objects.create(workspace_name="benchmark-claiming")
+        trunk = SIPTrunk.objects.create(
+            provider_name="Benchmark",
+            sip_username="bench",
+            sip_password="bench",
+            sip_host="sip.bench.local",
+            livekit_trunk_id="ST_benchmark",
+        )
+        phone = PhoneNumber.objects.create(
+            phonenumber=f"+4930{random.randint(10000000, 99999999)}",
+            sip_trunk=trunk,
+        )
+        agent = Agent.objects.create(workspace=workspace, name="Benchmark Agent", phone_number=phone)
+
+        now = timezone.now()
+        phones = []
+        tasks = []
+        for i in range(n_tasks):
+            if phones and random.random() < dup_rate:
+                callee = random.choice(phones)
+            else:
+                callee = f"+49151{i:08d}"
+                phones.append(callee)
+            tasks.append(CallTask(
+                status=random.choice([CallStatus.SCHEDULED, CallStatus.RETRY, CallStatus.WAITING]),
+                phone=callee,
+                workspace=workspace,
+                agent=agent,
+                next_call=now - timedelta(seconds=random.randint(1, 3600)),
+            ))
+        CallTask.objects.bulk_create(tasks, batch_size=1000)
+        return [t.id for t in tasks]
+
+    def _reset(self, task_ids):
+        CallTask.objects.filter(id__in=task_ids).update(
+            status=CallStatus.SCHEDULED, next_call=timezone.now() - timedelta(minutes=1)
+        )
+
+    def _measure(self, label, claim_tick, task_ids):
+        """Run scheduler ticks until nothing else can be claimed; complete claimed calls between ticks."""
+        claimed_total = 0
+        elapsed = 0.0
+        query_count = 0
+        while True:
+            now = timezone.now()
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                claimed = claim_tick(now)
+                elapsed += time.perf_counter() - started
+            query_count += len(ctx.captured_queries)
+            if not claimed:
+                break
+            claimed_total += len(claimed)
+            # Simulate finished calls so their phones free up for the next tick
+            CallTask.objects.filter(id__in=claimed).update(status=CallStatus.SCHEDULED, next_call=now + timedelta(days=1))
+
+        self.stdout.write(f"⏱️ {label}: {claimed_total} claimed in {elapsed:.3f}s")
+        return {
+            "claimed": claimed_total,
+            "per_second": claimed_total / elapsed if elapsed else 0.0,
+            "queries_per_task": query_count / claimed_total if claimed_total else 0.0,
+        }
+
+    def _set_based_claim(self, now, batch):
+        from core.telephony.repositories.call_repo import claim_due_call_tasks
+        return claim_due_call_tasks(now=now, limit=batch)
+
+    def _legacy_claim(self, now, batch):
+        """Replica of the pre-batch schedule_agent_call loop (without trigger_call.delay)."""
+        from core.utils.calltask_utils import preflight_dispatch_config
+
+        candidates = (
+            CallTask.objects.filter(
+                next_call__lte=now,
+                status__in=[CallStatus.WAITING, CallStatus.SCHEDULED, CallStatus.RETRY],
+                agent__status="active",
+            )
+            .select_related("agent", "agent__phone_number", "agent__phone_number__sip_trunk", "workspace")
+            .annotate(
+                priority=Case(
+                    When(status=CallStatus.WAITING, then=1),
+                    When(status=CallStatus.SCHEDULED, then=2),
+                    When(status=CallStatus.RETRY, then=3),
+                    default=4,
+                    output_field=IntegerField(),
+                )
+            )
+            .order_by("priority", "next_call")[: batch * 2]
+        )
+
+        claimed = []
+        for task in candidates:
+            conflict = CallTask.objects.filter(
+                phone=task.phone,
+                status__in=[CallStatus.IN_PROGRESS, CallStatus.CALL_TRIGGERED],
+            ).exclude(id=task.id)
+            if conflict.exists():
+                continue
+
+            with transaction.atomic():
+                ct = CallTask.objects.select_for_update().get(id=task.id)
+                pre = preflight_dispatch_config(ct)
+            if not pre.get("ok"):
+                continue
+
+            rows_updated = CallTask.objects.filter(
+                id=task.id,
+                status__in=[CallStatus.WAITING, CallStatus.SCHEDULED, CallStatus.RETRY],
+                next_call__lte=now,
+                updated_at=task.updated_at,
+            ).update(status=CallStatus.CALL_TRIGGERED, updated_at=now)
+            if rows_updated == 1:
+                claimed.append(str(task.id))
+                if len(claimed) >= batch:
+                    break
+        return claimed
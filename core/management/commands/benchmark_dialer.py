@@ -0,0 +1,174 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from core.services.knowledge_cache import KnowledgeDocument
+from core.telephony.fake_livekit import FakeLiveKitServer
+from core.telephony.services._dialer_async import _make_call_async, create_livekit_api
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = """
+Benchmark the LiveKit leg of outbound dialing against a local fake LiveKit
+server (Twirp CreateDispatch + CreateSIPParticipant with simulated latency).
+
+Compares:
+  • per-task path – what each Celery trigger_call does today:
+    async_to_sync(_make_call_async) with a fresh LiveKitAPI per call,
+    run on --celery-concurrency threads
+  • pooled worker – one event loop, one LiveKitAPI on a shared keep-alive
+    session, --concurrency calls in flight under a semaphore
+
+Only the dispatch path is measured (no database); the fake server speaks
+plain HTTP, so real-world TLS handshake savings come on top.
+
+With --kb-bytes N, also compares KB_METADATA_MODE inline / reference / auto
+on the pooled path with a synthetic N-byte knowledge base, reporting the
+CreateDispatch request size and dispatch latency for each mode.
+
+USAGE:
+python manage.py benchmark_dialer --calls 2000 --latency-ms 30
+python manage.py benchmark_dialer --calls 500 --kb-bytes 200000
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=1000, help='Calls to place per strategy')
+        parser.add_argument('--latency-ms', type=float, default=20.0, help='Simulated LiveKit latency per request')
+        parser.add_argument('--celery-concurrency', type=int, default=8, help='Threads emulating Celery worker slots')
+        parser.add_argument('--concurrency', type=int, default=200, help='Semaphore size for the pooled worker')
+        parser.add_argument('--kb-bytes', type=int, default=0, help='Synthetic KB size for the metadata mode comparison (0 = skip)')
+
+    def handle(self, *args, **options):
+        n_calls = options['calls']
+        server = FakeLiveKitServer(latency_ms=options['latency_ms']).start()
+        os.environ.update({
+            "LIVEKIT_URL": server.url,
+            "LIVEKIT_API_KEY": "bench-key",
+            "LIVEKIT_API_SECRET": "bench-secret-bench-secret-bench-secret",
+            "LIVEKIT_AGENT_NAME": "bench-agent",
+        })
+        self.stdout.write(f"🧪 Fake LiveKit on {server.url} ({options['latency_ms']}ms per request)")
+
+        kb_results = []
+        try:
+            per_task = self._per_task(n_calls, options['celery_concurrency'])
+            pooled = asyncio.run(self._pooled(n_calls, options['concurrency']))
+            if options['kb_bytes']:
+                knowledge = KnowledgeDocument.from_text(self._synthetic_kb(options['kb_bytes']))
+                for mode in ("inline", "reference", "auto"):
+                    server.reset_counts()
+                    stats = asyncio.run(self._pooled(n_calls, options['concurrency'], knowledge=knowledge, mode=mode))
+                    stats["dispatch_bytes"] = server.bytes_in["CreateDispatch"] / max(server.counts["CreateDispatch"], 1)
+                    kb_results.append((mode, stats))
+        finally:
+            server.stop()
+
+        self.stdout.write(self.style.SUCCESS("=" * 72))
+        for name, stats in (("Per-task path", per_task), ("Pooled worker", pooled)):
+            self.stdout.write(
+                f"{name:<14} ok={stats['ok']:>6}/{n_calls:<6} "
+                f"{stats['per_second']:>9.1f} calls/s  "
+                f"p50={stats['p50'] * 1000:>7.1f}ms  p99={stats['p99'] * 1000:>7.1f}ms"
+            )
+        if per_task['per_second']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Throughput: {pooled['per_second'] / per_task['per_second']:.1f}x  "
+                f"p99 latency: {per_task['p99'] / max(pooled['p99'], 1e-9):.1f}x lower"
+            ))
+        self.stdout.write(self.style.SUCCESS("=" * 72))
+
+        if kb_results:
+            self.stdout.write(f"KB payload ({options['kb_bytes']} bytes of text):")
+            for mode, stats in kb_results:
+                self.stdout.write(
+                    f"  {mode:<10} dispatch={stats['dispatch_bytes']:>10.0f} B  "
+                    f"{stats['per_second']:>9.1f} calls/s  "
+                    f"p50={stats['p50'] * 1000:>7.1f}ms  p99={stats['p99'] * 1000:>7.1f}ms"
+                )
+            self.stdout.write(self.style.SUCCESS("=" * 72))
+
+    @staticmethod
+    def _synthetic_kb(n_bytes):
+        # Prose-like text so compression ratios resemble real extracted PDFs
+        words = ("Unsere Praxis bietet Termine von Montag bis Freitag an. Preise, Leistungen "
+                 "und Ansprechpartner stehen im Abschnitt {n}. ").split()
+        out, n = [], 0
+        while sum(len(w) + 1 for w in out) < n_bytes:
+            out.extend(w.format(n=n) for w in words)
+            n += 1
+        return " ".join(out)[:n_bytes]
+
+    @staticmethod
+    def _call_args(i):
+        agent_config = {
+            "agent_id": "bench", "name": "bench", "max_call_duration_minutes": 5,
+            "knowledge_documents": ["00000000-0000-0000-0000-000000000000"],
+        }
+        lead_data = {"id": str(i), "phone": f"+4915{i:09d}", "call_task_id": str(i)}
+        return ("ST_bench", agent_config, lead_data, "+4930000000")
+
+    def _per_task(self, n_calls, threads):
+        latencies = []
+
+        def one(i):
+            started = time.perf_counter()
+            result = async_to_sync(_make_call_async)(*self._call_args(i), call_task_id=str(i), knowledge_content="")
+            latencies.append(time.perf_counter() - started)
+            return bool(result.get("success"))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            ok = sum(pool.map(one, range(n_calls)))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"⏱️ per-task path: {ok} ok in {elapsed:.3f}s")
+        return self._stats(ok, elapsed, latencies)
+
+    async def _pooled(self, n_calls, concurrency, knowledge="", mode=None):
+        latencies = []
+        semaphore = asyncio.Semaphore(concurrency)
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=60),
+        )
+        livekit_api = create_livekit_api(session=session)
+
+        async def one(i):
+            async with semaphore:
+                started = time.perf_counter()
+                result = await _make_call_async(
+                    *self._call_args(i), call_task_id=str(i), knowledge_content=knowledge,
+                    livekit_api=livekit_api, knowledge_mode=mode,
+                )
+                latencies.append(time.perf_counter() - started)
+                return bool(result.get("success"))
+
+        try:
+            started = time.perf_counter()
+            ok = sum(await asyncio.gather(*(one(i) for i in range(n_calls))))
+            elapsed = time.perf_counter() - started
+        finally:
+            await livekit_api.aclose()
+            await session.close()
+        self.stdout.write(f"⏱️ pooled worker{f' ({mode})' if mode else ''}: {ok} ok in {elapsed:.3f}s")
+        return self._stats(ok, elapsed, latencies)
+
+    @staticmethod
+    def _stats(ok, elapsed, latencies):
+        return {
+            "ok": ok,
+            "per_second": ok / elapsed if elapsed else 0.0,
+            "p50": _percentile(latencies, 50),
+            "p99": _percentile(latencies, 99),
+        }
@@ -0,0 +1,197 @@
+import threading
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.models import (
+    EndpointFeature, Feature, FeatureUsage, Plan, PlanFeature, Workspace, WorkspaceSubscription,
+)
+from core.quotas import enforce_and_record
+
+BACKENDS = {
+    # name → QUOTA_REDIS_COUNTERS
+    "row_lock": False,
+    "redis": True,
+}
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = """
+Benchmark metered operations (core.quotas.enforce_and_record) under
+concurrent writers, comparing the FeatureUsage row lock with the Redis
+write-behind counters (QUOTA_REDIS_COUNTERS).
+
+Seeds a throwaway plan/feature/virtual route and one workspace per backend
+(or --workspaces per backend), then runs --writers threads that each record
+--ops operations of amount 1. Reports operations per second per workspace,
+latency percentiles, and checks that FeatureUsage ends up with exactly the
+recorded total (after a flush for the Redis backend).
+
+Needs PostgreSQL and Redis. Everything seeded is deleted unless --keep.
+
+USAGE:
+python manage.py benchmark_quota_enforcement
+python manage.py benchmark_quota_enforcement --writers 50 --ops 400 --backend redis
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=50, help='Concurrent writer threads')
+        parser.add_argument('--ops', type=int, default=200, help='Metered operations per writer')
+        parser.add_argument('--workspaces', type=int, default=1, help='Workspaces the writers are spread over (per backend)')
+        parser.add_argument('--backend', choices=sorted(BACKENDS) + ['both'], default='both', help='Backend(s) to run')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows after the run')
+
+    def handle(self, *args, **options):
+        if options['writers'] <= 0 or options['ops'] <= 0 or options['workspaces'] <= 0:
+            raise CommandError("--writers, --ops and --workspaces must be positive")
+
+        backends = sorted(BACKENDS) if options['backend'] == 'both' else [options['backend']]
+        run_id = uuid.uuid4().hex[:8]
+        seeded = self._seed(run_id, backends, options['workspaces'])
+        self.stdout.write(f"🌱 Seeded route {seeded['route_name']} for {', '.join(backends)} (run {run_id})")
+
+        results = []
+        try:
+            for backend in backends:
+                with override_settings(QUOTA_REDIS_COUNTERS=BACKENDS[backend]):
+                    results.append(self._run(backend, seeded, options))
+            self._report(results, options)
+        finally:
+            if not options['keep']:
+                self._cleanup(seeded)
+                self.stdout.write("🧹 Benchmark data deleted")
+
+    # ── seeding ──────────────────────────────────────────────────────────
+    @staticmethod
+    def _seed(run_id, backends, n_workspaces):
+        plan = Plan.objects.create(plan_name=f"Benchmark {run_id}")
+        feature = Feature.objects.create(feature_name=f"benchmark_ops_{run_id}")
+        PlanFeature.objects.create(plan=plan, feature=feature, limit=Decimal("999999999"))
+        route_name = f"internal:benchmark_{run_id}"
+        EndpointFeature.objects.create(feature=feature, route_name=route_name, http_method="POST")
+
+        workspaces = {}
+        for backend in backends:
+            workspaces[backend] = []
+            for i in range(n_workspaces):
+                workspace = Workspace.objects.create(workspace_name=f"benchmark-{run_id}-{backend}-{i}")
+                WorkspaceSubscription.objects.create(
+                    workspace=workspace, plan=plan, started_at=timezone.now() - timedelta(days=1), is_active=True,
+                )
+                workspaces[backend].append(workspace)
+
+        return {"plan": plan, "feature": feature, "route_name": route_name, "workspaces": workspaces}
+
+    # ── driving ──────────────────────────────────────────────────────────
+    def _run(self, backend, seeded, options):
+        workspaces = seeded["workspaces"][backend]
+        latencies, errors = [], []
+        lock = threading.Lock()
+        start = threading.Barrier(options['writers'] + 1)
+
+        def writer(index):
+            workspace = workspaces[index % len(workspaces)]
+            local = []
+            try:
+                start.wait()
+                for _ in range(options['ops']):
+                    began = time.perf_counter()
+                    try:
+                        enforce_and_record(workspace=workspace, route_name=seeded["route_name"], http_method="POST", amount=1)
+                    except Exception as e:
+                        with lock:
+                            errors.append(str(e))
+                        continue
+                    local.append(time.perf_counter() - began)
+            finally:
+                with lock:
+                    latencies.extend(local)
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(i,), daemon=True) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        began = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        if BACKENDS[backend]:
+            from core.utils.quota_counters import QuotaCounters
+
+            QuotaCounters().flush()
+
+        recorded = sum(
+            FeatureUsage.objects.filter(
+                usage_record__workspace__in=workspaces, feature=seeded["feature"]
+            ).values_list("used_amount", flat=True)
+        )
+        return {
+            "backend": backend,
+            "ops": len(latencies),
+            "errors": errors,
+            "elapsed": elapsed,
+            "latencies": latencies,
+            "workspaces": len(workspaces),
+            "recorded": Decimal(recorded or 0),
+        }
+
+    # ── report ───────────────────────────────────────────────────────────
+    def _report(self, results, options):
+        self.stdout.write(self.style.SUCCESS("=" * 78))
+        self.stdout.write(
+            f"Quota enforcement benchmark: {options['writers']} writers × {options['ops']} ops, "
+            f"{options['workspaces']} workspace(s) per backend"
+        )
+        self.stdout.write(
+            f"{'backend':<10}{'ops/s':>10}{'ops/s/ws':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'max ms':>9}{'errors':>8}  check"
+        )
+        for r in results:
+            rate = r["ops"] / r["elapsed"] if r["elapsed"] else 0.0
+            check = "ok" if r["recorded"] == r["ops"] else f"MISMATCH recorded={r['recorded']} ops={r['ops']}"
+            self.stdout.write(
+                f"{r['backend']:<10}{rate:>10.0f}{rate / r['workspaces']:>10.0f}"
+                f"{_percentile(r['latencies'], 50) * 1000:>9.2f}{_percentile(r['latencies'], 95) * 1000:>9.2f}"
+                f"{_percentile(r['latencies'], 99) * 1000:>9.2f}{max(r['latencies'] or [0]) * 1000:>9.2f}"
+                f"{len(r['errors']):>8}  {check}"
+            )
+            if r["errors"]:
+                self.stdout.write(f"  first error: {r['errors'][0]}")
+        self.stdout.write(self.style.SUCCESS("=" * 78))
+
+    @staticmethod
+    def _cleanup(seeded):
+        from core.utils.quota_counters import QuotaCounters
+
+        workspace_ids = [w.id for ws in seeded["workspaces"].values() for w in ws]
+        usage_ids = list(
+            FeatureUsage.objects.filter(usage_record__workspace_id__in=workspace_ids).values_list("id", flat=True)
+        )
+        try:
+            counters = QuotaCounters()
+            if usage_ids:
+                counters.redis.delete(*(counters.COUNTER_KEY.format(id=i) for i in usage_ids))
+        except Exception:
+            pass
+        EndpointFeature.objects.filter(route_name=seeded["route_name"]).delete()
+        # Workspaces cascade to subscriptions and usage containers
+        Workspace.objects.filter(id__in=workspace_ids).delete()
+        PlanFeature.objects.filter(plan=seeded["plan"]).delete()
+        seeded["plan"].delete()
+        seeded["feature"].delete()
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from jinja2 import Environment
+
+from core.services.script_template_service import ScriptTemplateService
+
+
+DEFAULT_TEMPLATE = """
+Du bist {{ name }}s Ansprechpartner bei {{ company | default('uns') }}.
+{% if budget %}Das Budget liegt bei {{ budget }} EUR.{% else %}Frage nach dem Budget.{% endif %}
+Begrüße {{ name }} {{ surname }} freundlich und bestätige die E-Mail {{ email }}.
+{% for topic in topics %}- Sprich über {{ topic }}
+{% endfor %}
+Rufnummer für Rückfragen: {{ phone }}.
+""" * 8
+
+
+class Command(BaseCommand):
+    help = """
+Microbenchmark for agent script template rendering.
+
+Compares:
+  • uncached    – Environment.from_string() on every render (previous behaviour)
+  • cached      – ScriptTemplateService.render_script_template (compiled LRU)
+  • render_many – one compile, N contexts in a single call
+
+USAGE:
+python manage.py benchmark_script_templates --renders 20000
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renders', type=int, default=10000, help='Renders per strategy')
+        parser.add_argument('--templates', type=int, default=5, help='Distinct agent templates in rotation')
+
+    def handle(self, *args, **options):
+        n = options['renders']
+        templates = [f"{{# agent {i} #}}{DEFAULT_TEMPLATE}" for i in range(max(options['templates'], 1))]
+        contexts = [
+            {
+                "name": f"Lead{i}", "surname": "Muster", "email": f"lead{i}@example.com",
+                "phone": f"+4915{i:09d}", "company": "ACME", "budget": str(1000 + i) if i % 2 else "",
+                "topics": ["Preise", "Termine", "Vertrag"],
+            }
+            for i in range(n)
+        ]
+
+        uncached_env = Environment(autoescape=False)
+        started = time.perf_counter()
+        for i, context in enumerate(contexts):
+            uncached_env.from_string(templates[i % len(templates)]).render(**context)
+        uncached = time.perf_counter() - started
+
+        service = ScriptTemplateService()
+        started = time.perf_counter()
+        for i, context in enumerate(contexts):
+            service.render_script_template(templates[i % len(templates)], context)
+        cached = time.perf_counter() - started
+
+        service.clear_cache()
+        per_template = [contexts[j::len(templates)] for j in range(len(templates))]
+        started = time.perf_counter()
+        for template, batch in zip(templates, per_template):
+            service.render_many(template, batch)
+        batched = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS("=" * 72))
+        for name, elapsed in (("uncached", uncached), ("cached", cached), ("render_many", batched)):
+            self.stdout.write(f"{name:<12} {n / elapsed if elapsed else 0:>12.0f} renders/s  ({elapsed:.3f}s)")
+        self.stdout.write(f"cache: {service.cache_hits} hits / {service.cache_misses} misses")
+        if cached:
+            self.stdout.write(self.style.SUCCESS(f"Speedup (cached vs uncached): {uncached / cached:.1f}x"))
+        self.stdout.write(self.style.SUCCESS("=" * 72))
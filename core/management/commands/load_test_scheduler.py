@@ -0,0 +1,458 @@
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.models import Agent, CallStatus, CallTask, PhoneNumber, SIPTrunk, Workspace
+from core.utils.dial_calendar import ALL_DAYS
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class _QueryCounter:
+    """connection.execute_wrapper that counts queries and their total time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = """
+Load-test the outbound pipeline end to end:
+schedule_agent_call (SchedulerService tick) → trigger_call → DialerService.
+
+Seeds N workspaces with agents on a set of SIP trunks and M CallTasks with
+a realistic next_call distribution (an overdue backlog, Poisson arrivals
+over --spread-seconds, and a share of bulk-import bursts on whole minutes),
+points LiveKit at the local fake server (configurable latency / failure
+rate) and runs scheduler ticks until every arrival was dispatched or
+--duration ran out. Dispatched calls "hang up" after --hold-seconds, which
+frees their admission slot like the end_of_call webhook would.
+
+--dispatch eager   trigger_call runs inline in this process (Celery eager);
+                   query counts cover the whole pipeline per call.
+--dispatch workers trigger_call.delay goes to the broker and real Celery
+                   workers (or `run_dialer` with DIALER_MODE=worker) place
+                   the calls. Start them with LIVEKIT_URL set to the fake
+                   server URL printed at startup (see --fake-host/--fake-port);
+                   query counts then cover the scheduler side only.
+
+Stop Celery beat while the test runs so schedule_agent_call does not tick
+concurrently. Ticks only claim tasks of the seeded workspaces. The command
+refuses to run outside DEBUG when the database already holds due or
+active CallTasks, unless --allow-shared-db is given. Everything seeded is
+deleted afterwards unless --keep.
+
+Reports throughput, scheduler tick duration, per-stage latency percentiles
+(from CallTask.dispatch_timeline), DB queries per dispatched call and lock
+wait time (pg_stat_activity samples of backends waiting on a lock).
+
+USAGE:
+python manage.py load_test_scheduler --workspaces 20 --agents 5 --tasks 20000
+python manage.py load_test_scheduler --tasks 5000 --latency-ms 80 --failure-rate 0.02
+python manage.py load_test_scheduler --dispatch workers --fake-host 0.0.0.0 --fake-port 7881
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workspaces', type=int, default=10, help='Workspaces to seed')
+        parser.add_argument('--agents', type=int, default=3, help='Agents per workspace')
+        parser.add_argument('--trunks', type=int, default=4, help='SIP trunks shared by the agents')
+        parser.add_argument('--tasks', type=int, default=5000, help='CallTasks to seed')
+        parser.add_argument('--backlog-share', type=float, default=0.3, help='Share of tasks already overdue at start')
+        parser.add_argument('--burst-share', type=float, default=0.2, help='Share of future tasks snapped to whole minutes')
+        parser.add_argument('--spread-seconds', type=float, default=300.0, help='Window over which future tasks fall due')
+        parser.add_argument('--latency-ms', type=float, default=30.0, help='Fake LiveKit latency per request')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Fake LiveKit failure rate (0.0-1.0)')
+        parser.add_argument('--fake-host', default='127.0.0.1', help='Fake LiveKit bind address')
+        parser.add_argument('--fake-port', type=int, default=0, help='Fake LiveKit port (0 = ephemeral)')
+        parser.add_argument('--dispatch', choices=('eager', 'workers'), default='eager', help='How trigger_call runs')
+        parser.add_argument('--hold-seconds', type=float, default=5.0, help='Simulated call duration before hang-up')
+        parser.add_argument('--tick-interval', type=float, default=1.0, help='Seconds between scheduler ticks')
+        parser.add_argument('--duration', type=float, default=900.0, help='Give up after this many seconds')
+        parser.add_argument('--lock-sample-ms', type=float, default=50.0, help='pg_stat_activity sampling interval')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows after the run')
+        parser.add_argument(
+            '--allow-shared-db', action='store_true',
+            help='Run even though the database has CallTasks of its own (DEBUG off)'
+        )
+
+    def handle(self, *args, **options):
+        from core.telephony.fake_livekit import FakeLiveKitServer
+
+        if options['tasks'] <= 0 or options['workspaces'] <= 0 or options['agents'] <= 0 or options['trunks'] <= 0:
+            raise CommandError("--tasks, --workspaces, --agents and --trunks must be positive")
+        self._check_database(options)
+
+        run_id = uuid.uuid4().hex[:8]
+        server = FakeLiveKitServer(
+            host=options['fake_host'], port=options['fake_port'],
+            latency_ms=options['latency_ms'], failure_rate=options['failure_rate'],
+        ).start()
+        saved_env = {k: os.environ.get(k) for k in ("LIVEKIT_URL", "LIVEKIT_API_KEY", "LIVEKIT_API_SECRET", "LIVEKIT_AGENT_NAME")}
+        os.environ.update({
+            "LIVEKIT_URL": server.url,
+            "LIVEKIT_API_KEY": "loadtest-key",
+            "LIVEKIT_API_SECRET": "loadtest-secret-loadtest-secret-loadtest",
+            "LIVEKIT_AGENT_NAME": "loadtest-agent",
+        })
+        self.stdout.write(
+            f"🧪 Fake LiveKit on {server.url} ({options['latency_ms']}ms, {options['failure_rate']:.1%} failures)"
+        )
+
+        # The dialer logs several lines per call; keep the console readable
+        core_logger = logging.getLogger("core")
+        saved_level = core_logger.level
+        if options['verbosity'] < 2:
+            core_logger.setLevel(logging.WARNING)
+
+        seeded = None
+        try:
+            seeded = self._seed(run_id, options)
+            self.stdout.write(
+                f"🌱 Seeded {len(seeded['workspace_ids'])} workspaces, {len(seeded['agent_ids'])} agents, "
+                f"{len(seeded['trunk_ids'])} trunks, {seeded['tasks']} CallTasks (run {run_id})"
+            )
+            if options['dispatch'] == 'eager':
+                from hotcalls.celery import app
+
+                previous_eager = app.conf.task_always_eager
+                app.conf.task_always_eager = True
+                try:
+                    with override_settings(DIALER_MODE="celery"):
+                        stats = self._drive(seeded, options)
+                finally:
+                    app.conf.task_always_eager = previous_eager
+            else:
+                self.stdout.write(f"📡 Waiting for workers: run them with LIVEKIT_URL={server.url}")
+                stats = self._drive(seeded, options)
+            stats["livekit"] = dict(server.counts)
+            self._report(stats, options)
+        finally:
+            if seeded is not None and not options['keep']:
+                self._cleanup(seeded)
+                self.stdout.write("🧹 Load-test data deleted")
+            core_logger.setLevel(saved_level)
+            server.stop()
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+    @staticmethod
+    def _check_database(options):
+        """Refuse to load-test a database with live CallTasks (production) unless told to."""
+        from django.conf import settings
+
+        from core.telephony.repositories.call_repo import ACTIVE_STATUSES, SCHEDULABLE_STATUSES
+
+        if settings.DEBUG or options['allow_shared_db']:
+            return
+        statuses = [str(s) for s in SCHEDULABLE_STATUSES + ACTIVE_STATUSES]
+        if CallTask.objects.filter(status__in=statuses).exists():
+            raise CommandError(
+                "This database already has scheduled or active CallTasks and DEBUG is off. "
+                "Run against a disposable database or pass --allow-shared-db."
+            )
+
+    # ── seeding ──────────────────────────────────────────────────────────
+    def _seed(self, run_id, options):
+        from core.telephony.services.dial_windows import call_task_window, refresh_agent_windows
+        from core.telephony.services.due_index import DueIndex, due_at
+
+        # Digits unique to this run so seeded phone numbers never collide
+        run_digits = f"{int(run_id, 16) % 1000:03d}"
+
+        trunks = [
+            SIPTrunk.objects.create(
+                provider_name=f"LoadTest {run_id}",
+                sip_username="loadtest",
+                sip_password="loadtest",
+                sip_host="sip.loadtest.local",
+                livekit_trunk_id=f"ST_loadtest_{run_id}_{i}",
+            )
+            for i in range(options['trunks'])
+        ]
+
+        workspaces, agents, phones = [], [], []
+        for w in range(options['workspaces']):
+            workspace = Workspace.objects.create(workspace_name=f"loadtest-{run_id}-{w}")
+            workspaces.append(workspace)
+            for a in range(options['agents']):
+                n = len(agents)
+                phone = PhoneNumber.objects.create(
+                    phonenumber=f"+49309{run_digits}{n:05d}",
+                    sip_trunk=trunks[n % len(trunks)],
+                )
+                phones.append(phone)
+                agents.append(Agent.objects.create(
+                    workspace=workspace,
+                    name=f"LoadTest Agent {w}-{a}",
+                    phone_number=phone,
+                    workdays=list(ALL_DAYS),
+                    call_from=dt_time(0, 0),
+                    call_to=dt_time(23, 59, 59),
+                ))
+
+        now = timezone.now()
+        refresh_agent_windows(now)
+
+        due_times = self._due_times(now, options)
+        tasks = []
+        for i, next_call in enumerate(due_times):
+            agent = agents[i % len(agents)]
+            eligible_from, eligible_until = call_task_window(agent, next_call)
+            tasks.append(CallTask(
+                status=CallStatus.SCHEDULED,
+                phone=f"+4915{run_digits}{i:07d}",
+                workspace_id=agent.workspace_id,
+                agent=agent,
+                next_call=next_call,
+                eligible_from=eligible_from,
+                eligible_until=eligible_until,
+            ))
+        # bulk_create skips pre_save, so windows were filled above
+        CallTask.objects.bulk_create(tasks, batch_size=1000)
+
+        if DueIndex.enabled():
+            DueIndex().push_many(
+                (str(t.id), t.workspace_id, due_at(t.next_call, t.eligible_from)) for t in tasks
+            )
+
+        return {
+            "run_id": run_id,
+            "workspace_ids": [w.id for w in workspaces],
+            "agent_ids": [a.agent_id for a in agents],
+            "phone_ids": [p.id for p in phones],
+            "trunk_ids": [t.id for t in trunks],
+            "tasks": len(tasks),
+            "last_due": max(due_times),
+        }
+
+    @staticmethod
+    def _due_times(now, options):
+        """Overdue backlog + Poisson arrivals, a share of them on whole minutes."""
+        n_tasks = options['tasks']
+        spread = max(options['spread_seconds'], 1.0)
+        n_backlog = int(n_tasks * min(max(options['backlog_share'], 0.0), 1.0))
+        n_future = n_tasks - n_backlog
+
+        out = [now - timedelta(seconds=random.uniform(1, 3600)) for _ in range(n_backlog)]
+        offset = 0.0
+        rate = n_future / spread if n_future else 1.0
+        for _ in range(n_future):
+            offset = min(offset + random.expovariate(rate), spread)
+            due = offset
+            if random.random() < options['burst_share']:
+                # Lead imports and retry intervals land on minute boundaries
+                due = min(60.0 * round(offset / 60.0), spread)
+            out.append(now + timedelta(seconds=due))
+        random.shuffle(out)
+        return out
+
+    # ── driving ──────────────────────────────────────────────────────────
+    def _drive(self, seeded, options):
+        from core.telephony.services.scheduler_service import SchedulerService
+
+        queries = _QueryCounter()
+        lock_stats = {"samples": 0, "waiting": 0, "max_waiting": 0}
+        stop = threading.Event()
+        sampler = None
+        if connection.vendor == "postgresql":
+            sampler = threading.Thread(
+                target=self._sample_lock_waits,
+                args=(stop, options['lock_sample_ms'] / 1000.0, lock_stats),
+                name="loadtest-lock-sampler",
+                daemon=True,
+            )
+            sampler.start()
+
+        samples = defaultdict(list)
+        tick_seconds = []
+        dispatched = 0
+        scheduler = SchedulerService(logger)
+        started = time.monotonic()
+        try:
+            while True:
+                tick_started = time.perf_counter()
+                with connection.execute_wrapper(queries):
+                    scheduler.run_tick(workspace_ids=seeded["workspace_ids"])
+                tick_seconds.append(time.perf_counter() - tick_started)
+
+                dispatched += self._hang_up(seeded, options['hold_seconds'], samples)
+
+                elapsed = time.monotonic() - started
+                if elapsed >= options['duration']:
+                    self.stdout.write(self.style.WARNING(f"⏰ Stopped after {elapsed:.0f}s (--duration)"))
+                    break
+                if self._finished(seeded):
+                    break
+                if int(elapsed) and len(tick_seconds) % 30 == 0:
+                    self.stdout.write(f"… {elapsed:.0f}s: {dispatched} dispatched")
+                time.sleep(max(options['tick_interval'] - (time.perf_counter() - tick_started), 0.0))
+
+            # Let the last calls hang up so their timelines are collected
+            deadline = time.monotonic() + options['hold_seconds'] + 5.0
+            while time.monotonic() < deadline and CallTask.objects.filter(
+                workspace_id__in=seeded["workspace_ids"], status=CallStatus.IN_PROGRESS
+            ).exists():
+                time.sleep(0.5)
+                dispatched += self._hang_up(seeded, options['hold_seconds'], samples)
+            elapsed = time.monotonic() - started
+        finally:
+            stop.set()
+            if sampler is not None:
+                sampler.join(timeout=5)
+
+        interval = options['lock_sample_ms'] / 1000.0
+        return {
+            "elapsed": elapsed,
+            "dispatched": dispatched,
+            "ticks": len(tick_seconds),
+            "tick_seconds": tick_seconds,
+            "samples": samples,
+            "queries": queries.count,
+            "query_seconds": queries.seconds,
+            "lock_supported": sampler is not None,
+            "lock_wait_seconds": lock_stats["waiting"] * interval,
+            "lock_max_waiting": lock_stats["max_waiting"],
+        }
+
+    def _hang_up(self, seeded, hold_seconds, samples):
+        """End calls that have been up for hold_seconds; collect their timelines."""
+        now = time.time()
+        rows = CallTask.objects.filter(
+            workspace_id__in=seeded["workspace_ids"], status=CallStatus.IN_PROGRESS
+        ).values_list("id", "dispatch_timeline")
+
+        finished = []
+        for task_id, timeline in rows:
+            timeline = timeline or {}
+            sip_participant = timeline.get("sip_participant")
+            if sip_participant is None or now - float(sip_participant) < hold_seconds:
+                continue
+            finished.append(task_id)
+            for stage, seconds in (timeline.get("durations") or {}).items():
+                samples[stage].append(float(seconds))
+            if "due" in timeline and "claimed" in timeline:
+                samples["due_to_claimed"].append(float(timeline["claimed"]) - float(timeline["due"]))
+                samples["due_to_sip_participant"].append(float(sip_participant) - float(timeline["due"]))
+
+        if finished:
+            # Deleting fires the post_delete signal that releases admission and the phone
+            CallTask.objects.filter(id__in=finished).delete()
+        return len(finished)
+
+    @staticmethod
+    def _finished(seeded):
+        """All arrivals are past and nothing is due or on a call anymore."""
+        from core.telephony.repositories.call_repo import ACTIVE_STATUSES, SCHEDULABLE_STATUSES
+
+        now = timezone.now()
+        if now < seeded["last_due"]:
+            return False
+        tasks = CallTask.objects.filter(workspace_id__in=seeded["workspace_ids"])
+        if tasks.filter(status__in=[str(s) for s in ACTIVE_STATUSES]).exists():
+            return False
+        # Failed attempts rescheduled past retry_interval are not waited for
+        return not tasks.filter(status__in=[str(s) for s in SCHEDULABLE_STATUSES], next_call__lte=now).exists()
+
+    @staticmethod
+    def _sample_lock_waits(stop, interval, out):
+        """Count backends of this database waiting on a heavyweight lock."""
+        conn = connections["default"]
+        try:
+            while not stop.wait(interval):
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT count(*) FROM pg_stat_activity "
+                            "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                        )
+                        waiting = cursor.fetchone()[0]
+                except Exception as e:
+                    logger.warning(f"⚠️ Lock sampler query failed: {e}")
+                    continue
+                out["samples"] += 1
+                out["waiting"] += waiting
+                out["max_waiting"] = max(out["max_waiting"], waiting)
+        finally:
+            conn.close()
+
+    # ── reporting / cleanup ──────────────────────────────────────────────
+    def _report(self, stats, options):
+        dispatched = stats["dispatched"]
+        elapsed = stats["elapsed"]
+        scope = "pipeline" if options['dispatch'] == 'eager' else "scheduler"
+
+        self.stdout.write(self.style.SUCCESS("=" * 78))
+        self.stdout.write(
+            f"Dispatched {dispatched} calls in {elapsed:.1f}s → {dispatched / elapsed if elapsed else 0.0:.1f} calls/s "
+            f"({stats['ticks']} ticks, tick p50={_percentile(stats['tick_seconds'], 50) * 1000:.1f}ms "
+            f"p99={_percentile(stats['tick_seconds'], 99) * 1000:.1f}ms)"
+        )
+        self.stdout.write(f"{'stage':<24}{'n':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+        for stage in ("due_to_claimed", "queue_wait", "template_render", "kb_fetch",
+                      "create_dispatch", "create_sip_participant", "due_to_sip_participant"):
+            values = stats["samples"].get(stage, [])
+            if not values:
+                continue
+            self.stdout.write(
+                f"{stage:<24}{len(values):>8}"
+                f"{_percentile(values, 50) * 1000:>11.1f}{_percentile(values, 95) * 1000:>11.1f}"
+                f"{_percentile(values, 99) * 1000:>11.1f}{max(values) * 1000:>11.1f}"
+            )
+        if dispatched:
+            self.stdout.write(
+                f"DB ({scope}): {stats['queries'] / dispatched:.2f} queries/call, "
+                f"{stats['query_seconds'] / dispatched * 1000:.2f}ms query time/call"
+            )
+        if stats["lock_supported"]:
+            per_call = stats["lock_wait_seconds"] / dispatched * 1000 if dispatched else 0.0
+            self.stdout.write(
+                f"Lock waits: ~{stats['lock_wait_seconds']:.2f}s total (~{per_call:.2f}ms/call), "
+                f"max {stats['lock_max_waiting']} backends waiting at once"
+            )
+        else:
+            self.stdout.write("Lock waits: not sampled (PostgreSQL only)")
+        livekit = stats["livekit"]
+        self.stdout.write(
+            f"Fake LiveKit: {livekit['CreateDispatch']} dispatches, "
+            f"{livekit['CreateSIPParticipant']} SIP participants, {livekit['failed']} injected failures"
+        )
+        self.stdout.write(self.style.SUCCESS("=" * 78))
+
+    @staticmethod
+    def _cleanup(seeded):
+        # Task deletes go through post_delete so admission slots and phones are released
+        CallTask.objects.filter(workspace_id__in=seeded["workspace_ids"]).delete()
+        Agent.objects.filter(agent_id__in=seeded["agent_ids"]).delete()
+        Workspace.objects.filter(id__in=seeded["workspace_ids"]).delete()
+        PhoneNumber.objects.filter(id__in=seeded["phone_ids"]).delete()
+        SIPTrunk.objects.filter(id__in=seeded["trunk_ids"]).delete()
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hotcalls.celery import WORKER_PROFILES, app
+
+
+class Command(BaseCommand):
+    help = """
+Run a Celery worker for one workload class (see WORKER_PROFILES in
+hotcalls/celery.py):
+
+  dispatch     schedule_agent_call + trigger_call(_batch), thread pool
+  feedback     end-of-call CallTask updates
+  ai           OpenAI call summaries
+  maintenance  reconcilers, cleanups, token refreshes, Meta syncs
+               (also drains the legacy `celery` queue)
+
+Concurrency/autoscale come from the profile unless overridden by
+WORKER_<PROFILE>_CONCURRENCY / WORKER_<PROFILE>_AUTOSCALE or the flags below.
+
+USAGE:
+python manage.py run_celery_worker --profile dispatch
+python manage.py run_celery_worker --profile ai --autoscale 8,2
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', required=True, choices=sorted(WORKER_PROFILES), help='Workload class to serve')
+        parser.add_argument('--concurrency', type=int, default=None, help='Fixed pool size (overrides the profile)')
+        parser.add_argument('--autoscale', type=str, default=None, help='"max,min" prefork autoscaling (overrides the profile)')
+        parser.add_argument('--loglevel', type=str, default='INFO', help='Worker log level')
+
+    def handle(self, *args, **options):
+        name = options['profile']
+        profile = dict(WORKER_PROFILES[name])
+        prefix = f"WORKER_{name.upper()}_"
+
+        concurrency = options['concurrency'] or getattr(settings, f"{prefix}CONCURRENCY", None) or profile["concurrency"]
+        autoscale = options['autoscale'] or getattr(settings, f"{prefix}AUTOSCALE", None) or profile["autoscale"]
+        if options['concurrency'] or getattr(settings, f"{prefix}CONCURRENCY", None):
+            autoscale = None
+        if autoscale and profile["pool"] != "prefork":
+            raise CommandError(f"Autoscaling needs the prefork pool; profile {name!r} uses {profile['pool']!r}")
+
+        argv = [
+            "worker",
+            "--hostname", f"{name}@%h",
+            "--queues", ",".join(profile["queues"]),
+            "--pool", profile["pool"],
+            "--prefetch-multiplier", str(profile["prefetch_multiplier"]),
+            "--loglevel", options['loglevel'],
+        ]
+        if autoscale:
+            argv += ["--autoscale", str(autoscale)]
+        elif concurrency:
+            argv += ["--concurrency", str(int(concurrency))]
+        if profile["max_tasks_per_child"]:
+            argv += ["--max-tasks-per-child", str(profile["max_tasks_per_child"])]
+
+        self.stdout.write(self.style.SUCCESS(f"👷 Celery worker profile {name}: {' '.join(argv[1:])}"))
+        app.worker_main(argv=argv)
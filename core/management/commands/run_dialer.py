@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.telephony.services.dialer_worker import DialerWorker
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = """
+Run the long-lived asyncio dialer (DIALER_MODE=worker).
+
+Consumes claimed CallTask IDs from the Redis list `dialer:queue` and places
+up to --concurrency calls at once through one pooled LiveKit client.
+SIGTERM/SIGINT stop taking new IDs and let in-flight calls finish. IDs a
+crashed worker had taken are requeued when the next worker starts.
+
+USAGE:
+python manage.py run_dialer
+python manage.py run_dialer --concurrency 300 --db-threads 48
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=None,
+            help='Maximum concurrent calls (default: DIALER_CONCURRENCY)'
+        )
+        parser.add_argument(
+            '--db-threads',
+            type=int,
+            default=None,
+            help='Thread pool size for ORM work (default: DIALER_DB_THREADS)'
+        )
+
+    def handle(self, *args, **options):
+        worker = DialerWorker(
+            logger,
+            concurrency=options['concurrency'] or getattr(settings, "DIALER_CONCURRENCY", 200),
+            db_threads=options['db_threads'] or getattr(settings, "DIALER_DB_THREADS", 32),
+        )
+
+        async def _main():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, worker.stop)
+            await worker.run()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"📞 Dialer worker starting (concurrency {worker.concurrency}, db threads {worker.db_threads})"
+        ))
+        asyncio.run(_main())
+        self.stdout.write(f"Dialer stats: {worker.stats}")
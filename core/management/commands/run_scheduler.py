@@ -0,0 +1,125 @@
+import logging
+import os
+import signal
+import socket
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.telephony.services.due_index import DueIndex
+from core.telephony.services.scheduler_service import SchedulerService
+from core.telephony.services.shard_leases import ShardLeaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = """
+Run a long-lived call scheduler instance (SCHEDULER_MODE=sharded).
+
+Each instance leases a fair share of the SCHEDULER_SHARD_COUNT workspace hash
+shards in Redis and runs one scheduling tick per owned shard every
+SCHEDULER_TICK_SECONDS. When an instance dies its leases expire after
+SCHEDULER_LEASE_TTL_SECONDS and the remaining instances take over its shards.
+
+Due work comes from the Redis timing wheel (calltasks:due:<shard>), not from
+polling Postgres. Between rounds the loop blocks until a create/reschedule
+push wakes one of its shards, the earliest owned task becomes due, or
+SCHEDULER_TICK_SECONDS elapse (lease renewal).
+
+USAGE:
+python manage.py run_scheduler
+python manage.py run_scheduler --tick 0.5
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tick',
+            type=float,
+            default=None,
+            help='Seconds between scheduling rounds (default: SCHEDULER_TICK_SECONDS)'
+        )
+        parser.add_argument(
+            '--instance-id',
+            type=str,
+            default=None,
+            help='Stable instance id (default: <hostname>:<pid>:<random>)'
+        )
+
+    def handle(self, *args, **options):
+        tick = options['tick'] or float(getattr(settings, "SCHEDULER_TICK_SECONDS", 1.0))
+        instance_id = options['instance_id'] or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        shard_count = SchedulerService.shard_count()
+
+        leases = ShardLeaseManager(
+            instance_id,
+            shard_count=shard_count,
+            lease_ttl=float(getattr(settings, "SCHEDULER_LEASE_TTL_SECONDS", 15.0)),
+        )
+        service = SchedulerService(logger)
+        due_index = DueIndex(shard_count=shard_count)
+
+        stopping = {"flag": False}
+
+        def _stop(signum, frame):
+            stopping["flag"] = True
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🗓️ Scheduler {instance_id} started ({shard_count} shards, tick {tick}s)"
+        ))
+
+        owned_before = set()
+        try:
+            while not stopping["flag"]:
+                started = time.monotonic()
+                close_old_connections()
+
+                try:
+                    owned = leases.rebalance()
+                except Exception as lease_err:
+                    # Without Redis we cannot prove ownership; do not schedule
+                    logger.error(f"❌ Shard lease rebalance failed: {lease_err}")
+                    owned = set()
+
+                if owned != owned_before:
+                    logger.info(f"🔀 {instance_id} now owns shards {sorted(owned)}")
+                    owned_before = owned
+
+                triggered = 0
+                for shard in sorted(owned):
+                    if stopping["flag"]:
+                        break
+                    try:
+                        result = service.run_tick(shard=(shard, shard_count), due_index=due_index)
+                        triggered += result.get("triggered", 0)
+                    except Exception as tick_err:
+                        logger.error(f"❌ Scheduler tick failed for shard {shard}: {tick_err}")
+
+                if stopping["flag"] or triggered:
+                    # Made progress: go straight into the next round
+                    continue
+
+                remaining = max(tick - (time.monotonic() - started), 0)
+                try:
+                    until_due = due_index.seconds_until_next(sorted(owned))
+                    if until_due is not None and until_due > 0:
+                        # Idle until the earliest owned task is due (or a push wakes us)
+                        due_index.wait(sorted(owned), timeout=min(until_due, tick))
+                    elif until_due is None and owned:
+                        # Nothing queued: block on the wakeup lists
+                        due_index.wait(sorted(owned), timeout=tick)
+                    else:
+                        # Due work but no capacity / no shards: plain back-off
+                        time.sleep(remaining)
+                except Exception as wait_err:
+                    logger.error(f"❌ Due index wait failed: {wait_err}")
+                    time.sleep(remaining)
+        finally:
+            leases.release_all()
+            self.stdout.write(f"👋 Scheduler {instance_id} stopped; leases released")
@@ -41,6 +41,62 @@ class Command(BaseCommand):
             True
         )
 
+        # Re-sync the Redis due index with Postgres every 60s
+        ensure_interval_task(
+            "reconcile-due-index",
+            "core.tasks.reconcile_due_index",
+            60,
+            True
+        )
+
+        # Rebuild admission in-flight counters every 60s
+        ensure_interval_task(
+            "reconcile-admission-counters",
+            "core.tasks.reconcile_admission_counters",
+            60,
+            True
+        )
+
+        # Re-sync the Redis active-phone set every 60s
+        ensure_interval_task(
+            "rebuild-active-phone-index",
+            "core.tasks.rebuild_active_phone_index",
+            60,
+            True
+        )
+
+        # Agent dial-window flags and task eligibility windows every 30s
+        ensure_interval_task(
+            "refresh-dial-windows",
+            "core.tasks.refresh_dial_windows",
+            30,
+            True
+        )
+
+        # Write Redis quota counters through to FeatureUsage every 5s
+        ensure_interval_task(
+            "flush-quota-counters",
+            "core.tasks.flush_quota_counters",
+            5,
+            True
+        )
+
+        # Fold accumulated end-of-call minutes into usage every 5s
+        ensure_interval_task(
+            "fold-call-minutes",
+            "core.tasks.fold_call_minutes",
+            5,
+            True
+        )
+
+        # Free expired call-minute reservations every 60s
+        ensure_interval_task(
+            "sweep-quota-reservations",
+            "core.tasks.sweep_quota_reservations",
+            60,
+            True
+        )
+
         # Cleanup router subaccounts every 300s (5 minutes)
         ensure_interval_task(
             "cleanup-router-subaccounts",
@@ -64,6 +64,11 @@ class Command(BaseCommand):
                 'description': 'Maximum number of agents allowed per workspace',
                 'unit': 'general_unit',
             },
+            {
+                'name': 'max_concurrent_calls',
+                'description': 'Maximum number of simultaneous outbound calls per workspace',
+                'unit': 'general_unit',
+            },
         ]
         
         features = {}
@@ -113,6 +118,7 @@ class Command(BaseCommand):
         self._add_feature_to_plan(start_plan, features['call_minutes'], 250)
         self._add_feature_to_plan(start_plan, features['max_users'], 3)  # 3 User (Admin + 2 User)
         self._add_feature_to_plan(start_plan, features['max_agents'], 1)  # 1 Agent pro Workspace
+        self._add_feature_to_plan(start_plan, features['max_concurrent_calls'], 2)  # 2 parallele Anrufe
         
         # PRO PLAN
         pro_plan = self._create_plan(
@@ -127,6 +133,7 @@ class Command(BaseCommand):
         self._add_feature_to_plan(pro_plan, features['call_minutes'], 1000)
         self._add_feature_to_plan(pro_plan, features['max_users'], 5)  # 5 User (Admin + 4 User)
         self._add_feature_to_plan(pro_plan, features['max_agents'], 3)  # 3 Agents pro Workspace
+        self._add_feature_to_plan(pro_plan, features['max_concurrent_calls'], 10)  # 10 parallele Anrufe
         
         # ENTERPRISE PLAN
         enterprise_plan = self._create_plan(
@@ -141,6 +148,7 @@ class Command(BaseCommand):
         self._add_feature_to_plan(enterprise_plan, features['call_minutes'], 999999)  # Unlimited
         self._add_feature_to_plan(enterprise_plan, features['max_users'], 999999)  # Unlimited users
         self._add_feature_to_plan(enterprise_plan, features['max_agents'], 999999)  # Unlimited agents
+        self._add_feature_to_plan(enterprise_plan, features['max_concurrent_calls'], 999999)  # Capped by global limit
 
     def _create_plan(self, name, price_monthly, description, stripe_product_id=None, stripe_price_id_monthly=None):
         """Create a single plan with Stripe IDs"""
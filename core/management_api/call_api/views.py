@@ -288,7 +288,7 @@ class CallLogViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         """Create call log and record actual call minutes usage"""
-        from core.quotas import enforce_and_record
+        from core.quotas import commit_call_minutes
         from decimal import Decimal
         
         # call_task_id is required in request but not persisted (popped in serializer.create)
@@ -303,24 +303,11 @@ class CallLogViewSet(viewsets.ModelViewSet):
             # Convert duration from seconds to minutes
             duration_minutes = Decimal(call_log.duration) / Decimal('60')
             
-            # Record actual usage (virtual route, bypasses HTTP middleware)
-            enforce_and_record(
-                workspace=workspace,
-                route_name="internal:call_duration_used",
-                http_method="POST",
-                amount=duration_minutes
-            )
+            # Record actual usage in place of the minutes reserved at dispatch
+            # (usage thresholds are checked when core.tasks.fold_call_minutes runs)
+            commit_call_minutes(workspace, self.request.data.get('call_task_id'), duration_minutes)
             
             logger.info(f"📞 Recorded {duration_minutes} minutes usage for workspace {workspace.id}")
-
-            # Check usage thresholds (90% / 75%) and notify admin if needed
-            try:
-                from core.utils import check_and_notify_minutes_threshold
-                check_and_notify_minutes_threshold(workspace)
-            except Exception as notify_err:
-                logger.error(
-                    f"⚠️ Threshold notification failed for workspace {workspace.id}: {notify_err}"
-                )
             
         except Exception as quota_err:
             # Log error but don't fail call log creation
@@ -440,12 +427,24 @@ def end_of_call(request):
                 pass
         raise
 
-    # Record usage minutes only on fresh create
+    # Record usage minutes only on fresh create, before the release below
+    # drops the call's minute reservation
     try:
-        _record_usage_minutes(call_log)
+        _record_usage_minutes(call_log, provided_calltask_id)
     except Exception as quota_err:
         logger.error(f"⚠️ Failed to record call minutes for call log {call_log.id} (end_of_call): {quota_err}")
 
+    # Free the concurrency slot right away; feedback may take a while to run
+    try:
+        from core.telephony.services.admission import release_admission
+        release_admission(provided_calltask_id)
+    except Exception as admission_err:
+        logger.error(f"⚠️ Failed to release admission for CallTask {provided_calltask_id} (end_of_call): {admission_err}")
+
+    # SIP participant → end_of_call latency (never raises)
+    from core.telephony.services.dispatch_metrics import observe_end_of_call
+    observe_end_of_call(provided_calltask_id)
+
     # Trigger feedback for fresh create
     try:
         from core.tasks import update_calltask_from_calllog
@@ -466,19 +465,15 @@ def end_of_call(request):
 
     return Response(CallLogSerializer(call_log).data, status=status.HTTP_201_CREATED)
 
-def _record_usage_minutes(call_log: CallLog):
+def _record_usage_minutes(call_log: CallLog, call_task_id: str | None = None):
     from decimal import Decimal
-    from core.quotas import enforce_and_record
+    from core.quotas import commit_call_minutes
     workspace = getattr(call_log.agent, 'workspace', None)
     if not workspace:
         return
     duration_minutes = Decimal(call_log.duration) / Decimal('60')
-    enforce_and_record(
-        workspace=workspace,
-        route_name="internal:call_duration_used",
-        http_method="POST",
-        amount=duration_minutes
-    )
+    # Replaces the minutes reserved at dispatch; thresholds are checked when folded
+    commit_call_minutes(workspace, call_task_id, duration_minutes)
 
 def _maybe_trigger_feedback_if_needed(call_log: CallLog, provided_calltask_id: str | None):
     if not provided_calltask_id:
@@ -1243,6 +1238,12 @@ class CallTaskViewSet(viewsets.ModelViewSet):
             # Update status to in progress
             call_task.status = CallStatus.IN_PROGRESS
             call_task.save(update_fields=['status'])
+            try:
+                from core.telephony.services.active_phones import ActivePhoneIndex
+                if ActivePhoneIndex.enabled():
+                    ActivePhoneIndex().add_many([call_task.phone])
+            except Exception as index_err:
+                logger.warning(f"⚠️ Active phone index update failed for {call_task.id}: {index_err}")
             
             return Response({
                 'task_id': str(call_task.id),
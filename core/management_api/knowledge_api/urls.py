@@ -32,6 +32,12 @@ urlpatterns = [
         views.AgentKnowledgeDocumentPresignByIdView.as_view(),
         name='agent-knowledge-document-presign-by-id'
     ),
+    # Immutable KB text addressed by sha256 (dispatch metadata `knowledge_ref`)
+    path(
+        'agents/<uuid:agent_id>/documents/by-id/<uuid:doc_id>/content/<str:sha256>/',
+        views.AgentKnowledgeDocumentContentView.as_view(),
+        name='agent-knowledge-document-content'
+    ),
     # Optional explicit rebuild trigger to bump manifest version
     path(
         'agents/<uuid:agent_id>/rebuild/',
@@ -7,7 +7,7 @@ import uuid
 from typing import Dict, Any, Tuple
 import logging
 
-from django.http import Http404
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from django.utils.timezone import now
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -119,6 +119,15 @@ def _save_manifest(storage: AzureMediaStorage, agent_id: str, manifest: Dict[str
         raise
 
 
+def _bump_kb_version(agent_id: str) -> None:
+    """Invalidate the dial-time KB text cache for this agent (never fails the request)."""
+    try:
+        from core.services.knowledge_cache import knowledge_cache
+        knowledge_cache.bump_version(str(agent_id))
+    except Exception as exc:
+        logger.warning("KB: failed to bump cache version for %s: %s", agent_id, exc)
+
+
 def _get_agent_or_404(agent_id: str) -> Agent:
     try:
         return Agent.objects.get(agent_id=agent_id)
@@ -322,6 +331,9 @@ class AgentKnowledgeDocumentsView(APIView):
             except Exception as vision_exc:
                 logger.warning("KB: Vision OCR failed for %s: %s", agent_id, vision_exc)
 
+            # New PDF (and possibly new .txt) → invalidate cached KB text
+            _bump_kb_version(agent_id)
+
             # Response format compatible with frontend (single file list)
             try:
                 size_val = getattr(agent.kb_pdf, 'size', None)
@@ -422,6 +434,7 @@ class AgentKnowledgeDocumentDetailView(APIView):
                 return True
         manifest["files"] = [f for f in manifest.get("files", []) if _keep(f)]
         _save_manifest(storage, agent_id, manifest)
+        _bump_kb_version(agent_id)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -487,6 +500,7 @@ class AgentKnowledgeRebuildView(APIView):
         manifest = _load_manifest(storage, agent_id)
         manifest["version"] = int(manifest.get("version", 1)) + 1
         _save_manifest(storage, agent_id, manifest)
+        _bump_kb_version(agent_id)
 
         return Response({
             "version": manifest["version"],
@@ -523,10 +537,64 @@ class AgentKnowledgeDocumentDetailByIdView(APIView):
             pass
         agent.kb_pdf = None
         agent.save(update_fields=['kb_pdf', 'updated_at'])
+        _bump_kb_version(agent_id)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class AgentKnowledgeDocumentContentView(APIView):
+    """
+    Content-addressed KB text for agents that receive `knowledge_ref` in their
+    dispatch metadata instead of the full text.
+
+    The URL embeds the sha256 of the text, so a given URL never changes content:
+    responses are immutable and agents can cache them by hash. A hash that is
+    no longer the agent's current KB returns 404.
+    """
+    permission_classes = [AgentKnowledgePermission]
+
+    @extend_schema(
+        summary="📄 Knowledge text by content hash",
+        description="Returns the extracted KB text (text/plain) if `sha256` matches the agent's current knowledge base.",
+        responses={200: {"type": "string"}, 304: None, 404: {"description": "Unknown document or stale hash"}},
+        parameters=[
+            OpenApiParameter(name="agent_id", location=OpenApiParameter.PATH, description="Agent UUID", required=True),
+            OpenApiParameter(name="doc_id", location=OpenApiParameter.PATH, description="Document UUID", required=True),
+            OpenApiParameter(name="sha256", location=OpenApiParameter.PATH, description="sha256 of the UTF-8 text", required=True),
+        ],
+        tags=["Knowledge"],
+    )
+    def get(self, request, agent_id, doc_id, sha256):
+        agent = _get_agent_or_404(agent_id)
+        self.check_object_permissions(request, agent)
+
+        if not agent.kb_pdf:
+            raise Http404("File not found")
+        current_name = os.path.basename(agent.kb_pdf.name)
+        deterministic = uuid.uuid5(uuid.NAMESPACE_URL, f"kb/{agent.agent_id}/{current_name}")
+        if str(deterministic) != str(doc_id):
+            raise Http404("File not found")
+
+        from core.services.knowledge_cache import knowledge_cache
+        from core.telephony.services._dialer_async import _load_knowledge_text
+
+        document = knowledge_cache.get_document(str(agent_id), lambda: _load_knowledge_text(str(agent_id)))
+        if not document.size or document.sha256 != sha256.lower():
+            raise Http404("Content not found")
+
+        # Only after the hash check, so a stale hash gets 404 rather than 304
+        etag = f'"{sha256.lower()}"'
+        if request.headers.get("If-None-Match") == etag:
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+
+        response = HttpResponse(document.text, content_type="text/plain; charset=utf-8")
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, max-age=31536000, immutable"
+        return response
+
+
 class AgentKnowledgeDocumentPresignByIdView(APIView):
     permission_classes = []
 
@@ -1556,6 +1556,8 @@ def stripe_webhook(request):
                                 workspace=workspace,
                                 is_active=True
                             ).update(is_active=False)
+                            from core.quotas import invalidate_quota_context
+                            invalidate_quota_context(workspace.id)
 
                             # Create new active subscription
                             WorkspaceSubscription.objects.create(
@@ -1729,6 +1731,9 @@ def stripe_webhook(request):
                 workspace=workspace,
                 is_active=True
             ).update(is_active=False)
+            # Queryset update skips post_save; drop the cached quota context explicitly
+            from core.quotas import invalidate_quota_context
+            invalidate_quota_context(workspace.id)
             logger.info("Subscription cancelled for workspace %s - deactivated WorkspaceSubscription records", workspace.id)
         except Workspace.DoesNotExist:
             logger.warning("No workspace found for customer %s in subscription.deleted", customer_id)
@@ -1,8 +1,7 @@
 from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
-from django.core.cache import cache
-from core.models import EndpointFeature
-from core.quotas import enforce_and_record, QuotaExceeded
+from core.models import EndpointFeature, Feature
+from core.quotas import endpoint_routes, enforce_and_record, QuotaExceeded
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,8 +21,13 @@ class PlanQuotaMiddleware(MiddlewareMixin):
     (workers, webhooks, etc.) bypass middleware and call enforce_and_record() directly.
     """
 
-    CACHE_KEY_TEMPLATE = "endpoint_feature:{method}:{route}"
-    CACHE_TIMEOUT = 60  # 1 minute cache for endpoint mappings
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        # Compile the route → feature table at startup instead of on the first request
+        try:
+            endpoint_routes.warm()
+        except Exception as exc:
+            logger.warning(f"Endpoint route table not compiled at startup: {exc}")
 
     def process_view(self, request, view_func, view_args, view_kwargs):
         """
@@ -53,10 +57,10 @@ class PlanQuotaMiddleware(MiddlewareMixin):
         if not route_name:
             return None
 
-        # Check if this endpoint is metered (with caching)
-        mapping = self._get_endpoint_mapping(route_name, method)
+        # Check if this endpoint is metered (process-local route table)
+        feature = endpoint_routes.feature_for(route_name, method)
         
-        if mapping is None:
+        if feature is None:
             # Endpoint is not metered → allow request
             return None
 
@@ -99,30 +103,6 @@ class PlanQuotaMiddleware(MiddlewareMixin):
         # Quota check passed, allow request to continue
         return None
 
-    def _get_endpoint_mapping(self, route_name: str, method: str):
-        """
-        Get EndpointFeature mapping with caching.
-        
-        Returns:
-            EndpointFeature instance or None if not found
-        """
-        cache_key = self.CACHE_KEY_TEMPLATE.format(method=method, route=route_name)
-        mapping = cache.get(cache_key)
-        
-        if mapping is None:
-            # Cache miss - query database
-            mapping = (
-                EndpointFeature.objects
-                .filter(route_name=route_name, http_method=method)
-                .select_related("feature")
-                .first()
-            )
-            
-            # Cache the result (even if None) to avoid repeated DB queries
-            cache.set(cache_key, mapping, timeout=self.CACHE_TIMEOUT)
-            
-        return mapping
-
     def _get_workspace(self, request):
         """
         Get workspace for the authenticated user.
@@ -169,4 +149,13 @@ def invalidate_endpoint_cache_on_delete(sender, instance, **kwargs):
     Invalidate cache when EndpointFeature is deleted.
     """
     from core.quotas import invalidate_endpoint_cache
-    invalidate_endpoint_cache(instance.route_name, instance.http_method)
\ No newline at end of file
+    invalidate_endpoint_cache(instance.route_name, instance.http_method)
+
+
+@receiver(post_save, sender=Feature)
+def invalidate_endpoint_cache_on_feature_save(sender, instance, **kwargs):
+    """
+    The route table holds Feature instances; recompile when one changes.
+    """
+    from core.quotas import invalidate_endpoint_cache
+    invalidate_endpoint_cache()
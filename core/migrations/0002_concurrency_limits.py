@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="agent",
+            name="max_concurrent_calls",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Maximum simultaneous calls for this agent (empty = no agent-level limit)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="siptrunk",
+            name="max_concurrent_calls",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Maximum simultaneous calls over this trunk (empty = no trunk-level limit)",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_concurrency_limits"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="calltask",
+            index=models.Index(
+                condition=models.Q(("status__in", ["call_triggered", "in_progress"])),
+                fields=["phone"],
+                name="calltask_active_phone_idx",
+            ),
+        ),
+    ]
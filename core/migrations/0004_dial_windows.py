@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_calltask_active_phone_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="agent",
+            name="dial_window_open",
+            field=models.BooleanField(
+                default=True,
+                help_text="Whether the agent's calling window is open right now (maintained by the scheduler)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="agent",
+            name="dial_window_changes_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When dial_window_open next flips (empty = recompute on next refresh)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="calltask",
+            name="eligible_from",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Start of the calling window for next_call",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="calltask",
+            name="eligible_until",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="End of the calling window for next_call",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="agent",
+            index=models.Index(
+                condition=models.Q(("dial_window_open", True), ("status", "active")),
+                fields=["agent_id"],
+                name="agent_dial_open_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="calltask",
+            index=models.Index(
+                condition=models.Q(("status__in", ["waiting", "scheduled", "retry"])),
+                fields=["status", "next_call", "eligible_until"],
+                name="calltask_due_window_idx",
+            ),
+        ),
+    ]
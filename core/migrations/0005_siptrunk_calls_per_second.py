@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_dial_windows"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="siptrunk",
+            name="max_calls_per_second",
+            field=models.FloatField(
+                blank=True,
+                help_text="Maximum new calls per second over this trunk (empty = DIALER_DEFAULT_TRUNK_CPS)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="siptrunk",
+            name="max_calls_per_second_per_number",
+            field=models.FloatField(
+                blank=True,
+                help_text="Maximum new calls per second per caller ID on this trunk (empty = DIALER_DEFAULT_CALLER_ID_CPS)",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_siptrunk_calls_per_second"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="calltask",
+            name="dispatch_timeline",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="Dispatch stage timestamps/durations of the current attempt",
+            ),
+        ),
+    ]
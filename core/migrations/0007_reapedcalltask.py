@@ -0,0 +1,53 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_calltask_dispatch_timeline"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReapedCallTask",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("call_task_id", models.UUIDField(help_text="ID of the deleted CallTask")),
+                ("workspace_id", models.UUIDField(help_text="Workspace of the deleted CallTask")),
+                ("agent_id", models.UUIDField(help_text="Agent of the deleted CallTask")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("scheduled", "scheduled"),
+                            ("call_triggered", "call_triggered"),
+                            ("in_progress", "in_progress"),
+                            ("retry", "retry"),
+                            ("waiting", "waiting"),
+                        ],
+                        help_text="Status the task was stuck in",
+                        max_length=20,
+                    ),
+                ),
+                ("phone", models.CharField(help_text="Phone number of the task", max_length=20)),
+                ("attempts", models.IntegerField(default=0, help_text="Retry attempts made before it got stuck")),
+                ("stuck_since", models.DateTimeField(help_text="Last update of the task before it was reaped")),
+                ("threshold_minutes", models.IntegerField(help_text="Timeout that applied to the task (minutes)")),
+                ("reaped_at", models.DateTimeField(db_index=True, help_text="When the reaper deleted the task")),
+            ],
+            options={
+                "ordering": ["-reaped_at"],
+                "indexes": [
+                    models.Index(fields=["workspace_id", "reaped_at"], name="reapedcalltask_ws_idx"),
+                ],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="calltask",
+            index=models.Index(
+                condition=models.Q(("status__in", ["call_triggered", "in_progress"])),
+                fields=["status", "updated_at"],
+                name="calltask_stuck_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_reapedcalltask"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="calltask",
+            index=models.Index(
+                condition=models.Q(("status__in", ["waiting", "scheduled", "retry"])),
+                fields=["workspace", "status", "next_call"],
+                name="calltask_ws_due_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_calltask_ws_due_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="calltask",
+            index=models.Index(fields=["updated_at"], name="calltask_updated_idx"),
+        ),
+    ]
@@ -1004,6 +1004,11 @@ class Agent(models.Model):
         help_text="Maximum allowed call duration (minutes) before auto-cleanup of stuck IN_PROGRESS tasks",
         default=30
     )
+    max_concurrent_calls = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Maximum simultaneous calls for this agent (empty = no agent-level limit)"
+    )
     workdays = models.JSONField(
         default=list,
         help_text="List of working days, e.g., ['monday', 'tuesday', 'wednesday']",
@@ -1017,6 +1022,17 @@ class Agent(models.Model):
         help_text="End time for calls",
         default="17:00:00"
     )
+    # Denormalized "inside calling hours right now" flag, flipped at window
+    # boundaries by core.tasks.refresh_dial_windows
+    dial_window_open = models.BooleanField(
+        default=True,
+        help_text="Whether the agent's calling window is open right now (maintained by the scheduler)"
+    )
+    dial_window_changes_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When dial_window_open next flips (empty = recompute on next refresh)"
+    )
     character = models.TextField(
         help_text="Agent character/personality description",
         blank=True,
@@ -1091,6 +1107,27 @@ class Agent(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Scheduler join: only active agents inside their calling window
+            models.Index(
+                fields=['agent_id'],
+                name='agent_dial_open_idx',
+                condition=models.Q(status='active', dial_window_open=True),
+            ),
+        ]
+
+    DIAL_HOURS_FIELDS = ('workdays', 'call_from', 'call_to')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Hours as loaded, so pre_save can spot changes without re-reading the row
+        instance._loaded_dial_hours = {
+            name: value for name, value in zip(field_names, values) if name in cls.DIAL_HOURS_FIELDS
+        }
+        return instance
+
     def __str__(self):
         return f"{self.name} ({self.workspace.workspace_name})"
 
@@ -1135,6 +1172,22 @@ class SIPTrunk(models.Model):
         help_text="LiveKit trunk ID for this provider"
     )
     
+    max_concurrent_calls = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Maximum simultaneous calls over this trunk (empty = no trunk-level limit)"
+    )
+    max_calls_per_second = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Maximum new calls per second over this trunk (empty = DIALER_DEFAULT_TRUNK_CPS)"
+    )
+    max_calls_per_second_per_number = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Maximum new calls per second per caller ID on this trunk (empty = DIALER_DEFAULT_CALLER_ID_CPS)"
+    )
+    
     is_active = models.BooleanField(
         default=True,
         help_text="Whether this SIP trunk is active"
@@ -2222,12 +2275,26 @@ class CallTask(models.Model):
     next_call = models.DateTimeField(
         help_text="Scheduled time for the next call attempt"
     )
+    # Agent calling window the next attempt falls into (denormalized from the
+    # agent's hours; empty = not computed yet, treated as eligible)
+    eligible_from = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Start of the calling window for next_call"
+    )
+    eligible_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="End of the calling window for next_call"
+    )
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     # Retry reason history (append-only)
     retry_reasons = models.JSONField(default=list, help_text="Append-only list of retry reason dicts: {reason, hint, at}")
+    # Stage markers of the current dispatch attempt (epoch seconds), see core.telephony.services.dispatch_metrics
+    dispatch_timeline = models.JSONField(default=dict, blank=True, help_text="Dispatch stage timestamps/durations of the current attempt")
     
     class Meta:
         ordering = ['-created_at']
@@ -2235,6 +2302,32 @@ class CallTask(models.Model):
             models.Index(fields=['status', 'next_call']),
             models.Index(fields=['agent', 'status']),
             models.Index(fields=['next_call']),
+            # Busy-phone lookups (SQL conflict check, active-phone index rebuild)
+            models.Index(
+                fields=['phone'],
+                name='calltask_active_phone_idx',
+                condition=models.Q(status__in=['call_triggered', 'in_progress']),
+            ),
+            # Due-candidate scan restricted to tasks inside their calling window
+            models.Index(
+                fields=['status', 'next_call', 'eligible_until'],
+                name='calltask_due_window_idx',
+                condition=models.Q(status__in=['waiting', 'scheduled', 'retry']),
+            ),
+            # Per-workspace due scan of the admission claim (oldest first per status)
+            models.Index(
+                fields=['workspace', 'status', 'next_call'],
+                name='calltask_ws_due_idx',
+                condition=models.Q(status__in=['waiting', 'scheduled', 'retry']),
+            ),
+            # Stuck-task reaper scan (oldest active tasks first)
+            models.Index(
+                fields=['status', 'updated_at'],
+                name='calltask_stuck_idx',
+                condition=models.Q(status__in=['call_triggered', 'in_progress']),
+            ),
+            # Incremental due-index reconcile (rows saved since the watermark)
+            models.Index(fields=['updated_at'], name='calltask_updated_idx'),
         ]
     
     def __str__(self):
@@ -2257,6 +2350,33 @@ class CallTask(models.Model):
         return self.attempts < max_retries and self.status in [CallStatus.SCHEDULED, CallStatus.RETRY]
 
 
+class ReapedCallTask(models.Model):
+    """Audit record of a CallTask deleted by the stuck-task reaper"""
+    # Plain ids (no foreign keys) so the record outlives the task, agent and workspace
+    call_task_id = models.UUIDField(help_text="ID of the deleted CallTask")
+    workspace_id = models.UUIDField(help_text="Workspace of the deleted CallTask")
+    agent_id = models.UUIDField(help_text="Agent of the deleted CallTask")
+    status = models.CharField(
+        max_length=20,
+        choices=CallStatus.choices,
+        help_text="Status the task was stuck in"
+    )
+    phone = models.CharField(max_length=20, help_text="Phone number of the task")
+    attempts = models.IntegerField(default=0, help_text="Retry attempts made before it got stuck")
+    stuck_since = models.DateTimeField(help_text="Last update of the task before it was reaped")
+    threshold_minutes = models.IntegerField(help_text="Timeout that applied to the task (minutes)")
+    reaped_at = models.DateTimeField(db_index=True, help_text="When the reaper deleted the task")
+
+    class Meta:
+        ordering = ['-reaped_at']
+        indexes = [
+            models.Index(fields=['workspace_id', 'reaped_at'], name='reapedcalltask_ws_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reaped CallTask {self.call_task_id} ({self.status}, {self.threshold_minutes} min)"
+
+
 # Signal handlers for eager FeatureUsage initialization
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
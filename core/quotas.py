@@ -3,7 +3,15 @@ from django.utils import timezone
 from django.core.cache import cache
 from decimal import Decimal
 import datetime
-from typing import Tuple, Optional
+import logging
+import threading
+import time
+from typing import Dict, Tuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Capacity limits are checked against live entity counts and never recorded
+CAPACITY_FEATURES = ('max_agents', 'max_users')
 
 
 class QuotaExceeded(Exception):
@@ -229,6 +237,93 @@ def get_usage_container(workspace):
     return usage_container
 
 
+# ─────────────────────────────
+# Cached quota context per workspace
+# ─────────────────────────────
+QUOTA_CONTEXT_CACHE_KEY = "quota_context:{workspace_id}"
+
+
+def build_quota_context(workspace) -> dict:
+    """
+    Collect what quota checks need about the workspace's current billing
+    period (creating the usage container and FeatureUsage rows if missing).
+
+    Returns:
+        {
+            'subscription_id', 'plan_id', 'period_start', 'period_end',
+            'usage_container_id', 'extra_call_minutes': Decimal,
+            'features': {feature_name: {'feature_id', 'feature_usage_id', 'limit': Decimal|None}},
+        }
+
+    Raises:
+        WorkspaceSubscription.DoesNotExist: If no active subscription found
+    """
+    from core.models import FeatureUsage, PlanFeature
+
+    usage_container = get_usage_container(workspace)
+    subscription = usage_container.subscription
+    limits = dict(
+        PlanFeature.objects.filter(plan_id=subscription.plan_id).values_list('feature_id', 'limit')
+    )
+    features = {}
+    for feature_usage in FeatureUsage.objects.filter(usage_record=usage_container).select_related('feature'):
+        features[feature_usage.feature.feature_name] = {
+            'feature_id': str(feature_usage.feature_id),
+            'feature_usage_id': str(feature_usage.id),
+            'limit': limits.get(feature_usage.feature_id),
+        }
+
+    return {
+        'subscription_id': str(subscription.id),
+        'plan_id': str(subscription.plan_id),
+        'period_start': usage_container.period_start,
+        'period_end': usage_container.period_end,
+        'usage_container_id': str(usage_container.id),
+        'extra_call_minutes': Decimal(str(getattr(usage_container, 'extra_call_minutes', None) or 0)),
+        'features': features,
+    }
+
+
+def get_quota_context(workspace) -> dict:
+    """
+    Cached build_quota_context(): one cache GET while the billing period it
+    describes is current. Rebuilt at period rollover and after
+    invalidate_quota_context() (subscription, usage container or plan
+    feature changes, see core/signals.py).
+    """
+    from django.conf import settings
+
+    cache_key = QUOTA_CONTEXT_CACHE_KEY.format(workspace_id=workspace.id)
+    now = timezone.now()
+    context = cache.get(cache_key)
+    if context is not None and context['period_end'] > now:
+        return context
+
+    context = build_quota_context(workspace)
+    timeout = min(
+        int(getattr(settings, 'QUOTA_CONTEXT_CACHE_TIMEOUT', 3600)),
+        int((context['period_end'] - now).total_seconds()),
+    )
+    if timeout > 0:
+        cache.set(cache_key, context, timeout=timeout)
+    return context
+
+
+def invalidate_quota_context(workspace_id) -> None:
+    """Drop the cached quota context of one workspace."""
+    cache.delete(QUOTA_CONTEXT_CACHE_KEY.format(workspace_id=workspace_id))
+
+
+def invalidate_quota_context_for_plan(plan_id) -> None:
+    """Drop the cached quota context of every workspace subscribed to a plan."""
+    from core.models import WorkspaceSubscription
+
+    workspace_ids = WorkspaceSubscription.objects.filter(
+        plan_id=plan_id, is_active=True
+    ).values_list('workspace_id', flat=True)
+    cache.delete_many([QUOTA_CONTEXT_CACHE_KEY.format(workspace_id=w) for w in workspace_ids])
+
+
 def enforce_and_record(
     *,
     workspace,
@@ -274,19 +369,27 @@ def enforce_and_record(
     if amount < 0:
         raise ValueError(f"Usage amount must be positive, got {amount}")
     
-    from core.models import EndpointFeature, FeatureUsage
+    from core.models import FeatureUsage
     
-    # Look up route mapping in EndpointFeature
-    mapping = EndpointFeature.objects.select_related("feature").filter(
-        route_name=route_name,
-        http_method=http_method,
-    ).first()
+    # Look up route mapping (process-local EndpointFeature table)
+    feature = endpoint_routes.feature_for(route_name, http_method)
     
-    if not mapping:
+    if feature is None:
         # Route is not metered → free operation
         return
-    
-    feature = mapping.feature
+
+    # Consumption features: lock-free check + increment in Redis, flushed to
+    # FeatureUsage in batches (core.utils.quota_counters)
+    from core.utils.quota_counters import QuotaCounters
+
+    if feature.feature_name not in CAPACITY_FEATURES and QuotaCounters.enabled():
+        try:
+            _enforce_with_counters(workspace, feature, amount)
+            return
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Redis quota counters unavailable, using row lock for {feature.feature_name}: {e}")
     
     with transaction.atomic():
         # Get usage container for current billing period
@@ -335,6 +438,256 @@ def enforce_and_record(
             feature_usage.save(update_fields=["used_amount"])
 
 
+def _counter_entry(workspace, feature) -> Tuple[dict, Optional[Decimal]]:
+    """Quota context entry for `feature` and its effective limit (None = unlimited)."""
+    from core.models import FeatureUsage
+
+    context = get_quota_context(workspace)
+    entry = context['features'].get(feature.feature_name)
+    if entry is None:
+        # Feature outside the plan (unlimited): create its counter row once
+        FeatureUsage.objects.get_or_create(
+            usage_record_id=context['usage_container_id'],
+            feature=feature,
+            defaults={"used_amount": Decimal('0')},
+        )
+        invalidate_quota_context(workspace.id)
+        entry = get_quota_context(workspace)['features'][feature.feature_name]
+
+    limit = entry['limit']
+    if feature.feature_name == 'call_minutes' and limit is not None:
+        limit = limit + context['extra_call_minutes']
+    return entry, limit
+
+
+def _used_loader(entry):
+    """Seed for a counter that does not exist yet: the row's used_amount."""
+    from core.models import FeatureUsage
+
+    def load_used():
+        return FeatureUsage.objects.filter(id=entry['feature_usage_id']).values_list('used_amount', flat=True).first()
+
+    return load_used
+
+
+def _enforce_with_counters(workspace, feature, amount: Decimal, enforce_limit: bool = True) -> None:
+    """Check the plan limit (unless enforce_limit=False) and record `amount` with one Redis Lua call."""
+    from core.utils.quota_counters import QuotaCounters
+
+    entry, limit = _counter_entry(workspace, feature)
+    effective_limit = limit if enforce_limit else None
+
+    recorded, used = QuotaCounters().check_and_record(
+        entry['feature_usage_id'], amount, effective_limit, _used_loader(entry)
+    )
+    if not recorded:
+        raise QuotaExceeded(
+            f"{feature.feature_name}: {used + amount} exceeds plan limit {effective_limit}"
+        )
+
+
+# ─────────────────────────────
+# Call minutes (accumulated, folded in batches)
+# ─────────────────────────────
+CALL_MINUTES_ROUTE = "internal:call_duration_used"
+
+
+def record_call_minutes(workspace, minutes) -> None:
+    """
+    Record minutes consumed by a finished call.
+
+    With CALL_MINUTES_ACCUMULATOR the amount is added to a per-workspace
+    Redis hash and folded into usage by fold_call_minutes(); otherwise (or
+    when Redis fails) it goes through enforce_and_record() right away.
+    """
+    from core.utils.quota_counters import CallMinutesAccumulator
+
+    minutes = Decimal(str(minutes))
+    if minutes <= 0:
+        return
+    if CallMinutesAccumulator.enabled():
+        try:
+            CallMinutesAccumulator().add(workspace.id, minutes)
+            return
+        except Exception as e:
+            logger.warning(f"⚠️ Call minutes accumulator unavailable for workspace {workspace.id}: {e}")
+
+    enforce_and_record(
+        workspace=workspace,
+        route_name=CALL_MINUTES_ROUTE,
+        http_method="POST",
+        amount=minutes,
+    )
+    from core.utils import check_and_notify_minutes_threshold
+    check_and_notify_minutes_threshold(workspace)
+
+
+def fold_call_minutes() -> Dict[str, int]:
+    """
+    Move accumulated call minutes into each workspace's call-minute usage
+    (no limit check, the minutes are already spent) and evaluate the usage
+    threshold notifications once per workspace.
+    """
+    from core.models import FeatureUsage, Workspace
+    from core.utils import check_and_notify_minutes_threshold
+    from core.utils.quota_counters import CallMinutesAccumulator, QuotaCounters
+
+    accumulator = CallMinutesAccumulator()
+    amounts = accumulator.take()
+    counts = {"workspaces": 0, "failed": 0, "dropped": 0}
+    if not amounts:
+        return counts
+
+    try:
+        feature = endpoint_routes.feature_for(CALL_MINUTES_ROUTE, "POST")
+        workspaces = {}
+        if feature is not None:
+            workspaces = {str(pk): w for pk, w in Workspace.objects.in_bulk(list(amounts)).items()}
+    except Exception:
+        # Nothing folded yet: put every amount back for the next run
+        accumulator.restore(amounts)
+        raise
+    if feature is None:
+        # Call minutes are not metered
+        counts["dropped"] = len(amounts)
+        return counts
+
+    for workspace_id, minutes in amounts.items():
+        workspace = workspaces.get(workspace_id)
+        if workspace is None:
+            counts["dropped"] += 1
+            continue
+        try:
+            if minutes <= 0:
+                # Recorded when a reservation was committed; only the threshold check is due
+                pass
+            elif QuotaCounters.enabled():
+                _enforce_with_counters(workspace, feature, minutes, enforce_limit=False)
+            else:
+                with transaction.atomic():
+                    feature_usage, _ = FeatureUsage.objects.get_or_create(
+                        usage_record=get_usage_container(workspace),
+                        feature=feature,
+                        defaults={"used_amount": Decimal('0')},
+                    )
+                    FeatureUsage.objects.filter(id=feature_usage.id).update(
+                        used_amount=models.F("used_amount") + minutes
+                    )
+        except Exception as e:
+            logger.error(f"❌ Folding {minutes} call minutes failed for workspace {workspace_id}: {e}")
+            accumulator.restore({workspace_id: minutes})
+            counts["failed"] += 1
+            continue
+        counts["workspaces"] += 1
+        check_and_notify_minutes_threshold(workspace)
+    return counts
+
+
+# ─────────────────────────────
+# Call minute reservations (dispatch → end_of_call)
+# ─────────────────────────────
+OUTBOUND_CALL_ROUTE = "internal:outbound_call"
+
+
+def reserve_call_minutes(workspace, call_task_id, minutes) -> bool:
+    """
+    Hold the estimated minutes of a call about to be dialed against the
+    workspace's call-minute limit (plus extra minutes bought this period).
+
+    Concurrent dispatches see each other's reservations, so a burst of calls
+    cannot overshoot the plan, and the check is one Redis Lua call instead
+    of a FeatureUsage row lock. The reservation is replaced by the actual
+    minutes in commit_call_minutes() or dropped by release_call_reservations().
+
+    Returns True when a reservation is held, False when call minutes are not
+    metered or QUOTA_REDIS_COUNTERS is off (the plain check on
+    OUTBOUND_CALL_ROUTE runs instead).
+
+    Raises:
+        QuotaExceeded: If used + reserved + minutes exceeds the limit
+    """
+    from django.conf import settings
+    from core.utils.quota_counters import QuotaCounters
+
+    feature = endpoint_routes.feature_for(CALL_MINUTES_ROUTE, "POST")
+    reserving = feature is not None and QuotaCounters.enabled()
+    outbound = endpoint_routes.feature_for(OUTBOUND_CALL_ROUTE, "POST")
+    if outbound is not None and not (reserving and outbound.id == feature.id):
+        # Limits the reservation does not cover keep the status check
+        enforce_and_record(
+            workspace=workspace,
+            route_name=OUTBOUND_CALL_ROUTE,
+            http_method="POST",
+            amount=0,
+        )
+    if not reserving:
+        return False
+
+    minutes = Decimal(str(minutes))
+    entry, limit = _counter_entry(workspace, feature)
+    ttl = int(minutes * 60) + int(getattr(settings, 'QUOTA_RESERVATION_GRACE_SECONDS', 900))
+    reserved, total = QuotaCounters().reserve(
+        entry['feature_usage_id'], call_task_id, minutes, limit, _used_loader(entry), ttl
+    )
+    if not reserved:
+        raise QuotaExceeded(
+            f"{feature.feature_name}: {total + minutes} (incl. in-flight calls) exceeds plan limit {limit}"
+        )
+    return True
+
+
+def commit_call_minutes(workspace, call_task_id, minutes) -> None:
+    """
+    Record the minutes a finished call actually used in place of its
+    reservation. Calls without one (test calls, expired reservations,
+    counters off) go through record_call_minutes().
+    """
+    from core.utils.quota_counters import CallMinutesAccumulator, QuotaCounters
+
+    minutes = Decimal(str(minutes))
+    if call_task_id and QuotaCounters.enabled():
+        try:
+            committed = QuotaCounters().commit_reservation(call_task_id, max(minutes, Decimal('0'))) == 1
+        except Exception as e:
+            logger.warning(f"⚠️ Committing reservation of CallTask {call_task_id} failed: {e}")
+            committed = False
+        if committed:
+            if CallMinutesAccumulator.enabled():
+                # Thresholds are evaluated when the workspace is next folded
+                CallMinutesAccumulator().touch(workspace.id)
+            else:
+                from core.utils import check_and_notify_minutes_threshold
+                check_and_notify_minutes_threshold(workspace)
+            return
+
+    record_call_minutes(workspace, minutes)
+
+
+def release_call_reservations(call_task_ids) -> int:
+    """Drop the reservations of calls that were not placed or will be retried (never raises)."""
+    from core.utils.quota_counters import QuotaCounters
+
+    if not QuotaCounters.enabled():
+        return 0
+    try:
+        return QuotaCounters().release_reservations(call_task_ids)
+    except Exception as e:
+        logger.warning(f"⚠️ Releasing call minute reservations failed: {e}")
+        return 0
+
+
+def _unflushed_usage(feature_usage) -> Decimal:
+    """Usage recorded in Redis but not yet flushed to this FeatureUsage row."""
+    from core.utils.quota_counters import QuotaCounters
+
+    if feature_usage is None or not QuotaCounters.enabled():
+        return Decimal('0')
+    try:
+        return QuotaCounters().pending(feature_usage.id)
+    except Exception:
+        return Decimal('0')
+
+
 def get_feature_usage_status(workspace, feature_name: str) -> dict:
     """
     Get current usage status for a specific feature.
@@ -352,42 +705,12 @@ def get_feature_usage_status(workspace, feature_name: str) -> dict:
             'unlimited': bool
         }
     """
-    from core.models import Feature, FeatureUsage
-    
-    try:
-        feature = Feature.objects.get(feature_name=feature_name)
-        usage_container = get_usage_container(workspace)
-        
-        feature_usage = FeatureUsage.objects.filter(
-            usage_record=usage_container,
-            feature=feature
-        ).first()
-        
-        if not feature_usage:
-            # No usage recorded yet
-            used = Decimal('0')
-        else:
-            used = feature_usage.used_amount
-            
-        # Get limit from plan
-        limit = None
-        if feature_usage:
-            limit = feature_usage.limit
-            
-        remaining = None
-        unlimited = limit is None
-        
-        if not unlimited:
-            remaining = max(limit - used, Decimal('0'))
-            
-        return {
-            'used': used,
-            'limit': limit,
-            'remaining': remaining, 
-            'unlimited': unlimited
-        }
-        
-    except Feature.DoesNotExist:
+    from core.models import FeatureUsage
+    from core.utils.quota_counters import QuotaCounters
+
+    entry = get_quota_context(workspace)['features'].get(feature_name)
+    if entry is None:
+        # Unknown feature or none recorded for this period: nothing used, no limit
         return {
             'used': Decimal('0'),
             'limit': None,
@@ -395,26 +718,122 @@ def get_feature_usage_status(workspace, feature_name: str) -> dict:
             'unlimited': True
         }
 
+    # Redis counter (includes unflushed usage) when seeded, else the row
+    used = None
+    if QuotaCounters.enabled():
+        try:
+            used = QuotaCounters().used(entry['feature_usage_id'])
+        except Exception:
+            used = None
+    if used is None:
+        used = FeatureUsage.objects.filter(
+            id=entry['feature_usage_id']
+        ).values_list('used_amount', flat=True).first() or Decimal('0')
+
+    # Limit from plan
+    limit = entry['limit']
+    remaining = None
+    unlimited = limit is None
+
+    if not unlimited:
+        remaining = max(limit - used, Decimal('0'))
+
+    return {
+        'used': used,
+        'limit': limit,
+        'remaining': remaining,
+        'unlimited': unlimited
+    }
+
+
+class EndpointRouteTable:
+    """
+    Process-local (route_name, http_method) → Feature map compiled from all
+    EndpointFeature rows.
+
+    Lookups are a dict access. At most every ENDPOINT_ROUTE_TABLE_CHECK_SECONDS
+    the table compares its version with the Redis counter bumped by
+    invalidate_endpoint_cache() and recompiles when another process changed
+    a mapping; the process that made the change recompiles right away.
+    """
+
+    VERSION_KEY = "quota:endpoint_features:version"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Optional[Dict[Tuple[str, str], object]] = None
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+
+    def feature_for(self, route_name: str, http_method: str):
+        """Feature metering this route/method, or None when it is free."""
+        return self._current().get((route_name, (http_method or '').upper()))
+
+    def _current(self) -> Dict[Tuple[str, str], object]:
+        from django.conf import settings
+
+        routes = self._routes
+        interval = float(getattr(settings, 'ENDPOINT_ROUTE_TABLE_CHECK_SECONDS', 5))
+        if routes is not None and time.monotonic() - self._checked_at < interval:
+            return routes
+
+        with self._lock:
+            if self._routes is not None and time.monotonic() - self._checked_at < interval:
+                return self._routes
+            # Read the version before compiling so a concurrent bump is never missed
+            version = self._remote_version()
+            if self._routes is None or version is None or version != self._version:
+                self._routes = self._compile()
+                self._version = version
+            self._checked_at = time.monotonic()
+            return self._routes
+
+    @staticmethod
+    def _compile() -> Dict[Tuple[str, str], object]:
+        from core.models import EndpointFeature
+
+        return {
+            (mapping.route_name, mapping.http_method): mapping.feature
+            for mapping in EndpointFeature.objects.select_related('feature')
+        }
+
+    def _remote_version(self) -> Optional[int]:
+        from core.utils.redis_client import get_redis_client
+
+        try:
+            return int(get_redis_client().get(self.VERSION_KEY) or 0)
+        except Exception as e:
+            logger.debug(f"Endpoint route table version unavailable: {e}")
+            return None
+
+    def warm(self) -> None:
+        self._current()
+
+    def invalidate(self) -> None:
+        """Recompile here on next use and make every other process recompile."""
+        from core.utils.redis_client import get_redis_client
+
+        with self._lock:
+            self._routes = None
+        try:
+            get_redis_client().incr(self.VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"⚠️ Endpoint route table version not bumped: {e}")
+
+
+# Global instance
+endpoint_routes = EndpointRouteTable()
+
 
 # Cache invalidation helpers
-def invalidate_endpoint_cache(route_name: str, http_method: str = None):
+def invalidate_endpoint_cache(route_name: str = None, http_method: str = None):
     """
-    Invalidate cache for specific endpoint feature mappings.
-    
-    Args:
-        route_name: Route name to invalidate
-        http_method: Specific method to invalidate, or None for all methods
+    Invalidate the endpoint → feature route table in every process.
+
+    The whole table is recompiled, so route_name/http_method only document
+    which mapping changed.
     """
-    if http_method:
-        cache_key = f"endpoint_feature:{http_method}:{route_name}"
-        cache.delete(cache_key)
-    else:
-        # Invalidate all methods for this route
-        from core.models import HTTPMethod
-        for method_choice in HTTPMethod.choices:
-            method = method_choice[0]
-            cache_key = f"endpoint_feature:{method}:{route_name}"
-            cache.delete(cache_key)
+    endpoint_routes.invalidate()
 
 
 """
@@ -554,7 +973,7 @@ def get_feature_usage_status_readonly(workspace, feature_name: str) -> dict:
                 if not feature_usage:
                     used = Decimal('0')
                 else:
-                    used = feature_usage.used_amount
+                    used = feature_usage.used_amount + _unflushed_usage(feature_usage)
                 
         # FIXED: Always get limit from PlanFeature, not from FeatureUsage
         from core.models import PlanFeature
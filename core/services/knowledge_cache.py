@@ -0,0 +1,213 @@
+"""
+Knowledge Base Text Cache
+
+Two-tier cache for the extracted KB text an agent receives at dial time:
+
+- L1: in-process LRU bounded by a byte budget (KB_CACHE_MAX_BYTES)
+- L2: Redis (`kb:text:<agent_id>:<version>`, TTL KB_CACHE_TTL_SECONDS)
+- Source: the `.txt` written next to the agent's KB PDF in blob storage
+
+Entries are keyed by agent_id plus a KB content version stored in Redis
+(`kb:version:<agent_id>`). Uploading or deleting the KB bumps the version, so
+stale text is never served and old entries simply age out.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from core.utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class KnowledgeDocument:
+    """KB text plus its content address (sha256 of the UTF-8 bytes)."""
+    text: str
+    sha256: str
+    size: int
+
+    @classmethod
+    def from_text(cls, text: str) -> "KnowledgeDocument":
+        raw = (text or "").encode("utf-8")
+        return cls(text=text or "", sha256=hashlib.sha256(raw).hexdigest(), size=len(raw))
+
+
+class KnowledgeTextCache:
+    """
+    Service for caching agent knowledge-base text across calls.
+
+    Features:
+    - Byte-budgeted LRU per process, shared Redis tier across processes
+    - Version-keyed entries; `bump_version()` invalidates everywhere
+    - Hit/miss counters per process, flushed periodically to a Redis hash
+      so cluster-wide totals are available from any process
+    """
+
+    VERSION_KEY = "kb:version:{agent_id}"
+    TEXT_KEY = "kb:text:{agent_id}:{version}"
+    STATS_KEY = "kb:cache:stats"
+    STATS_FLUSH_SECONDS = 10.0
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl_seconds: Optional[int] = None):
+        self.max_bytes = int(max_bytes if max_bytes is not None else getattr(settings, "KB_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+        self.ttl_seconds = int(ttl_seconds if ttl_seconds is not None else getattr(settings, "KB_CACHE_TTL_SECONDS", 24 * 3600))
+        self._lru: "OrderedDict[Tuple[str, str], KnowledgeDocument]" = OrderedDict()
+        self._sizes: Dict[Tuple[str, str], int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+        self._unflushed = dict.fromkeys(self._stats, 0)
+        self._last_flush = time.monotonic()
+
+    # ─────────────────────────────
+    # Versioning
+    # ─────────────────────────────
+    def get_version(self, agent_id: str) -> str:
+        """Current KB version for an agent (initialized on first use)."""
+        redis_client = get_redis_client()
+        key = self.VERSION_KEY.format(agent_id=agent_id)
+        version = redis_client.get(key)
+        if version is None:
+            # Random initial value: never collides with a version cached before a Redis flush
+            redis_client.set(key, uuid.uuid4().hex, nx=True)
+            version = redis_client.get(key)
+        return version.decode() if isinstance(version, bytes) else str(version)
+
+    def bump_version(self, agent_id: str) -> str:
+        """Invalidate the agent's cached KB text in every process."""
+        version = uuid.uuid4().hex
+        get_redis_client().set(self.VERSION_KEY.format(agent_id=agent_id), version)
+        with self._lock:
+            for key in [k for k in self._lru if k[0] == str(agent_id)]:
+                self._drop(key)
+        logger.info(f"KB cache version bumped for agent {agent_id}")
+        return version
+
+    # ─────────────────────────────
+    # Lookup
+    # ─────────────────────────────
+    def get_text(self, agent_id: str, loader: Callable[[], str]) -> str:
+        """Return the agent's KB text, loading it via `loader()` on a full miss."""
+        return self.get_document(agent_id, loader).text
+
+    def get_document(self, agent_id: str, loader: Callable[[], str]) -> KnowledgeDocument:
+        """
+        Return the agent's KB text with its sha256/size, loading it via
+        `loader()` on a full miss.
+
+        Redis errors degrade to calling the loader directly.
+        """
+        agent_id = str(agent_id)
+        try:
+            version = self.get_version(agent_id)
+        except Exception as e:
+            logger.warning(f"KB cache unavailable for agent {agent_id}: {e}")
+            self._count("errors")
+            return KnowledgeDocument.from_text(loader())
+
+        key = (agent_id, version)
+        with self._lock:
+            document = self._lru.get(key)
+            if document is not None:
+                self._lru.move_to_end(key)
+        if document is not None:
+            self._count("l1_hits")
+            return document
+
+        redis_key = self.TEXT_KEY.format(agent_id=agent_id, version=version)
+        try:
+            raw = get_redis_client().get(redis_key)
+        except Exception as e:
+            logger.warning(f"KB cache L2 read failed for agent {agent_id}: {e}")
+            self._count("errors")
+            raw = None
+
+        if raw is not None:
+            text = raw.decode("utf-8")
+            self._count("l2_hits")
+        else:
+            text = loader() or ""
+            self._count("misses")
+            try:
+                get_redis_client().set(redis_key, text.encode("utf-8"), ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"KB cache L2 write failed for agent {agent_id}: {e}")
+                self._count("errors")
+
+        # Hash once per process and version; every later call reuses it
+        document = KnowledgeDocument.from_text(text)
+        self._store(key, document)
+        return document
+
+    # ─────────────────────────────
+    # L1 bookkeeping
+    # ─────────────────────────────
+    def _store(self, key: Tuple[str, str], document: KnowledgeDocument) -> None:
+        size = document.size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._lru:
+                self._drop(key)
+            self._lru[key] = document
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._lru:
+                self._drop(next(iter(self._lru)))
+                self._stats["evictions"] += 1
+                self._unflushed["evictions"] += 1
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        self._lru.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+
+    # ─────────────────────────────
+    # Metrics
+    # ─────────────────────────────
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+            self._unflushed[name] += 1
+            due = time.monotonic() - self._last_flush >= self.STATS_FLUSH_SECONDS
+            if due:
+                deltas, self._unflushed = self._unflushed, dict.fromkeys(self._stats, 0)
+                self._last_flush = time.monotonic()
+        if due:
+            try:
+                pipe = get_redis_client().pipeline(transaction=False)
+                for field, delta in deltas.items():
+                    if delta:
+                        pipe.hincrby(self.STATS_KEY, field, delta)
+                pipe.execute()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, object]:
+        """Process-local counters plus cluster-wide totals from Redis."""
+        with self._lock:
+            local = dict(self._stats)
+            local.update({"l1_entries": len(self._lru), "l1_bytes": self._bytes, "l1_max_bytes": self.max_bytes})
+        lookups = local["l1_hits"] + local["l2_hits"] + local["misses"]
+        local["hit_ratio"] = round((local["l1_hits"] + local["l2_hits"]) / lookups, 4) if lookups else None
+
+        cluster: Dict[str, int] = {}
+        try:
+            raw = get_redis_client().hgetall(self.STATS_KEY)
+            cluster = {
+                (k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()
+            }
+        except Exception:
+            pass
+        return {"process": local, "cluster": cluster}
+
+
+# Global service instance
+knowledge_cache = KnowledgeTextCache()
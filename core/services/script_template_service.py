@@ -5,9 +5,15 @@ This service handles dynamic Jinja2 template rendering for agent script template
 It merges lead core fields (name, surname, email, phone) with custom variables
 from the lead.variables JSONField to create a comprehensive template context.
 """
+import hashlib
 import logging
-from typing import Dict, Any, Optional
-from jinja2 import Environment, Template
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional
+from django.conf import settings
+from jinja2 import Template
+from jinja2.sandbox import SandboxedEnvironment
 
 logger = logging.getLogger(__name__)
 
@@ -18,17 +24,53 @@ class ScriptTemplateService:
     
     Features:
     - Secure sandboxed Jinja2 environment to prevent code injection
+    - Bounded LRU of compiled templates keyed by template hash, so identical
+      agent templates are parsed and compiled once per process
+    - Batch rendering (`render_many`) for bulk paths and previews
     - Merges lead core fields with custom variables
     - Graceful error handling with fallback to original template
     - Comprehensive logging for debugging
     """
     
-    def __init__(self):
-        """Initialize the Jinja2 environment."""
-        # Use basic Environment with default undefined behavior
-        self.jinja_env = Environment(
+    def __init__(self, cache_size: Optional[int] = None):
+        """Initialize the Jinja2 environment and the compiled template cache."""
+        # Sandboxed: templates are user-authored, attribute access is restricted
+        self.jinja_env = SandboxedEnvironment(
             autoescape=False,  # Don't HTML-escape since this is for voice scripts
         )
+        self.cache_size = int(
+            cache_size if cache_size is not None else getattr(settings, "SCRIPT_TEMPLATE_CACHE_SIZE", 512)
+        )
+        self._templates: "OrderedDict[bytes, Template]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def get_template(self, script_template: str) -> Template:
+        """Compiled template for `script_template`, served from the LRU when possible."""
+        key = hashlib.sha1(script_template.encode("utf-8")).digest()
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.cache_hits += 1
+                return template
+
+        # Compile outside the lock; a concurrent duplicate compile is harmless
+        template = self.jinja_env.from_string(script_template)
+        with self._lock:
+            self.cache_misses += 1
+            self._templates[key] = template
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.cache_size:
+                self._templates.popitem(last=False)
+        return template
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._templates.clear()
+            self.cache_hits = 0
+            self.cache_misses = 0
     
     def render_script_template(
         self, 
@@ -45,8 +87,40 @@ class ScriptTemplateService:
         if not lead_data:
             return script_template
         
-        template = self.jinja_env.from_string(script_template)
+        template = self.get_template(script_template)
         return template.render(**lead_data)
+
+    def render_many(
+        self,
+        script_template: str,
+        contexts: Iterable[Optional[Dict[str, Any]]],
+    ) -> List[str]:
+        """
+        Render one template against many contexts (bulk scheduling, previews).
+
+        The template is compiled (or fetched from the cache) once. Empty
+        contexts yield the original template, like `render_script_template`;
+        a context that fails to render falls back to the original template.
+        """
+        contexts = list(contexts)
+        if not script_template:
+            return ["" for _ in contexts]
+
+        template = self.get_template(script_template)
+        rendered = []
+        for context in contexts:
+            if not context:
+                rendered.append(script_template)
+                continue
+            try:
+                rendered.append(template.render(**context))
+            except Exception as e:
+                logger.warning(
+                    "Error rendering script template in batch",
+                    extra={"error": str(e), "error_type": type(e).__name__},
+                )
+                rendered.append(script_template)
+        return rendered
     
     def merge_lead_context(self, lead) -> Dict[str, Any]:
         """
@@ -201,6 +275,82 @@ class ScriptTemplateService:
             # Fallback to original template on any error
             return script_template
     
+    def render_scripts_for_target_ref(self, script_templates: List[str], target_ref: str) -> List[str]:
+        """
+        Render several templates (e.g. script + greeting) for one target_ref,
+        resolving the target context once instead of once per template.
+        Each template falls back to its original text on error.
+        """
+        if not target_ref:
+            return [t or "" for t in script_templates]
+
+        context = self.create_context_from_target_ref(target_ref)
+        rendered = []
+        for script_template in script_templates:
+            if not script_template or not isinstance(script_template, str):
+                rendered.append(script_template or "")
+                continue
+            try:
+                rendered.append(self.render_script_template(script_template, context))
+            except Exception as e:
+                logger.error(
+                    "Error rendering script template for target_ref",
+                    extra={
+                        "target_ref": target_ref,
+                        "error": str(e),
+                        "error_type": type(e).__name__,
+                        "template_length": len(script_template)
+                    },
+                    exc_info=True
+                )
+                rendered.append(script_template)
+        return rendered
+
+    def contexts_for_target_refs(
+        self, target_refs: Iterable[str], leads: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Batch variant of `create_context_from_target_ref` for many CallTasks.
+
+        Leads passed in `leads` (id → Lead, e.g. from select_related) are
+        used as is; the remaining leads and test users are loaded with one
+        query each. Unresolvable targets map to an empty context, which
+        renders the original template like the single-target path.
+        """
+        from core.models import Lead, User
+        from core.utils.calltask_utils import parse_target_ref
+
+        leads = dict(leads or {})
+        parsed: Dict[str, tuple] = {}
+        for target_ref in dict.fromkeys(t for t in target_refs if t):
+            scheme, value = parse_target_ref(target_ref)
+            try:
+                parsed[target_ref] = (scheme, str(uuid.UUID(value)))
+            except (TypeError, ValueError):
+                parsed[target_ref] = (None, None)
+
+        missing_leads = {value for scheme, value in parsed.values() if scheme == "lead" and value not in leads}
+        if missing_leads:
+            leads.update({str(lead.id): lead for lead in Lead.objects.filter(id__in=missing_leads)})
+        user_ids = {value for scheme, value in parsed.values() if scheme == "test_user"}
+        users = {str(user.id): user for user in User.objects.filter(id__in=user_ids)} if user_ids else {}
+
+        contexts: Dict[str, Dict[str, Any]] = {}
+        for target_ref, (scheme, value) in parsed.items():
+            if scheme == "lead" and value in leads and leads[value].phone:
+                contexts[target_ref] = self.merge_lead_context(leads[value])
+            elif scheme == "test_user" and value in users and getattr(users[value], "phone", None):
+                user = users[value]
+                contexts[target_ref] = {
+                    "name": getattr(user, 'first_name', '') or '',
+                    "surname": getattr(user, 'last_name', '') or '',
+                    "email": getattr(user, 'email', '') or '',
+                    "phone": user.phone,
+                }
+            else:
+                contexts[target_ref] = {}
+        return contexts
+
     def create_context_from_target_ref(self, target_ref: str) -> Dict[str, Any]:
         """
         Resolve target_ref to template context using resolve_call_target utility.
@@ -1,12 +1,23 @@
-from django.db.models.signals import post_delete, post_save, pre_delete
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
 from core.models import (
+    Agent,
+    CallLog,
+    CallTask,
+    PhoneNumber,
+    SIPTrunk,
+    Voice,
+    Workspace,
     SubAccount,
     GoogleSubAccount,
     OutlookSubAccount,
     Calendar,
     EventType,
+    PlanFeature,
+    WorkspaceSubscription,
+    WorkspaceUsage,
 )
 
 
@@ -107,3 +118,199 @@ def delete_orphan_eventtypes_after_subaccount_delete(sender, instance: SubAccoun
         pass
 
 
+
+
+@receiver(post_delete, sender=CallTask)
+def release_admission_on_calltask_delete(sender, instance: CallTask, **kwargs):
+    """
+    Free the task's concurrency slot whenever a CallTask is deleted (success
+    feedback, max retries, quota exceeded, stuck-task cleanup); the release
+    is keyed by task id, so tasks that were never admitted are a no-op.
+    The phone only leaves the active-phone set when the deleted task itself
+    was on a call: a pending sibling of an active task must not free it.
+    """
+    try:
+        from core.telephony.services.admission import release_admission
+        release_admission(instance.id)
+    except Exception:
+        pass
+    try:
+        from core.telephony.repositories.call_repo import ACTIVE_STATUSES
+        from core.telephony.services.active_phones import release_active_phone
+        if str(instance.status) in {str(s) for s in ACTIVE_STATUSES}:
+            release_active_phone(instance.phone)
+    except Exception:
+        pass
+
+
+def _invalidate_dispatch_snapshots(agent_ids):
+    try:
+        from core.telephony.services.dispatch_snapshot import dispatch_snapshots
+        dispatch_snapshots.invalidate(agent_ids)
+    except Exception:
+        pass
+
+
+@receiver(post_save, sender=Agent)
+def refresh_dispatch_snapshot_on_agent_save(sender, instance: Agent, **kwargs):
+    _invalidate_dispatch_snapshots([instance.agent_id])
+
+
+@receiver(post_save, sender=Agent)
+def invalidate_dial_calendar_on_agent_save(sender, instance: Agent, **kwargs):
+    from core.utils.dial_calendar import invalidate_dial_calendar
+    invalidate_dial_calendar(instance.agent_id)
+
+
+_DIAL_HOURS_FIELDS = Agent.DIAL_HOURS_FIELDS
+# CallTask fields whose change moves the task's dialing window
+_CALL_TASK_WINDOW_FIELDS = {"next_call", "agent", "agent_id"}
+
+
+@receiver(pre_save, sender=Agent)
+def detect_dial_hours_change(sender, instance: Agent, update_fields=None, **kwargs):
+    if instance._state.adding:
+        instance._dial_hours_changed = True
+        return
+    if update_fields is not None and not set(update_fields) & set(_DIAL_HOURS_FIELDS):
+        instance._dial_hours_changed = False
+        return
+    previous = getattr(instance, "_loaded_dial_hours", None)
+    if previous is None or len(previous) != len(_DIAL_HOURS_FIELDS):
+        # Built by hand or loaded with deferred hours: read them once
+        previous = Agent.objects.filter(agent_id=instance.agent_id).values(*_DIAL_HOURS_FIELDS).first()
+    instance._dial_hours_changed = previous is None or any(
+        str(previous[f]) != str(getattr(instance, f)) for f in _DIAL_HOURS_FIELDS
+    )
+
+
+@receiver(post_save, sender=Agent)
+def refresh_dial_window_on_agent_save(sender, instance: Agent, **kwargs):
+    """
+    Recompute the agent's open flag right away when its hours change and
+    let refresh_dial_windows re-derive the windows of its pending tasks.
+    """
+    if not getattr(instance, "_dial_hours_changed", False):
+        return
+    instance._loaded_dial_hours = {f: getattr(instance, f) for f in _DIAL_HOURS_FIELDS}
+    try:
+        from django.utils import timezone
+        from core.telephony.repositories.call_repo import SCHEDULABLE_STATUSES
+        from core.utils.dial_calendar import dial_calendar_for
+
+        open_now, changes_at = dial_calendar_for(instance).next_change(timezone.now())
+        Agent.objects.filter(agent_id=instance.agent_id).update(
+            dial_window_open=open_now, dial_window_changes_at=changes_at
+        )
+        CallTask.objects.filter(
+            agent_id=instance.agent_id, status__in=[str(s) for s in SCHEDULABLE_STATUSES]
+        ).update(eligible_from=None, eligible_until=None)
+    except Exception:
+        pass
+
+
+@receiver(pre_save, sender=CallTask)
+def fill_call_task_dial_window(sender, instance: CallTask, update_fields=None, **kwargs):
+    """
+    Keep eligible_from/eligible_until in step with next_call. Saves that
+    name update_fields without a scheduling field are skipped; the agent's
+    hours come from the cached `instance.agent` when the caller loaded it,
+    otherwise from a narrow read of just those columns.
+    """
+    if update_fields is not None and not set(update_fields) & _CALL_TASK_WINDOW_FIELDS:
+        return
+    try:
+        from core.telephony.services.dial_windows import call_task_window
+        if instance.next_call is None or instance.agent_id is None:
+            instance.eligible_from = instance.eligible_until = None
+            return
+        agent_field = CallTask._meta.get_field("agent")
+        if agent_field.is_cached(instance):
+            agent = instance.agent
+        else:
+            agent = Agent.objects.only("agent_id", *_DIAL_HOURS_FIELDS).get(agent_id=instance.agent_id)
+        instance.eligible_from, instance.eligible_until = call_task_window(agent, instance.next_call)
+    except Exception:
+        instance.eligible_from = instance.eligible_until = None
+
+
+@receiver(post_delete, sender=Agent)
+def drop_dispatch_snapshot_on_agent_delete(sender, instance: Agent, **kwargs):
+    try:
+        from core.telephony.services.dispatch_snapshot import dispatch_snapshots
+        dispatch_snapshots.drop(instance.agent_id)
+    except Exception:
+        pass
+
+
+@receiver(post_save, sender=PhoneNumber)
+def refresh_dispatch_snapshots_on_phone_number_save(sender, instance: PhoneNumber, **kwargs):
+    _invalidate_dispatch_snapshots(
+        Agent.objects.filter(phone_number=instance).values_list('agent_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=SIPTrunk)
+def refresh_dispatch_snapshots_on_sip_trunk_save(sender, instance: SIPTrunk, **kwargs):
+    _invalidate_dispatch_snapshots(
+        Agent.objects.filter(phone_number__sip_trunk=instance).values_list('agent_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Voice)
+def refresh_dispatch_snapshots_on_voice_save(sender, instance: Voice, **kwargs):
+    _invalidate_dispatch_snapshots(
+        Agent.objects.filter(voice=instance).values_list('agent_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Workspace)
+def refresh_dispatch_snapshots_on_workspace_save(sender, instance: Workspace, created, **kwargs):
+    if created:
+        return
+    _invalidate_dispatch_snapshots(
+        Agent.objects.filter(workspace=instance).values_list('agent_id', flat=True)
+    )
+
+
+@receiver(pre_delete, sender=EventType)
+def refresh_dispatch_snapshots_on_event_type_delete(sender, instance: EventType, **kwargs):
+    # Agent.event_type is SET_NULL: the cascade is a queryset update that sends no Agent post_save
+    _invalidate_dispatch_snapshots(
+        Agent.objects.filter(event_type=instance).values_list('agent_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=CallLog)
+def update_pacing_on_call_log(sender, instance: CallLog, created, **kwargs):
+    """Fold each new CallLog into the rolling answer-rate / handle-time estimates."""
+    if not created:
+        return
+    try:
+        from core.telephony.services.pacing import record_call_log_outcome
+        transaction.on_commit(lambda: record_call_log_outcome(instance))
+    except Exception:
+        pass
+
+
+# Cached quota context (core.quotas.get_quota_context): subscription, usage
+# container (extra minutes) and plan limit changes rebuild it on next use
+@receiver(post_save, sender=WorkspaceSubscription)
+@receiver(post_delete, sender=WorkspaceSubscription)
+@receiver(post_save, sender=WorkspaceUsage)
+def invalidate_quota_context_on_subscription_change(sender, instance, **kwargs):
+    try:
+        from core.quotas import invalidate_quota_context
+        invalidate_quota_context(instance.workspace_id)
+    except Exception:
+        pass
+
+
+@receiver(post_save, sender=PlanFeature)
+@receiver(post_delete, sender=PlanFeature)
+def invalidate_quota_context_on_plan_feature_change(sender, instance: PlanFeature, **kwargs):
+    try:
+        from core.quotas import invalidate_quota_context_for_plan
+        invalidate_quota_context_for_plan(instance.plan_id)
+    except Exception:
+        pass
@@ -7,9 +7,9 @@ Key improvements
     `schedule_agent_call` task body runs anywhere in the cluster.
 2.  **SingletonTask** base class adds a second layer of protection:
     if the Redis lock somehow fails, the Celery task itself cannot overlap.
-3.  **Atomic jerk‑off**: a single `UPDATE … WHERE id=? AND status IN (…)`
-    changes a CallTask's status to `CALL_TRIGGERED`.  If the row was already
-    touched, the update count is 0 and we do *not* fire `trigger_call.delay`.
+3.  **Atomic batch claim**: a single `UPDATE … FROM (SELECT … FOR UPDATE
+    SKIP LOCKED)` promotes a whole batch of due CallTasks to `CALL_TRIGGERED`
+    and returns their IDs.  Only returned IDs get a `trigger_call.delay`.
 4.  **No silent falls‑through** – every failure path is logged and returned.
 5.  The original hefty `select_for_update()` blocks are kept **inside**
     `trigger_call` (where they belong) so call‑level race conditions are still
@@ -24,8 +24,6 @@ from datetime import timedelta
 import redis
 from celery import Task, shared_task
 from django.conf import settings
-from django.db import transaction
-from django.db.models import Case, IntegerField, When
 from django.utils import timezone
 # Token import removed - no longer using DRF token authentication
 
@@ -120,225 +118,71 @@ def trigger_call(self, call_task_id):
       5. • If call launch succeeds → keep IN_PROGRESS (do NOT change status).
          • If call launch fails     → RETRY / WAITING logic.
       6. External webhook / feedback loop will delete or close the task.
-    """
-    # Function-level imports (avoid inner-block imports; still avoids module-level cycles)
-    from core.models import CallTask, CallStatus
-    from core.utils.calltask_utils import (
-        handle_max_retries,
-        handle_call_success,
-        handle_call_failure,
-    )
-    from core.quotas import enforce_and_record, QuotaExceeded
 
-    try:
-        call_task = CallTask.objects.get(id=call_task_id)
-    except CallTask.DoesNotExist:
-        logger.error(f"❌ CallTask {call_task_id} vanished before trigger.")
-        return {"success": False, "error": "calltask_missing", "id": call_task_id}
-
-    # Guard‑rail: only proceed if it is *still* CALL_TRIGGERED
-    if call_task.status != CallStatus.CALL_TRIGGERED:
-        logger.warning(
-            f"⚠️ trigger_call: task {call_task_id} in status {call_task.status}; abort."
-        )
-        return {"success": False, "reason": "stale_trigger", "status": call_task.status}
+    Steps 1–3 and 5 live in DialerService so the long-lived `run_dialer`
+    worker follows exactly the same path.
+    """
+    from core.telephony.services.dialer_service import DialerService
 
-    # Entire call‑init phase wrapped in a DB transaction for safety
+    dialer_service = DialerService(logger)
     try:
-        with transaction.atomic():
-            # Lock *this* row – prevents double‑processing by a rogue duplicate trigger
-            call_task = CallTask.objects.select_for_update().get(id=call_task_id)
-
-            if call_task.status != CallStatus.CALL_TRIGGERED:
-                return {
-                    "success": False,
-                    "reason": "status_changed_inside_tx",
-                    "status": call_task.status,
-                }
-
-            # EARLY MAX-RETRIES GUARD (no defaults; uses agent config)
-            if handle_max_retries(call_task):
-                return {
-                    "success": False,
-                    "call_task_id": call_task_id,
-                    "message": "Max retries reached - task deleted before dispatch",
-                    "deleted": True,
-                }
-
-            # Do not move to IN_PROGRESS yet. Only mark IN_PROGRESS after a successful
-            # call dispatch; leave as CALL_TRIGGERED until then.
-            call_task.save(update_fields=["updated_at"])  # just touch timestamp
-
-        # Extract all payload *outside* the lock
-        agent = call_task.agent
-        workspace = call_task.workspace
-        lead = call_task.lead
-
-        # Get SIP trunk ID from agent's phone number (required)
-        phone_obj = getattr(agent, "phone_number", None)
-        sip_trunk = getattr(phone_obj, "sip_trunk", None)
-        sip_trunk_id = getattr(sip_trunk, "livekit_trunk_id", None)
-
-        # DYNAMIC TEMPLATE RENDERING: Render script_template and greeting_outbound with target_ref data
-        raw_script_template = getattr(agent, "script_template", "")
-        raw_greeting_outbound = getattr(agent, "greeting_outbound", "")
-        raw_greeting_inbound = getattr(agent, "greeting_inbound", "")
-        from core.services.script_template_service import script_template_service
-        
-        rendered_script = script_template_service.render_script_for_target_ref(
-            raw_script_template, call_task.target_ref
-        )
-        rendered_greeting_outbound = script_template_service.render_script_for_target_ref(
-            raw_greeting_outbound, call_task.target_ref
-        )
-        
-        logger.info(f" rendered script and greeting outbound': {raw_script_template} \n {raw_greeting_outbound}")
-       
-
-        agent_config = {
-            "name": agent.name,
-            "agent_id": str(agent.agent_id),
-            "voice_external_id": (agent.voice.voice_external_id if agent.voice else None),
-            "language": agent.language,
-            # RENDERED script template (dynamically generated with lead data)
-            "script_template": rendered_script,
-            "greeting_outbound": rendered_greeting_outbound,
-            "greeting_inbound": raw_greeting_inbound,
-            "character": agent.character,
-            # Provide max duration to agent runtime; convert minutes→seconds downstream
-            "max_call_duration_minutes": agent.max_call_duration_minutes,
-            "workspace_name": workspace.workspace_name,
-            "sip_trunk_id": sip_trunk_id,  # Pass dynamic trunk ID
-            # Pass booking identifiers
-            "workspace_id": str(workspace.id),
-            "event_type_id": (str(agent.event_type_id) if getattr(agent, 'event_type_id', None) else None),
-        }
-        
-        # Add knowledge document ID if agent has kb_pdf
-        if agent.kb_pdf:
-            import os
-            import uuid
-            kb_filename = os.path.basename(agent.kb_pdf.name)
-            doc_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"kb/{agent.agent_id}/{kb_filename}"))
-            agent_config["knowledge_documents"] = [doc_id]
-            logger.info(f"🧠 KNOWLEDGE DOCUMENT AVAILABLE - doc_id: {doc_id}, filename: {kb_filename}")
-        else:
-            logger.info(f"TASKS NO AGENT KB_PDF")
-
-        if agent.send_document:
-            agent_config["send_document"] = True
-            logger.info("SEND DOCUMENT AVAILABLE")
-        
-        # DEBUG: Log what we're passing to the dialer service
-        logger.info(f"🚀 PASSING TO DIALER SERVICE - agent_config script_template: {agent_config['script_template'][:200]}...")
-        logger.info(f"🚀 PASSING TO DIALER SERVICE - agent_config greeting_outbound: {agent_config['greeting_outbound'][:100]}...")
-        if lead is not None:
-            lead_data = {
-                "id": str(lead.id),
-                "name": lead.name,
-                "surname": lead.surname,
-                "email": lead.email,
-                "phone": lead.phone,
-                "call_task_id": str(call_task.id),
-            }
-        else:
-            # Test call: only pass minimal, non-fallback data
-            lead_data = {
-                "id": str(call_task.id),
-                "phone": call_task.phone,
-                "call_task_id": str(call_task.id),
-            }
-
-        # Require an agent phone number (no env fallback)
-        phone_obj = getattr(agent, "phone_number", None)
-        from_number = getattr(phone_obj, "phonenumber", None)
-
-        # 🎯 QUOTA ENFORCEMENT: Skip quotas for test calls (lead is null)
-        if lead is not None:
-            # Only enforce quotas for real calls with leads
-            try:
-                # Check quota without recording usage (amount=0)
-                enforce_and_record(
-                    workspace=workspace,
-                    route_name="internal:outbound_call",
-                    http_method="POST",
-                    amount=0,  # Just check status, don't pre-charge
-                )
-
-            except QuotaExceeded as quota_err:
-                logger.warning(
-                    f"🚫 Call quota exceeded for workspace {workspace.id}: {quota_err}"
-                )
-                # DELETE this call task - quota exceeded
-                with transaction.atomic():
-                    call_task = CallTask.objects.select_for_update().get(
-                        id=call_task_id
-                    )
-                    call_task.delete()
-                return {
-                    "success": False,
-                    "call_task_id": call_task_id,
-                    "error": "quota_exceeded",
-                    "message": f"Call task deleted - {quota_err}",
-                }
-            except Exception as quota_err:
-                # Log error but don't block the call on quota system failures
-                logger.error(
-                    f"⚠️ Quota check failed for workspace {workspace.id}: {quota_err}"
-                )
-                # Allow call to proceed
-        else:
-            # Test call (lead is null) - skip quota enforcement
-            logger.info(
-                f"🧪 Test call detected (lead is null) - skipping quota enforcement for workspace {workspace.id}"
-            )
+        prepared, early_result = dialer_service.prepare_dispatch(call_task_id)
+        if early_result is not None:
+            return early_result
 
         logger.info("Placing Call now, tasks.py")
 
         # 🚀 Quota OK - Place the outbound call via DialerService
-        from core.telephony.services.dialer_service import DialerService
-        dialer_service = DialerService(logger)
         service_result = dialer_service.place_call_now(
-            call_task_id=str(call_task.id),
-            sip_trunk_id=sip_trunk_id,
-            agent_config=agent_config,
-            lead_data=lead_data,
-            from_number=from_number,
+            call_task_id=prepared.call_task_id,
+            sip_trunk_id=prepared.sip_trunk_id,
+            agent_config=prepared.agent_config,
+            lead_data=prepared.lead_data,
+            from_number=prepared.from_number,
+            rate_limit=prepared.rate_limit,
+            trunk_pk=prepared.trunk_pk,
+            timer=prepared.timer,
         )
 
         # Shape a response for Celery task; statuses are handled inside the service
-        if service_result.success:
-            result_payload = {
-                "success": True,
-                "room_name": service_result.room_name,
-                "dispatch_id": service_result.dispatch_id,
-                "participant_id": service_result.participant_id,
-                "sip_call_id": service_result.sip_call_id,
-            }
-            with transaction.atomic():
-                call_task = CallTask.objects.select_for_update().get(id=call_task_id)
-                return handle_call_success(call_task, result_payload)
-        else:
-            with transaction.atomic():
-                call_task = CallTask.objects.select_for_update().get(id=call_task_id)
-                return handle_call_failure(
-                    call_task,
-                    service_result.error,
-                    service_result.abort_reason or "failed",
-                )
+        return dialer_service.finalize_dispatch(call_task_id, service_result)
 
     except Exception as err:
         logger.error(f"❌ trigger_call exception for {call_task_id}: {err}")
         traceback.print_exc()
-        # Reschedule without increment; early max-retries guard will handle deletion on next cycle
-        try:
-            with transaction.atomic():
-                call_task = CallTask.objects.select_for_update().get(id=call_task_id)
-                result = handle_call_failure(call_task, str(err), "trigger_exception")
-                return result
-        except Exception:
-            pass
-        return {"success": False, "error": str(err), "call_task_id": call_task_id}
+        return dialer_service.handle_dispatch_exception(call_task_id, err)
+
+
+@shared_task(bind=True, name="core.tasks.trigger_call_batch")
+def trigger_call_batch(self, call_task_ids):
+    """
+    Dispatch a whole claimed batch in one task (DIALER_MODE="batch").
+
+    Same guards and bookkeeping as `trigger_call`, but one locking query,
+    one quota check per workspace, concurrent LiveKit calls on one pooled
+    client and one bulk write-back (see BatchDispatcher).
+    """
+    from core.telephony.services.batch_dialer import BatchDispatcher
+    from core.telephony.services.dialer_service import DialerService
+
+    dispatcher = BatchDispatcher(logger)
+    try:
+        return dispatcher.run(call_task_ids)
+
+    except Exception as err:
+        logger.error(f"❌ trigger_call_batch exception for {len(call_task_ids)} tasks: {err}")
+        traceback.print_exc()
+        # Reschedule (no attempt increment) only tasks this run owns whose call was
+        # not placed; placed ones were moved to IN_PROGRESS by the dispatcher
+        from core.models import CallStatus, CallTask
+
+        dialer_service = DialerService(logger)
+        stuck = CallTask.objects.filter(
+            id__in=dispatcher.unplaced(call_task_ids), status=CallStatus.CALL_TRIGGERED
+        ).values_list("id", flat=True)
+        for call_task_id in stuck:
+            dialer_service.handle_dispatch_exception(str(call_task_id), err)
+        return {"success": False, "error": str(err), "requested": len(call_task_ids)}
 
 
 # ─────────────────────────────
@@ -357,12 +201,19 @@ def schedule_agent_call(self):
     Runs every few seconds.  Promotes ready CallTasks → CALL_TRIGGERED and
     fires `trigger_call.delay()` **only** when the promotion succeeded.
 
+    With SCHEDULER_MODE="sharded" this task is a no-op: `run_scheduler`
+    instances split the CallTask table into workspace hash shards instead.
+
     Fully protected by:
         • SingletonTask (task level)
         • Redis lock (cluster level)
-        • Atomic UPDATE (row level)
+        • Set-based UPDATE with SKIP LOCKED (row level)
     """
 
+    # Sharded mode: long-running `run_scheduler` instances own the work
+    if getattr(settings, "SCHEDULER_MODE", "singleton") == "sharded":
+        return {"success": True, "skipped": "sharded_mode"}
+
     # ② cluster‑wide Redis lock (belt‑and‑braces)
     redis_lock_key = "lock:schedule_agent_call_body"
     redis_lock_ttl = 90
@@ -371,104 +222,10 @@ def schedule_agent_call(self):
         logger.warning("🛑 schedule_agent_call body already running elsewhere.")
         return {"success": False, "error": "body_lock_busy"}
 
-    from core.models import CallTask, CallStatus  # local import
+    from core.telephony.services.scheduler_service import SchedulerService
 
     try:
-        now = timezone.now()
-
-        total_concurrency = 100  # Default concurrency limit
-        concurrency_limit = max(
-            total_concurrency, 1
-        )  # At least 1 to prevent division by zero
-
-        in_progress = CallTask.objects.filter(status=CallStatus.IN_PROGRESS).count()
-        call_triggered_cnt = CallTask.objects.filter(status=CallStatus.CALL_TRIGGERED).count()
-        available_slots = max(concurrency_limit - (in_progress + call_triggered_cnt), 0)
-
-        if available_slots == 0:
-            return {
-                "success": True,
-                "message": "No capacity; skipping.",
-                "in_progress": in_progress,
-                "call_triggered": call_triggered_cnt,
-                "limit": concurrency_limit,
-            }
-
-        # Pull candidate tasks (order: WAITING, SCHEDULED, RETRY, by next_call)
-        candidates = (
-            CallTask.objects.filter(
-                next_call__lte=now,
-                status__in=[
-                    CallStatus.WAITING,
-                    CallStatus.SCHEDULED,
-                    CallStatus.RETRY,
-                ],
-                agent__status="active",
-            )
-            .select_related("agent", "agent__phone_number", "agent__phone_number__sip_trunk", "workspace")
-            .annotate(
-                priority=Case(
-                    When(status=CallStatus.WAITING, then=1),
-                    When(status=CallStatus.SCHEDULED, then=2),
-                    When(status=CallStatus.RETRY, then=3),
-                    default=4,
-                    output_field=IntegerField(),
-                )
-            )
-            .order_by("priority", "next_call")[
-                : available_slots * 2
-            ]  # over‑fetch a bit
-        )
-
-        triggered_ids = []
-        for task in candidates:
-            # Phone‑conflict check
-            conflict = CallTask.objects.filter(
-                phone=task.phone,
-                status__in=[CallStatus.IN_PROGRESS, CallStatus.CALL_TRIGGERED],
-            ).exclude(id=task.id)
-            if conflict.exists():
-                continue
-
-            # Pre‑promotion config preflight via utils
-            try:
-                from core.utils.calltask_utils import preflight_dispatch_config
-                with transaction.atomic():
-                    ct = CallTask.objects.select_for_update().get(id=task.id)
-                    pre = preflight_dispatch_config(ct)
-                if not pre.get("ok"):
-                    continue
-            except Exception as preflight_err:
-                logger.error(f"⚠️ Pre-promotion preflight failed for task {task.id}: {preflight_err}")
-                continue
-
-            # ③ atomic hand‑off
-            rows_updated = CallTask.objects.filter(
-                id=task.id,
-                status__in=[
-                    CallStatus.WAITING,
-                    CallStatus.SCHEDULED,
-                    CallStatus.RETRY,
-                ],
-                next_call__lte=now,
-                updated_at=task.updated_at,
-            ).update(status=CallStatus.CALL_TRIGGERED, updated_at=now)
-            if rows_updated == 1:
-                trigger_call.delay(str(task.id))
-                triggered_ids.append(str(task.id))
-                if len(triggered_ids) >= available_slots:
-                    break  # we filled the capacity
-
-        return {
-            "success": True,
-            "triggered": len(triggered_ids),
-            "task_ids": triggered_ids,
-            "available_slots": available_slots,
-            "in_progress": in_progress,
-            "call_triggered": call_triggered_cnt,
-            "concurrency_limit": concurrency_limit,
-            "timestamp": now.isoformat(),
-        }
+        return SchedulerService(logger).run_tick()
 
     except Exception as e:
         logger.error(f"❌ schedule_agent_call failed: {e}")
@@ -488,49 +245,66 @@ def schedule_agent_call(self):
 @shared_task(bind=True, name="core.tasks.cleanup_stuck_call_tasks")
 def cleanup_stuck_call_tasks(self):
     """
-    Kill CALL_TRIGGERED older than 10 min and IN_PROGRESS older than 30 min.
+    Delete CALL_TRIGGERED tasks older than STUCK_REAPER_TRIGGERED_MINUTES and
+    IN_PROGRESS tasks older than their own agent's max_call_duration_minutes.
+
+    Works in chunks of STUCK_REAPER_CHUNK_SIZE (one short transaction each,
+    rows locked by a dispatcher are skipped) and records every deleted task
+    in ReapedCallTask. Returns counts only.
     """
-    from core.models import CallTask, CallStatus
+    from core.models import CallStatus, ReapedCallTask
+    from core.quotas import release_call_reservations
+    from core.telephony.repositories.call_repo import reap_stuck_call_tasks
+    from core.telephony.services.active_phones import ActivePhoneIndex
+    from core.telephony.services.admission import AdmissionController
 
     now = timezone.now()
-    trig_thresh = now - timedelta(minutes=10)
-    # Threshold comes from per-agent setting; default 30
-    from core.models import Agent
-    from django.db.models import Min
-    # Use the minimum across active agents to be conservative if needed
-    try:
-        min_minutes = Agent.objects.filter(status="active").aggregate(m=Min("max_call_duration_minutes"))["m"]
-    except Exception:
-        min_minutes = None
-    if not min_minutes:
-        min_minutes = 30
-    prog_thresh = now - timedelta(minutes=min_minutes)
+    chunk_size = max(int(getattr(settings, "STUCK_REAPER_CHUNK_SIZE", 500)), 1)
+    triggered_minutes = int(getattr(settings, "STUCK_REAPER_TRIGGERED_MINUTES", 10))
+    retention_days = int(getattr(settings, "STUCK_REAPER_AUDIT_RETENTION_DAYS", 30))
 
+    counts = {"deleted_triggered": 0, "deleted_progress": 0, "chunks": 0, "audit_purged": 0}
     try:
-        with transaction.atomic():
-            trig_q = CallTask.objects.select_for_update().filter(
-                status=CallStatus.CALL_TRIGGERED, updated_at__lt=trig_thresh
-            )
-            prog_q = CallTask.objects.select_for_update().filter(
-                status=CallStatus.IN_PROGRESS, updated_at__lt=prog_thresh
-            )
-            trig_ids = list(trig_q.values_list("id", flat=True))
-            prog_ids = list(prog_q.values_list("id", flat=True))
-            trig_deleted = trig_q.delete()[0]
-            prog_deleted = prog_q.delete()[0]
+        while True:
+            rows = reap_stuck_call_tasks(now, limit=chunk_size, triggered_minutes=triggered_minutes)
+            if not rows:
+                break
+            counts["chunks"] += 1
+            for _, _, status in rows:
+                if status == CallStatus.CALL_TRIGGERED:
+                    counts["deleted_triggered"] += 1
+                else:
+                    counts["deleted_progress"] += 1
 
-        if trig_deleted or prog_deleted:
+            # Raw delete: release what the post_delete signal would have
+            try:
+                AdmissionController().release_many(row[0] for row in rows)
+                release_call_reservations(row[0] for row in rows)
+                if ActivePhoneIndex.enabled():
+                    ActivePhoneIndex().remove_many(row[1] for row in rows)
+            except Exception as e:
+                logger.warning(f"⚠️ Release after reaping stuck tasks incomplete: {e}")
+
+            if len(rows) < chunk_size:
+                break
+
+        # Audit retention, one bounded chunk per run
+        if retention_days > 0:
+            expired = ReapedCallTask.objects.filter(
+                reaped_at__lt=now - timedelta(days=retention_days)
+            ).values_list("id", flat=True)[:chunk_size]
+            counts["audit_purged"] = ReapedCallTask.objects.filter(id__in=list(expired)).delete()[0]
+
+        if counts["deleted_triggered"] or counts["deleted_progress"]:
             logger.warning(
-                f"🧹 Deleted stuck tasks: {trig_deleted} CALL_TRIGGERED, "
-                f"{prog_deleted} IN_PROGRESS"
+                f"🧹 Deleted stuck tasks: {counts['deleted_triggered']} CALL_TRIGGERED, "
+                f"{counts['deleted_progress']} IN_PROGRESS ({counts['chunks']} chunks)"
             )
 
         return {
             "success": True,
-            "deleted_triggered": trig_deleted,
-            "deleted_progress": prog_deleted,
-            "triggered_ids": trig_ids,
-            "progress_ids": prog_ids,
+            **counts,
+            "total_deleted": counts["deleted_triggered"] + counts["deleted_progress"],
             "timestamp": now.isoformat(),
         }
 
@@ -539,13 +313,197 @@ def cleanup_stuck_call_tasks(self):
         return {
             "success": False,
             "error": str(e),
-            "deleted_triggered": 0,
-            "deleted_progress": 0,
-            "total_deleted": 0,
+            **counts,
+            "total_deleted": counts["deleted_triggered"] + counts["deleted_progress"],
             "timestamp": timezone.now().isoformat(),
         }
 
 
+# ─────────────────────────────
+# 4b) Due index reconciler (sharded scheduler mode)
+# ─────────────────────────────
+@shared_task(bind=True, name="core.tasks.reconcile_due_index")
+def reconcile_due_index(self):
+    """
+    Re-sync the Redis due index (calltasks:due:<shard>) with Postgres.
+
+    Pushes from the create/reschedule paths keep the index current; this
+    catches pushes lost to Redis errors or crashes between pop and claim,
+    and drops members whose task is gone or no longer schedulable.
+    """
+    from core.telephony.services.due_index import DueIndex
+
+    if not DueIndex.enabled():
+        return {"success": True, "skipped": "singleton_mode"}
+
+    try:
+        counts = DueIndex().reconcile()
+        if counts["removed"]:
+            pass_kind = "full" if counts["full"] else "incremental"
+            logger.info(f"🔁 Due index reconciled ({pass_kind}): {counts['added']} upserted, {counts['removed']} stale removed")
+        return {"success": True, **counts, "timestamp": timezone.now().isoformat()}
+    except Exception as e:
+        logger.error(f"❌ Due index reconcile failed: {e}")
+        return {"success": False, "error": str(e)}
+
+
+# ─────────────────────────────
+# 4c) Admission counter reconciler
+# ─────────────────────────────
+@shared_task(bind=True, name="core.tasks.reconcile_admission_counters")
+def reconcile_admission_counters(self):
+    """
+    Rebuild the Redis in-flight counters (global/workspace/agent/trunk) and
+    per-task held records from CALL_TRIGGERED/IN_PROGRESS CallTasks, healing
+    any drift from missed releases.
+    """
+    from core.telephony.services.admission import AdmissionController
+
+    try:
+        counts = AdmissionController().reconcile()
+        if counts["stale_held_removed"]:
+            logger.info(f"🔁 Admission reconciled: {counts['active']} active, {counts['stale_held_removed']} stale slots freed")
+        return {"success": True, **counts, "timestamp": timezone.now().isoformat()}
+    except Exception as e:
+        logger.error(f"❌ Admission reconcile failed: {e}")
+        return {"success": False, "error": str(e)}
+
+
+# ─────────────────────────────
+# 4d) Active-phone index rebuild
+# ─────────────────────────────
+@shared_task(bind=True, name="core.tasks.rebuild_active_phone_index")
+def rebuild_active_phone_index(self):
+    """
+    Re-sync the Redis set of phones on a call (calltasks:active_phones) with
+    CALL_TRIGGERED/IN_PROGRESS CallTasks, healing missed adds/removes.
+    """
+    from core.telephony.services.active_phones import ActivePhoneIndex
+
+    if not ActivePhoneIndex.enabled():
+        return {"success": True, "skipped": "sql_mode"}
+
+    try:
+        counts = ActivePhoneIndex().rebuild()
+        if counts["removed"] or counts["added"]:
+            logger.info(f"🔁 Active-phone index rebuilt: {counts['active']} active, -{counts['removed']} +{counts['added']}")
+        return {"success": True, **counts, "timestamp": timezone.now().isoformat()}
+    except Exception as e:
+        logger.error(f"❌ Active-phone index rebuild failed: {e}")
+        return {"success": False, "error": str(e)}
+
+
+# ─────────────────────────────
+# 4e) Dial-window eligibility
+# ─────────────────────────────
+@shared_task(bind=True, name="core.tasks.refresh_dial_windows")
+def refresh_dial_windows(self):
+    """
+    Flip core_agent.dial_window_open for agents whose window boundary has
+    passed and move CallTasks whose eligibility window closed into the next
+    one, so the claim query can filter out-of-hours tasks in SQL.
+    """
+    from core.telephony.services.dial_windows import refresh_agent_windows, roll_call_task_windows
+
+    now = timezone.now()
+    try:
+        agents = refresh_agent_windows(now)
+        tasks = roll_call_task_windows(now, limit=getattr(settings, "DIAL_WINDOW_ROLL_BATCH", 5000))
+        if agents["flipped"] or tasks["rolled"]:
+            logger.info(f"🕘 Dial windows refreshed: {agents['flipped']} agents flipped, {tasks['rolled']} tasks rolled")
+        return {"success": True, **agents, **tasks, "timestamp": now.isoformat()}
+    except Exception as e:
+        logger.error(f"❌ Dial window refresh failed: {e}")
+        return {"success": False, "error": str(e)}
+
+
+# ─────────────────────────────
+# 4f) Quota counter write-behind
+# ─────────────────────────────
+@shared_task(bind=True, name="core.tasks.flush_quota_counters")
+def flush_quota_counters(self):
+    """
+    Fold usage recorded in the Redis quota counters into FeatureUsage,
+    one UPDATE per batch of counters.
+    """
+    from core.utils.quota_counters import QuotaCounters
+
+    if not QuotaCounters.enabled():
+        return {"success": True, "skipped": "disabled"}
+
+    try:
+        counts = QuotaCounters().flush()
+        return {"success": True, **counts, "timestamp": timezone.now().isoformat()}
+    except Exception as e:
+        logger.error(f"❌ Quota counter flush failed: {e}")
+        return {"success": False, "error": str(e)}
+
+
+@shared_task(bind=True, name="core.tasks.fold_call_minutes")
+def fold_call_minutes(self):
+    """
+    Fold call minutes accumulated at end_of_call into call-minute usage and
+    check the usage notification thresholds once per workspace.
+    """
+    from core.quotas import fold_call_minutes as fold
+    from core.utils.quota_counters import CallMinutesAccumulator
+
+    if not CallMinutesAccumulator.enabled():
+        return {"success": True, "skipped": "disabled"}
+
+    try:
+        counts = fold()
+        if counts["failed"]:
+            logger.warning(f"⚠️ Call minutes fold: {counts['failed']} workspaces failed, retried next run")
+        return {"success": True, **counts, "timestamp": timezone.now().isoformat()}
+    except Exception as e:
+        logger.error(f"❌ Call minutes fold failed: {e}")
+        return {"success": False, "error": str(e)}
+
+
+@shared_task(bind=True, name="core.tasks.sweep_quota_reservations")
+def sweep_quota_reservations(self):
+    """
+    Free call-minute reservations whose call never reported back (lost
+    end_of_call, crashed dispatcher) once they outlive the call's maximum
+    duration plus QUOTA_RESERVATION_GRACE_SECONDS.
+    """
+    from core.utils.quota_counters import QuotaCounters
+
+    if not QuotaCounters.enabled():
+        return {"success": True, "skipped": "disabled"}
+
+    try:
+        counts = QuotaCounters().sweep_reservations()
+        return {"success": True, **counts, "timestamp": timezone.now().isoformat()}
+    except Exception as e:
+        logger.error(f"❌ Quota reservation sweep failed: {e}")
+        return {"success": False, "error": str(e)}
+
+
+@shared_task(bind=True, name="core.tasks.reconcile_quota_counters")
+def reconcile_quota_counters(self):
+    """
+    Flush the Redis quota counters and drop idle ones so they reseed from
+    FeatureUsage. Sent by the first worker to start after a deploy
+    (hotcalls/celery.py); concurrent runs are skipped.
+    """
+    from core.utils.quota_counters import QuotaCounters
+
+    if not QuotaCounters.enabled():
+        return {"success": True, "skipped": "disabled"}
+
+    try:
+        counts = QuotaCounters().reconcile()
+        if counts is None:
+            return {"success": True, "skipped": "running"}
+        logger.info(f"🔁 Quota counters reconciled: {counts['flushed']} flushed, {counts['dropped']} reseeding")
+        return {"success": True, **counts, "timestamp": timezone.now().isoformat()}
+    except Exception as e:
+        logger.error(f"❌ Quota counter reconcile failed: {e}")
+        return {"success": False, "error": str(e)}
+
+
 # ─────────────────────────────
 # 5) CallTask Feedback Loop
 # ─────────────────────────────
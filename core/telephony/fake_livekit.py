@@ -0,0 +1,100 @@
+"""
+In-process fake LiveKit server for benchmarks and load tests.
+
+Speaks just enough Twirp (protobuf over HTTP POST) for the two calls the
+dialer makes – AgentDispatchService/CreateDispatch and SIP/CreateSIPParticipant –
+with configurable latency and failure rate. Runs on its own event loop in a
+background thread so both the per-task (async_to_sync) path and the pooled
+dialer worker can talk to it.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import uuid
+from typing import Dict, Optional
+
+from aiohttp import web
+from livekit.protocol import agent_dispatch as proto_dispatch
+from livekit.protocol import sip as proto_sip
+
+
+class FakeLiveKitServer:
+    def __init__(self, *, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 20.0, failure_rate: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency_s = max(latency_ms, 0.0) / 1000.0
+        self.failure_rate = failure_rate
+        self.counts: Dict[str, int] = {"CreateDispatch": 0, "CreateSIPParticipant": 0, "failed": 0}
+        # Request body bytes received per method (dispatch payload size)
+        self.bytes_in: Dict[str, int] = {"CreateDispatch": 0, "CreateSIPParticipant": 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        body = await request.read()
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+
+        if method not in ("CreateDispatch", "CreateSIPParticipant"):
+            return web.json_response({"code": "unimplemented", "msg": method}, status=404)
+
+        self.counts[method] += 1
+        self.bytes_in[method] += len(body)
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.counts["failed"] += 1
+            return web.json_response({"code": "unavailable", "msg": "fake failure"}, status=503)
+
+        if method == "CreateDispatch":
+            body = proto_dispatch.AgentDispatch(id=f"AD_{uuid.uuid4().hex[:12]}").SerializeToString()
+        else:
+            body = proto_sip.SIPParticipantInfo(
+                participant_id=f"PA_{uuid.uuid4().hex[:12]}",
+                sip_call_id=f"SCL_{uuid.uuid4().hex[:12]}",
+            ).SerializeToString()
+        return web.Response(body=body, content_type="application/protobuf")
+
+    def _serve(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+
+        app = web.Application()
+        app.router.add_post("/twirp/{service}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        # Resolve the ephemeral port
+        sockets = site._server.sockets if site._server else []
+        if sockets:
+            self.port = sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def reset_counts(self) -> None:
+        for key in self.counts:
+            self.counts[key] = 0
+        for key in self.bytes_in:
+            self.bytes_in[key] = 0
+
+    def start(self) -> "FakeLiveKitServer":
+        self._thread = threading.Thread(target=self._serve, name="fake-livekit", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=10)
+        return self
+
+    def stop(self) -> None:
+        if not self._loop:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=10)
@@ -1,11 +1,223 @@
 from __future__ import annotations
 
+import uuid
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple
 
-from django.db import transaction
+from django.db import connection, transaction
 
-from core.models import CallTask
+from core.models import CallTask, CallStatus
+
+
+# Statuses the scheduler may promote, and statuses that occupy a phone line
+SCHEDULABLE_STATUSES = (CallStatus.WAITING, CallStatus.SCHEDULED, CallStatus.RETRY)
+ACTIVE_STATUSES = (CallStatus.IN_PROGRESS, CallStatus.CALL_TRIGGERED)
+
+# Candidate priority: WAITING first, then SCHEDULED, then RETRY (same as the old loop)
+_PRIORITY_SQL = """
+    CASE {alias}.status
+        WHEN 'waiting' THEN 1
+        WHEN 'scheduled' THEN 2
+        WHEN 'retry' THEN 3
+        ELSE 4
+    END
+"""
+
+# Shard of a CallTask = last two bytes of its workspace UUID modulo the shard
+# count. Must stay in sync with shard_for_workspace() below.
+_SHARD_SQL = """
+      AND mod(
+          get_byte(uuid_send(ct.workspace_id), 14) * 256
+          + get_byte(uuid_send(ct.workspace_id), 15),
+          %(shard_count)s
+      ) = %(shard_index)s
+"""
+
+# Restrict candidates to ids popped from the Redis due index
+_CANDIDATES_SQL = """
+      AND ct.id = ANY(%(candidate_ids)s::uuid[])
+"""
+
+# Restrict candidates to a set of workspaces (load tests on a shared database)
+_WORKSPACES_SQL = """
+      AND ct.workspace_id = ANY(%(workspace_ids)s::uuid[])
+"""
+
+# Skip tasks whose phone is already on a call (SQL variant of ActivePhoneIndex)
+_BUSY_PHONE_SQL = """
+      AND NOT EXISTS (
+          SELECT 1 FROM core_calltask busy
+          WHERE busy.phone = ct.phone
+            AND busy.status IN %(active)s
+      )
+"""
+
+# Fresh dispatch timeline written on promotion: when the task became due
+# (next_call, or its calling window opening later) and when it was claimed
+_TIMELINE_SQL = """jsonb_build_object(
+        'due', extract(epoch FROM GREATEST({alias}next_call, COALESCE({alias}eligible_from, {alias}next_call))),
+        'claimed', extract(epoch FROM %(now)s::timestamptz)
+    )"""
+
+# Due, schedulable tasks of active agents inside their calling window whose
+# phone is not already on a call. Tasks without a computed window yet
+# (eligible_until IS NULL) fall back to the agent-level flag alone.
+_DUE_WHERE_SQL = """
+    WHERE ct.next_call <= %(now)s
+      AND ct.status IN %(schedulable)s
+      AND a.status = 'active'
+      AND a.dial_window_open
+      AND (
+          ct.eligible_until IS NULL
+          OR (ct.eligible_from <= %(now)s AND ct.eligible_until >= %(now)s)
+      )
+      {extra_filters}
+      {busy_phone_filter}
+"""
+
+# One statement: lock due candidates (skipping rows another scheduler holds),
+# drop candidates whose phone is already on a call, keep one task per phone,
+# and flip the winners to CALL_TRIGGERED.
+_CLAIM_SQL = f"""
+WITH candidates AS (
+    SELECT ct.id, ct.phone, ct.next_call, {_PRIORITY_SQL.format(alias="ct")} AS priority
+    FROM core_calltask ct
+    JOIN core_agent a ON a.agent_id = ct.agent_id
+    {_DUE_WHERE_SQL}
+    ORDER BY priority, ct.next_call
+    LIMIT %(overfetch)s
+    FOR UPDATE OF ct SKIP LOCKED
+),
+picked AS (
+    SELECT id FROM (
+        SELECT id, priority, next_call,
+               row_number() OVER (PARTITION BY phone ORDER BY priority, next_call) AS phone_rank
+        FROM candidates
+    ) ranked
+    WHERE phone_rank = 1
+    ORDER BY priority, next_call
+    LIMIT %(limit)s
+)
+UPDATE core_calltask t
+SET status = %(claimed_status)s, updated_at = %(now)s,
+    dispatch_timeline = {_TIMELINE_SQL.format(alias="t.")}
+FROM picked
+WHERE t.id = picked.id
+RETURNING t.id
+"""
+
+# Oldest due tasks of one workspace in one status, read in next_call order
+# from calltask_ws_due_idx and stopped after %(per_workspace)s rows
+_WS_DUE_BRANCH_SQL = """
+    (SELECT ct.id, ct.workspace_id, ct.next_call, {priority} AS priority
+     FROM core_calltask ct
+     JOIN core_agent a ON a.agent_id = ct.agent_id
+     {due_where}
+       AND ct.workspace_id = w.workspace_id
+       AND ct.status = '{status}'
+     ORDER BY ct.next_call
+     LIMIT %(per_workspace)s)
+"""
+_WS_DUE_SQL = " UNION ALL ".join(
+    _WS_DUE_BRANCH_SQL.format(priority=priority, status=status, due_where=_DUE_WHERE_SQL)
+    for priority, status in ((1, "waiting"), (2, "scheduled"), (3, "retry"))
+)
+
+# Admission-controlled claim, step 1: lock candidates together with the
+# routing ids and limits the admission controller needs. Each workspace with
+# an active agent in its window contributes at most %(per_workspace)s tasks
+# per status (LATERAL, index-ordered), so the ranking never sorts the whole
+# backlog. Candidates are interleaved round-robin across workspaces (ws_rank
+# first) so one large backlog cannot fill the whole over-fetch window.
+_LOCK_CANDIDATES_SQL = f"""
+WITH due AS (
+    SELECT d.*
+    FROM (
+        SELECT DISTINCT a.workspace_id
+        FROM core_agent a
+        WHERE a.status = 'active' AND a.dial_window_open
+    ) w
+    CROSS JOIN LATERAL ({_WS_DUE_SQL}) d
+),
+ranked AS (
+    SELECT id, next_call, priority,
+           row_number() OVER (PARTITION BY workspace_id ORDER BY priority, next_call) AS ws_rank
+    FROM due
+)
+SELECT ct.id, ct.phone, ct.workspace_id, ct.agent_id, pn.sip_trunk_id,
+       a.max_concurrent_calls, st.max_concurrent_calls
+FROM ranked r
+JOIN core_calltask ct ON ct.id = r.id
+JOIN core_agent a ON a.agent_id = ct.agent_id
+LEFT JOIN core_phonenumber pn ON pn.id = a.phone_number_id
+LEFT JOIN core_siptrunk st ON st.id = pn.sip_trunk_id
+WHERE ct.status IN %(schedulable)s
+  AND ct.next_call <= %(now)s
+ORDER BY r.ws_rank, r.priority, r.next_call
+LIMIT %(overfetch)s
+FOR UPDATE OF ct SKIP LOCKED
+"""
+
+# Admission-controlled claim, step 2: promote the admitted subset
+_PROMOTE_SQL = f"""
+UPDATE core_calltask
+SET status = %(claimed_status)s, updated_at = %(now)s,
+    dispatch_timeline = {_TIMELINE_SQL.format(alias="")}
+WHERE id = ANY(%(ids)s::uuid[])
+RETURNING id
+"""
+
+
+# Stuck-task reaper, one bounded chunk per statement: CALL_TRIGGERED tasks
+# past a fixed timeout and IN_PROGRESS tasks past their own agent's
+# max_call_duration_minutes. Rows held by a dispatcher are skipped; every
+# deleted row is copied into the audit table by the same statement.
+_REAP_STUCK_SQL = """
+WITH doomed AS (
+    SELECT ct.id,
+           CASE WHEN ct.status = %(triggered)s THEN %(triggered_minutes)s
+                ELSE COALESCE(NULLIF(a.max_call_duration_minutes, 0), %(default_minutes)s)
+           END AS threshold_minutes
+    FROM core_calltask ct
+    JOIN core_agent a ON a.agent_id = ct.agent_id
+    WHERE (ct.status = %(triggered)s
+           AND ct.updated_at < %(now)s - make_interval(mins => %(triggered_minutes)s))
+       OR (ct.status = %(in_progress)s
+           AND ct.updated_at < %(now)s - make_interval(
+               mins => COALESCE(NULLIF(a.max_call_duration_minutes, 0), %(default_minutes)s)))
+    ORDER BY ct.updated_at
+    LIMIT %(limit)s
+    FOR UPDATE OF ct SKIP LOCKED
+),
+reaped AS (
+    DELETE FROM core_calltask t
+    USING doomed d
+    WHERE t.id = d.id
+    RETURNING t.id, t.workspace_id, t.agent_id, t.status, t.phone, t.attempts,
+              t.updated_at, d.threshold_minutes
+),
+audit AS (
+    INSERT INTO core_reapedcalltask
+        (call_task_id, workspace_id, agent_id, status, phone, attempts,
+         stuck_since, threshold_minutes, reaped_at)
+    SELECT id, workspace_id, agent_id, status, phone, attempts,
+           updated_at, threshold_minutes, %(now)s
+    FROM reaped
+)
+SELECT id, phone, status FROM reaped
+"""
+
+
+class ClaimCandidate(NamedTuple):
+    """A locked, due CallTask offered to the admission controller."""
+
+    id: str
+    phone: str
+    workspace_id: str
+    agent_id: str
+    trunk_id: Optional[str]
+    agent_limit: Optional[int]
+    trunk_limit: Optional[int]
 
 
 @contextmanager
@@ -18,5 +230,181 @@ def lock_call_task(call_task_id: str) -> Iterator[CallTask]:
         yield task
 
 
+def shard_for_workspace(workspace_id, shard_count: int) -> int:
+    """Python mirror of the SQL shard expression used by claim_due_call_tasks()."""
+    if shard_count <= 1:
+        return 0
+    raw = uuid.UUID(str(workspace_id)).bytes
+    return int.from_bytes(raw[14:16], "big") % shard_count
+
+
+def claim_due_call_tasks(
+    *,
+    now,
+    limit: int,
+    shard: Optional[Tuple[int, int]] = None,
+    candidate_ids: Optional[Sequence[str]] = None,
+    workspace_ids: Optional[Sequence] = None,
+    admission=None,
+    phone_index=None,
+    gate=None,
+) -> List[str]:
+    """
+    Promote up to `limit` due CallTasks to CALL_TRIGGERED in a single statement.
+
+    Rows locked by a concurrent claimer are skipped (FOR UPDATE SKIP LOCKED),
+    tasks whose phone already has an IN_PROGRESS/CALL_TRIGGERED task are
+    excluded, and at most one task per phone is claimed per batch.
+
+    Args:
+        now: Reference time; only tasks with next_call <= now are claimed
+        limit: Maximum number of tasks to claim
+        shard: Optional (shard_index, shard_count) restricting the claim to
+            one workspace hash partition (sharded scheduler mode)
+        candidate_ids: Optional ids popped from the due index; when given
+            only these rows are considered and the shard filter is skipped
+            (membership in the shard ZSET already routes them)
+        workspace_ids: Optional workspaces to restrict the claim to
+        admission: Optional AdmissionController. When given, candidates are
+            locked first, the controller picks (and counts) the admitted
+            subset with workspace fair share, and only that subset is
+            promoted. Admissions are released again if the promotion fails.
+        phone_index: Optional ActivePhoneIndex (admission path only). When
+            given, busy phones are filtered with one SMISMEMBER for the whole
+            batch instead of the NOT EXISTS anti-join, and promoted phones
+            are added to the index before the claim commits.
+        gate: Optional circuit-breaker DispatchGate (admission path only).
+            Candidates on open trunks are skipped; a trunk ready for its
+            half-open probe gets at most one.
+
+    Returns the claimed CallTask IDs as strings.
+    """
+    if limit <= 0:
+        return []
+
+    params = {
+        "now": now,
+        "limit": limit,
+        # Over-fetch so duplicate phones inside the batch do not starve the limit
+        "overfetch": limit * 2,
+        "schedulable": tuple(str(s) for s in SCHEDULABLE_STATUSES),
+        "active": tuple(str(s) for s in ACTIVE_STATUSES),
+        "claimed_status": str(CallStatus.CALL_TRIGGERED),
+    }
+    extra_filters = ""
+    if candidate_ids is not None:
+        if not candidate_ids:
+            return []
+        extra_filters = _CANDIDATES_SQL
+        params["candidate_ids"] = [str(pk) for pk in candidate_ids]
+    elif shard is not None and shard[1] > 1:
+        extra_filters = _SHARD_SQL
+        params["shard_index"], params["shard_count"] = shard
+    if workspace_ids is not None:
+        if not workspace_ids:
+            return []
+        extra_filters += _WORKSPACES_SQL
+        params["workspace_ids"] = [str(pk) for pk in workspace_ids]
+
+    if admission is not None:
+        # Wider window: per-workspace/agent/trunk limits reject some candidates
+        params["overfetch"] = limit * 4
+        # No workspace can be admitted more than `limit` tasks per claim
+        params["per_workspace"] = limit
+        lock_sql = _LOCK_CANDIDATES_SQL.replace("{extra_filters}", extra_filters).replace(
+            "{busy_phone_filter}", "" if phone_index is not None else _BUSY_PHONE_SQL
+        )
+        return _claim_with_admission(lock_sql, params, limit, admission, phone_index, gate)
+
+    claim_sql = _CLAIM_SQL.replace("{extra_filters}", extra_filters).replace("{busy_phone_filter}", _BUSY_PHONE_SQL)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(claim_sql, params)
+            rows = cursor.fetchall()
+    return [str(row[0]) for row in rows]
+
 
+def _claim_with_admission(lock_sql: str, params: dict, limit: int, admission, phone_index=None, gate=None) -> List[str]:
+    admitted: List[str] = []
+    marked_phones: List[str] = []
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(lock_sql, params)
+                candidates: List[ClaimCandidate] = []
+                seen_phones = set()
+                for row in cursor.fetchall():
+                    # One task per phone per batch
+                    if row[1] in seen_phones:
+                        continue
+                    seen_phones.add(row[1])
+                    candidates.append(
+                        ClaimCandidate(
+                            id=str(row[0]),
+                            phone=row[1],
+                            workspace_id=str(row[2]),
+                            agent_id=str(row[3]),
+                            trunk_id=str(row[4]) if row[4] else None,
+                            agent_limit=row[5],
+                            trunk_limit=row[6],
+                        )
+                    )
 
+                if gate is not None and candidates:
+                    candidates = gate.filter(candidates)
+
+                if phone_index is not None and candidates:
+                    busy = phone_index.busy(c.phone for c in candidates)
+                    if busy:
+                        candidates = [c for c in candidates if c.phone not in busy]
+
+                admitted = admission.admit_batch(candidates, limit)
+                if not admitted:
+                    return []
+
+                cursor.execute(_PROMOTE_SQL, {**params, "ids": admitted})
+                rows = cursor.fetchall()
+
+                if phone_index is not None:
+                    # Mark before commit so a concurrent claimer never sees the phone free
+                    phone_by_id = {c.id: c.phone for c in candidates}
+                    marked_phones = [phone_by_id[str(row[0])] for row in rows if str(row[0]) in phone_by_id]
+                    phone_index.add_many(marked_phones)
+    except Exception:
+        admission.release_many(admitted)
+        for phone in marked_phones:
+            try:
+                phone_index.remove(phone)
+            except Exception:
+                pass
+        raise
+    return [str(row[0]) for row in rows]
+
+
+def reap_stuck_call_tasks(
+    now,
+    *,
+    limit: int,
+    triggered_minutes: int = 10,
+    default_minutes: int = 30,
+) -> List[Tuple[str, str, str]]:
+    """
+    Delete one chunk (at most `limit`) of stuck active CallTasks and record
+    them in ReapedCallTask. Returns (id, phone, status) of the deleted rows.
+
+    Raw delete: post_delete signals do not fire, so the caller releases
+    admission slots and active phones.
+    """
+    params = {
+        "now": now,
+        "limit": int(limit),
+        "triggered": CallStatus.CALL_TRIGGERED,
+        "in_progress": CallStatus.IN_PROGRESS,
+        "triggered_minutes": int(triggered_minutes),
+        "default_minutes": int(default_minutes),
+    }
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(_REAP_STUCK_SQL, params)
+            rows = cursor.fetchall()
+    return [(str(row[0]), row[1], row[2]) for row in rows]
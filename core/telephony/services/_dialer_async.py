@@ -3,10 +3,15 @@ from __future__ import annotations
 import os
 import json
 import uuid
+import zlib
+import base64
+import asyncio
+import time
 import datetime
 import contextlib
 from typing import Optional, Dict, Any
 
+import aiohttp
 from dotenv import load_dotenv
 from livekit import api
 from livekit.protocol.sip import CreateSIPParticipantRequest
@@ -16,41 +21,38 @@ from asgiref.sync import sync_to_async
 load_dotenv()
 
 
-@sync_to_async
-def _fetch_knowledge_content_sync(agent_id: str, doc_ids: list) -> str:
-    """
-    Synchronous knowledge content fetch wrapped for async compatibility.
-    
-    Args:
-        agent_id: Agent UUID  
-        doc_ids: List of document IDs (currently only supports single doc)
-        
-    Returns:
-        Combined full text content of all documents
-    """
+def create_livekit_api(session=None) -> api.LiveKitAPI:
+    """LiveKit API client from env; pass an aiohttp `session` to share its connection pool."""
+    kwargs = {"session": session} if session is not None else {}
+    return api.LiveKitAPI(
+        url=os.getenv("LIVEKIT_URL"),
+        api_key=os.getenv("LIVEKIT_API_KEY"),
+        api_secret=os.getenv("LIVEKIT_API_SECRET"),
+        **kwargs,
+    )
+
+
+def _load_knowledge_text(agent_id: str) -> str:
+    """Read the extracted KB text (.txt next to the agent's PDF) from blob storage."""
     import logging
     logger = logging.getLogger(__name__)
-    
-    if not doc_ids:
-        logger.info(f"KNOWLEDGE FETCH ABORTED: no doc_ids")
-        return ""
-    
+
     logger.info(f"KNOWLEDGE FETCH STARTED")
-    
+
     try:
         from core.management_api.knowledge_api.views import _get_agent_or_404, AzureMediaStorage
-        
+
         agent = _get_agent_or_404(agent_id)
-        storage = AzureMediaStorage()
 
         if agent.kb_pdf:
+            storage = AzureMediaStorage()
             # Use exact same logic as AgentKnowledgeDocumentPresignByIdView
             current_name = os.path.basename(agent.kb_pdf.name)
             base_no_ext = os.path.splitext(current_name)[0]
             path = agent.kb_pdf.name
             dir_path = os.path.dirname(path)
             txt_path = f"{dir_path}/{base_no_ext}.txt"
-            
+
             if storage.exists(txt_path):
                 with storage.open(txt_path, "rb") as fh:
                     content = fh.read().decode("utf-8")
@@ -62,12 +64,52 @@ def _fetch_knowledge_content_sync(agent_id: str, doc_ids: list) -> str:
             logger.warning(f"KNOWLEDGE FETCH FAILED: agent {agent_id} has no kb_pdf")
 
     except Exception as e:
-        logger = logging.getLogger(__name__)
         logger.warning(f"Failed to fetch knowledge content for agent {agent_id}: {e}")
-        
+
     return ""
 
 
+def _fetch_knowledge_document_sync(agent_id: str, doc_ids: list):
+    """
+    Knowledge text plus its content address (sha256/size) for an agent.
+
+    Served from the versioned two-tier KB cache; blob storage is only read
+    when the agent's current KB version is in neither tier.
+
+    Returns:
+        KnowledgeDocument (empty when the agent has no documents)
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+
+    from core.services.knowledge_cache import knowledge_cache, KnowledgeDocument
+
+    if not doc_ids:
+        logger.info(f"KNOWLEDGE FETCH ABORTED: no doc_ids")
+        return KnowledgeDocument.from_text("")
+
+    return knowledge_cache.get_document(agent_id, lambda: _load_knowledge_text(agent_id))
+
+
+@sync_to_async
+def _fetch_knowledge_content_sync(agent_id: str, doc_ids: list) -> str:
+    """
+    Synchronous knowledge content fetch wrapped for async compatibility.
+
+    Args:
+        agent_id: Agent UUID  
+        doc_ids: List of document IDs (currently only supports single doc)
+        
+    Returns:
+        Combined full text content of all documents
+    """
+    return _fetch_knowledge_document_sync(agent_id, doc_ids).text
+
+
+# Shared pool for sync KB fetches issued from inside a running event loop
+_knowledge_executor = None
+
+
 def _fetch_knowledge_content(agent_id: str, doc_ids: list) -> str:
     """
     Fetch full knowledge document content using the actual knowledge API function logic.
@@ -82,25 +124,76 @@ def _fetch_knowledge_content(agent_id: str, doc_ids: list) -> str:
     Returns:
         Combined full text content of all documents
     """
+    return _fetch_knowledge_document(agent_id, doc_ids).text
+
+
+def _fetch_knowledge_document(agent_id: str, doc_ids: list):
+    """Like `_fetch_knowledge_content`, but returns the KnowledgeDocument (text, sha256, size)."""
     import asyncio
-    import logging
-    logger = logging.getLogger(__name__)
-    
+
+    global _knowledge_executor
     try:
         # Check if we're in an async context
         loop = asyncio.get_running_loop()
         if loop is not None:
-            # We're in an async context, need to run the sync version in executor
+            # We're in an async context, need to run the sync version off the loop thread
             import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(_fetch_knowledge_content_sync.func, agent_id, doc_ids)
-                return future.result()
+            if _knowledge_executor is None:
+                _knowledge_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=4, thread_name_prefix="kb-fetch"
+                )
+            future = _knowledge_executor.submit(_fetch_knowledge_document_sync, agent_id, doc_ids)
+            return future.result()
     except RuntimeError:
         # No running event loop, we're in sync context
         pass
-    
+
     # Fallback to direct sync call
-    return _fetch_knowledge_content_sync.func(agent_id, doc_ids)
+    return _fetch_knowledge_document_sync(agent_id, doc_ids)
+
+
+def _knowledge_payload(agent_config: Dict[str, Any], knowledge, mode: Optional[str] = None) -> Dict[str, Any]:
+    """
+    KB fields for the agent_config section of the dispatch metadata.
+
+    Modes (KB_METADATA_MODE):
+    - "inline":    full text in `knowledge_content` (legacy agents)
+    - "reference": only `knowledge_ref` {doc_id, sha256, size, path}; the agent
+                   GETs the immutable content-addressed endpoint and caches by sha256
+    - "auto":      reference, plus zlib+base64 text in `knowledge_content_z`
+                   when the compressed form fits KB_INLINE_MAX_BYTES
+
+    `knowledge_ref` is always included when there is KB text, so agents can
+    switch to by-reference fetching independently of the server mode.
+    """
+    from django.conf import settings
+    from core.services.knowledge_cache import KnowledgeDocument
+
+    if not isinstance(knowledge, KnowledgeDocument):
+        knowledge = KnowledgeDocument.from_text(knowledge or "")
+    mode = mode or getattr(settings, "KB_METADATA_MODE", "inline")
+
+    doc_ids = agent_config.get("knowledge_documents") or []
+    if not knowledge.size or not doc_ids:
+        return {"knowledge_content": knowledge.text if mode == "inline" else ""}
+
+    agent_id = agent_config.get("agent_id")
+    doc_id = str(doc_ids[0])
+    payload: Dict[str, Any] = {
+        "knowledge_ref": {
+            "doc_id": doc_id,
+            "sha256": knowledge.sha256,
+            "size": knowledge.size,
+            "path": f"/api/knowledge/agents/{agent_id}/documents/by-id/{doc_id}/content/{knowledge.sha256}/",
+        },
+    }
+    if mode == "inline":
+        payload["knowledge_content"] = knowledge.text
+    elif mode == "auto":
+        compressed = base64.b64encode(zlib.compress(knowledge.text.encode("utf-8"), 6)).decode("ascii")
+        if len(compressed) <= int(getattr(settings, "KB_INLINE_MAX_BYTES", 16 * 1024)):
+            payload["knowledge_content_z"] = compressed
+    return payload
 
 
 async def _make_call_async(
@@ -113,6 +206,10 @@ async def _make_call_async(
     room_name: Optional[str] = None,
     answer_timeout_s: Optional[float] = None,
     knowledge_content,
+    livekit_api: Optional[api.LiveKitAPI] = None,
+    knowledge_mode: Optional[str] = None,
+    rate_limit=None,
+    trunk_pk: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     Place an outbound call via LiveKit and return identifiers.
@@ -121,14 +218,23 @@ async def _make_call_async(
     - Adds a stable callee_identity into job metadata for the agent to wait on
     - Does not rely on experimental wait_until_answered flags
     - Returns a deterministic dict. Never raises; errors are returned.
+    - Pass a shared `livekit_api` to reuse its HTTP session (dialer worker);
+      otherwise a client is created for this call and closed afterwards.
+    - `knowledge_content` is KB text or a KnowledgeDocument; how it is carried
+      in the metadata follows KB_METADATA_MODE (see `_knowledge_payload`).
+    - `rate_limit` (CallRateLimit) makes the call wait for a token from its
+      trunk / caller-ID CPS buckets before anything is sent to LiveKit.
+    - Shared circuit breakers (LiveKit URL, `trunk_pk`) fail the call fast
+      with abort_reason "circuit_open" while open and record every outcome.
+    - Durations of create_dispatch / create_sip_participant are returned
+      under "timings" (seconds) for the dispatch latency histograms.
     """
+    from core.telephony.services.circuit_breaker import CIRCUIT_OPEN, CircuitBreaker, livekit_scope, trunk_scope
     from core.utils.calltask_utils import preflight_check_agent_token_async
 
-    livekit_api = api.LiveKitAPI(
-        url=os.getenv("LIVEKIT_URL"),
-        api_key=os.getenv("LIVEKIT_API_KEY"),
-        api_secret=os.getenv("LIVEKIT_API_SECRET"),
-    )
+    owns_client = livekit_api is None
+    if owns_client:
+        livekit_api = create_livekit_api()
 
     room_name = room_name or f"outbound-call-{uuid.uuid4().hex[:8]}"
     agent_name = os.getenv("LIVEKIT_AGENT_NAME")
@@ -137,6 +243,7 @@ async def _make_call_async(
 
     callee_phone = (lead_data.get("phone") or "").strip()
     callee_identity = f"phone_{callee_phone.replace('+', '')}"
+    timings: Dict[str, float] = {}
 
     # DEBUG: Log what we received from tasks.py
     import logging
@@ -159,7 +266,7 @@ async def _make_call_async(
         "workspace_id": agent_config.get("workspace_id"),
         "event_type_id": agent_config.get("event_type_id"),
         "knowledge_documents": agent_config.get("knowledge_documents"),
-        "knowledge_content": knowledge_content,
+        **_knowledge_payload(agent_config, knowledge_content, knowledge_mode),
         "send_document": agent_config.get("send_document"),
     }
     
@@ -219,26 +326,65 @@ async def _make_call_async(
                 "abort_reason": abort_reason,
             }
 
+        # 1a) Circuit breakers: do not spend a timeout on a LiveKit / trunk that is down
+        loop = asyncio.get_running_loop()
+        breaker = CircuitBreaker()
+        lk_scope, sip_scope = livekit_scope(), trunk_scope(trunk_pk)
+        for scope in (lk_scope, sip_scope):
+            if not await loop.run_in_executor(None, breaker.allow, scope):
+                return {
+                    "success": False,
+                    "error": f"Circuit open for {scope}",
+                    "to_number": callee_phone,
+                    "agent_name": agent_name,
+                    "abort_reason": CIRCUIT_OPEN,
+                }
+
+        # 1b) Calls-per-second limits: wait for a token instead of bursting the carrier
+        if rate_limit is not None and rate_limit.buckets:
+            from core.telephony.services.rate_limiter import CallRateLimiter, THROTTLED
+
+            limiter = CallRateLimiter()
+            acquired, waited = await limiter.acquire(rate_limit)
+            if waited >= 0.5:
+                logger.info(f"⏳ CPS wait {waited:.2f}s for call to {callee_phone}")
+            if not acquired:
+                limiter.record_throttled(THROTTLED, rate_limit.trunk_id)
+                return {
+                    "success": False,
+                    "error": f"CPS limit: no token after {waited:.1f}s",
+                    "to_number": callee_phone,
+                    "agent_name": agent_name,
+                    "abort_reason": THROTTLED,
+                }
+
         logger.info("Trying to dispatch agent to room")
 
         # 2) Dispatch agent to room with metadata (token can be added by caller if needed)
+        metadata = json.dumps(hotcalls_metadata, ensure_ascii=False)
+        logger.info(f"Dispatch metadata size: {len(metadata.encode('utf-8'))} bytes")
+        started = time.perf_counter()
         try:
             dispatch = await livekit_api.agent_dispatch.create_dispatch(
                 api.CreateAgentDispatchRequest(
                     agent_name=agent_name,
                     room=room_name,
-                    metadata=json.dumps(hotcalls_metadata, ensure_ascii=False),
+                    metadata=metadata,
                 )
             )
         except Exception as dispatch_error:
+            timings["create_dispatch"] = time.perf_counter() - started
             logger.error(f"Failed to dispatch agent to room: {dispatch_error}")
+            await loop.run_in_executor(None, breaker.record_failure, lk_scope)
             return {
                 "success": False,
                 "error": f"Agent dispatch failed: {str(dispatch_error)}",
                 "to_number": callee_phone,
                 "agent_name": agent_name,
                 "abort_reason": "dispatch_failed",
+                "timings": timings,
             }
+        timings["create_dispatch"] = time.perf_counter() - started
 
         # 3) Create SIP participant (no experimental args)
         participant_identity = callee_identity
@@ -256,7 +402,35 @@ async def _make_call_async(
 
         # The client supports a timeout param when invoking the API call itself
         # Match previous behavior: no explicit timeout argument passed here
-        participant = await livekit_api.sip.create_sip_participant(request)
+        started = time.perf_counter()
+        try:
+            participant = await livekit_api.sip.create_sip_participant(request)
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            # Transport-level: LiveKit itself did not answer
+            await loop.run_in_executor(None, breaker.record_failure, lk_scope)
+            raise
+        except Exception as sip_error:
+            from core.telephony.services.rate_limiter import CARRIER_THROTTLED, CallRateLimiter, is_carrier_throttle
+
+            if not is_carrier_throttle(sip_error):
+                await loop.run_in_executor(None, breaker.record_failure, sip_scope)
+                raise
+            # Rate rejections are handled by the CPS limiter, not the breaker, and are no attempt
+            logger.warning(f"Carrier throttled call to {callee_phone}: {sip_error}")
+            with contextlib.suppress(Exception):
+                CallRateLimiter().record_throttled(CARRIER_THROTTLED, getattr(rate_limit, "trunk_id", None))
+            return {
+                "success": False,
+                "error": str(sip_error),
+                "to_number": callee_phone,
+                "agent_name": agent_name,
+                "abort_reason": CARRIER_THROTTLED,
+                "timings": timings,
+            }
+        finally:
+            timings["create_sip_participant"] = time.perf_counter() - started
+        await loop.run_in_executor(None, breaker.record_success, lk_scope)
+        await loop.run_in_executor(None, breaker.record_success, sip_scope)
 
         return {
             "success": True,
@@ -266,6 +440,7 @@ async def _make_call_async(
             "sip_call_id": participant.sip_call_id,
             "to_number": callee_phone,
             "agent_name": agent_name,
+            "timings": timings,
         }
 
     except Exception as e:
@@ -276,10 +451,12 @@ async def _make_call_async(
             "to_number": callee_phone,
             "agent_name": agent_name,
             "abort_reason": "exception",
+            "timings": timings,
         }
     finally:
-        with contextlib.suppress(Exception):
-            await livekit_api.aclose()
+        if owns_client:
+            with contextlib.suppress(Exception):
+                await livekit_api.aclose()
 
 
 
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Dict, Iterable, List, Set
+
+from django.conf import settings
+from django.db import transaction
+
+from core.utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+# Remove the phones in ARGV[2..n] unless they were (re)added at or after
+# ARGV[1] (epoch seconds); KEYS[1] = active set, KEYS[2] = added-at ZSET
+_REMOVE_STALE_LUA = """
+local cutoff = tonumber(ARGV[1])
+local removed = 0
+for i = 2, #ARGV do
+    local added_at = redis.call('ZSCORE', KEYS[2], ARGV[i])
+    if not added_at or tonumber(added_at) < cutoff then
+        removed = removed + redis.call('SREM', KEYS[1], ARGV[i])
+    end
+end
+return removed
+"""
+
+
+class ActivePhoneIndex:
+    """
+    Redis set of phone numbers that currently have a CALL_TRIGGERED or
+    IN_PROGRESS CallTask (`calltasks:active_phones`).
+
+    • The scheduler adds phones when it promotes tasks and filters each
+      candidate batch with a single SMISMEMBER instead of a per-candidate
+      `EXISTS` against core_calltask.
+    • Terminal transitions (retry, reschedule, deletion) remove the phone
+      after commit via `release_active_phone()`.
+    • `rebuild()` re-syncs the set with Postgres periodically, healing
+      anything missed by crashes or bulk updates. Adds are also stamped in
+      `calltasks:active_phones:added` so a rebuild never drops a phone
+      promoted while its query ran.
+    • The set is only trusted once a rebuild has stamped
+      `calltasks:active_phones:ready`; after a deploy or a Redis flush the
+      first `busy()` call rebuilds synchronously instead of reading an empty
+      set that would report every busy phone as free.
+
+    Enabled when SCHEDULER_PHONE_INDEX="redis"; "sql" keeps the NOT EXISTS
+    anti-join inside the claim statement.
+    """
+
+    KEY = "calltasks:active_phones"
+    ADDED_KEY = "calltasks:active_phones:added"
+    READY_KEY = "calltasks:active_phones:ready"
+    # Adds this close to the rebuild query may not be visible to it yet
+    ADD_GRACE_SECONDS = 60
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_redis_client()
+        self._remove_stale = self.redis.register_script(_REMOVE_STALE_LUA)
+
+    @staticmethod
+    def enabled() -> bool:
+        return getattr(settings, "SCHEDULER_PHONE_INDEX", "redis") == "redis"
+
+    def busy(self, phones: Iterable[str]) -> Set[str]:
+        """Subset of `phones` currently on a call (one SMISMEMBER round trip)."""
+        phones = [p for p in dict.fromkeys(phones) if p]
+        if not phones:
+            return set()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.exists(self.READY_KEY)
+        pipe.smismember(self.KEY, phones)
+        ready, flags = pipe.execute()
+        if not ready:
+            self.rebuild()
+            flags = self.redis.smismember(self.KEY, phones)
+        return {phone for phone, flag in zip(phones, flags) if flag}
+
+    def add_many(self, phones: Iterable[str]) -> int:
+        phones = [p for p in phones if p]
+        if not phones:
+            return 0
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.sadd(self.KEY, *phones)
+        pipe.zadd(self.ADDED_KEY, {phone: time.time() for phone in phones})
+        return int(pipe.execute()[0])
+
+    def remove(self, phone: str) -> None:
+        if phone:
+            self.redis.srem(self.KEY, phone)
+
+    def remove_many(self, phones: Iterable[str]) -> None:
+        phones = [p for p in phones if p]
+        if phones:
+            self.redis.srem(self.KEY, *phones)
+
+    def rebuild(self) -> Dict[str, int]:
+        """
+        Re-sync with Postgres without a window where busy phones disappear:
+        only phones that were already members before the query, are not
+        active in the database and were not (re)added since shortly before
+        the query are removed. A phone released and promoted again while the
+        query runs is therefore kept even though the query cannot see it.
+        """
+        from core.models import CallTask
+        from core.telephony.repositories.call_repo import ACTIVE_STATUSES
+
+        cutoff = time.time() - self.ADD_GRACE_SECONDS
+        before = {m.decode() if isinstance(m, bytes) else m for m in self.redis.smembers(self.KEY)}
+        active = set(
+            CallTask.objects.filter(status__in=[str(s) for s in ACTIVE_STATUSES])
+            .values_list("phone", flat=True)
+            .distinct()
+        )
+        active.discard(None)
+        active.discard("")
+
+        stale: List[str] = sorted(before - active)
+        missing: List[str] = sorted(active - before)
+        removed = int(self._remove_stale(keys=[self.KEY, self.ADDED_KEY], args=[cutoff, *stale]) or 0) if stale else 0
+        pipe = self.redis.pipeline(transaction=False)
+        if missing:
+            pipe.sadd(self.KEY, *missing)
+        # Stamps older than the grace window no longer protect anything
+        pipe.zremrangebyscore(self.ADDED_KEY, "-inf", cutoff)
+        pipe.set(self.READY_KEY, 1)
+        pipe.execute()
+        return {"active": len(active), "removed": removed, "added": len(missing)}
+
+
+def release_active_phone(phone) -> None:
+    """
+    Drop a phone from the active set once the surrounding transaction
+    commits. Safe to call repeatedly.
+    """
+    if not phone or not ActivePhoneIndex.enabled():
+        return
+
+    def _release():
+        try:
+            ActivePhoneIndex().remove(phone)
+        except Exception as e:
+            logger.warning(f"⚠️ Active phone release failed for {phone}: {e}")
+
+    transaction.on_commit(_release)
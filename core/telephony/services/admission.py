@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import heapq
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+# KEYS[1] = held record, KEYS[2..n-1] = counters (global, workspace, agent[, trunk]),
+# KEYS[n] = version
+# ARGV[1] = held TTL seconds, ARGV[2..n-1] = limit per counter (0 = unlimited)
+# Returns 0 admitted, -1 already admitted, k > 0 blocked by counter k
+_ADMIT_LUA = """
+local last = #KEYS - 1
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return -1
+end
+for i = 2, last do
+    local limit = tonumber(ARGV[i])
+    if limit > 0 and tonumber(redis.call('GET', KEYS[i]) or '0') >= limit then
+        return i - 1
+    end
+end
+for i = 2, last do
+    redis.call('INCR', KEYS[i])
+end
+redis.call('SET', KEYS[1], table.concat(KEYS, ',', 2, last), 'EX', ARGV[1])
+redis.call('INCR', KEYS[#KEYS])
+return 0
+"""
+
+# Decrement every counter recorded in the held record once, then forget it
+# KEYS[1] = held record, KEYS[2] = version
+_RELEASE_LUA = """
+local held = redis.call('GET', KEYS[1])
+if not held then
+    return 0
+end
+for key in string.gmatch(held, '[^,]+') do
+    if redis.call('DECR', key) < 0 then
+        redis.call('SET', key, 0)
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('INCR', KEYS[2])
+return 1
+"""
+
+# Count an active task that has no held record, ignoring limits (reconcile);
+# refresh the TTL of one that has. Same KEYS layout as _ADMIT_LUA.
+# Returns 1 when counted, 0 when it was already held
+_ADOPT_LUA = """
+local last = #KEYS - 1
+if redis.call('EXPIRE', KEYS[1], ARGV[1]) == 1 then
+    return 0
+end
+for i = 2, last do
+    redis.call('INCR', KEYS[i])
+end
+redis.call('SET', KEYS[1], table.concat(KEYS, ',', 2, last), 'EX', ARGV[1])
+redis.call('INCR', KEYS[#KEYS])
+return 1
+"""
+
+# Overwrite counters with values recomputed from the held records, unless an
+# admit/release changed the version since they were read
+# KEYS[1] = version, KEYS[2..n] = counters; ARGV[1] = version read, ARGV[2..n] = values (0 = delete)
+_RECOUNT_LUA = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+for i = 2, #KEYS do
+    if tonumber(ARGV[i]) > 0 then
+        redis.call('SET', KEYS[i], ARGV[i])
+    else
+        redis.call('DEL', KEYS[i])
+    end
+end
+return 1
+"""
+
+# Level index returned by _ADMIT_LUA
+_BLOCKED_GLOBAL = 1
+_BLOCKED_WORKSPACE = 2
+
+
+class AdmissionController:
+    """
+    Concurrency admission for outbound calls, backed by Redis counters.
+
+    Limits (0/None = unlimited):
+      • global    – settings.DISPATCH_MAX_CONCURRENT_CALLS
+      • workspace – plan feature `max_concurrent_calls`
+                    (fallback settings.DISPATCH_WORKSPACE_MAX_CONCURRENT_CALLS)
+      • agent     – Agent.max_concurrent_calls
+      • trunk     – SIPTrunk.max_concurrent_calls
+
+    A task is admitted atomically (all counters checked and incremented in
+    one Lua call) when the scheduler promotes it to CALL_TRIGGERED. The keys
+    it incremented are remembered in `admission:held:<task_id>`, so release
+    is idempotent and can be called from every exit path (end_of_call,
+    reschedule, deletion, cleanup). `reconcile()` heals drift against
+    Postgres with releases/adoptions and a version-checked recount, so it
+    never drops admissions made while it runs.
+
+    Within a batch, workspaces are served by weighted fair share: the next
+    slot goes to the workspace with the lowest in-flight/weight ratio, where
+    the weight is its workspace limit (capped at the global limit).
+    """
+
+    GLOBAL_KEY = "admission:inflight:global"
+    WORKSPACE_KEY = "admission:inflight:ws:{id}"
+    AGENT_KEY = "admission:inflight:agent:{id}"
+    TRUNK_KEY = "admission:inflight:trunk:{id}"
+    HELD_KEY = "admission:held:{id}"
+    INFLIGHT_PATTERN = "admission:inflight:*"
+    HELD_PATTERN = "admission:held:*"
+    # Bumped by every admit/release; guards reconcile's recount
+    VERSION_KEY = "admission:version"
+
+    WORKSPACE_LIMIT_FEATURE = "max_concurrent_calls"
+    WORKSPACE_LIMIT_CACHE_KEY = "admission:ws_limit:{id}"
+    WORKSPACE_LIMIT_CACHE_TIMEOUT = 60
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_redis_client()
+        self._admit = self.redis.register_script(_ADMIT_LUA)
+        self._release = self.redis.register_script(_RELEASE_LUA)
+        self._adopt = self.redis.register_script(_ADOPT_LUA)
+        self._recount = self.redis.register_script(_RECOUNT_LUA)
+        self.global_limit = int(getattr(settings, "DISPATCH_MAX_CONCURRENT_CALLS", 100))
+        # Held records outlive any sane call; reconcile() is the real safety net
+        self.held_ttl = int(getattr(settings, "DISPATCH_ADMISSION_HELD_TTL_SECONDS", 4 * 3600))
+
+    # ── capacity ─────────────────────────────────────────────────────────
+    def inflight(self) -> int:
+        return int(self.redis.get(self.GLOBAL_KEY) or 0)
+
+    def available_global(self) -> int:
+        if self.global_limit <= 0:
+            return int(getattr(settings, "DISPATCH_MAX_BATCH", 500))
+        return max(self.global_limit - self.inflight(), 0)
+
+    def workspace_limits(self, workspace_ids: Iterable[str]) -> Dict[str, int]:
+        """Plan-driven workspace limits (0 = unlimited), cached for a minute."""
+        from core.models import PlanFeature
+
+        ids = {str(w) for w in workspace_ids}
+        keys = {w: self.WORKSPACE_LIMIT_CACHE_KEY.format(id=w) for w in ids}
+        cached = cache.get_many(list(keys.values()))
+        limits = {w: cached[k] for w, k in keys.items() if k in cached}
+
+        missing = ids - set(limits)
+        if missing:
+            default = int(getattr(settings, "DISPATCH_WORKSPACE_MAX_CONCURRENT_CALLS", 0))
+            fetched = {w: default for w in missing}
+            rows = PlanFeature.objects.filter(
+                feature__feature_name=self.WORKSPACE_LIMIT_FEATURE,
+                plan__workspacesubscription__is_active=True,
+                plan__workspacesubscription__workspace_id__in=list(missing),
+            ).values_list("plan__workspacesubscription__workspace_id", "limit")
+            for workspace_id, limit in rows:
+                fetched[str(workspace_id)] = int(limit)
+            cache.set_many(
+                {keys[w]: v for w, v in fetched.items()},
+                timeout=self.WORKSPACE_LIMIT_CACHE_TIMEOUT,
+            )
+            limits.update(fetched)
+        return limits
+
+    # ── admission ────────────────────────────────────────────────────────
+    def _counter_keys(self, candidate) -> List[str]:
+        keys = [
+            self.GLOBAL_KEY,
+            self.WORKSPACE_KEY.format(id=candidate.workspace_id),
+            self.AGENT_KEY.format(id=candidate.agent_id),
+        ]
+        if candidate.trunk_id:
+            keys.append(self.TRUNK_KEY.format(id=candidate.trunk_id))
+        return keys
+
+    def try_admit(self, candidate, workspace_limit: int) -> int:
+        """Admit one ClaimCandidate. Returns 0/-1 on success, else the blocking level."""
+        limits = [self.global_limit, workspace_limit, candidate.agent_limit or 0]
+        if candidate.trunk_id:
+            limits.append(candidate.trunk_limit or 0)
+        return int(
+            self._admit(
+                keys=[self.HELD_KEY.format(id=candidate.id)] + self._counter_keys(candidate) + [self.VERSION_KEY],
+                args=[self.held_ttl] + [max(int(l), 0) for l in limits],
+            )
+        )
+
+    def admit_batch(self, candidates: Sequence, limit: int) -> List[str]:
+        """
+        Admit up to `limit` candidates with weighted fair share across
+        workspaces. Returns the admitted CallTask ids (already counted).
+        """
+        if not candidates or limit <= 0:
+            return []
+
+        per_workspace: Dict[str, List] = defaultdict(list)
+        for candidate in candidates:
+            per_workspace[candidate.workspace_id].append(candidate)
+
+        workspace_ids = list(per_workspace)
+        limits = self.workspace_limits(workspace_ids)
+        inflight = self.redis.mget([self.WORKSPACE_KEY.format(id=w) for w in workspace_ids])
+
+        cap = self.global_limit if self.global_limit > 0 else limit
+        heap = []
+        for order, (workspace_id, current) in enumerate(zip(workspace_ids, inflight)):
+            weight = min(limits.get(workspace_id) or cap, cap) or 1
+            used = int(current or 0)
+            heapq.heappush(heap, (used / weight, order, workspace_id, used, weight))
+
+        admitted: List[str] = []
+        while heap and len(admitted) < limit:
+            _, order, workspace_id, used, weight = heapq.heappop(heap)
+            queue = per_workspace[workspace_id]
+            candidate = queue.pop(0)
+
+            result = self.try_admit(candidate, limits.get(workspace_id) or 0)
+            if result <= 0:
+                admitted.append(candidate.id)
+                used += 1
+            elif result == _BLOCKED_GLOBAL:
+                break
+            elif result == _BLOCKED_WORKSPACE:
+                # Workspace is full; its remaining candidates wait for a later tick
+                continue
+            # Agent/trunk full: skip this candidate, keep serving the workspace
+
+            if queue:
+                heapq.heappush(heap, (used / weight, order, workspace_id, used, weight))
+
+        return admitted
+
+    # ── release ──────────────────────────────────────────────────────────
+    def release(self, task_id) -> bool:
+        return bool(self._release(keys=[self.HELD_KEY.format(id=task_id), self.VERSION_KEY]))
+
+    def release_many(self, task_ids: Iterable) -> int:
+        released = 0
+        for task_id in task_ids:
+            try:
+                released += int(self.release(task_id))
+            except Exception as e:
+                logger.warning(f"⚠️ Admission release failed for CallTask {task_id}: {e}")
+        return released
+
+    # ── reconciliation ───────────────────────────────────────────────────
+    def reconcile(self) -> Dict[str, int]:
+        """
+        Heal drift between the admission state and active CallTasks without
+        losing admissions made while it runs:
+
+          1. held records of tasks not active in Postgres are released, unless
+             younger than DISPATCH_ADMISSION_RECONCILE_GRACE_SECONDS (a claim
+             whose promotion has not committed yet)
+          2. active tasks without a held record are counted (no limits)
+          3. counters are recomputed from the held records and written only
+             if no admit/release ran in between; otherwise the next run retries
+        """
+        from core.models import CallTask
+        from core.telephony.repositories.call_repo import ACTIVE_STATUSES
+
+        rows = CallTask.objects.filter(
+            status__in=[str(s) for s in ACTIVE_STATUSES]
+        ).values_list("id", "workspace_id", "agent_id", "agent__phone_number__sip_trunk_id")
+
+        active: Dict[str, List[str]] = {}
+        for task_id, workspace_id, agent_id, trunk_id in rows:
+            keys = [
+                self.GLOBAL_KEY,
+                self.WORKSPACE_KEY.format(id=workspace_id),
+                self.AGENT_KEY.format(id=agent_id),
+            ]
+            if trunk_id:
+                keys.append(self.TRUNK_KEY.format(id=trunk_id))
+            active[str(task_id)] = keys
+
+        # 1) stale held records (released through the normal script)
+        grace = int(getattr(settings, "DISPATCH_ADMISSION_RECONCILE_GRACE_SECONDS", 120))
+        prefix = self.HELD_KEY.format(id="")
+        stale_held = 0
+        for key in self.redis.scan_iter(self.HELD_PATTERN, count=1000):
+            task_id = (key.decode() if isinstance(key, bytes) else key)[len(prefix):]
+            if task_id in active:
+                continue
+            ttl = self.redis.ttl(key)
+            if ttl is not None and ttl >= 0 and self.held_ttl - ttl < grace:
+                continue
+            stale_held += int(self.release(task_id))
+
+        # 2) active tasks nobody counted
+        adopted = 0
+        if active:
+            pipe = self.redis.pipeline(transaction=False)
+            for task_id, keys in active.items():
+                self._adopt(
+                    keys=[self.HELD_KEY.format(id=task_id)] + keys + [self.VERSION_KEY],
+                    args=[self.held_ttl],
+                    client=pipe,
+                )
+            adopted = sum(int(r) for r in pipe.execute())
+
+        # 3) counters from the held records (heals expired records and manual edits)
+        recounted = False
+        counters: Counter = Counter()
+        for _ in range(3):
+            version = int(self.redis.get(self.VERSION_KEY) or 0)
+            held_keys = list(self.redis.scan_iter(self.HELD_PATTERN, count=1000))
+            counters = Counter()
+            for value in (self.redis.mget(held_keys) if held_keys else []):
+                if value:
+                    counters.update((value.decode() if isinstance(value, bytes) else value).split(","))
+            existing = {
+                k.decode() if isinstance(k, bytes) else k
+                for k in self.redis.scan_iter(self.INFLIGHT_PATTERN, count=1000)
+            }
+            keys = sorted(existing | set(counters))
+            if not keys:
+                recounted = True
+                break
+            if int(self._recount(keys=[self.VERSION_KEY] + keys, args=[version] + [counters.get(k, 0) for k in keys])):
+                recounted = True
+                break
+
+        return {
+            "active": len(active),
+            "counters": len(counters),
+            "stale_held_removed": stale_held,
+            "adopted": adopted,
+            "recounted": recounted,
+        }
+
+
+def release_admission(call_task_id) -> None:
+    """
+    Release a CallTask's admission slot (and any call-minute reservation it
+    still holds) once the surrounding transaction commits. Safe to call
+    repeatedly and for tasks that were never admitted.
+    """
+    def _release():
+        from core.quotas import release_call_reservations
+
+        try:
+            AdmissionController().release(str(call_task_id))
+        except Exception as e:
+            logger.warning(f"⚠️ Admission release failed for CallTask {call_task_id}: {e}")
+        release_call_reservations([call_task_id])
+
+    transaction.on_commit(_release)
@@ -0,0 +1,395 @@
+"""
+Batched dispatch of claimed CallTasks (`trigger_call_batch`).
+
+With DIALER_MODE="batch" the scheduler sends each claimed batch as one
+Celery message instead of one `trigger_call` per task. A batch follows the
+same stages as DialerService, with set-based I/O:
+
+  1. prepare   one SELECT … FOR UPDATE SKIP LOCKED (select_related lead,
+               agent, workspace) for the whole batch; status / max-retries
+               guards; trigger_started stamped with one bulk_update
+  2. payload   one snapshot read per agent, one quota check per workspace,
+               template contexts resolved in bulk and rendered per agent
+  3. dispatch  all calls concurrently on one event loop through a single
+               pooled LiveKit client (DIALER_BATCH_CONCURRENCY in flight)
+  4. write     every outcome (IN_PROGRESS / RETRY) in one bulk_update of
+               the rows that are still CALL_TRIGGERED
+
+Idempotency is kept per task: a row that is locked by another trigger,
+is no longer CALL_TRIGGERED or already carries trigger_started for this
+claim is skipped and reported, never dispatched twice.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+import aiohttp
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import CallStatus, CallTask
+from core.telephony.services.dialer_service import DEFAULT_RESERVED_CALL_MINUTES, DialerService, PreparedCall
+from core.telephony.services.dispatch_metrics import DispatchTimer
+
+
+class BatchDispatcher:
+    """Dispatch a batch of CALL_TRIGGERED CallTasks in one pass."""
+
+    def __init__(self, logger, *, concurrency: int = None):
+        self.logger = logger
+        self.concurrency = max(int(concurrency or getattr(settings, "DIALER_BATCH_CONCURRENCY", 50)), 1)
+        self.dialer = DialerService(logger)
+        # Per-task dispatch outcomes, kept so a failed run can tell placed calls apart
+        self.outcomes: Dict[str, Dict[str, Any]] = {}
+        # Tasks this run stamped trigger_started on (None until prepare got that far)
+        self.claimed: Optional[List[str]] = None
+
+    def run(self, call_task_ids: Sequence[str]) -> Dict[str, Any]:
+        ids = list(dict.fromkeys(str(pk) for pk in call_task_ids))
+        results: Dict[str, Dict[str, Any]] = {}
+
+        prepared = self.prepare(ids, results)
+        if prepared:
+            try:
+                knowledge = self._fetch_knowledge(prepared)
+                async_to_sync(self._dispatch_all)(prepared, knowledge)
+                self.write_back(prepared, self.outcomes, results)
+            except Exception:
+                # Placed calls must leave CALL_TRIGGERED or the caller's reschedule dials them again
+                self.mark_placed()
+                raise
+
+        placed = sum(1 for r in results.values() if r.get("success"))
+        return {
+            "success": True,
+            "requested": len(ids),
+            "placed": placed,
+            "not_placed": len(results) - placed,
+            "results": results,
+        }
+
+    def mark_placed(self) -> int:
+        """Move tasks with a successful outcome to IN_PROGRESS (after a failed write-back)."""
+        placed = [pk for pk, outcome in self.outcomes.items() if outcome.get("success")]
+        if not placed:
+            return 0
+        try:
+            return CallTask.objects.filter(id__in=placed, status=CallStatus.CALL_TRIGGERED).update(
+                status=CallStatus.IN_PROGRESS, updated_at=timezone.now()
+            )
+        except Exception as e:
+            self.logger.error(f"❌ Could not mark {len(placed)} placed calls IN_PROGRESS: {e}")
+            return 0
+
+    def unplaced(self, call_task_ids: Sequence[str]) -> List[str]:
+        """
+        Tasks of this run that may be rescheduled after it failed: the ones it
+        claimed (all requested ones when it failed before claiming) that have
+        no successful dispatch outcome.
+        """
+        owned = self.claimed if self.claimed is not None else [str(pk) for pk in call_task_ids]
+        return [pk for pk in owned if not self.outcomes.get(pk, {}).get("success")]
+
+    # ── 1 + 2) prepare ───────────────────────────────────────────────────
+    def prepare(self, ids: List[str], results: Dict[str, Dict[str, Any]]) -> List[PreparedCall]:
+        from core.quotas import QuotaExceeded, reserve_call_minutes
+        from core.services.script_template_service import script_template_service
+        from core.telephony.services.dispatch_snapshot import dispatch_snapshots
+        from core.telephony.services.rate_limiter import CallRateLimit
+        from core.utils.calltask_utils import reschedule_without_increment
+
+        started_at = time.time()
+        with transaction.atomic():
+            tasks = list(
+                CallTask.objects.select_related("lead", "agent", "workspace")
+                .select_for_update(of=("self",), skip_locked=True)
+                .filter(id__in=ids)
+            )
+            for pk in set(ids) - {str(t.id) for t in tasks}:
+                # Deleted, or locked by a concurrent trigger of the same task
+                results[pk] = {"success": False, "reason": "missing_or_locked"}
+
+            live: List[CallTask] = []
+            expired: List[CallTask] = []
+            for task in tasks:
+                timeline = task.dispatch_timeline or {}
+                if task.status != CallStatus.CALL_TRIGGERED:
+                    results[str(task.id)] = {"success": False, "reason": "stale_trigger", "status": task.status}
+                elif "trigger_started" in timeline:
+                    results[str(task.id)] = {"success": False, "reason": "already_triggered"}
+                elif task.agent is not None and task.attempts >= task.agent.max_retries:
+                    expired.append(task)
+                else:
+                    live.append(task)
+
+            # EARLY MAX-RETRIES GUARD, as in prepare_dispatch
+            if expired:
+                self.logger.warning(f"🗑️ Deleting {len(expired)} CallTasks at max retries before dispatch")
+                CallTask.objects.filter(id__in=[t.id for t in expired]).delete()
+                for task in expired:
+                    results[str(task.id)] = {"success": False, "deleted": True, "message": "Max retries reached - task deleted before dispatch"}
+
+            now = timezone.now()
+            for task in live:
+                timeline = dict(task.dispatch_timeline or {})
+                timeline["trigger_started"] = started_at
+                task.dispatch_timeline = timeline
+                task.updated_at = now
+            if live:
+                CallTask.objects.bulk_update(live, ["dispatch_timeline", "updated_at"], batch_size=500)
+        self.claimed = [str(t.id) for t in live]
+
+        if not live:
+            return []
+
+        # One snapshot per agent
+        snapshots = {}
+        for agent_id in {t.agent_id for t in live}:
+            snapshots[agent_id] = dispatch_snapshots.get(agent_id)
+        missing = [t for t in live if snapshots.get(t.agent_id) is None]
+        for task in missing:
+            self.logger.error(f"❌ Agent {task.agent_id} vanished before trigger of {task.id}.")
+            results[str(task.id)] = {"success": False, "error": "agent_missing", "id": str(task.id)}
+        live = [t for t in live if snapshots.get(t.agent_id) is not None]
+
+        # Reserve each call's maximum minutes (test calls without a lead are exempt);
+        # once a workspace runs out, the rest of its tasks are refused with it
+        by_workspace: Dict[Any, List[CallTask]] = defaultdict(list)
+        for task in live:
+            if task.lead is not None:
+                by_workspace[task.workspace_id].append(task)
+        over_quota: List[CallTask] = []
+        unchecked: List[CallTask] = []
+        for workspace_id, workspace_tasks in by_workspace.items():
+            for index, task in enumerate(workspace_tasks):
+                minutes = snapshots[task.agent_id].max_call_duration_minutes or DEFAULT_RESERVED_CALL_MINUTES
+                try:
+                    reserve_call_minutes(task.workspace, task.id, minutes)
+                except QuotaExceeded as quota_err:
+                    self.logger.warning(f"🚫 Call quota exceeded for workspace {workspace_id}: {quota_err}")
+                    over_quota.extend(workspace_tasks[index:])
+                    for refused in workspace_tasks[index:]:
+                        results[str(refused.id)] = {
+                            "success": False,
+                            "error": "quota_exceeded",
+                            "message": f"Call task deleted - {quota_err}",
+                        }
+                    break
+                except Exception as quota_err:
+                    # Fail closed: an unavailable quota backend must not switch the limits off
+                    self.logger.error(f"❌ Quota check failed for workspace {workspace_id}: {quota_err}")
+                    unchecked.extend(workspace_tasks[index:])
+                    for refused in workspace_tasks[index:]:
+                        reschedule_without_increment(refused, "quota_check_failed", str(quota_err))
+                        results[str(refused.id)] = {"success": False, "reason": "quota_check_failed", "rescheduled": True}
+                    break
+        if over_quota:
+            CallTask.objects.filter(
+                id__in=[t.id for t in over_quota], status=CallStatus.CALL_TRIGGERED
+            ).delete()
+        if over_quota or unchecked:
+            dropped = {t.id for t in over_quota} | {t.id for t in unchecked}
+            live = [t for t in live if t.id not in dropped]
+
+        # Template contexts in bulk, rendering per agent (template compiled once)
+        contexts = script_template_service.contexts_for_target_refs(
+            [t.target_ref for t in live],
+            leads={str(t.lead_id): t.lead for t in live if t.lead is not None},
+        )
+        by_agent: Dict[Any, List[CallTask]] = defaultdict(list)
+        for task in live:
+            by_agent[task.agent_id].append(task)
+
+        prepared: List[PreparedCall] = []
+        for agent_id, agent_tasks in by_agent.items():
+            snapshot = snapshots[agent_id]
+            task_contexts = [contexts.get(t.target_ref) or {} for t in agent_tasks]
+            render_started = time.perf_counter()
+            scripts = script_template_service.render_many(snapshot.script_template, task_contexts)
+            greetings = script_template_service.render_many(snapshot.greeting_outbound, task_contexts)
+            render_seconds = (time.perf_counter() - render_started) / len(agent_tasks)
+
+            rate_limit = CallRateLimit.from_snapshot(snapshot)
+            for task, script, greeting in zip(agent_tasks, scripts, greetings):
+                timer = DispatchTimer(
+                    workspace_id=snapshot.workspace_id, agent_id=snapshot.agent_id, trunk_id=snapshot.sip_trunk_pk
+                )
+                timeline = task.dispatch_timeline
+                if "claimed" in timeline:
+                    timer.durations["queue_wait"] = started_at - float(timeline["claimed"])
+                timer.durations["template_render"] = render_seconds
+                prepared.append(PreparedCall(
+                    call_task_id=str(task.id),
+                    sip_trunk_id=snapshot.sip_trunk_id,
+                    agent_config=DialerService.build_agent_config(snapshot, script, greeting),
+                    lead_data=DialerService.build_lead_data(task),
+                    from_number=snapshot.from_number,
+                    rate_limit=rate_limit,
+                    trunk_pk=snapshot.sip_trunk_pk,
+                    timer=timer,
+                ))
+        return prepared
+
+    # ── 3) dispatch ──────────────────────────────────────────────────────
+    @staticmethod
+    def _fetch_knowledge(prepared: List[PreparedCall]) -> Dict[str, Any]:
+        """KB document once per agent (served from the KB cache)."""
+        from ._dialer_async import _fetch_knowledge_document_sync
+
+        knowledge: Dict[str, Any] = {}
+        seconds: Dict[str, float] = {}
+        for call in prepared:
+            agent_id = call.agent_config.get("agent_id")
+            if agent_id not in knowledge:
+                started = time.perf_counter()
+                knowledge[agent_id] = _fetch_knowledge_document_sync(
+                    agent_id, call.agent_config.get("knowledge_documents", [])
+                )
+                seconds[agent_id] = time.perf_counter() - started
+            call.timer.durations["kb_fetch"] = seconds[agent_id]
+        return knowledge
+
+    async def _dispatch_all(self, prepared: List[PreparedCall], knowledge: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        from ._dialer_async import _make_call_async, create_livekit_api
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=60),
+        )
+        livekit_api = create_livekit_api(session=session)
+
+        async def one(call: PreparedCall) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    outcome = await _make_call_async(
+                        call.sip_trunk_id,
+                        call.agent_config,
+                        call.lead_data,
+                        call.from_number,
+                        call_task_id=call.call_task_id,
+                        knowledge_content=knowledge.get(call.agent_config.get("agent_id"), ""),
+                        livekit_api=livekit_api,
+                        rate_limit=call.rate_limit,
+                        trunk_pk=call.trunk_pk,
+                    )
+                except Exception as e:
+                    outcome = {"success": False, "error": str(e), "abort_reason": "trigger_exception"}
+                self.outcomes[call.call_task_id] = outcome
+                return outcome
+
+        try:
+            outcomes = await asyncio.gather(*(one(call) for call in prepared))
+        finally:
+            try:
+                await livekit_api.aclose()
+            finally:
+                await session.close()
+        return {call.call_task_id: outcome for call, outcome in zip(prepared, outcomes)}
+
+    # ── 4) write back ────────────────────────────────────────────────────
+    def write_back(
+        self,
+        prepared: List[PreparedCall],
+        outcomes: Dict[str, Dict[str, Any]],
+        results: Dict[str, Dict[str, Any]],
+    ) -> None:
+        from core.quotas import release_call_reservations
+        from core.telephony.services.active_phones import ActivePhoneIndex
+        from core.telephony.services.admission import AdmissionController
+        from core.telephony.services.circuit_breaker import CIRCUIT_OPEN
+        from core.telephony.services.dial_windows import call_task_window
+        from core.telephony.services.due_index import DueIndex, due_at
+        from core.telephony.services.rate_limiter import THROTTLE_ABORT_REASONS
+        from core.utils.calltask_utils import calculate_next_call_times
+
+        timers = {call.call_task_id: call.timer for call in prepared}
+        now = timezone.now()
+
+        with transaction.atomic():
+            tasks = list(
+                CallTask.objects.select_related("agent")
+                .select_for_update(of=("self",))
+                .filter(id__in=list(outcomes), status=CallStatus.CALL_TRIGGERED)
+            )
+            for pk in set(outcomes) - {str(t.id) for t in tasks}:
+                results[pk] = {"success": bool(outcomes[pk].get("success")), "reason": "status_changed"}
+
+            failed_by_agent: Dict[Any, List[CallTask]] = defaultdict(list)
+            for task in tasks:
+                result = outcomes[str(task.id)]
+                self.dialer._close_timeline(task, timers.get(str(task.id)), result)
+                task.updated_at = now
+                if result.get("success"):
+                    task.status = CallStatus.IN_PROGRESS
+                    results[str(task.id)] = {
+                        "success": True,
+                        "room_name": result.get("room_name"),
+                        "dispatch_id": result.get("dispatch_id"),
+                        "participant_id": result.get("participant_id"),
+                        "sip_call_id": result.get("sip_call_id"),
+                    }
+                else:
+                    failed_by_agent[task.agent_id].append(task)
+
+            failed: List[CallTask] = []
+            for agent_tasks in failed_by_agent.values():
+                agent = agent_tasks[0].agent
+                next_calls = calculate_next_call_times(agent, [now] * len(agent_tasks))
+                for task, next_call in zip(agent_tasks, next_calls):
+                    result = outcomes[str(task.id)]
+                    reason = result.get("abort_reason") or "failed"
+                    hint = result.get("error") or reason
+                    # CPS throttling and open circuits are not call attempts. Tasks
+                    # that reach max retries are deleted by the early guard next time.
+                    if reason not in THROTTLE_ABORT_REASONS and reason != CIRCUIT_OPEN:
+                        task.attempts += 1
+                    task.status = CallStatus.RETRY
+                    task.next_call = next_call
+                    task.eligible_from, task.eligible_until = call_task_window(agent, next_call)
+                    task.retry_reasons = ((task.retry_reasons or []) + [
+                        {"reason": reason, "hint": hint, "at": now.isoformat()}
+                    ])[-30:]
+                    failed.append(task)
+                    results[str(task.id)] = {
+                        "success": False,
+                        "error": result.get("error"),
+                        "abort_reason": reason,
+                        "attempts": task.attempts,
+                    }
+
+            if tasks:
+                CallTask.objects.bulk_update(
+                    tasks,
+                    ["status", "attempts", "next_call", "eligible_from", "eligible_until",
+                     "retry_reasons", "dispatch_timeline", "updated_at"],
+                    batch_size=500,
+                )
+
+            if failed:
+                failed_ids = [str(t.id) for t in failed]
+                failed_phones = [t.phone for t in failed]
+                due_entries = [(str(t.id), t.workspace_id, due_at(t.next_call, t.eligible_from)) for t in failed]
+
+                def _release():
+                    AdmissionController().release_many(failed_ids)
+                    release_call_reservations(failed_ids)
+                    try:
+                        if ActivePhoneIndex.enabled():
+                            ActivePhoneIndex().remove_many(failed_phones)
+                        if DueIndex.enabled():
+                            DueIndex().push_many(due_entries)
+                    except Exception as e:
+                        self.logger.warning(f"⚠️ Release after failed batch dispatch incomplete: {e}")
+
+                transaction.on_commit(_release)
+
+        self.logger.info(
+            f"📞 Batch dispatch: {sum(1 for t in tasks if t.status == CallStatus.IN_PROGRESS)} placed, "
+            f"{len(failed)} rescheduled"
+        )
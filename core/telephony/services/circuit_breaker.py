@@ -0,0 +1,276 @@
+"""
+Shared circuit breakers for the outbound call path.
+
+When LiveKit or a SIP trunk degrades, every claimed CallTask would otherwise
+still go through create_dispatch / create_sip_participant, wait for a
+timeout, fail and be rescheduled. Breakers live in Redis so every scheduler
+and dialer process sees the same state:
+
+  breaker:{scope}        hash: state, failures, first_failure_at, opened_at
+  breaker:{scope}:probe  held by the single half-open probe call
+  breaker:open           set of scopes currently not closed
+
+Scopes are `livekit:{LIVEKIT_URL}` (agent dispatch, API reachability) and
+`trunk:{sip_trunk_pk}` (SIP participant creation).
+
+    closed    → FAILURE_THRESHOLD consecutive failures within WINDOW → open
+    open      → calls fail fast; after COOLDOWN the next call becomes the probe
+    half_open → exactly one probe call; success closes, failure re-opens
+
+The scheduler reads `dispatch_gate()` each tick: it skips promotion while
+the LiveKit breaker is open and never promotes tasks on an open trunk
+(at most one per tick on a trunk that is ready to probe).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional
+
+from django.conf import settings
+
+from core.utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+CIRCUIT_OPEN = "circuit_open"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+# KEYS: state hash, probe key; ARGV: cooldown ms, probe ttl ms
+# Returns 1 allowed, 2 allowed as the half-open probe, 0 rejected
+_ALLOW_LUA = """
+redis.replicate_commands()
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HGET', KEYS[1], 'state')
+if not state or state == 'closed' then
+    return 1
+end
+if state == 'open' then
+    local opened_at = tonumber(redis.call('HGET', KEYS[1], 'opened_at') or '0')
+    if now - opened_at < tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'state', 'half_open')
+end
+if redis.call('SET', KEYS[2], '1', 'NX', 'PX', ARGV[2]) then
+    return 2
+end
+return 0
+"""
+
+# KEYS: state hash, probe key, open set; ARGV: threshold, window ms, scope, ttl ms
+# Returns 1 if the breaker is (now) open
+_FAILURE_LUA = """
+redis.replicate_commands()
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local opened = 0
+if state == 'half_open' then
+    opened = 1
+elseif state == 'open' then
+    return 1
+else
+    local first = tonumber(redis.call('HGET', KEYS[1], 'first_failure_at') or '0')
+    local failures = tonumber(redis.call('HGET', KEYS[1], 'failures') or '0')
+    if now - first > tonumber(ARGV[2]) then
+        failures = 0
+        redis.call('HSET', KEYS[1], 'first_failure_at', now)
+    end
+    failures = failures + 1
+    redis.call('HSET', KEYS[1], 'failures', failures, 'state', 'closed')
+    if failures >= tonumber(ARGV[1]) then
+        opened = 1
+    end
+end
+if opened == 1 then
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', now)
+    redis.call('DEL', KEYS[2])
+    redis.call('SADD', KEYS[3], ARGV[3])
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return opened
+"""
+
+# KEYS: state hash, probe key, open set; ARGV: scope
+# Returns 1 if a half-open breaker was closed by this success
+_SUCCESS_LUA = """
+local state = redis.call('HGET', KEYS[1], 'state')
+if state == 'open' then
+    return 0
+end
+if state == 'half_open' then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    redis.call('SREM', KEYS[3], ARGV[1])
+    return 1
+end
+if state then
+    redis.call('HSET', KEYS[1], 'failures', 0)
+end
+return 0
+"""
+
+
+def livekit_scope(url: Optional[str] = None) -> str:
+    return f"livekit:{url or os.getenv('LIVEKIT_URL') or 'default'}"
+
+
+def trunk_scope(trunk_pk) -> Optional[str]:
+    return f"trunk:{trunk_pk}" if trunk_pk else None
+
+
+@dataclass(frozen=True)
+class DispatchGate:
+    """Breaker view for one scheduler tick."""
+
+    livekit_blocked: bool = False
+    livekit_probing: bool = False
+    blocked_trunks: FrozenSet[str] = frozenset()
+    probing_trunks: FrozenSet[str] = frozenset()
+
+    def filter(self, candidates: List) -> List:
+        """Drop candidates on open trunks; keep one per trunk that may probe."""
+        if not (self.blocked_trunks or self.probing_trunks):
+            return candidates
+        kept = []
+        probed = set()
+        for candidate in candidates:
+            trunk_id = candidate.trunk_id
+            if trunk_id in self.blocked_trunks:
+                continue
+            if trunk_id in self.probing_trunks:
+                if trunk_id in probed:
+                    continue
+                probed.add(trunk_id)
+            kept.append(candidate)
+        return kept
+
+
+class CircuitBreaker:
+    """
+    Redis-backed circuit breakers shared by all dialer and scheduler processes.
+
+    Every Redis error fails open (calls are allowed, outcomes not recorded):
+    a Redis outage must not stop dialing on its own.
+    """
+
+    KEY = "breaker:{scope}"
+    PROBE_KEY = "breaker:{scope}:probe"
+    OPEN_SET_KEY = "breaker:open"
+    STATE_TTL_MS = 7 * 24 * 3600 * 1000
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_redis_client()
+        self._allow = self.redis.register_script(_ALLOW_LUA)
+        self._failure = self.redis.register_script(_FAILURE_LUA)
+        self._success = self.redis.register_script(_SUCCESS_LUA)
+        self.failure_threshold = int(getattr(settings, "CIRCUIT_BREAKER_FAILURE_THRESHOLD", 5))
+        self.window_seconds = float(getattr(settings, "CIRCUIT_BREAKER_WINDOW_SECONDS", 60))
+        self.cooldown_seconds = float(getattr(settings, "CIRCUIT_BREAKER_COOLDOWN_SECONDS", 30))
+        self.probe_timeout_seconds = float(getattr(settings, "CIRCUIT_BREAKER_PROBE_TIMEOUT_SECONDS", 60))
+
+    def _keys(self, scope: str) -> List[str]:
+        return [self.KEY.format(scope=scope), self.PROBE_KEY.format(scope=scope)]
+
+    # ── dialer side ──────────────────────────────────────────────────────
+    def allow(self, scope: Optional[str]) -> bool:
+        """Whether a call may go through `scope` now (claims the probe when half-open)."""
+        if not scope:
+            return True
+        try:
+            verdict = int(self._allow(
+                keys=self._keys(scope),
+                args=[int(self.cooldown_seconds * 1000), int(self.probe_timeout_seconds * 1000)],
+            ))
+        except Exception as e:
+            logger.warning(f"⚠️ Circuit breaker unavailable for {scope}: {e}")
+            return True
+        if verdict == 2:
+            logger.info(f"🔌 Circuit {scope} half-open: sending probe call")
+        return verdict != 0
+
+    def record_failure(self, scope: Optional[str]) -> None:
+        if not scope:
+            return
+        try:
+            opened = int(self._failure(
+                keys=self._keys(scope) + [self.OPEN_SET_KEY],
+                args=[self.failure_threshold, int(self.window_seconds * 1000), scope, self.STATE_TTL_MS],
+            ))
+            if opened:
+                logger.warning(f"🔴 Circuit {scope} open")
+        except Exception as e:
+            logger.warning(f"⚠️ Circuit breaker failure not recorded for {scope}: {e}")
+
+    def record_success(self, scope: Optional[str]) -> None:
+        if not scope:
+            return
+        try:
+            if int(self._success(keys=self._keys(scope) + [self.OPEN_SET_KEY], args=[scope])):
+                logger.info(f"🟢 Circuit {scope} closed after successful probe")
+        except Exception as e:
+            logger.warning(f"⚠️ Circuit breaker success not recorded for {scope}: {e}")
+
+    # ── scheduler / readiness side ───────────────────────────────────────
+    def states(self) -> Dict[str, Dict[str, object]]:
+        """State of every breaker that is not closed."""
+        scopes = sorted(s.decode() if isinstance(s, bytes) else s for s in self.redis.smembers(self.OPEN_SET_KEY))
+        if not scopes:
+            return {}
+        pipe = self.redis.pipeline(transaction=False)
+        for scope in scopes:
+            pipe.hmget(self.KEY.format(scope=scope), "state", "opened_at", "failures")
+            pipe.exists(self.PROBE_KEY.format(scope=scope))
+        results = pipe.execute()
+
+        now_ms = time.time() * 1000
+        out: Dict[str, Dict[str, object]] = {}
+        stale: List[str] = []
+        for scope, (state_row, probe_held) in zip(scopes, zip(results[0::2], results[1::2])):
+            state, opened_at, failures = (v.decode() if isinstance(v, bytes) else v for v in state_row)
+            if state not in (OPEN, HALF_OPEN):
+                stale.append(scope)
+                continue
+            opened_at = float(opened_at or 0)
+            cooled = now_ms - opened_at >= self.cooldown_seconds * 1000
+            out[scope] = {
+                "state": state,
+                "opened_seconds_ago": round((now_ms - opened_at) / 1000, 1),
+                "failures": int(failures or 0),
+                "probe_in_flight": bool(probe_held),
+                # Ready for the next call to become the half-open probe
+                "probe_ready": (state == OPEN and cooled) or (state == HALF_OPEN and not probe_held),
+            }
+        if stale:
+            self.redis.srem(self.OPEN_SET_KEY, *stale)
+        return out
+
+    def dispatch_gate(self) -> DispatchGate:
+        try:
+            states = self.states()
+        except Exception as e:
+            logger.warning(f"⚠️ Circuit breaker state unavailable: {e}")
+            return DispatchGate()
+        if not states:
+            return DispatchGate()
+
+        livekit = states.get(livekit_scope())
+        blocked, probing = set(), set()
+        for scope, info in states.items():
+            if not scope.startswith("trunk:"):
+                continue
+            (probing if info["probe_ready"] else blocked).add(scope.split(":", 1)[1])
+        return DispatchGate(
+            livekit_blocked=bool(livekit and not livekit["probe_ready"]),
+            livekit_probing=bool(livekit and livekit["probe_ready"]),
+            blocked_trunks=frozenset(blocked),
+            probing_trunks=frozenset(probing),
+        )
@@ -0,0 +1,103 @@
+"""
+SQL-side dialing-window eligibility.
+
+The claim query filters on two denormalized columns instead of checking
+agent hours in Python after candidates were fetched:
+
+  core_agent.dial_window_open      is the agent inside its calling hours now?
+  core_calltask.eligible_from/until  the window next_call falls into
+
+CallTask windows are filled on save (core/signals.py). `refresh_dial_windows`
+(beat) flips agent flags whose boundary has passed and rolls tasks whose
+window closed without being dialed into their next window, so hour changes
+and DST shifts never let an out-of-window task reach preflight.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+
+from core.utils.dial_calendar import dial_calendar_for
+
+logger = logging.getLogger(__name__)
+
+
+def call_task_window(agent, next_call: Optional[datetime]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """(eligible_from, eligible_until) for a task of `agent` due at `next_call`."""
+    if agent is None or next_call is None:
+        return None, None
+    start, end = dial_calendar_for(agent).window(next_call)
+    return max(start, next_call), end
+
+
+def refresh_agent_windows(now: datetime) -> Dict[str, int]:
+    """
+    Recompute dial_window_open for agents whose boundary has passed (or was
+    never computed). Agents inside a stable window are not touched.
+    """
+    from core.models import Agent
+
+    agents = list(
+        Agent.objects.filter(Q(dial_window_changes_at__isnull=True) | Q(dial_window_changes_at__lte=now))
+        .only("agent_id", "workdays", "call_from", "call_to", "dial_window_open", "dial_window_changes_at")
+    )
+    flipped = 0
+    for agent in agents:
+        open_now, changes_at = dial_calendar_for(agent).next_change(now)
+        flipped += int(open_now != agent.dial_window_open)
+        agent.dial_window_open = open_now
+        agent.dial_window_changes_at = changes_at
+    if agents:
+        # bulk_update skips post_save, so dispatch snapshots are not invalidated
+        Agent.objects.bulk_update(agents, ["dial_window_open", "dial_window_changes_at"], batch_size=500)
+    return {"agents": len(agents), "flipped": flipped}
+
+
+def roll_call_task_windows(now: datetime, *, limit: int = 5000) -> Dict[str, int]:
+    """
+    Move schedulable tasks whose window closed (or was never computed) into
+    the next window of their agent. Processes at most `limit` rows per call,
+    locking them with SKIP LOCKED so a concurrent claim is never blocked.
+    """
+    from core.models import CallTask
+    from core.telephony.repositories.call_repo import SCHEDULABLE_STATUSES
+    from core.telephony.services.due_index import DueIndex
+
+    with transaction.atomic():
+        tasks: List[CallTask] = list(
+            CallTask.objects.select_related("agent")
+            .filter(status__in=[str(s) for s in SCHEDULABLE_STATUSES])
+            .filter(Q(eligible_until__isnull=True) | Q(eligible_until__lt=now))
+            .select_for_update(of=("self",), skip_locked=True)
+            .order_by("next_call")[:limit]
+        )
+        if not tasks:
+            return {"rolled": 0}
+
+        by_agent: Dict[str, List[CallTask]] = {}
+        for task in tasks:
+            by_agent.setdefault(str(task.agent_id), []).append(task)
+        for agent_tasks in by_agent.values():
+            calendar = dial_calendar_for(agent_tasks[0].agent)
+            for task in agent_tasks:
+                start, end = calendar.window(max(task.next_call, now))
+                task.eligible_from = max(start, task.next_call)
+                task.eligible_until = end
+        CallTask.objects.bulk_update(tasks, ["eligible_from", "eligible_until"], batch_size=500)
+
+        if DueIndex.enabled():
+            entries = [(str(t.id), t.workspace_id, t.eligible_from) for t in tasks]
+
+            def _push():
+                try:
+                    DueIndex().push_many(entries)
+                except Exception as e:
+                    logger.warning(f"⚠️ Due index push failed for {len(entries)} rolled CallTasks: {e}")
+
+            transaction.on_commit(_push)
+
+    return {"rolled": len(tasks)}
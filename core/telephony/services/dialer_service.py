@@ -1,12 +1,18 @@
 from __future__ import annotations
 
+import time
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import transaction
 
 from core.models import CallTask, CallStatus
 from core.telephony.repositories.call_repo import lock_call_task
+from core.telephony.services.dispatch_metrics import DispatchTimer
+
+# Minutes reserved for a call whose agent has no max_call_duration_minutes
+DEFAULT_RESERVED_CALL_MINUTES = 30
 
 
 @dataclass
@@ -20,30 +26,252 @@ class PlaceCallResult:
     error: Optional[str] = None
 
 
+@dataclass
+class PreparedCall:
+    """Everything the low-level dialer needs, resolved from a CALL_TRIGGERED task."""
+    call_task_id: str
+    sip_trunk_id: Optional[str]
+    agent_config: Dict[str, Any]
+    lead_data: Dict[str, Any]
+    from_number: Optional[str]
+    rate_limit: Optional[Any] = None
+    trunk_pk: Optional[str] = None
+    timer: Optional[Any] = None
+
+
 class DialerService:
     """
     Orchestrates outbound calls with idempotency by CallTask.
+
+    Stages (shared by the Celery `trigger_call` task and the long-lived
+    `run_dialer` worker):
+      1. prepare_dispatch  – status guards, max-retries guard, payload, quota
+      2. place_call_now / place_call_async – LiveKit dispatch + SIP participant
+      3. finalize_dispatch – success / failure bookkeeping on the CallTask
     """
 
     def __init__(self, logger):
         self.logger = logger
 
-    def place_call_now(
-        self,
-        call_task_id: str,
-        *,
-        sip_trunk_id: str,
-        agent_config: Dict[str, Any],
-        lead_data: Dict[str, Any],
-        from_number: str,
-        answer_timeout_s: float = 45.0,
-    ) -> PlaceCallResult:
-        import logging
-        logger = logging.getLogger(__name__)
+    # ─────────────────────────────
+    # 1) Prepare
+    # ─────────────────────────────
+    def prepare_dispatch(self, call_task_id: str) -> Tuple[Optional[PreparedCall], Optional[Dict[str, Any]]]:
+        """
+        Validate a CALL_TRIGGERED task and build the dialer payload.
 
-        logger.info(f"DialerService.place_call_now {call_task_id}")
+        Returns (prepared, None) when the call should be placed, or
+        (None, result) with the final task result when it must not be.
+        """
+        from core.utils.calltask_utils import handle_max_retries
+        from core.quotas import reserve_call_minutes, QuotaExceeded
 
-        # 1) Idempotency & status transitions
+        try:
+            call_task = CallTask.objects.get(id=call_task_id)
+        except CallTask.DoesNotExist:
+            self.logger.error(f"❌ CallTask {call_task_id} vanished before trigger.")
+            return None, {"success": False, "error": "calltask_missing", "id": call_task_id}
+
+        # Guard‑rail: only proceed if it is *still* CALL_TRIGGERED
+        if call_task.status != CallStatus.CALL_TRIGGERED:
+            self.logger.warning(
+                f"⚠️ trigger_call: task {call_task_id} in status {call_task.status}; abort."
+            )
+            return None, {"success": False, "reason": "stale_trigger", "status": call_task.status}
+
+        # Entire call‑init phase wrapped in a DB transaction for safety
+        with transaction.atomic():
+            # Lock *this* row – prevents double‑processing by a rogue duplicate trigger
+            call_task = (
+                CallTask.objects.select_related("lead")
+                .select_for_update(of=("self",))
+                .get(id=call_task_id)
+            )
+
+            if call_task.status != CallStatus.CALL_TRIGGERED:
+                return None, {
+                    "success": False,
+                    "reason": "status_changed_inside_tx",
+                    "status": call_task.status,
+                }
+
+            # EARLY MAX-RETRIES GUARD (no defaults; uses agent config)
+            if handle_max_retries(call_task):
+                return None, {
+                    "success": False,
+                    "call_task_id": call_task_id,
+                    "message": "Max retries reached - task deleted before dispatch",
+                    "deleted": True,
+                }
+
+            # Do not move to IN_PROGRESS yet. Only mark IN_PROGRESS after a successful
+            # call dispatch; leave as CALL_TRIGGERED until then.
+            timeline = dict(call_task.dispatch_timeline or {})
+            timeline["trigger_started"] = time.time()
+            call_task.dispatch_timeline = timeline
+            call_task.save(update_fields=["updated_at", "dispatch_timeline"])
+
+        # Extract all payload *outside* the lock.
+        # Agent routing/config comes from the precomputed dispatch snapshot
+        # (one Redis read) instead of agent.voice / phone_number.sip_trunk / workspace.
+        from core.telephony.services.dispatch_snapshot import dispatch_snapshots
+
+        snapshot = dispatch_snapshots.get(call_task.agent_id)
+        if snapshot is None:
+            self.logger.error(f"❌ Agent {call_task.agent_id} vanished before trigger of {call_task_id}.")
+            return None, {"success": False, "error": "agent_missing", "id": call_task_id}
+        lead = call_task.lead
+
+        sip_trunk_id = snapshot.sip_trunk_id
+
+        timer = DispatchTimer(
+            workspace_id=snapshot.workspace_id, agent_id=snapshot.agent_id, trunk_id=snapshot.sip_trunk_pk
+        )
+        if "claimed" in timeline:
+            timer.durations["queue_wait"] = timeline["trigger_started"] - float(timeline["claimed"])
+
+        # DYNAMIC TEMPLATE RENDERING: Render script_template and greeting_outbound with target_ref data
+        raw_script_template = snapshot.script_template
+        raw_greeting_outbound = snapshot.greeting_outbound
+        from core.services.script_template_service import script_template_service
+
+        with timer.stage("template_render"):
+            rendered_script, rendered_greeting_outbound = script_template_service.render_scripts_for_target_ref(
+                [raw_script_template, raw_greeting_outbound], call_task.target_ref
+            )
+
+        self.logger.info(f" rendered script and greeting outbound': {raw_script_template} \n {raw_greeting_outbound}")
+
+        agent_config = self.build_agent_config(snapshot, rendered_script, rendered_greeting_outbound)
+
+        # Add knowledge document ID if agent has kb_pdf
+        if snapshot.kb_doc_id:
+            self.logger.info(f"🧠 KNOWLEDGE DOCUMENT AVAILABLE - doc_id: {snapshot.kb_doc_id}, filename: {snapshot.kb_filename}")
+        else:
+            self.logger.info(f"TASKS NO AGENT KB_PDF")
+
+        if snapshot.send_document:
+            self.logger.info("SEND DOCUMENT AVAILABLE")
+
+        # DEBUG: Log what we're passing to the dialer service
+        self.logger.info(f"🚀 PASSING TO DIALER SERVICE - agent_config script_template: {agent_config['script_template'][:200]}...")
+        self.logger.info(f"🚀 PASSING TO DIALER SERVICE - agent_config greeting_outbound: {agent_config['greeting_outbound'][:100]}...")
+        lead_data = self.build_lead_data(call_task)
+
+        # Require an agent phone number (no env fallback)
+        from_number = snapshot.from_number
+
+        # 🎯 QUOTA ENFORCEMENT: Skip quotas for test calls (lead is null)
+        if lead is not None:
+            # Only enforce quotas for real calls with leads
+            try:
+                # Reserve the longest this call can last; end_of_call commits the actual minutes
+                reserve_call_minutes(
+                    call_task.workspace,
+                    call_task.id,
+                    snapshot.max_call_duration_minutes or DEFAULT_RESERVED_CALL_MINUTES,
+                )
+
+            except QuotaExceeded as quota_err:
+                self.logger.warning(
+                    f"🚫 Call quota exceeded for workspace {snapshot.workspace_id}: {quota_err}"
+                )
+                # DELETE this call task - quota exceeded
+                with transaction.atomic():
+                    call_task = CallTask.objects.select_for_update().get(
+                        id=call_task_id
+                    )
+                    call_task.delete()
+                return None, {
+                    "success": False,
+                    "call_task_id": call_task_id,
+                    "error": "quota_exceeded",
+                    "message": f"Call task deleted - {quota_err}",
+                }
+            except Exception as quota_err:
+                # Fail closed: an unavailable quota backend must not switch the limits off
+                self.logger.error(
+                    f"❌ Quota check failed for workspace {snapshot.workspace_id}, rescheduling {call_task_id}: {quota_err}"
+                )
+                from core.utils.calltask_utils import reschedule_without_increment
+                reschedule_without_increment(call_task, "quota_check_failed", str(quota_err))
+                return None, {
+                    "success": False,
+                    "call_task_id": call_task_id,
+                    "reason": "quota_check_failed",
+                    "rescheduled": True,
+                }
+        else:
+            # Test call (lead is null) - skip quota enforcement
+            self.logger.info(
+                f"🧪 Test call detected (lead is null) - skipping quota enforcement for workspace {snapshot.workspace_id}"
+            )
+
+        from core.telephony.services.rate_limiter import CallRateLimit
+
+        return PreparedCall(
+            call_task_id=str(call_task.id),
+            sip_trunk_id=sip_trunk_id,
+            agent_config=agent_config,
+            lead_data=lead_data,
+            from_number=from_number,
+            rate_limit=CallRateLimit.from_snapshot(snapshot),
+            trunk_pk=snapshot.sip_trunk_pk,
+            timer=timer,
+        ), None
+
+    @staticmethod
+    def build_agent_config(snapshot, rendered_script: str, rendered_greeting_outbound: str) -> Dict[str, Any]:
+        """Agent part of the dispatch payload, from the snapshot and rendered templates."""
+        agent_config = {
+            "name": snapshot.name,
+            "agent_id": snapshot.agent_id,
+            "voice_external_id": snapshot.voice_external_id,
+            "language": snapshot.language,
+            # RENDERED script template (dynamically generated with lead data)
+            "script_template": rendered_script,
+            "greeting_outbound": rendered_greeting_outbound,
+            "greeting_inbound": snapshot.greeting_inbound,
+            "character": snapshot.character,
+            # Provide max duration to agent runtime; convert minutes→seconds downstream
+            "max_call_duration_minutes": snapshot.max_call_duration_minutes,
+            "workspace_name": snapshot.workspace_name,
+            "sip_trunk_id": snapshot.sip_trunk_id,  # Pass dynamic trunk ID
+            # Pass booking identifiers
+            "workspace_id": snapshot.workspace_id,
+            "event_type_id": snapshot.event_type_id,
+        }
+        if snapshot.kb_doc_id:
+            agent_config["knowledge_documents"] = [snapshot.kb_doc_id]
+        if snapshot.send_document:
+            agent_config["send_document"] = True
+        return agent_config
+
+    @staticmethod
+    def build_lead_data(call_task) -> Dict[str, Any]:
+        """Callee part of the dispatch payload (`call_task.lead` must be loaded)."""
+        lead = call_task.lead
+        if lead is not None:
+            return {
+                "id": str(lead.id),
+                "name": lead.name,
+                "surname": lead.surname,
+                "email": lead.email,
+                "phone": lead.phone,
+                "call_task_id": str(call_task.id),
+            }
+        # Test call: only pass minimal, non-fallback data
+        return {
+            "id": str(call_task.id),
+            "phone": call_task.phone,
+            "call_task_id": str(call_task.id),
+        }
+
+    # ─────────────────────────────
+    # 2) Place the call
+    # ─────────────────────────────
+    def _begin_dispatch(self, call_task_id: str) -> Optional[PlaceCallResult]:
+        """Idempotency & status transitions; returns a result only to short-circuit."""
         try:
             with lock_call_task(call_task_id) as call_task:
                 # Only short-circuit if a dispatch already succeeded and is active
@@ -56,30 +284,34 @@ class DialerService:
                     call_task.save(update_fields=["status"])
         except CallTask.DoesNotExist:
             return PlaceCallResult(False, abort_reason="invalid_call_task", error="CallTask not found")
+        return None
 
-        # 2) Execute async low-level path
-        from ._dialer_async import _make_call_async as low_level
-        from ._dialer_async import _fetch_knowledge_content
+    @staticmethod
+    def _close_timeline(call_task, timer, result: Dict[str, Any]) -> None:
+        """Fold this attempt's stage durations into the task's dispatch_timeline."""
+        timer = timer or DispatchTimer(workspace_id=call_task.workspace_id, agent_id=call_task.agent_id)
+        timer.durations.update(result.get("timings") or {})
+        timer.observe_all()
 
-        knowledge_content = _fetch_knowledge_content(agent_id=agent_config.get("agent_id"), doc_ids=agent_config.get("knowledge_documents", []))
+        timeline = dict(call_task.dispatch_timeline or {})
+        timeline["labels"] = timer.labels
+        timeline["durations"] = {k: round(v, 6) for k, v in timer.durations.items()}
+        if result.get("success"):
+            timeline["sip_participant"] = time.time()
+        call_task.dispatch_timeline = timeline
 
-        result = async_to_sync(low_level)(
-            sip_trunk_id,
-            agent_config,
-            lead_data,
-            from_number,
-            call_task_id=str(call_task.id),
-            answer_timeout_s=answer_timeout_s,
-            knowledge_content=knowledge_content,
-        )
+    def _complete_dispatch(self, call_task_id: str, result: Dict[str, Any], timer=None) -> PlaceCallResult:
+        """Persist the low-level outcome on the CallTask."""
+        import logging
+        logger = logging.getLogger(__name__)
 
-        # 3) Persist outcome & return
         if result.get("success"):
             logger.info(f"DialerService.place_call_now {call_task_id} success")
             try:
                 with lock_call_task(call_task_id) as call_task:
                     call_task.status = CallStatus.IN_PROGRESS
-                    call_task.save(update_fields=["status"])
+                    self._close_timeline(call_task, timer, result)
+                    call_task.save(update_fields=["status", "dispatch_timeline"])
             except CallTask.DoesNotExist:
                 pass
             return PlaceCallResult(
@@ -92,12 +324,18 @@ class DialerService:
 
         logger.info(f"DialerService.place_call_now {call_task_id} failed")
 
-        # Failure paths
+        from core.telephony.services.circuit_breaker import CIRCUIT_OPEN
+        from core.telephony.services.rate_limiter import THROTTLE_ABORT_REASONS
+
+        # Failure paths (CPS throttling and open circuits are not call attempts)
         try:
             with lock_call_task(call_task_id) as call_task:
                 call_task.status = CallStatus.RETRY
-                call_task.increment_retries()
-                call_task.save(update_fields=["status"])
+                abort_reason = result.get("abort_reason")
+                if abort_reason not in THROTTLE_ABORT_REASONS and abort_reason != CIRCUIT_OPEN:
+                    call_task.increment_retries()
+                self._close_timeline(call_task, timer, result)
+                call_task.save(update_fields=["status", "dispatch_timeline"])
         except CallTask.DoesNotExist:
             pass
 
@@ -107,4 +345,136 @@ class DialerService:
             error=result.get("error"),
         )
 
+    def place_call_now(
+        self,
+        call_task_id: str,
+        *,
+        sip_trunk_id: str,
+        agent_config: Dict[str, Any],
+        lead_data: Dict[str, Any],
+        from_number: str,
+        answer_timeout_s: float = 45.0,
+        rate_limit=None,
+        trunk_pk: Optional[str] = None,
+        timer=None,
+    ) -> PlaceCallResult:
+        import logging
+        logger = logging.getLogger(__name__)
+
+        logger.info(f"DialerService.place_call_now {call_task_id}")
+
+        # 1) Idempotency & status transitions
+        early = self._begin_dispatch(call_task_id)
+        if early is not None:
+            return early
+
+        # 2) Execute async low-level path
+        from ._dialer_async import _make_call_async as low_level
+        from ._dialer_async import _fetch_knowledge_document
+
+        timer = timer or DispatchTimer(
+            workspace_id=agent_config.get("workspace_id"), agent_id=agent_config.get("agent_id"), trunk_id=trunk_pk
+        )
+        with timer.stage("kb_fetch"):
+            knowledge = _fetch_knowledge_document(agent_id=agent_config.get("agent_id"), doc_ids=agent_config.get("knowledge_documents", []))
+
+        result = async_to_sync(low_level)(
+            sip_trunk_id,
+            agent_config,
+            lead_data,
+            from_number,
+            call_task_id=str(call_task_id),
+            answer_timeout_s=answer_timeout_s,
+            knowledge_content=knowledge,
+            rate_limit=rate_limit,
+            trunk_pk=trunk_pk,
+        )
+
+        # 3) Persist outcome & return
+        return self._complete_dispatch(call_task_id, result, timer)
+
+    async def place_call_async(
+        self,
+        prepared: PreparedCall,
+        *,
+        livekit_api,
+        answer_timeout_s: float = 45.0,
+    ) -> PlaceCallResult:
+        """
+        Event-loop variant of place_call_now for the long-lived dialer worker.
+
+        Uses the worker's shared `livekit_api` client (pooled HTTP session) and
+        runs the short ORM steps in the thread pool.
+        """
+        from ._dialer_async import _make_call_async as low_level
+        from ._dialer_async import _fetch_knowledge_document_sync
+
+        call_task_id = prepared.call_task_id
+
+        early = await sync_to_async(self._begin_dispatch, thread_sensitive=False)(call_task_id)
+        if early is not None:
+            return early
+
+        timer = prepared.timer or DispatchTimer(
+            workspace_id=prepared.agent_config.get("workspace_id"),
+            agent_id=prepared.agent_config.get("agent_id"),
+            trunk_id=prepared.trunk_pk,
+        )
+        with timer.stage("kb_fetch"):
+            knowledge = await sync_to_async(
+                _fetch_knowledge_document_sync, thread_sensitive=False
+            )(prepared.agent_config.get("agent_id"), prepared.agent_config.get("knowledge_documents", []))
+
+        result = await low_level(
+            prepared.sip_trunk_id,
+            prepared.agent_config,
+            prepared.lead_data,
+            prepared.from_number,
+            call_task_id=call_task_id,
+            answer_timeout_s=answer_timeout_s,
+            knowledge_content=knowledge,
+            livekit_api=livekit_api,
+            rate_limit=prepared.rate_limit,
+            trunk_pk=prepared.trunk_pk,
+        )
+
+        return await sync_to_async(self._complete_dispatch, thread_sensitive=False)(call_task_id, result, timer)
 
+    # ─────────────────────────────
+    # 3) Finalize
+    # ─────────────────────────────
+    def finalize_dispatch(self, call_task_id: str, service_result: PlaceCallResult) -> Dict[str, Any]:
+        """Shape the task result; statuses are handled by the calltask helpers."""
+        from core.utils.calltask_utils import handle_call_success, handle_call_failure
+
+        if service_result.success:
+            result_payload = {
+                "success": True,
+                "room_name": service_result.room_name,
+                "dispatch_id": service_result.dispatch_id,
+                "participant_id": service_result.participant_id,
+                "sip_call_id": service_result.sip_call_id,
+            }
+            with transaction.atomic():
+                call_task = CallTask.objects.select_for_update().get(id=call_task_id)
+                return handle_call_success(call_task, result_payload)
+
+        with transaction.atomic():
+            call_task = CallTask.objects.select_for_update().get(id=call_task_id)
+            return handle_call_failure(
+                call_task,
+                service_result.error,
+                service_result.abort_reason or "failed",
+            )
+
+    def handle_dispatch_exception(self, call_task_id: str, err: Exception) -> Dict[str, Any]:
+        """Reschedule without increment; early max-retries guard will handle deletion on next cycle."""
+        from core.utils.calltask_utils import handle_call_failure
+
+        try:
+            with transaction.atomic():
+                call_task = CallTask.objects.select_for_update().get(id=call_task_id)
+                return handle_call_failure(call_task, str(err), "trigger_exception")
+        except Exception:
+            pass
+        return {"success": False, "error": str(err), "call_task_id": call_task_id}
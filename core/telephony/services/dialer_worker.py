@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import contextlib
+import os
+import socket
+import uuid
+from typing import Any, Dict, Iterable, Optional, Set
+
+import aiohttp
+import redis.asyncio as redis_async
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from core.telephony.services.dialer_service import DialerService
+from core.utils.redis_client import get_redis_client
+
+
+def _run_in_db_thread(fn, *args):
+    """Run an ORM callable on a pool thread, dropping stale connections first."""
+    def _call():
+        close_old_connections()
+        return fn(*args)
+    return sync_to_async(_call, thread_sensitive=False)()
+
+
+class DialerWorker:
+    """
+    Long-lived asyncio dialer.
+
+    • One event loop and ONE LiveKitAPI client whose aiohttp session keeps a
+      pool of warm keep-alive connections (no TLS handshake per call).
+    • Claimed CallTask IDs arrive on the Redis list `dialer:queue`
+      (SchedulerService pushes there when DIALER_MODE="worker"). Each ID is
+      moved atomically (BLMOVE) into this worker's `dialer:processing:{id}`
+      list and removed once handled; a worker that stops heartbeating
+      leaves its list to be requeued by the next worker that starts.
+    • Up to `concurrency` calls run at once under a semaphore; a new ID is
+      only popped once a slot is free, so the queue is the backpressure.
+    • ORM work (prepare/finalize) runs on a bounded thread pool and follows
+      the same DialerService stages as the Celery `trigger_call` task.
+    """
+
+    QUEUE_KEY = "dialer:queue"
+    PROCESSING_KEY = "dialer:processing:{id}"
+    RECOVERING_KEY = "dialer:recovering:{id}"
+    HEARTBEAT_KEY = "dialer:worker:{id}"
+    WORKERS_KEY = "dialer:workers"
+    HEARTBEAT_TTL = 30
+
+    def __init__(self, logger, *, concurrency: int = 200, db_threads: int = 32, livekit_api=None):
+        self.logger = logger
+        self.concurrency = max(int(concurrency), 1)
+        self.db_threads = max(int(db_threads), 1)
+        self.dialer = DialerService(logger)
+        self._livekit_api = livekit_api
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._stop = asyncio.Event()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.processing_key = self.PROCESSING_KEY.format(id=self.worker_id)
+        self.stats: Dict[str, int] = {"placed": 0, "failed": 0, "skipped": 0, "errors": 0}
+
+    # ── producer side (sync) ─────────────────────────────────────────────
+    @classmethod
+    def enqueue(cls, call_task_ids: Iterable[str]) -> int:
+        ids = [str(pk) for pk in call_task_ids]
+        if ids:
+            get_redis_client().rpush(cls.QUEUE_KEY, *ids)
+        return len(ids)
+
+    # ── crash recovery (sync) ────────────────────────────────────────────
+    def recover_orphans(self) -> Dict[str, int]:
+        """
+        Requeue IDs left in the processing lists of workers whose heartbeat
+        expired. Each dead list is taken over with one RENAME, so concurrent
+        starters never recover it twice. Only tasks still CALL_TRIGGERED
+        without `trigger_started` go back on the queue; a started dispatch
+        may have placed its call and is left to end_of_call or the reaper.
+        """
+        from redis.exceptions import ResponseError
+
+        from core.models import CallStatus, CallTask
+
+        client = get_redis_client()
+        counts = {"workers": 0, "requeued": 0, "left": 0}
+        for raw in client.smembers(self.WORKERS_KEY):
+            worker_id = raw.decode() if isinstance(raw, bytes) else raw
+            if worker_id == self.worker_id or client.exists(self.HEARTBEAT_KEY.format(id=worker_id)):
+                continue
+            recovering = self.RECOVERING_KEY.format(id=worker_id)
+            try:
+                client.rename(self.PROCESSING_KEY.format(id=worker_id), recovering)
+            except ResponseError:
+                # Empty list, or another worker took it over
+                client.srem(self.WORKERS_KEY, worker_id)
+                continue
+
+            ids = [i.decode() if isinstance(i, bytes) else i for i in client.lrange(recovering, 0, -1)]
+            rows = CallTask.objects.filter(id__in=ids, status=CallStatus.CALL_TRIGGERED).values_list(
+                "id", "dispatch_timeline"
+            )
+            requeue = [str(pk) for pk, timeline in rows if "trigger_started" not in (timeline or {})]
+            if requeue:
+                client.lpush(self.QUEUE_KEY, *requeue)
+            client.delete(recovering)
+            client.srem(self.WORKERS_KEY, worker_id)
+            counts["workers"] += 1
+            counts["requeued"] += len(requeue)
+            counts["left"] += len(ids) - len(requeue)
+        return counts
+
+    # ── lifecycle ────────────────────────────────────────────────────────
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def _heartbeat(self, queue) -> None:
+        key = self.HEARTBEAT_KEY.format(id=self.worker_id)
+        while not self._stop.is_set():
+            try:
+                await queue.set(key, 1, ex=self.HEARTBEAT_TTL)
+            except Exception as e:
+                self.logger.warning(f"⚠️ Dialer heartbeat failed: {e}")
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._stop.wait(), timeout=self.HEARTBEAT_TTL / 3)
+
+    async def _open_client(self):
+        if self._livekit_api is not None:
+            return self._livekit_api
+        from core.telephony.services._dialer_async import create_livekit_api
+
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=60),
+        )
+        self._livekit_api = create_livekit_api(session=self._session)
+        return self._livekit_api
+
+    async def _close_client(self) -> None:
+        try:
+            if self._livekit_api is not None:
+                await self._livekit_api.aclose()
+        finally:
+            if self._session is not None:
+                await self._session.close()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(max_workers=self.db_threads, thread_name_prefix="dialer-db")
+        )
+        livekit_api = await self._open_client()
+        queue = redis_async.from_url(getattr(settings, "CELERY_BROKER_URL", "redis://localhost:6379/0"))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        inflight: Set[asyncio.Task] = set()
+
+        await queue.set(self.HEARTBEAT_KEY.format(id=self.worker_id), 1, ex=self.HEARTBEAT_TTL)
+        await queue.sadd(self.WORKERS_KEY, self.worker_id)
+        heartbeat = asyncio.create_task(self._heartbeat(queue))
+        try:
+            recovered = await _run_in_db_thread(self.recover_orphans)
+            if recovered["workers"]:
+                self.logger.warning(f"♻️ Recovered dialer queue items of dead workers: {recovered}")
+        except Exception as recover_err:
+            self.logger.error(f"❌ Dialer orphan recovery failed: {recover_err}")
+
+        self.logger.info(f"📞 Dialer worker {self.worker_id} started (concurrency {self.concurrency})")
+        try:
+            while not self._stop.is_set():
+                await semaphore.acquire()
+                try:
+                    item = await queue.blmove(self.QUEUE_KEY, self.processing_key, 1, "LEFT", "RIGHT")
+                except Exception as queue_err:
+                    semaphore.release()
+                    self.logger.error(f"❌ Dialer queue read failed: {queue_err}")
+                    await asyncio.sleep(1)
+                    continue
+                if item is None:
+                    semaphore.release()
+                    continue
+
+                call_task_id = item.decode() if isinstance(item, bytes) else str(item)
+                task = asyncio.create_task(self._handle_and_ack(call_task_id, livekit_api, queue))
+                inflight.add(task)
+
+                def _done(t, _sem=semaphore):
+                    inflight.discard(t)
+                    _sem.release()
+
+                task.add_done_callback(_done)
+        finally:
+            # Drain: finish calls already in flight before closing the client
+            if inflight:
+                await asyncio.gather(*inflight, return_exceptions=True)
+            self._stop.set()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            with contextlib.suppress(Exception):
+                await queue.delete(self.HEARTBEAT_KEY.format(id=self.worker_id))
+                if not await queue.llen(self.processing_key):
+                    await queue.srem(self.WORKERS_KEY, self.worker_id)
+            await queue.close()
+            await self._close_client()
+            self.logger.info(f"👋 Dialer worker stopped: {self.stats}")
+
+    # ── one call ─────────────────────────────────────────────────────────
+    async def _handle_and_ack(self, call_task_id: str, livekit_api, queue) -> Dict[str, Any]:
+        try:
+            return await self.handle(call_task_id, livekit_api)
+        finally:
+            try:
+                await queue.lrem(self.processing_key, 1, call_task_id)
+            except Exception as e:
+                self.logger.warning(f"⚠️ Could not ack {call_task_id} on {self.processing_key}: {e}")
+
+    async def handle(self, call_task_id: str, livekit_api) -> Dict[str, Any]:
+        try:
+            prepared, early_result = await _run_in_db_thread(self.dialer.prepare_dispatch, call_task_id)
+            if early_result is not None:
+                self.stats["skipped"] += 1
+                return early_result
+
+            service_result = await self.dialer.place_call_async(prepared, livekit_api=livekit_api)
+            self.stats["placed" if service_result.success else "failed"] += 1
+            return await _run_in_db_thread(self.dialer.finalize_dispatch, call_task_id, service_result)
+
+        except Exception as err:
+            self.stats["errors"] += 1
+            self.logger.error(f"❌ Dialer worker exception for {call_task_id}: {err}")
+            return await _run_in_db_thread(self.dialer.handle_dispatch_exception, call_task_id, err)
@@ -0,0 +1,214 @@
+"""
+Call-dispatch latency instrumentation.
+
+Stages between a CallTask becoming due and the call ending:
+
+  due_to_claimed          next_call (or window open) → promoted by the scheduler
+  queue_wait              claimed → trigger_call / dialer worker picked it up
+  template_render         script + greeting rendering
+  kb_fetch                knowledge base document load
+  create_dispatch         LiveKit agent dispatch
+  create_sip_participant  LiveKit SIP participant (INVITE sent)
+  end_of_call             SIP participant created → end_of_call webhook
+
+Every observation carries workspace_id / agent_id / trunk_id labels and goes
+to two sinks:
+
+  • OpenTelemetry histogram `hotcalls.dispatch.stage_duration` (seconds),
+    exported by azure-monitor-opentelemetry when
+    APPLICATIONINSIGHTS_CONNECTION_STRING is set. Configured lazily per
+    process so prefork Celery children get their own exporter.
+  • Optional Prometheus histogram (DISPATCH_METRICS_PROMETHEUS=True).
+    Buckets are aggregated in Redis so observations from every worker
+    process show up on the single `health/metrics/prometheus/` endpoint.
+
+Stage timestamps/durations of the current attempt are also kept on the task
+itself in CallTask.dispatch_timeline (epoch seconds), written by the claim
+statement and the dispatch steps that already update the row.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from django.conf import settings
+
+from core.utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+STAGES = (
+    "due_to_claimed",
+    "queue_wait",
+    "template_render",
+    "kb_fetch",
+    "create_dispatch",
+    "create_sip_participant",
+    "end_of_call",
+)
+
+# Upper bounds in seconds; wide enough for end_of_call (call duration)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class DispatchTimer:
+    """Stage durations of one dispatch attempt plus its labels."""
+
+    def __init__(self, *, workspace_id=None, agent_id=None, trunk_id=None):
+        self.labels = {
+            "workspace_id": str(workspace_id or ""),
+            "agent_id": str(agent_id or ""),
+            "trunk_id": str(trunk_id or ""),
+        }
+        self.durations: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = time.perf_counter() - started
+
+    def observe_all(self) -> None:
+        for stage, seconds in self.durations.items():
+            dispatch_metrics.observe(stage, seconds, **self.labels)
+
+
+class DispatchMetrics:
+    """Histogram sinks for dispatch stages (OpenTelemetry + optional Prometheus)."""
+
+    SERIES_KEY = "metrics:dispatch:series"
+    SERIES_HASH_KEY = "metrics:dispatch:{series}"
+    SERIES_TTL_SECONDS = 7 * 24 * 3600
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogram = None
+        self._configured_pid: Optional[int] = None
+
+    @property
+    def prometheus_enabled(self) -> bool:
+        return bool(getattr(settings, "DISPATCH_METRICS_PROMETHEUS", False))
+
+    # ── OpenTelemetry ────────────────────────────────────────────────────
+    def _otel_histogram(self):
+        pid = os.getpid()
+        if self._configured_pid == pid:
+            return self._histogram
+        with self._lock:
+            if self._configured_pid == pid:
+                return self._histogram
+            self._configured_pid = pid
+            self._histogram = None
+            try:
+                if os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING"):
+                    from azure.monitor.opentelemetry import configure_azure_monitor
+
+                    configure_azure_monitor()
+                from opentelemetry import metrics
+
+                self._histogram = metrics.get_meter("hotcalls.dispatch").create_histogram(
+                    "hotcalls.dispatch.stage_duration",
+                    unit="s",
+                    description="Latency of each call-dispatch stage",
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ OpenTelemetry dispatch metrics unavailable: {e}")
+        return self._histogram
+
+    # ── recording ────────────────────────────────────────────────────────
+    def observe(self, stage: str, seconds: float, *, workspace_id="", agent_id="", trunk_id="") -> None:
+        """Record one stage duration (never raises)."""
+        if seconds is None or seconds < 0:
+            return
+        labels = {"stage": stage, "workspace_id": str(workspace_id or ""), "agent_id": str(agent_id or ""), "trunk_id": str(trunk_id or "")}
+        try:
+            histogram = self._otel_histogram()
+            if histogram is not None:
+                histogram.record(seconds, attributes=labels)
+        except Exception as e:
+            logger.debug(f"OpenTelemetry record failed for {stage}: {e}")
+
+        if self.prometheus_enabled:
+            try:
+                self._record_prometheus(labels, seconds)
+            except Exception as e:
+                logger.debug(f"Prometheus record failed for {stage}: {e}")
+
+    def _record_prometheus(self, labels: Dict[str, str], seconds: float) -> None:
+        series = "|".join(labels[k] for k in ("stage", "workspace_id", "agent_id", "trunk_id"))
+        key = self.SERIES_HASH_KEY.format(series=series)
+        bucket = next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.hincrby(key, f"b{bucket}", 1)
+        pipe.hincrby(key, "count", 1)
+        pipe.hincrbyfloat(key, "sum", seconds)
+        pipe.expire(key, self.SERIES_TTL_SECONDS)
+        pipe.sadd(self.SERIES_KEY, series)
+        pipe.execute()
+
+    # ── exposition ───────────────────────────────────────────────────────
+    def prometheus_text(self) -> str:
+        """Prometheus text exposition of every series aggregated in Redis."""
+        redis_client = get_redis_client()
+        series_list = sorted(
+            s.decode() if isinstance(s, bytes) else s for s in redis_client.smembers(self.SERIES_KEY)
+        )
+        pipe = redis_client.pipeline(transaction=False)
+        for series in series_list:
+            pipe.hgetall(self.SERIES_HASH_KEY.format(series=series))
+        rows = pipe.execute() if series_list else []
+
+        name = "hotcalls_dispatch_stage_duration_seconds"
+        lines: List[str] = [
+            f"# HELP {name} Latency of each call-dispatch stage",
+            f"# TYPE {name} histogram",
+        ]
+        expired: List[str] = []
+        for series, raw in zip(series_list, rows):
+            if not raw:
+                expired.append(series)
+                continue
+            data = {(k.decode() if isinstance(k, bytes) else k): v for k, v in raw.items()}
+            stage, workspace_id, agent_id, trunk_id = (series.split("|") + ["", "", "", ""])[:4]
+            label_str = f'stage="{stage}",workspace_id="{workspace_id}",agent_id="{agent_id}",trunk_id="{trunk_id}"'
+            cumulative = 0
+            for i, bound in enumerate(BUCKETS):
+                cumulative += int(data.get(f"b{i}", 0))
+                lines.append(f'{name}_bucket{{{label_str},le="{bound}"}} {cumulative}')
+            cumulative += int(data.get(f"b{len(BUCKETS)}", 0))
+            lines.append(f'{name}_bucket{{{label_str},le="+Inf"}} {cumulative}')
+            lines.append(f"{name}_sum{{{label_str}}} {float(data.get('sum', 0))}")
+            lines.append(f"{name}_count{{{label_str}}} {int(data.get('count', 0))}")
+        if expired:
+            redis_client.srem(self.SERIES_KEY, *expired)
+        return "\n".join(lines) + "\n"
+
+
+def observe_end_of_call(call_task_id) -> None:
+    """Record the SIP-participant → end_of_call stage from the task's timeline (never raises)."""
+    try:
+        from core.models import CallTask
+
+        row = CallTask.objects.filter(id=call_task_id).values("dispatch_timeline").first()
+        timeline = (row or {}).get("dispatch_timeline") or {}
+        started = timeline.get("sip_participant")
+        if started is None:
+            return
+        now = time.time()
+        labels = timeline.get("labels") or {}
+        dispatch_metrics.observe("end_of_call", now - float(started), **labels)
+        timeline["end_of_call"] = now
+        CallTask.objects.filter(id=call_task_id).update(dispatch_timeline=timeline)
+    except Exception as e:
+        logger.warning(f"⚠️ end_of_call latency not recorded for CallTask {call_task_id}: {e}")
+
+
+# Global instance
+dispatch_metrics = DispatchMetrics()
@@ -0,0 +1,254 @@
+"""
+Per-agent dispatch snapshots.
+
+Everything the dialer needs about an agent's routing and runtime config
+(voice, trunk, from number, limits, KB handle, templates) is flattened into
+one immutable JSON document in Redis, so dial time costs one round trip
+instead of walking agent → voice / phone_number → sip_trunk / workspace.
+
+Keys:
+  dispatch:snapshot:{agent_id}          JSON snapshot tagged with its version
+  dispatch:snapshot:version:{agent_id}  INCR'd whenever a source row changes
+
+Saving an Agent, PhoneNumber, SIPTrunk, Voice or Workspace, or deleting an
+EventType (Agent.event_type is SET_NULL), bumps the version of every
+affected agent, bumps it again after commit and then rebuilds their
+snapshots (see core/signals.py). A reader that finds a snapshot whose
+version differs from the counter treats it as stale and rebuilds from the
+database, so a missed or failed rebuild can never serve outdated routing.
+
+Writes that skip model signals (QuerySet.update(), bulk_update(), raw SQL)
+must call `dispatch_snapshots.invalidate(agent_ids)` themselves when they
+touch a snapshot input; otherwise the snapshot stays stale for up to
+DISPATCH_SNAPSHOT_TTL_SECONDS.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import uuid
+from dataclasses import asdict, dataclass, fields
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from core.utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DispatchSnapshot:
+    agent_id: str
+    version: int
+    workspace_id: str
+    workspace_name: str
+    name: str
+    language: str
+    character: str
+    voice_external_id: Optional[str]
+    script_template: str
+    greeting_outbound: str
+    greeting_inbound: str
+    max_call_duration_minutes: int
+    max_concurrent_calls: int
+    event_type_id: Optional[str]
+    kb_doc_id: Optional[str]
+    kb_filename: Optional[str]
+    send_document: bool
+    phone_number_id: Optional[str]
+    from_number: Optional[str]
+    phone_active: bool
+    sip_trunk_pk: Optional[str]
+    sip_trunk_id: Optional[str]
+    trunk_active: bool
+    trunk_max_concurrent_calls: int
+    trunk_calls_per_second: float = 0.0
+    number_calls_per_second: float = 0.0
+    schema: int = 2
+
+    @classmethod
+    def from_json(cls, raw) -> Optional["DispatchSnapshot"]:
+        try:
+            data = json.loads(raw)
+            names = {f.name for f in fields(cls)}
+            return cls(**{k: v for k, v in data.items() if k in names})
+        except Exception:
+            return None
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+
+class DispatchSnapshotService:
+    """
+    Service for building, caching and invalidating agent dispatch snapshots.
+
+    Features:
+    - One MGET (version + snapshot) per lookup at dial time
+    - Version-tagged snapshots; mismatch means stale and triggers a rebuild
+    - Degrades to a single select_related query when Redis is unavailable
+    """
+
+    SNAPSHOT_KEY = "dispatch:snapshot:{agent_id}"
+    VERSION_KEY = "dispatch:snapshot:version:{agent_id}"
+    SCHEMA = 2
+
+    def __init__(self, ttl_seconds: Optional[int] = None):
+        self.ttl_seconds = int(
+            ttl_seconds if ttl_seconds is not None else getattr(settings, "DISPATCH_SNAPSHOT_TTL_SECONDS", 24 * 3600)
+        )
+
+    # ─────────────────────────────
+    # Build
+    # ─────────────────────────────
+    def build(self, agent_id: str, version: int = 0) -> Optional[DispatchSnapshot]:
+        """Snapshot straight from the database (one query), or None if the agent is gone."""
+        from core.models import Agent
+
+        agent = (
+            Agent.objects.select_related("workspace", "voice", "phone_number__sip_trunk")
+            .filter(agent_id=agent_id)
+            .first()
+        )
+        if agent is None:
+            return None
+
+        phone = agent.phone_number
+        trunk = getattr(phone, "sip_trunk", None) if phone else None
+
+        kb_doc_id = kb_filename = None
+        if agent.kb_pdf:
+            kb_filename = os.path.basename(agent.kb_pdf.name)
+            kb_doc_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"kb/{agent.agent_id}/{kb_filename}"))
+
+        return DispatchSnapshot(
+            agent_id=str(agent.agent_id),
+            version=int(version),
+            workspace_id=str(agent.workspace_id),
+            workspace_name=agent.workspace.workspace_name,
+            name=agent.name,
+            language=agent.language,
+            character=agent.character or "",
+            voice_external_id=(agent.voice.voice_external_id if agent.voice else None),
+            script_template=agent.script_template or "",
+            greeting_outbound=agent.greeting_outbound or "",
+            greeting_inbound=agent.greeting_inbound or "",
+            max_call_duration_minutes=agent.max_call_duration_minutes,
+            max_concurrent_calls=agent.max_concurrent_calls or 0,
+            event_type_id=(str(agent.event_type_id) if agent.event_type_id else None),
+            kb_doc_id=kb_doc_id,
+            kb_filename=kb_filename,
+            send_document=bool(agent.send_document),
+            phone_number_id=(str(phone.id) if phone else None),
+            from_number=(phone.phonenumber if phone else None),
+            phone_active=bool(phone.is_active) if phone else False,
+            sip_trunk_pk=(str(trunk.id) if trunk else None),
+            sip_trunk_id=(trunk.livekit_trunk_id if trunk else None) or None,
+            trunk_active=bool(trunk.is_active) if trunk else False,
+            trunk_max_concurrent_calls=(trunk.max_concurrent_calls or 0) if trunk else 0,
+            trunk_calls_per_second=(trunk.max_calls_per_second or 0.0) if trunk else 0.0,
+            number_calls_per_second=(trunk.max_calls_per_second_per_number or 0.0) if trunk else 0.0,
+            schema=self.SCHEMA,
+        )
+
+    # ─────────────────────────────
+    # Lookup
+    # ─────────────────────────────
+    def get(self, agent_id) -> Optional[DispatchSnapshot]:
+        """Current snapshot for an agent; rebuilds it when missing or stale."""
+        agent_id = str(agent_id)
+        try:
+            version_raw, snapshot_raw = get_redis_client().mget(
+                self.VERSION_KEY.format(agent_id=agent_id),
+                self.SNAPSHOT_KEY.format(agent_id=agent_id),
+            )
+        except Exception as e:
+            logger.warning(f"Dispatch snapshot unavailable for agent {agent_id}: {e}")
+            return self.build(agent_id)
+
+        version = int(version_raw or 0)
+        if snapshot_raw is not None:
+            snapshot = DispatchSnapshot.from_json(snapshot_raw)
+            if snapshot and snapshot.version == version and snapshot.schema == self.SCHEMA:
+                return snapshot
+            logger.info(f"🔄 Stale dispatch snapshot for agent {agent_id} (version {version})")
+
+        return self.rebuild(agent_id, version)
+
+    def rebuild(self, agent_id: str, version: Optional[int] = None) -> Optional[DispatchSnapshot]:
+        """
+        Build and store the snapshot tagged with `version` (read from Redis if omitted).
+
+        If the version moves on while we build, the stored snapshot carries the
+        old tag and the next reader rebuilds it, so the race is harmless.
+        """
+        agent_id = str(agent_id)
+        redis_client = get_redis_client()
+        if version is None:
+            try:
+                version = int(redis_client.get(self.VERSION_KEY.format(agent_id=agent_id)) or 0)
+            except Exception:
+                version = 0
+
+        snapshot = self.build(agent_id, version)
+        try:
+            key = self.SNAPSHOT_KEY.format(agent_id=agent_id)
+            if snapshot is None:
+                redis_client.delete(key)
+            else:
+                redis_client.set(key, snapshot.to_json(), ex=self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Dispatch snapshot write failed for agent {agent_id}: {e}")
+        return snapshot
+
+    # ─────────────────────────────
+    # Invalidation
+    # ─────────────────────────────
+    def invalidate(self, agent_ids: Iterable) -> None:
+        """
+        Bump versions now and again once the surrounding transaction commits,
+        then rebuild. A reader racing the first bump may store a snapshot built
+        from the not yet committed (old) rows; the second bump makes it stale
+        even if the rebuild after commit fails.
+        """
+        ids = sorted({str(a) for a in agent_ids if a})
+        if not ids or not self._bump(ids):
+            return
+
+        def _rebuild():
+            if not self._bump(ids):
+                return
+            for agent_id in ids:
+                try:
+                    self.rebuild(agent_id)
+                except Exception as e:
+                    logger.warning(f"Dispatch snapshot rebuild failed for agent {agent_id}: {e}")
+
+        transaction.on_commit(_rebuild)
+
+    def _bump(self, agent_ids) -> bool:
+        try:
+            pipe = get_redis_client().pipeline(transaction=False)
+            for agent_id in agent_ids:
+                pipe.incr(self.VERSION_KEY.format(agent_id=agent_id))
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"Dispatch snapshot invalidation failed for {len(agent_ids)} agents: {e}")
+            return False
+
+    def drop(self, agent_id) -> None:
+        try:
+            get_redis_client().delete(
+                self.SNAPSHOT_KEY.format(agent_id=agent_id),
+                self.VERSION_KEY.format(agent_id=agent_id),
+            )
+        except Exception:
+            pass
+
+
+# Global service instance
+dispatch_snapshots = DispatchSnapshotService()
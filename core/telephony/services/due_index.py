@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from core.utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+# Pop up to ARGV[2] members with score <= ARGV[1] (atomic read + remove)
+_POP_DUE_LUA = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+for i = 1, #items, 2 do
+    redis.call('ZREM', KEYS[1], items[i])
+end
+return items
+"""
+
+# Remove a member only if its score is unchanged since it was read
+# (a concurrent reschedule pushes a new score and must win)
+_REMOVE_IF_SCORE_LUA = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score and tonumber(score) == tonumber(ARGV[2]) then
+    return redis.call('ZREM', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+
+def _to_score(dt: datetime) -> float:
+    return dt.timestamp()
+
+
+def due_at(next_call: Optional[datetime], eligible_from: Optional[datetime]) -> Optional[datetime]:
+    """When a task can actually be claimed: next_call, or later if its calling window opens later."""
+    if next_call is None or eligible_from is None:
+        return next_call
+    return max(next_call, eligible_from)
+
+
+class DueIndex:
+    """
+    Redis timing wheel of schedulable CallTasks.
+
+    • One ZSET per scheduler shard `calltasks:due:<shard>`
+      (member = CallTask id, score = next_call as epoch seconds).
+    • Create / reschedule paths push `(next_call, task_id)` after commit.
+    • `run_scheduler` pops due members instead of scanning Postgres and blocks
+      on a per-shard wakeup list between rounds, so a task that becomes due
+      now is dispatched without waiting for the next poll.
+    • `reconcile()` re-syncs the ZSETs with Postgres (missed pushes, deleted
+      tasks, status changes made outside the hooked paths): incrementally from
+      an `updated_at` watermark, with a full pass every
+      DUE_INDEX_FULL_RECONCILE_SECONDS.
+
+    Only maintained when SCHEDULER_MODE="sharded"; the beat-driven singleton
+    scheduler keeps polling Postgres.
+    """
+
+    KEY_TEMPLATE = "calltasks:due:{shard}"
+    WAKEUP_KEY_TEMPLATE = "calltasks:due:wakeup:{shard}"
+    WATERMARK_KEY = "calltasks:due:reconciled_until"
+    FULL_PASS_KEY = "calltasks:due:full_reconcile_at"
+    # Re-read rows saved shortly before the watermark (their commit may have landed after it)
+    WATERMARK_OVERLAP_SECONDS = 60
+
+    def __init__(self, *, shard_count: Optional[int] = None, redis_client=None):
+        from core.telephony.services.scheduler_service import SchedulerService
+
+        self.shard_count = shard_count or SchedulerService.shard_count()
+        self.redis = redis_client or get_redis_client()
+        self._pop_due = self.redis.register_script(_POP_DUE_LUA)
+        self._remove_if_score = self.redis.register_script(_REMOVE_IF_SCORE_LUA)
+
+    @staticmethod
+    def enabled() -> bool:
+        return getattr(settings, "SCHEDULER_MODE", "singleton") == "sharded"
+
+    def key(self, shard: int) -> str:
+        return self.KEY_TEMPLATE.format(shard=shard)
+
+    def wakeup_key(self, shard: int) -> str:
+        return self.WAKEUP_KEY_TEMPLATE.format(shard=shard)
+
+    def shard_of(self, workspace_id) -> int:
+        from core.telephony.repositories.call_repo import shard_for_workspace
+
+        return shard_for_workspace(workspace_id, self.shard_count)
+
+    # ── writers ──────────────────────────────────────────────────────────
+    def push_many(self, entries: Iterable[Tuple[str, object, datetime]]) -> int:
+        """Upsert `(task_id, workspace_id, next_call)` entries and wake their shards."""
+        by_shard: Dict[int, Dict[str, float]] = {}
+        for task_id, workspace_id, next_call in entries:
+            if next_call is None:
+                continue
+            by_shard.setdefault(self.shard_of(workspace_id), {})[str(task_id)] = _to_score(next_call)
+        if not by_shard:
+            return 0
+
+        pipe = self.redis.pipeline(transaction=False)
+        for shard, mapping in by_shard.items():
+            pipe.zadd(self.key(shard), mapping)
+            # Single-slot wakeup signal; the scheduler only needs to know "something changed"
+            pipe.lpush(self.wakeup_key(shard), 1)
+            pipe.ltrim(self.wakeup_key(shard), 0, 0)
+        pipe.execute()
+        return sum(len(m) for m in by_shard.values())
+
+    def push(self, call_task) -> None:
+        self.push_many([(str(call_task.id), call_task.workspace_id, due_at(call_task.next_call, call_task.eligible_from))])
+
+    def requeue(self, shard: int, entries: Dict[str, float]) -> None:
+        """Put popped-but-unclaimed members back with the given scores."""
+        if entries:
+            self.redis.zadd(self.key(shard), entries)
+
+    # ── scheduler side ───────────────────────────────────────────────────
+    def has_due(self, shard: int, now: Optional[float] = None) -> bool:
+        now = now if now is not None else time.time()
+        return bool(self.redis.zrangebyscore(self.key(shard), "-inf", now, start=0, num=1))
+
+    def pop_due(self, shard: int, limit: int, now: Optional[float] = None) -> Dict[str, float]:
+        """Atomically remove and return up to `limit` due members as {task_id: score}."""
+        if limit <= 0:
+            return {}
+        now = now if now is not None else time.time()
+        raw = self._pop_due(keys=[self.key(shard)], args=[now, int(limit)])
+        popped: Dict[str, float] = {}
+        for i in range(0, len(raw), 2):
+            member = raw[i].decode() if isinstance(raw[i], bytes) else str(raw[i])
+            popped[member] = float(raw[i + 1])
+        return popped
+
+    def seconds_until_next(self, shards: Sequence[int], now: Optional[float] = None) -> Optional[float]:
+        """Seconds until the earliest member across `shards` is due (<= 0 if already due)."""
+        if not shards:
+            return None
+        now = now if now is not None else time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        for shard in shards:
+            pipe.zrange(self.key(shard), 0, 0, withscores=True)
+        heads = [row[0][1] for row in pipe.execute() if row]
+        if not heads:
+            return None
+        return min(heads) - now
+
+    def wait(self, shards: Sequence[int], timeout: float) -> bool:
+        """Block until a push wakes one of `shards` or `timeout` elapses."""
+        if not shards or timeout <= 0:
+            return False
+        return self.redis.blpop([self.wakeup_key(s) for s in shards], timeout=timeout) is not None
+
+    # ── reconciliation ───────────────────────────────────────────────────
+    def reconcile(self, *, chunk_size: int = 2000, full: bool = False) -> Dict[str, int]:
+        """
+        Re-sync the shard ZSETs with Postgres.
+
+        Between full passes only CallTasks saved since the stored watermark
+        are looked at: schedulable ones are upserted, the others removed.
+        A full pass (every DUE_INDEX_FULL_RECONCILE_SECONDS, or when no
+        watermark exists) also catches deletions and bulk updates that did
+        not touch `updated_at`.
+        """
+        started = time.time()
+        watermark = self.redis.get(self.WATERMARK_KEY)
+        last_full = self.redis.get(self.FULL_PASS_KEY)
+        full_every = float(getattr(settings, "DUE_INDEX_FULL_RECONCILE_SECONDS", 3600))
+        if full or watermark is None or last_full is None or started - float(last_full) >= full_every:
+            counts = self._reconcile_full(chunk_size)
+            counts["full"] = 1
+            self.redis.set(self.FULL_PASS_KEY, started)
+        else:
+            counts = self._reconcile_since(float(watermark) - self.WATERMARK_OVERLAP_SECONDS, chunk_size)
+            counts["full"] = 0
+        self.redis.set(self.WATERMARK_KEY, started)
+        return counts
+
+    def _reconcile_since(self, since: float, chunk_size: int) -> Dict[str, int]:
+        """Upsert / remove the CallTasks saved at or after `since` (epoch seconds)."""
+        from core.models import CallTask
+        from core.telephony.repositories.call_repo import SCHEDULABLE_STATUSES
+
+        schedulable = {str(s) for s in SCHEDULABLE_STATUSES}
+        added = removed = 0
+        batch: List[Tuple[str, object, datetime]] = []
+        gone: List[Tuple[int, str]] = []
+        rows = (
+            CallTask.objects.filter(updated_at__gte=datetime.fromtimestamp(since, tz=dt_timezone.utc))
+            .order_by()
+            .values_list("id", "workspace_id", "status", "next_call", "eligible_from")
+            .iterator(chunk_size=chunk_size)
+        )
+        for task_id, workspace_id, status, next_call, eligible_from in rows:
+            if str(status) in schedulable:
+                batch.append((str(task_id), workspace_id, due_at(next_call, eligible_from)))
+            else:
+                gone.append((self.shard_of(workspace_id), str(task_id)))
+            if len(batch) >= chunk_size:
+                added += self.push_many(batch)
+                batch = []
+            if len(gone) >= chunk_size:
+                removed += self._remove_members(gone)
+                gone = []
+        if batch:
+            added += self.push_many(batch)
+        if gone:
+            removed += self._remove_members(gone)
+        return {"added": added, "removed": removed}
+
+    def _remove_members(self, members: List[Tuple[int, str]]) -> int:
+        """Remove `(shard, task_id)` members still at the score read here."""
+        pipe = self.redis.pipeline(transaction=False)
+        for shard, member in members:
+            pipe.zscore(self.key(shard), member)
+        removed = 0
+        for (shard, member), score in zip(members, pipe.execute()):
+            if score is not None:
+                removed += int(self._remove_if_score(keys=[self.key(shard)], args=[member, score]) or 0)
+        return removed
+
+    def _reconcile_full(self, chunk_size: int) -> Dict[str, int]:
+        """
+        1) Upsert all schedulable CallTasks with their current next_call.
+        2) Remove members whose task no longer exists or is not schedulable,
+           unless a concurrent push changed the member's score meanwhile.
+        """
+        from core.models import CallTask
+        from core.telephony.repositories.call_repo import SCHEDULABLE_STATUSES
+
+        schedulable = [str(s) for s in SCHEDULABLE_STATUSES]
+        added = 0
+        batch: List[Tuple[str, object, datetime]] = []
+        rows = (
+            CallTask.objects.filter(status__in=schedulable)
+            .values_list("id", "workspace_id", "next_call", "eligible_from")
+            .iterator(chunk_size=chunk_size)
+        )
+        for task_id, workspace_id, next_call, eligible_from in rows:
+            batch.append((str(task_id), workspace_id, due_at(next_call, eligible_from)))
+            if len(batch) >= chunk_size:
+                added += self.push_many(batch)
+                batch = []
+        if batch:
+            added += self.push_many(batch)
+
+        removed = 0
+        for shard in range(self.shard_count):
+            key = self.key(shard)
+            members: Dict[str, float] = {}
+            for member, score in self.redis.zscan_iter(key, count=chunk_size):
+                members[member.decode() if isinstance(member, bytes) else str(member)] = score
+                if len(members) >= chunk_size:
+                    removed += self._drop_stale(key, members, schedulable)
+                    members = {}
+            if members:
+                removed += self._drop_stale(key, members, schedulable)
+
+        return {"added": added, "removed": removed}
+
+    def _drop_stale(self, key: str, members: Dict[str, float], schedulable: List[str]) -> int:
+        from core.models import CallTask
+
+        live = {
+            str(pk)
+            for pk in CallTask.objects.filter(id__in=list(members), status__in=schedulable)
+            .values_list("id", flat=True)
+        }
+        removed = 0
+        for member, score in members.items():
+            if member not in live:
+                removed += int(self._remove_if_score(keys=[key], args=[member, score]) or 0)
+        return removed
+
+
+def enqueue_due_call_task(call_task) -> None:
+    """
+    Push a CallTask's next_call into the due index once the surrounding
+    transaction commits. No-op unless the sharded scheduler is enabled; Redis
+    failures are logged and left to the periodic reconciler.
+    """
+    if not DueIndex.enabled():
+        return
+
+    task_id, workspace_id = str(call_task.id), call_task.workspace_id
+    next_call = due_at(call_task.next_call, getattr(call_task, "eligible_from", None))
+
+    def _push():
+        try:
+            DueIndex().push_many([(task_id, workspace_id, next_call)])
+        except Exception as e:
+            logger.warning(f"⚠️ Due index push failed for CallTask {task_id}: {e}")
+
+    transaction.on_commit(_push)
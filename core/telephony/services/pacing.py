@@ -0,0 +1,256 @@
+"""
+Answer-rate-aware pacing for outbound dispatch.
+
+A dial attempt holds an admission slot while it rings (ring time R) and, if
+answered (probability p), for the conversation (average handle time H).
+In steady state the share of in-flight calls that are actually connected is
+
+    f = p·H / (R + p·H)
+
+so hitting a target of T concurrent connected calls needs about T / f calls
+in flight. Each tick the scheduler promotes only the difference between that
+and what is already in flight (never more than the admission controller's
+free slots, so the configured caps still hold).
+
+p, H and R are exponentially weighted moving averages kept in Redis hashes,
+updated incrementally from every CallLog as it is written:
+  pacing:stats:global
+  pacing:stats:agent:{agent_id}
+  pacing:stats:trunk:{sip_trunk_id}
+Calls already in flight are weighted by their trunk's own estimate.
+"""
+from __future__ import annotations
+
+import logging
+import math
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from core.models import DisconnectionReason
+from core.utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+# Outcomes where nobody picked up; everything else occupied the line as a connected call
+NOT_CONNECTED_REASONS = frozenset(str(r) for r in (
+    DisconnectionReason.DIAL_BUSY,
+    DisconnectionReason.DIAL_FAILED,
+    DisconnectionReason.DIAL_NO_ANSWER,
+    DisconnectionReason.INVALID_DESTINATION,
+    DisconnectionReason.TELEPHONY_PROVIDER_PERMISSION_DENIED,
+    DisconnectionReason.TELEPHONY_PROVIDER_UNAVAILABLE,
+    DisconnectionReason.SIP_ROUTING_ERROR,
+    DisconnectionReason.MARKED_AS_SPAM,
+    DisconnectionReason.USER_DECLINED,
+    DisconnectionReason.ERROR_USER_NOT_JOINED,
+))
+
+
+# KEYS = stats hashes; ARGV = alpha, answered (0/1), duration seconds, ttl
+# Until a hash has 1/alpha samples the update is a plain running mean (warm start).
+_RECORD_LUA = """
+local alpha = tonumber(ARGV[1])
+local answered = tonumber(ARGV[2])
+local duration = tonumber(ARGV[3])
+
+local function step(key, value_field, count_field, value)
+    local n = tonumber(redis.call('HGET', key, count_field) or '0')
+    local a = alpha
+    if n < 1 / alpha then a = 1 / (n + 1) end
+    local current = tonumber(redis.call('HGET', key, value_field) or '0')
+    redis.call('HSET', key, value_field, tostring(current + a * (value - current)))
+    redis.call('HSET', key, count_field, n + 1)
+end
+
+for i = 1, #KEYS do
+    step(KEYS[i], 'answer_rate', 'n', answered)
+    if answered == 1 then
+        step(KEYS[i], 'aht', 'n_answered', duration)
+    elseif duration > 0 then
+        step(KEYS[i], 'ring', 'n_ring', duration)
+    end
+    redis.call('EXPIRE', KEYS[i], ARGV[4])
+end
+return #KEYS
+"""
+
+
+@dataclass(frozen=True)
+class PacingEstimate:
+    answer_rate: float
+    aht_seconds: float
+    ring_seconds: float
+    samples: int
+
+    @property
+    def connected_fraction(self) -> float:
+        """Expected share of in-flight calls that are in conversation."""
+        talk = self.answer_rate * self.aht_seconds
+        if talk <= 0:
+            return 0.0
+        return talk / (self.ring_seconds + talk)
+
+
+class PacingEngine:
+    """
+    Service turning rolling answer-rate / handle-time estimates into a
+    per-tick dial budget.
+
+    Disabled (budget = free admission slots) while
+    DISPATCH_TARGET_CONNECTED_CALLS is 0.
+    """
+
+    GLOBAL_KEY = "pacing:stats:global"
+    AGENT_KEY = "pacing:stats:agent:{id}"
+    TRUNK_KEY = "pacing:stats:trunk:{id}"
+    TRUNKS_KEY = "pacing:trunks"
+    STATS_TTL_SECONDS = 14 * 24 * 3600
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_redis_client()
+        self._record = self.redis.register_script(_RECORD_LUA)
+        self.target_connected = int(getattr(settings, "DISPATCH_TARGET_CONNECTED_CALLS", 0))
+        self.alpha = float(getattr(settings, "PACING_EWMA_ALPHA", 0.05))
+        self.min_samples = int(getattr(settings, "PACING_MIN_SAMPLES", 20))
+        self.default_ring_seconds = float(getattr(settings, "PACING_DEFAULT_RING_SECONDS", 20.0))
+        # Floor on p so a bad streak cannot explode the in-flight target
+        self.min_answer_rate = float(getattr(settings, "PACING_MIN_ANSWER_RATE", 0.05))
+
+    @property
+    def enabled(self) -> bool:
+        return self.target_connected > 0
+
+    # ── recording ────────────────────────────────────────────────────────
+    @staticmethod
+    def is_connected(disconnection_reason: Optional[str], duration: int) -> bool:
+        if disconnection_reason in NOT_CONNECTED_REASONS:
+            return False
+        return (duration or 0) > 0
+
+    def record_outcome(self, *, agent_id, trunk_id=None, answered: bool, duration_s: int) -> None:
+        keys = [self.GLOBAL_KEY, self.AGENT_KEY.format(id=agent_id)]
+        if trunk_id:
+            keys.append(self.TRUNK_KEY.format(id=trunk_id))
+        self._record(keys=keys, args=[self.alpha, 1 if answered else 0, max(int(duration_s or 0), 0), self.STATS_TTL_SECONDS])
+        if trunk_id:
+            self.redis.sadd(self.TRUNKS_KEY, str(trunk_id))
+
+    # ── estimates ────────────────────────────────────────────────────────
+    def _parse(self, raw: Dict) -> Optional[PacingEstimate]:
+        if not raw:
+            return None
+        data = {(k.decode() if isinstance(k, bytes) else k): float(v) for k, v in raw.items()}
+        samples = int(data.get("n", 0))
+        if samples < self.min_samples:
+            return None
+        ring = data.get("ring") if data.get("n_ring", 0) >= self.min_samples else None
+        return PacingEstimate(
+            answer_rate=max(data.get("answer_rate", 0.0), self.min_answer_rate),
+            aht_seconds=data.get("aht", 0.0),
+            ring_seconds=ring or self.default_ring_seconds,
+            samples=samples,
+        )
+
+    def estimate(self, *, agent_id=None, trunk_id=None) -> Optional[PacingEstimate]:
+        """Most specific estimate with enough samples: trunk, then agent, then global."""
+        keys = []
+        if trunk_id:
+            keys.append(self.TRUNK_KEY.format(id=trunk_id))
+        if agent_id:
+            keys.append(self.AGENT_KEY.format(id=agent_id))
+        keys.append(self.GLOBAL_KEY)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        for raw in pipe.execute():
+            parsed = self._parse(raw)
+            if parsed is not None:
+                return parsed
+        return None
+
+    def expected_connected(self, global_estimate: PacingEstimate) -> float:
+        """Expected connected calls among those in flight, weighted per trunk."""
+        from core.telephony.services.admission import AdmissionController
+
+        trunk_ids = sorted(t.decode() if isinstance(t, bytes) else t for t in self.redis.smembers(self.TRUNKS_KEY))
+        total_inflight = int(self.redis.get(AdmissionController.GLOBAL_KEY) or 0)
+        if not trunk_ids:
+            return total_inflight * global_estimate.connected_fraction
+
+        pipe = self.redis.pipeline(transaction=False)
+        for trunk_id in trunk_ids:
+            pipe.get(AdmissionController.TRUNK_KEY.format(id=trunk_id))
+            pipe.hgetall(self.TRUNK_KEY.format(id=trunk_id))
+        results = pipe.execute()
+
+        expected = 0.0
+        accounted = 0
+        for inflight_raw, stats_raw in zip(results[0::2], results[1::2]):
+            inflight = int(inflight_raw or 0)
+            if not inflight:
+                continue
+            trunk_estimate = self._parse(stats_raw) or global_estimate
+            expected += inflight * trunk_estimate.connected_fraction
+            accounted += inflight
+        # Calls on trunks without stats use the global estimate
+        expected += max(total_inflight - accounted, 0) * global_estimate.connected_fraction
+        return expected
+
+    # ── budget ───────────────────────────────────────────────────────────
+    def dial_budget(self, inflight: int, available_slots: int) -> int:
+        """
+        How many CallTasks to promote this tick (across all shards).
+
+        Never exceeds `available_slots`; falls back to it while pacing is
+        disabled or there is not yet enough history.
+        """
+        if not self.enabled or available_slots <= 0:
+            return available_slots
+        try:
+            global_estimate = self.estimate()
+            if global_estimate is None or global_estimate.connected_fraction <= 0:
+                return available_slots
+
+            deficit = self.target_connected - self.expected_connected(global_estimate)
+            if deficit <= 0:
+                return 0
+            budget = int(math.ceil(deficit / global_estimate.connected_fraction))
+        except Exception as e:
+            logger.warning(f"⚠️ Pacing estimate unavailable, using free slots: {e}")
+            return available_slots
+        return max(0, min(budget, available_slots))
+
+    def snapshot(self) -> Dict[str, object]:
+        """Global estimate and budget inputs for readiness/debugging."""
+        global_estimate = self.estimate()
+        return {
+            "enabled": self.enabled,
+            "target_connected": self.target_connected,
+            "answer_rate": round(global_estimate.answer_rate, 4) if global_estimate else None,
+            "aht_seconds": round(global_estimate.aht_seconds, 1) if global_estimate else None,
+            "ring_seconds": round(global_estimate.ring_seconds, 1) if global_estimate else None,
+            "connected_fraction": round(global_estimate.connected_fraction, 4) if global_estimate else None,
+            "samples": global_estimate.samples if global_estimate else 0,
+        }
+
+
+def record_call_log_outcome(call_log) -> None:
+    """Feed a freshly written CallLog into the pacing estimates (never raises)."""
+    try:
+        from core.telephony.services.dispatch_snapshot import dispatch_snapshots
+
+        if getattr(call_log, "direction", "outbound") != "outbound" or not call_log.agent_id:
+            return
+        snapshot = dispatch_snapshots.get(call_log.agent_id)
+        PacingEngine().record_outcome(
+            agent_id=call_log.agent_id,
+            trunk_id=snapshot.sip_trunk_pk if snapshot else None,
+            answered=PacingEngine.is_connected(call_log.disconnection_reason, call_log.duration),
+            duration_s=call_log.duration,
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Pacing update failed for CallLog {getattr(call_log, 'id', None)}: {e}")
@@ -0,0 +1,194 @@
+"""
+Distributed calls-per-second limiter for outbound SIP calls.
+
+Carriers cap how fast new calls may be set up, per trunk and often per
+caller ID. A scheduler tick that promotes 100 tasks at once would otherwise
+hit LiveKit's create_sip_participant in one burst and get rejected.
+
+Each limit is a token bucket in Redis:
+  cps:bucket:trunk:{sip_trunk_pk}      SIPTrunk.max_calls_per_second
+  cps:bucket:number:{phone_number_id}  SIPTrunk.max_calls_per_second_per_number
+
+A call takes one token from every bucket that applies in a single Lua call
+(all or nothing). When a bucket is empty the script returns how long until
+a token is available and the dialer sleeps on the event loop instead of
+failing the call. Only a wait longer than DIALER_CPS_MAX_WAIT_SECONDS gives
+up with abort_reason "throttled".
+
+Throttling outcomes are counted in `cps:throttled` (hash, field per reason
+and per trunk) and never count as call attempts.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from core.utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+# Dialer-side wait ran out, or the carrier rejected the call for rate
+THROTTLED = "throttled"
+CARRIER_THROTTLED = "carrier_throttled"
+THROTTLE_ABORT_REASONS = frozenset({THROTTLED, CARRIER_THROTTLED})
+
+# Structured statuses that mean "slow down" rather than a bad call or an outage:
+# 429 always, 503 only when the carrier says when to retry
+_TOO_MANY_REQUESTS = 429
+_SERVICE_UNAVAILABLE = 503
+_RETRY_AFTER_KEYS = ("sip_retry_after", "retry_after", "retry-after")
+
+
+# KEYS = buckets; ARGV = pairs of (rate per second, burst) per bucket
+# Returns 0 when a token was taken from every bucket, otherwise the number of
+# milliseconds until all buckets have one (nothing is taken in that case).
+_TAKE_LUA = """
+redis.replicate_commands()
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local levels = {}
+local wait = 0
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, math.ceil((1 - tokens) * 1000 / rate))
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', KEYS[i], 'tokens', levels[i] - 1, 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(burst * 1000 / rate) + 1000)
+end
+return 0
+"""
+
+
+@dataclass(frozen=True)
+class CallRateLimit:
+    """The buckets one outbound call must take a token from."""
+
+    trunk_id: Optional[str] = None
+    trunk_cps: float = 0.0
+    number_id: Optional[str] = None
+    number_cps: float = 0.0
+
+    @property
+    def buckets(self) -> List[Tuple[str, float]]:
+        out: List[Tuple[str, float]] = []
+        if self.trunk_id and self.trunk_cps > 0:
+            out.append((CallRateLimiter.TRUNK_KEY.format(id=self.trunk_id), self.trunk_cps))
+        if self.number_id and self.number_cps > 0:
+            out.append((CallRateLimiter.NUMBER_KEY.format(id=self.number_id), self.number_cps))
+        return out
+
+    @classmethod
+    def from_snapshot(cls, snapshot) -> "CallRateLimit":
+        default_trunk = float(getattr(settings, "DIALER_DEFAULT_TRUNK_CPS", 0) or 0)
+        default_number = float(getattr(settings, "DIALER_DEFAULT_CALLER_ID_CPS", 0) or 0)
+        return cls(
+            trunk_id=snapshot.sip_trunk_pk,
+            trunk_cps=float(snapshot.trunk_calls_per_second or default_trunk),
+            number_id=snapshot.phone_number_id,
+            number_cps=float(snapshot.number_calls_per_second or default_number),
+        )
+
+
+class CallRateLimiter:
+    """
+    Token-bucket CPS limiter shared by every dialer process.
+
+    Burst size equals one second of rate (at least one token), so a trunk
+    configured for 10 CPS starts at most 10 calls in any second.
+    """
+
+    TRUNK_KEY = "cps:bucket:trunk:{id}"
+    NUMBER_KEY = "cps:bucket:number:{id}"
+    THROTTLED_KEY = "cps:throttled"
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_redis_client()
+        self._take = self.redis.register_script(_TAKE_LUA)
+        self.max_wait_seconds = float(getattr(settings, "DIALER_CPS_MAX_WAIT_SECONDS", 30))
+
+    def try_acquire(self, limit: CallRateLimit) -> float:
+        """Take one token from every bucket; 0.0 on success, else seconds to wait."""
+        buckets = limit.buckets
+        if not buckets:
+            return 0.0
+        args: List[float] = []
+        for _, rate in buckets:
+            args.extend([rate, max(rate, 1.0)])
+        wait_ms = int(self._take(keys=[key for key, _ in buckets], args=args) or 0)
+        return wait_ms / 1000.0
+
+    async def acquire(self, limit: CallRateLimit) -> Tuple[bool, float]:
+        """
+        Wait on the event loop until every bucket yields a token.
+
+        Returns (acquired, seconds waited). Redis errors fail open: the call
+        goes ahead unthrottled rather than not at all.
+        """
+        if not limit.buckets:
+            return True, 0.0
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        while True:
+            try:
+                wait = await loop.run_in_executor(None, self.try_acquire, limit)
+            except Exception as e:
+                logger.warning(f"⚠️ CPS limiter unavailable, dialing unthrottled: {e}")
+                return True, time.monotonic() - started
+            waited = time.monotonic() - started
+            if wait <= 0:
+                return True, waited
+            if waited + wait > self.max_wait_seconds:
+                return False, waited
+            await asyncio.sleep(wait)
+
+    def record_throttled(self, reason: str, trunk_id: Optional[str] = None) -> None:
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hincrby(self.THROTTLED_KEY, reason, 1)
+            if trunk_id:
+                pipe.hincrby(self.THROTTLED_KEY, f"{reason}:trunk:{trunk_id}", 1)
+            pipe.execute()
+        except Exception:
+            pass
+
+    def throttled_counts(self) -> Dict[str, int]:
+        raw = self.redis.hgetall(self.THROTTLED_KEY) or {}
+        return {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()}
+
+
+def is_carrier_throttle(error: Exception) -> bool:
+    """
+    Whether a create_sip_participant failure is a rate rejection, judged by
+    the structured status of the Twirp error only: SIP 429 (metadata
+    `sip_status_code`) or Twirp HTTP 429, or SIP 503 with a Retry-After.
+    A plain 503 is an outage and counts as a failure.
+    """
+    metadata = getattr(error, "metadata", None)
+    metadata = metadata if isinstance(metadata, dict) else {}
+    try:
+        sip_status = int(metadata.get("sip_status_code") or 0)
+    except (TypeError, ValueError):
+        sip_status = 0
+    if sip_status == _TOO_MANY_REQUESTS or getattr(error, "status", None) == _TOO_MANY_REQUESTS:
+        return True
+    return sip_status == _SERVICE_UNAVAILABLE and any(metadata.get(key) for key in _RETRY_AFTER_KEYS)
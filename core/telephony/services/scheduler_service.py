@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import CallTask
+from core.telephony.repositories.call_repo import claim_due_call_tasks
+from core.telephony.services.active_phones import ActivePhoneIndex
+from core.telephony.services.admission import AdmissionController
+from core.telephony.services.circuit_breaker import CircuitBreaker
+from core.telephony.services.dispatch_metrics import dispatch_metrics
+from core.telephony.services.pacing import PacingEngine
+
+
+class SchedulerService:
+    """
+    One scheduling tick: read capacity from the admission controller, size
+    the batch with the answer-rate pacing engine, claim an admitted batch of
+    due CallTasks, preflight them and enqueue `trigger_call` for each.
+
+    Used by the beat-driven `schedule_agent_call` task (singleton mode, whole
+    table) and by the `run_scheduler` command (sharded mode, one tick per
+    owned shard). With a `due_index` the candidates come from the Redis
+    timing wheel and an idle shard costs no database query at all.
+    `workspace_ids` restricts the claim to those workspaces (load tests).
+    """
+
+    # Popped-but-unclaimed tasks that are still due (phone busy, row locked,
+    # over the batch limit) are looked at again after this many seconds
+    REQUEUE_DELAY_SECONDS = 1.0
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    @staticmethod
+    def shard_count() -> int:
+        return max(int(getattr(settings, "SCHEDULER_SHARD_COUNT", 1)), 1)
+
+    def run_tick(
+        self, *, shard: Optional[Tuple[int, int]] = None, due_index=None, workspace_ids=None
+    ) -> Dict[str, Any]:
+        from core.tasks import trigger_call
+        from core.utils.calltask_utils import handle_call_failure, preflight_dispatch_config
+
+        now = timezone.now()
+
+        # Event-driven mode: nothing due in this shard → no DB work this round
+        if due_index is not None and not due_index.has_due(shard[0], now.timestamp()):
+            return {"success": True, "triggered": 0, "claimed": 0, "shard": shard[0], "idle": True}
+
+        # Global capacity from the Redis in-flight counter (no table counts)
+        admission = AdmissionController()
+        inflight = admission.inflight()
+        available_slots = admission.available_global()
+
+        # Answer-rate pacing: promote only what is needed to reach the target
+        # number of connected calls (never more than the free slots)
+        free_slots = available_slots
+        available_slots = PacingEngine().dial_budget(inflight, available_slots)
+
+        # Sharded mode: each shard gets an equal slice of the global capacity
+        if shard is not None and shard[1] > 1:
+            available_slots = int(math.ceil(available_slots / shard[1]))
+
+        # Circuit breakers: nothing while LiveKit is open, one probe call when it may
+        # be half-open; open trunks are filtered out of the candidate batch
+        gate = CircuitBreaker().dispatch_gate()
+        if gate.livekit_blocked:
+            return {
+                "success": True,
+                "message": "LiveKit circuit open; skipping.",
+                "inflight": inflight,
+                "shard": shard[0] if shard else None,
+            }
+        if gate.livekit_probing:
+            available_slots = min(available_slots, 1)
+
+        if available_slots == 0:
+            return {
+                "success": True,
+                "message": "No capacity; skipping." if free_slots == 0 else "Paced; connected-call target met.",
+                "inflight": inflight,
+                "limit": admission.global_limit,
+                "shard": shard[0] if shard else None,
+            }
+
+        # Lock candidates (SKIP LOCKED), drop phones already on a call (Redis
+        # active-phone set, or the SQL anti-join), admit them against
+        # global/workspace/agent/trunk limits, promote the admitted
+        phone_index = ActivePhoneIndex() if ActivePhoneIndex.enabled() else None
+        if due_index is not None:
+            claimed_ids = self._claim_from_due_index(
+                due_index, shard[0], now, available_slots, admission, phone_index, gate, workspace_ids
+            )
+        else:
+            claimed_ids = claim_due_call_tasks(
+                now=now, limit=available_slots, shard=shard, workspace_ids=workspace_ids, admission=admission,
+                phone_index=phone_index, gate=gate,
+            )
+
+        triggered_ids: List[str] = []
+        if claimed_ids:
+            claimed = CallTask.objects.filter(id__in=claimed_ids).select_related(
+                "agent", "agent__phone_number", "agent__phone_number__sip_trunk"
+            )
+            for task in claimed:
+                self._observe_claim_latency(task)
+
+                # Config preflight on already-loaded relations; reschedules on failure
+                try:
+                    pre = preflight_dispatch_config(task)
+                    if not pre.get("ok"):
+                        continue
+                except Exception as preflight_err:
+                    self.logger.error(f"⚠️ Pre-promotion preflight failed for task {task.id}: {preflight_err}")
+                    # Give the claimed task back (slot, phone, due index) instead of leaving it to the reaper
+                    try:
+                        handle_call_failure(task, str(preflight_err), "preflight_exception")
+                    except Exception as reschedule_err:
+                        self.logger.error(f"❌ Reschedule after preflight failure failed for task {task.id}: {reschedule_err}")
+                    continue
+
+                triggered_ids.append(str(task.id))
+
+            if triggered_ids:
+                dialer_mode = getattr(settings, "DIALER_MODE", "celery")
+                if dialer_mode == "worker":
+                    # Long-lived asyncio dialer consumes IDs from Redis
+                    from core.telephony.services.dialer_worker import DialerWorker
+                    DialerWorker.enqueue(triggered_ids)
+                elif dialer_mode == "batch":
+                    # One message per chunk; each chunk is dispatched concurrently
+                    from core.tasks import trigger_call_batch
+                    size = max(int(getattr(settings, "DIALER_BATCH_SIZE", 50)), 1)
+                    for start in range(0, len(triggered_ids), size):
+                        trigger_call_batch.delay(triggered_ids[start:start + size])
+                else:
+                    for task_id in triggered_ids:
+                        trigger_call.delay(task_id)
+
+        return {
+            "success": True,
+            "triggered": len(triggered_ids),
+            "claimed": len(claimed_ids),
+            "task_ids": triggered_ids,
+            "available_slots": available_slots,
+            "free_slots": free_slots,
+            "inflight": inflight,
+            "concurrency_limit": admission.global_limit,
+            "shard": shard[0] if shard else None,
+            "timestamp": now.isoformat(),
+        }
+
+    @staticmethod
+    def _observe_claim_latency(task) -> None:
+        timeline = task.dispatch_timeline or {}
+        if "due" not in timeline or "claimed" not in timeline:
+            return
+        phone_number = task.agent.phone_number if task.agent_id else None
+        dispatch_metrics.observe(
+            "due_to_claimed",
+            float(timeline["claimed"]) - float(timeline["due"]),
+            workspace_id=task.workspace_id,
+            agent_id=task.agent_id,
+            trunk_id=phone_number.sip_trunk_id if phone_number else "",
+        )
+
+    def _claim_from_due_index(
+        self, due_index, shard_index: int, now, limit: int, admission, phone_index=None, gate=None,
+        workspace_ids=None,
+    ) -> List[str]:
+        # Over-pop like the SQL over-fetch so duplicate phones do not starve the batch
+        popped = due_index.pop_due(shard_index, limit * 2, now.timestamp())
+        if not popped:
+            return []
+
+        claimed_ids: List[str] = []
+        try:
+            claimed_ids = claim_due_call_tasks(
+                now=now, limit=limit, candidate_ids=list(popped), workspace_ids=workspace_ids,
+                admission=admission, phone_index=phone_index, gate=gate,
+            )
+        finally:
+            # Give back what we did not claim; rows that are no longer
+            # schedulable (deleted, promoted elsewhere) simply fall out
+            claimed = set(claimed_ids)
+            unclaimed = [pk for pk in popped if pk not in claimed]
+            if unclaimed:
+                self._requeue_unclaimed(due_index, shard_index, unclaimed)
+        return claimed_ids
+
+    def _requeue_unclaimed(self, due_index, shard_index: int, task_ids: List[str]) -> None:
+        from core.telephony.repositories.call_repo import SCHEDULABLE_STATUSES
+        from core.telephony.services.due_index import due_at
+
+        retry_at = time.time() + self.REQUEUE_DELAY_SECONDS
+        entries = {
+            str(pk): max(due_at(next_call, eligible_from).timestamp(), retry_at)
+            for pk, next_call, eligible_from in CallTask.objects.filter(
+                id__in=task_ids, status__in=[str(s) for s in SCHEDULABLE_STATUSES]
+            ).values_list("id", "next_call", "eligible_from")
+        }
+        due_index.requeue(shard_index, entries)
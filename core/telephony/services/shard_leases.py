@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import math
+import random
+import time
+from typing import Optional, Set
+
+from core.utils.redis_client import get_redis_client
+
+
+# Renew a lease only if we still own it
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Release a lease only if we still own it
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ShardLeaseManager:
+    """
+    Lease-based ownership of scheduler shards in Redis.
+
+    • Every scheduler instance heartbeats into a ZSET `scheduler:instances`
+      (member = instance id, score = last heartbeat).
+    • Each shard has a lease key `scheduler:shard:<n>` holding the owner id
+      with a TTL. Owners renew on every rebalance; a dead instance stops
+      renewing and its shards become free after `lease_ttl` seconds.
+    • Fair share = ceil(shards / live instances). Instances over their share
+      release leases, instances under their share pick up free shards, so the
+      partition rebalances automatically when instances join or die.
+    """
+
+    INSTANCES_KEY = "scheduler:instances"
+    LEASE_KEY_TEMPLATE = "scheduler:shard:{shard}"
+
+    def __init__(
+        self,
+        instance_id: str,
+        *,
+        shard_count: int,
+        lease_ttl: float = 15.0,
+        redis_client=None,
+    ):
+        self.instance_id = instance_id
+        self.shard_count = max(int(shard_count), 1)
+        self.lease_ttl = float(lease_ttl)
+        self.redis = redis_client or get_redis_client()
+        self._renew = self.redis.register_script(_RENEW_LUA)
+        self._release = self.redis.register_script(_RELEASE_LUA)
+        self.owned: Set[int] = set()
+
+    def _lease_key(self, shard: int) -> str:
+        return self.LEASE_KEY_TEMPLATE.format(shard=shard)
+
+    def heartbeat(self, now: Optional[float] = None) -> int:
+        """Record liveness, evict stale instances and return the live instance count."""
+        now = now if now is not None else time.time()
+        pipe = self.redis.pipeline()
+        pipe.zadd(self.INSTANCES_KEY, {self.instance_id: now})
+        pipe.zremrangebyscore(self.INSTANCES_KEY, "-inf", now - self.lease_ttl)
+        pipe.zcard(self.INSTANCES_KEY)
+        _, _, live = pipe.execute()
+        return max(int(live), 1)
+
+    def fair_share(self, live_instances: int) -> int:
+        return int(math.ceil(self.shard_count / max(live_instances, 1)))
+
+    def rebalance(self) -> Set[int]:
+        """Renew, shed or acquire leases so we own our fair share of shards."""
+        target = self.fair_share(self.heartbeat())
+        ttl_ms = int(self.lease_ttl * 1000)
+
+        # 1) Renew what we have; drop shards whose lease we lost
+        for shard in list(self.owned):
+            if not self._renew(keys=[self._lease_key(shard)], args=[self.instance_id, ttl_ms]):
+                self.owned.discard(shard)
+
+        # 2) Give back shards above our fair share (others will pick them up)
+        while len(self.owned) > target:
+            shard = self.owned.pop()
+            self._release(keys=[self._lease_key(shard)], args=[self.instance_id])
+
+        # 3) Pick up free shards (random order spreads contention between instances)
+        if len(self.owned) < target:
+            free = [s for s in range(self.shard_count) if s not in self.owned]
+            random.shuffle(free)
+            for shard in free:
+                if self.redis.set(self._lease_key(shard), self.instance_id, nx=True, px=ttl_ms):
+                    self.owned.add(shard)
+                    if len(self.owned) >= target:
+                        break
+
+        return set(self.owned)
+
+    def release_all(self) -> None:
+        """Release every owned lease and leave the instance set (graceful shutdown)."""
+        for shard in list(self.owned):
+            try:
+                self._release(keys=[self._lease_key(shard)], args=[self.instance_id])
+            except Exception:
+                pass
+        self.owned.clear()
+        try:
+            self.redis.zrem(self.INSTANCES_KEY, self.instance_id)
+        except Exception:
+            pass
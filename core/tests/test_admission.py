@@ -0,0 +1,250 @@
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import CallStatus, CallTask
+from core.telephony.repositories.call_repo import ClaimCandidate, claim_due_call_tasks
+from core.telephony.services.admission import AdmissionController
+from core.tests.utils import (
+    LOCMEM_CACHES,
+    RedisTestMixin,
+    make_agent,
+    make_phone_number,
+    make_task,
+    make_trunk,
+    make_workspace,
+    requires_postgres,
+    requires_redis,
+)
+
+
+class _RecordingAdmission(AdmissionController):
+    """Keeps the candidate list the claim offered for admission."""
+
+    offered = ()
+
+    def admit_batch(self, candidates, limit):
+        self.offered = list(candidates)
+        return super().admit_batch(candidates, limit)
+
+
+def _claim(limit=10):
+    return claim_due_call_tasks(now=timezone.now(), limit=limit, admission=AdmissionController())
+
+
+@requires_postgres
+@requires_redis
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    DISPATCH_MAX_CONCURRENT_CALLS=100,
+    DISPATCH_WORKSPACE_MAX_CONCURRENT_CALLS=0,
+)
+class AdmissionCapTests(RedisTestMixin, TestCase):
+    """Global / workspace / agent / trunk caps enforced by the admit Lua script."""
+
+    def counter(self, template, pk):
+        return int(self.redis.get(template.format(id=pk)) or 0)
+
+    @override_settings(DISPATCH_MAX_CONCURRENT_CALLS=3)
+    def test_global_cap(self):
+        agent = make_agent(make_workspace())
+        for _ in range(5):
+            make_task(agent)
+
+        self.assertEqual(len(_claim()), 3)
+        self.assertEqual(AdmissionController().inflight(), 3)
+        self.assertEqual(_claim(), [])
+
+    @override_settings(DISPATCH_WORKSPACE_MAX_CONCURRENT_CALLS=2)
+    def test_workspace_cap(self):
+        workspace = make_workspace()
+        agent = make_agent(workspace)
+        tasks = [make_task(agent) for _ in range(5)]
+        other = make_task(make_agent(make_workspace()))
+
+        claimed = _claim()
+
+        # The cap holds back this workspace only
+        self.assertIn(str(other.id), claimed)
+        in_workspace = [pk for pk in claimed if pk != str(other.id)]
+        self.assertEqual(len(in_workspace), 2)
+        self.assertEqual(self.counter(AdmissionController.WORKSPACE_KEY, workspace.id), 2)
+        self.assertEqual(_claim(), [])
+
+        # A released slot is handed out again
+        AdmissionController().release(in_workspace[0])
+        self.assertEqual(len(_claim()), 1)
+        triggered = CallTask.objects.filter(id__in=[t.id for t in tasks], status=CallStatus.CALL_TRIGGERED)
+        self.assertEqual(triggered.count(), 3)
+
+    def test_agent_cap(self):
+        workspace = make_workspace()
+        capped = make_agent(workspace, max_concurrent_calls=1)
+        uncapped = make_agent(workspace)
+        for _ in range(3):
+            make_task(capped)
+            make_task(uncapped)
+
+        claimed = set(_claim())
+
+        capped_claimed = CallTask.objects.filter(agent=capped, id__in=claimed).count()
+        self.assertEqual(capped_claimed, 1)
+        self.assertEqual(len(claimed), 4)
+        self.assertEqual(self.counter(AdmissionController.AGENT_KEY, capped.agent_id), 1)
+
+    def test_trunk_cap(self):
+        trunk = make_trunk(max_concurrent_calls=2)
+        shared_number = make_phone_number(trunk)
+        workspace = make_workspace()
+        first = make_agent(workspace, phone_number=shared_number)
+        second = make_agent(workspace, phone_number=shared_number)
+        for _ in range(3):
+            make_task(first)
+            make_task(second)
+        elsewhere = make_task(make_agent(workspace))
+
+        claimed = set(_claim())
+
+        self.assertIn(str(elsewhere.id), claimed)
+        self.assertEqual(len(claimed), 3)
+        self.assertEqual(self.counter(AdmissionController.TRUNK_KEY, trunk.id), 2)
+
+
+@requires_postgres
+@requires_redis
+@override_settings(CACHES=LOCMEM_CACHES, DISPATCH_MAX_CONCURRENT_CALLS=100, DISPATCH_WORKSPACE_MAX_CONCURRENT_CALLS=0)
+class WorkspaceRoundRobinTests(RedisTestMixin, TestCase):
+    """One workspace's backlog cannot crowd the others out of the candidate window."""
+
+    def test_candidate_window_interleaves_workspaces(self):
+        # limit 2 → over-fetch window of 8 rows; five workspaces with older
+        # backlogs would fill it on age alone
+        old = [make_workspace() for _ in range(5)]
+        for workspace in old:
+            agent = make_agent(workspace)
+            for i in range(3):
+                make_task(agent, due_seconds_ago=3600 + i)
+        newest = make_workspace()
+        make_task(make_agent(newest), due_seconds_ago=10)
+
+        admission = _RecordingAdmission()
+        claim_due_call_tasks(now=timezone.now(), limit=2, admission=admission)
+
+        offered = {c.workspace_id for c in admission.offered}
+        self.assertEqual(offered, {str(w.id) for w in old + [newest]})
+
+    def test_oldest_task_of_a_workspace_comes_first(self):
+        agent = make_agent(make_workspace())
+        backlog = [make_task(agent, due_seconds_ago=1000 + i) for i in range(30)]
+        quiet = make_task(make_agent(make_workspace()), due_seconds_ago=10)
+
+        claimed = _claim(limit=2)
+
+        self.assertEqual(set(claimed), {str(backlog[-1].id), str(quiet.id)})
+
+    def test_each_workspace_gets_a_turn(self):
+        workspaces = [make_workspace() for _ in range(3)]
+        for index, workspace in enumerate(workspaces):
+            agent = make_agent(workspace)
+            for _ in range(10 if index == 0 else 2):
+                make_task(agent, due_seconds_ago=3600 if index == 0 else 60)
+
+        claimed = _claim(limit=3)
+
+        served = set(CallTask.objects.filter(id__in=claimed).values_list("workspace_id", flat=True))
+        self.assertEqual(served, {w.id for w in workspaces})
+
+    def test_waiting_before_scheduled_before_retry_within_a_workspace(self):
+        agent = make_agent(make_workspace())
+        retry = make_task(agent, status=CallStatus.RETRY, due_seconds_ago=900)
+        scheduled = make_task(agent, status=CallStatus.SCHEDULED, due_seconds_ago=600)
+        waiting = make_task(agent, status=CallStatus.WAITING, due_seconds_ago=30)
+
+        self.assertEqual(_claim(limit=1), [str(waiting.id)])
+        self.assertEqual(_claim(limit=1), [str(scheduled.id)])
+        self.assertEqual(_claim(limit=1), [str(retry.id)])
+
+
+@requires_postgres
+@requires_redis
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    DISPATCH_MAX_CONCURRENT_CALLS=100,
+    DISPATCH_WORKSPACE_MAX_CONCURRENT_CALLS=0,
+    DISPATCH_ADMISSION_RECONCILE_GRACE_SECONDS=120,
+)
+class AdmissionReconcileTests(RedisTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.agent = make_agent(make_workspace())
+        self.controller = AdmissionController()
+
+    def candidate(self, task):
+        return ClaimCandidate(
+            id=str(task.id),
+            phone=task.phone,
+            workspace_id=str(task.workspace_id),
+            agent_id=str(task.agent_id),
+            trunk_id=None,
+            agent_limit=None,
+            trunk_limit=None,
+        )
+
+    def test_recount_with_stale_version_is_refused(self):
+        self.controller.try_admit(self.candidate(make_task(self.agent)), 0)
+        version = int(self.redis.get(AdmissionController.VERSION_KEY))
+        self.controller.try_admit(self.candidate(make_task(self.agent)), 0)
+
+        applied = self.controller._recount(
+            keys=[AdmissionController.VERSION_KEY, AdmissionController.GLOBAL_KEY], args=[version, 0]
+        )
+
+        self.assertEqual(int(applied), 0)
+        self.assertEqual(self.controller.inflight(), 2)
+
+    def test_recount_racing_an_admit_keeps_the_admission(self):
+        claimed = _claim(limit=1)
+        self.assertEqual(len(claimed), 1)
+        racer = self.candidate(make_task(self.agent))
+
+        real_recount = self.controller._recount
+        attempts = []
+
+        def recount_after_concurrent_admit(keys, args):
+            if not attempts:
+                # Another scheduler admits between reading the held records and writing counters
+                self.assertEqual(self.controller.try_admit(racer, 0), 0)
+            attempts.append(args[0])
+            return real_recount(keys=keys, args=args)
+
+        self.controller._recount = recount_after_concurrent_admit
+        result = self.controller.reconcile()
+
+        self.assertTrue(result["recounted"])
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(self.controller.inflight(), 2)
+        self.assertTrue(self.redis.exists(AdmissionController.HELD_KEY.format(id=racer.id)))
+
+    def test_stale_held_record_is_released_and_active_task_adopted(self):
+        stale = make_task(self.agent)
+        self.controller.try_admit(self.candidate(stale), 0)
+        # Older than the grace period, and its task never became active
+        self.redis.expire(AdmissionController.HELD_KEY.format(id=stale.id), self.controller.held_ttl - 600)
+        active = make_task(self.agent, status=CallStatus.IN_PROGRESS)
+
+        result = self.controller.reconcile()
+
+        self.assertEqual(result["stale_held_removed"], 1)
+        self.assertEqual(result["adopted"], 1)
+        self.assertFalse(self.redis.exists(AdmissionController.HELD_KEY.format(id=stale.id)))
+        self.assertTrue(self.redis.exists(AdmissionController.HELD_KEY.format(id=active.id)))
+        self.assertEqual(self.controller.inflight(), 1)
+
+    def test_fresh_held_record_survives_reconcile(self):
+        fresh = make_task(self.agent)
+        self.controller.try_admit(self.candidate(fresh), 0)
+
+        result = self.controller.reconcile()
+
+        self.assertEqual(result["stale_held_removed"], 0)
+        self.assertEqual(self.controller.inflight(), 1)
@@ -0,0 +1,171 @@
+import logging
+import threading
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core.models import CallStatus, CallTask
+from core.telephony.repositories.call_repo import claim_due_call_tasks
+from core.telephony.services.admission import AdmissionController
+from core.telephony.services.scheduler_service import SchedulerService
+from core.tests.utils import (
+    LOCMEM_CACHES,
+    RedisTestMixin,
+    make_agent,
+    make_task,
+    make_workspace,
+    requires_postgres,
+    requires_redis,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@requires_postgres
+class ClaimDueCallTasksTests(TestCase):
+    """claim_due_call_tasks() without admission control (single UPDATE … RETURNING)."""
+
+    def setUp(self):
+        self.agent = make_agent(make_workspace())
+
+    def test_limit_is_respected(self):
+        for _ in range(12):
+            make_task(self.agent)
+
+        claimed = claim_due_call_tasks(now=timezone.now(), limit=5)
+
+        self.assertEqual(len(claimed), 5)
+        self.assertEqual(CallTask.objects.filter(status=CallStatus.CALL_TRIGGERED).count(), 5)
+        self.assertEqual(
+            set(claimed),
+            {str(pk) for pk in CallTask.objects.filter(status=CallStatus.CALL_TRIGGERED).values_list("id", flat=True)},
+        )
+
+    def test_tasks_not_due_are_left_alone(self):
+        due = make_task(self.agent)
+        make_task(self.agent, due_seconds_ago=-3600)
+
+        self.assertEqual(claim_due_call_tasks(now=timezone.now(), limit=10), [str(due.id)])
+
+    def test_phone_already_on_a_call_is_skipped(self):
+        make_task(self.agent, phone="+4915100000001", status=CallStatus.IN_PROGRESS)
+        make_task(self.agent, phone="+4915100000002", status=CallStatus.CALL_TRIGGERED)
+        busy_in_progress = make_task(self.agent, phone="+4915100000001")
+        busy_triggered = make_task(self.agent, phone="+4915100000002")
+        free = make_task(self.agent, phone="+4915100000003")
+
+        claimed = claim_due_call_tasks(now=timezone.now(), limit=10)
+
+        self.assertEqual(claimed, [str(free.id)])
+        busy_in_progress.refresh_from_db()
+        busy_triggered.refresh_from_db()
+        self.assertEqual(busy_in_progress.status, CallStatus.SCHEDULED)
+        self.assertEqual(busy_triggered.status, CallStatus.SCHEDULED)
+
+    def test_one_task_per_phone_per_batch(self):
+        older = make_task(self.agent, phone="+4915100000004", due_seconds_ago=600)
+        make_task(self.agent, phone="+4915100000004", due_seconds_ago=60)
+
+        self.assertEqual(claim_due_call_tasks(now=timezone.now(), limit=10), [str(older.id)])
+
+
+class ConcurrentClaimMixin:
+    def setUp(self):
+        super().setUp()
+        self.agent = make_agent(make_workspace())
+        for _ in range(20):
+            make_task(self.agent)
+
+    def _claim_while_other_claim_is_open(self, claim):
+        """Run `claim` in a thread that keeps its transaction (and row locks) open
+        until a second `claim` in this thread has finished."""
+        first_done, second_done = threading.Event(), threading.Event()
+        first = []
+
+        def hold_claim():
+            try:
+                with transaction.atomic():
+                    first.extend(claim())
+                    first_done.set()
+                    second_done.wait(timeout=30)
+            finally:
+                first_done.set()
+                connection.close()
+
+        worker = threading.Thread(target=hold_claim)
+        worker.start()
+        self.assertTrue(first_done.wait(timeout=30))
+        try:
+            second = claim()
+        finally:
+            second_done.set()
+            worker.join(timeout=30)
+        return first, second
+
+
+@requires_postgres
+class ConcurrentClaimTests(ConcurrentClaimMixin, TransactionTestCase):
+    """Two claimers running at the same time never promote the same row."""
+
+    def test_concurrent_claimers_get_disjoint_tasks(self):
+        first, second = self._claim_while_other_claim_is_open(
+            lambda: claim_due_call_tasks(now=timezone.now(), limit=8)
+        )
+
+        self.assertEqual(len(first), 8)
+        self.assertEqual(len(second), 8)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(CallTask.objects.filter(status=CallStatus.CALL_TRIGGERED).count(), 16)
+
+
+
+@requires_postgres
+@requires_redis
+@override_settings(CACHES=LOCMEM_CACHES, DISPATCH_MAX_CONCURRENT_CALLS=100)
+class ConcurrentAdmissionClaimTests(RedisTestMixin, ConcurrentClaimMixin, TransactionTestCase):
+    """Same guarantee on the admission-controlled (lock, admit, promote) path."""
+
+    def test_concurrent_admission_claimers_get_disjoint_tasks(self):
+        first, second = self._claim_while_other_claim_is_open(
+            lambda: claim_due_call_tasks(now=timezone.now(), limit=8, admission=AdmissionController())
+        )
+
+        self.assertEqual(len(first), 8)
+        # The second claimer may come back empty (its candidates are locked), never with overlap
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(
+            CallTask.objects.filter(status=CallStatus.CALL_TRIGGERED).count(), len(first) + len(second)
+        )
+        # Only promoted tasks keep an admission slot
+        self.assertEqual(AdmissionController().inflight(), len(first) + len(second))
+
+
+@requires_postgres
+@requires_redis
+@override_settings(CACHES=LOCMEM_CACHES, DISPATCH_MAX_CONCURRENT_CALLS=100, SCHEDULER_PHONE_INDEX="sql")
+class PreflightExceptionTests(RedisTestMixin, TestCase):
+    """A claimed task whose preflight raises is given back, not left CALL_TRIGGERED."""
+
+    def test_preflight_exception_reschedules_task(self):
+        task = make_task(make_agent(make_workspace()))
+
+        with mock.patch(
+            "core.utils.calltask_utils.preflight_dispatch_config", side_effect=RuntimeError("snapshot store down")
+        ), mock.patch("core.tasks.trigger_call.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = SchedulerService(logger).run_tick()
+
+        self.assertEqual(result["claimed"], 1)
+        self.assertEqual(result["triggered"], 0)
+        delay.assert_not_called()
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, CallStatus.RETRY)
+        self.assertEqual(task.attempts, 0)
+        self.assertGreater(task.next_call, timezone.now())
+        self.assertEqual(task.retry_reasons[-1]["reason"], "preflight_exception")
+        # Admission slot released after commit
+        self.assertEqual(AdmissionController().inflight(), 0)
+        self.assertFalse(self.redis.exists(AdmissionController.HELD_KEY.format(id=task.id)))
@@ -0,0 +1,188 @@
+import logging
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import CallStatus, CallTask, Lead
+from core.quotas import QuotaExceeded
+from core.tasks import cleanup_stuck_call_tasks, sweep_quota_reservations, trigger_call_batch
+from core.telephony.services.dialer_service import DialerService
+from core.tests.utils import (
+    LOCMEM_CACHES,
+    RedisTestMixin,
+    make_agent,
+    make_task,
+    make_workspace,
+    requires_postgres,
+    requires_redis,
+)
+from core.utils.calltask_utils import handle_call_failure
+from core.utils.quota_counters import QuotaCounters
+
+logger = logging.getLogger(__name__)
+
+# Reservations are keyed by an opaque FeatureUsage id; no plan rows are needed
+FEATURE_USAGE_ID = "test-call-minutes"
+
+
+@requires_postgres
+@requires_redis
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    QUOTA_REDIS_COUNTERS=True,
+    SCHEDULER_PHONE_INDEX="sql",
+    STUCK_REAPER_TRIGGERED_MINUTES=10,
+)
+class ReservationReleaseTests(RedisTestMixin, TestCase):
+    """Every path that ends a call attempt without success gives its minutes back."""
+
+    def setUp(self):
+        super().setUp()
+        self.workspace = make_workspace()
+        self.agent = make_agent(self.workspace)
+
+    def hold(self, task, minutes=5, ttl_seconds=3600):
+        reserved, _ = QuotaCounters().reserve(FEATURE_USAGE_ID, task.id, minutes, None, lambda: 0, ttl_seconds)
+        self.assertTrue(reserved)
+        self.assertTrue(self.is_held(task))
+
+    def is_held(self, task):
+        return bool(self.redis.exists(QuotaCounters.RESERVATION_KEY.format(id=task.id)))
+
+    def reserved_total(self):
+        return int(self.redis.hget(QuotaCounters.COUNTER_KEY.format(id=FEATURE_USAGE_ID), "reserved") or 0)
+
+    def triggered_task(self, **kwargs):
+        lead = Lead.objects.create(name="Test", email="lead@example.com", phone="+4915100000000", workspace=self.workspace)
+        task = make_task(self.agent, status=CallStatus.CALL_TRIGGERED, **kwargs)
+        CallTask.objects.filter(id=task.id).update(lead=lead)
+        return task
+
+    def test_quota_exceeded_delete_releases(self):
+        task = self.triggered_task()
+        self.hold(task)
+
+        with mock.patch("core.quotas.reserve_call_minutes", side_effect=QuotaExceeded("call_minutes over limit")):
+            with self.captureOnCommitCallbacks(execute=True):
+                prepared, result = DialerService(logger).prepare_dispatch(str(task.id))
+
+        self.assertIsNone(prepared)
+        self.assertEqual(result["error"], "quota_exceeded")
+        self.assertFalse(CallTask.objects.filter(id=task.id).exists())
+        self.assertFalse(self.is_held(task))
+        self.assertEqual(self.reserved_total(), 0)
+
+    def test_quota_backend_failure_fails_closed(self):
+        task = self.triggered_task()
+        self.hold(task)
+
+        with mock.patch("core.quotas.reserve_call_minutes", side_effect=ConnectionError("redis down")):
+            with self.captureOnCommitCallbacks(execute=True):
+                prepared, result = DialerService(logger).prepare_dispatch(str(task.id))
+
+        self.assertIsNone(prepared)
+        self.assertEqual(result["reason"], "quota_check_failed")
+        task.refresh_from_db()
+        self.assertEqual(task.status, CallStatus.RETRY)
+        self.assertFalse(self.is_held(task))
+
+    def test_handle_call_failure_releases(self):
+        task = self.triggered_task()
+        self.hold(task)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            handle_call_failure(task, "sip 486 busy", "dispatch_failed")
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, CallStatus.RETRY)
+        self.assertFalse(self.is_held(task))
+        self.assertEqual(self.reserved_total(), 0)
+
+    def test_reaper_releases(self):
+        task = self.triggered_task()
+        CallTask.objects.filter(id=task.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.hold(task)
+
+        result = cleanup_stuck_call_tasks()
+
+        self.assertEqual(result["deleted_triggered"], 1)
+        self.assertFalse(CallTask.objects.filter(id=task.id).exists())
+        self.assertFalse(self.is_held(task))
+
+    def test_trigger_call_batch_failure_releases(self):
+        tasks = [self.triggered_task() for _ in range(3)]
+        for task in tasks:
+            self.hold(task)
+
+        with mock.patch(
+            "core.telephony.services.batch_dialer.BatchDispatcher.prepare", side_effect=RuntimeError("db gone")
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                result = trigger_call_batch([str(t.id) for t in tasks])
+
+        self.assertFalse(result["success"])
+        for task in tasks:
+            task.refresh_from_db()
+            self.assertEqual(task.status, CallStatus.RETRY)
+            self.assertFalse(self.is_held(task))
+        self.assertEqual(self.reserved_total(), 0)
+
+    def test_delete_releases(self):
+        task = self.triggered_task()
+        self.hold(task)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task.delete()
+
+        self.assertFalse(self.is_held(task))
+
+
+@requires_redis
+@override_settings(QUOTA_REDIS_COUNTERS=True)
+class ReservationSweepTests(RedisTestMixin, TestCase):
+    """sweep_reservations() frees only reservations past their expiry."""
+
+    def reserve(self, call_task_id, minutes, ttl_seconds):
+        reserved, _ = QuotaCounters().reserve(FEATURE_USAGE_ID, call_task_id, minutes, None, lambda: 0, ttl_seconds)
+        self.assertTrue(reserved)
+
+    def counter(self):
+        return self.redis.hgetall(QuotaCounters.COUNTER_KEY.format(id=FEATURE_USAGE_ID))
+
+    def test_expired_reservations_are_freed(self):
+        self.reserve("expired-call", 5, 60)
+        self.reserve("live-call", 3, 3600)
+
+        later = mock.Mock(time=mock.Mock(return_value=time.time() + 120))
+        with mock.patch("core.utils.quota_counters.time", later):
+            counts = QuotaCounters().sweep_reservations()
+
+        self.assertEqual(counts["freed"], 5000)
+        counter = self.counter()
+        self.assertNotIn(b"r:expired-call", counter)
+        self.assertIn(b"r:live-call", counter)
+        self.assertEqual(int(counter[b"reserved"]), 3000)
+        # The counter still holds a live reservation, so it stays in the sweep set
+        self.assertTrue(self.redis.sismember(QuotaCounters.RESERVING_KEY, FEATURE_USAGE_ID))
+
+    def test_swept_counter_leaves_the_sweep_set(self):
+        self.reserve("expired-call", 5, 60)
+
+        later = mock.Mock(time=mock.Mock(return_value=time.time() + 120))
+        with mock.patch("core.utils.quota_counters.time", later):
+            result = sweep_quota_reservations()
+
+        self.assertTrue(result["success"])
+        self.assertEqual(int(self.counter()[b"reserved"]), 0)
+        self.assertFalse(self.redis.sismember(QuotaCounters.RESERVING_KEY, FEATURE_USAGE_ID))
+
+    def test_nothing_expired_nothing_freed(self):
+        self.reserve("live-call", 3, 3600)
+
+        counts = QuotaCounters().sweep_reservations()
+
+        self.assertEqual(counts["freed"], 0)
+        self.assertEqual(int(self.counter()[b"reserved"]), 3000)
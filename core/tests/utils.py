@@ -0,0 +1,104 @@
+"""
+Shared fixtures for the scheduler / dispatch tests.
+
+These tests exercise Postgres-only SQL (FOR UPDATE SKIP LOCKED, LATERAL)
+and Redis Lua scripts, so they need the regular database settings plus a
+disposable Redis database in TEST_REDIS_URL (flushed before and after
+every test). Without it the Redis-backed tests are skipped.
+"""
+import os
+import unittest
+from datetime import time as dt_time, timedelta
+from itertools import count
+
+import redis
+from django.db import connection
+from django.utils import timezone
+
+from core.models import Agent, CallStatus, CallTask, PhoneNumber, SIPTrunk, Workspace
+from core.utils import redis_client
+from core.utils.dial_calendar import ALL_DAYS
+
+TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL")
+
+_numbers = count(1)
+
+
+def requires_postgres(test_item):
+    return unittest.skipUnless(connection.vendor == "postgresql", "needs PostgreSQL")(test_item)
+
+
+def requires_redis(test_item):
+    return unittest.skipUnless(TEST_REDIS_URL, "set TEST_REDIS_URL to a disposable Redis database")(test_item)
+
+
+class RedisTestMixin:
+    """Point get_redis_client() at the TEST_REDIS_URL database for the test."""
+
+    def setUp(self):
+        super().setUp()
+        self.redis = redis.StrictRedis.from_url(TEST_REDIS_URL)
+        self.redis.flushdb()
+        saved = redis_client._client
+        redis_client._client = self.redis
+
+        def restore():
+            redis_client._client = saved
+            self.redis.flushdb()
+
+        self.addCleanup(restore)
+
+
+def make_trunk(*, max_concurrent_calls=None) -> SIPTrunk:
+    n = next(_numbers)
+    return SIPTrunk.objects.create(
+        provider_name=f"Test trunk {n}",
+        sip_username="test",
+        sip_password="test",
+        sip_host="sip.test.local",
+        livekit_trunk_id=f"ST_test_{n}",
+        max_concurrent_calls=max_concurrent_calls,
+    )
+
+
+def make_phone_number(trunk=None) -> PhoneNumber:
+    return PhoneNumber.objects.create(
+        phonenumber=f"+4930100{next(_numbers):05d}",
+        sip_trunk=trunk or make_trunk(),
+    )
+
+
+def make_workspace() -> Workspace:
+    return Workspace.objects.create(workspace_name=f"test-{next(_numbers)}")
+
+
+def make_agent(workspace, *, phone_number=None, max_concurrent_calls=None) -> Agent:
+    """Active agent whose calling window is open around the clock."""
+    return Agent.objects.create(
+        workspace=workspace,
+        name=f"Test agent {next(_numbers)}",
+        phone_number=phone_number or make_phone_number(),
+        max_concurrent_calls=max_concurrent_calls,
+        workdays=list(ALL_DAYS),
+        call_from=dt_time(0, 0),
+        call_to=dt_time(23, 59, 59),
+        dial_window_open=True,
+    )
+
+
+def make_task(agent, *, phone=None, status=CallStatus.SCHEDULED, due_seconds_ago=60) -> CallTask:
+    """CallTask due `due_seconds_ago` seconds ago (no window restriction)."""
+    task = CallTask.objects.create(
+        agent=agent,
+        workspace_id=agent.workspace_id,
+        phone=phone or f"+4915{next(_numbers):09d}",
+        status=status,
+        next_call=timezone.now() - timedelta(seconds=due_seconds_ago),
+    )
+    # The window hook may have computed a window; keep these tasks unrestricted
+    CallTask.objects.filter(id=task.id).update(eligible_from=None, eligible_until=None)
+    return task
+
+
+# Workspace limits are cached in the Django cache; keep that per test process
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
@@ -7,13 +7,15 @@ automatically updating or deleting CallTasks based on call outcomes.
 
 import logging
 from datetime import timedelta
-from zoneinfo import ZoneInfo
-from django.conf import settings
 from asgiref.sync import sync_to_async
 from django.utils import timezone
 from django.utils import timezone as dj_timezone
 from django.db import connection, transaction
 from core.models import CallTask, CallStatus, DisconnectionReason, Lead, User
+from core.telephony.services.active_phones import release_active_phone
+from core.telephony.services.admission import release_admission
+from core.telephony.services.due_index import enqueue_due_call_task
+from core.utils.dial_calendar import dial_calendar_for
 import hashlib
 
 logger = logging.getLogger(__name__)
@@ -86,11 +88,16 @@ def handle_retry_with_increment(call_task, call_log):
     try:
         # Refresh from database to get updated state
         call_task.refresh_from_db()
+        # refresh_from_db drops the cached agent; keep it for the window hook
+        call_task.agent = agent
 
         # CallTask still exists - set up retry
         call_task.status = CallStatus.RETRY
         call_task.next_call = calculate_next_call_time(agent, timezone.now())
-        call_task.save(update_fields=["status", "next_call"])
+        call_task.save(update_fields=["status", "next_call", "eligible_from", "eligible_until"])
+        release_admission(call_task.id)
+        release_active_phone(call_task.phone)
+        enqueue_due_call_task(call_task)
         logger.info(
             f"CallTask {call_task_id} scheduled for retry at {call_task.next_call} (attempt {call_task.attempts})"
         )
@@ -115,7 +122,10 @@ def handle_retry_without_increment(call_task, call_log):
     # Don't increment attempts - this wasn't user's fault
     call_task.status = CallStatus.RETRY
     call_task.next_call = calculate_next_call_time(agent, timezone.now())
-    call_task.save(update_fields=["status", "next_call", "updated_at"])
+    call_task.save(update_fields=["status", "next_call", "eligible_from", "eligible_until", "updated_at"])
+    release_admission(call_task.id)
+    release_active_phone(call_task.phone)
+    enqueue_due_call_task(call_task)
 
     logger.info(
         f"CallTask {call_task.id} retrying without increment at {call_task.next_call} (technical failure: {call_log.disconnection_reason})"
@@ -153,7 +163,10 @@ def reschedule_without_increment(
         reasons_list = reasons_list[-30:]
     call_task.retry_reasons = reasons_list
 
-    call_task.save(update_fields=["status", "next_call", "retry_reasons", "updated_at"])
+    call_task.save(update_fields=["status", "next_call", "eligible_from", "eligible_until", "retry_reasons", "updated_at"])
+    release_admission(call_task.id)
+    release_active_phone(call_task.phone)
+    enqueue_due_call_task(call_task)
     logger.info(
         f"CallTask {call_task.id} rescheduled without increment ({reason}: {hint}); next_call={call_task.next_call}"
     )
@@ -163,91 +176,53 @@ def reschedule_without_increment(
 def preflight_dispatch_config(call_task: CallTask) -> dict:
     """Validate routing config before promoting/dispatching a call.
 
-    Checks resolvable from_number and SIP trunk routing for the agent.
+    Checks resolvable from_number and SIP trunk routing for the agent, using
+    the agent's dispatch snapshot (one Redis read instead of walking
+    agent → phone_number → sip_trunk).
     If missing, reschedules the task without increment and returns ok=False.
 
     Returns: {"ok": bool, "from_number": str|None, "sip_trunk_id": str|None, "reason": str|None}
     """
-    agent = call_task.agent
+    from core.telephony.services.dispatch_snapshot import dispatch_snapshots
 
-    # Guard 1: require agent phone number string
-    phone_obj = getattr(agent, "phone_number", None)
-    if not phone_obj or not getattr(phone_obj, "phonenumber", None):
-        reason = "missing_from_number"
-        try:
-            reschedule_without_increment(call_task, reason="config_missing", hint=reason)
-        except Exception as e:
-            logger.error(f"preflight_dispatch_config reschedule failed for {call_task.id}: {e}")
-        return {
-            "ok": False,
-            "from_number": None,
-            "sip_trunk_id": None,
-            "reason": reason,
-        }
+    snapshot = dispatch_snapshots.get(call_task.agent_id)
+    from_number = snapshot.from_number if snapshot else None
+    trunk_id = snapshot.sip_trunk_id if snapshot else None
 
-    # Optional guard: inactive phone number
-    if hasattr(phone_obj, "is_active") and not phone_obj.is_active:
+    if not from_number:
+        # Guard 1: require agent phone number string
+        reason = "missing_from_number"
+        trunk_id = None
+    elif not snapshot.phone_active:
+        # Optional guard: inactive phone number
         reason = "inactive_from_number"
-        try:
-            reschedule_without_increment(call_task, reason="config_missing", hint=reason)
-        except Exception as e:
-            logger.error(f"preflight_dispatch_config reschedule failed for {call_task.id}: {e}")
-        return {
-            "ok": False,
-            "from_number": phone_obj.phonenumber,
-            "sip_trunk_id": None,
-            "reason": reason,
-        }
-
-    # Guard 2: require SIP trunk and trunk id
-    sip_trunk = getattr(phone_obj, "sip_trunk", None)
-    if not sip_trunk:
+        trunk_id = None
+    elif not snapshot.sip_trunk_pk:
+        # Guard 2: require SIP trunk and trunk id
         reason = "missing_sip_trunk"
-        try:
-            reschedule_without_increment(call_task, reason="config_missing", hint=reason)
-        except Exception as e:
-            logger.error(f"preflight_dispatch_config reschedule failed for {call_task.id}: {e}")
-        return {
-            "ok": False,
-            "from_number": phone_obj.phonenumber,
-            "sip_trunk_id": None,
-            "reason": reason,
-        }
-
-    trunk_id = getattr(sip_trunk, "livekit_trunk_id", None)
-    if not trunk_id:
+    elif not trunk_id:
         reason = "missing_trunk_id"
-        try:
-            reschedule_without_increment(call_task, reason="config_missing", hint=reason)
-        except Exception as e:
-            logger.error(f"preflight_dispatch_config reschedule failed for {call_task.id}: {e}")
-        return {
-            "ok": False,
-            "from_number": phone_obj.phonenumber,
-            "sip_trunk_id": None,
-            "reason": reason,
-        }
-
-    # Optional guard: inactive trunk
-    if hasattr(sip_trunk, "is_active") and not sip_trunk.is_active:
+    elif not snapshot.trunk_active:
+        # Optional guard: inactive trunk
         reason = "inactive_sip_trunk"
-        try:
-            reschedule_without_increment(call_task, reason="config_missing", hint=reason)
-        except Exception as e:
-            logger.error(f"preflight_dispatch_config reschedule failed for {call_task.id}: {e}")
+    else:
+        # Success
         return {
-            "ok": False,
-            "from_number": phone_obj.phonenumber,
+            "ok": True,
+            "from_number": from_number,
             "sip_trunk_id": trunk_id,
-            "reason": reason,
+            "reason": None,
         }
 
-    # Success
+    try:
+        reschedule_without_increment(call_task, reason="config_missing", hint=reason)
+    except Exception as e:
+        logger.error(f"preflight_dispatch_config reschedule failed for {call_task.id}: {e}")
     return {
-        "ok": True,
-        "from_number": phone_obj.phonenumber,
+        "ok": False,
+        "from_number": from_number,
         "sip_trunk_id": trunk_id,
-        "reason": None,
+        "reason": reason,
     }
 
 
@@ -298,50 +273,25 @@ def calculate_next_call_time(agent, base_time):
     return next_time
 
 
-def _get_agent_local_tz(agent):
-    """Return the global project timezone for interpreting agent hours.
-
-    Per requirements, ignore any per-agent or per-calendar time zones and
-    consistently use the single `TIME_ZONE` from Django settings. Fallback
-    to UTC if misconfigured.
+def calculate_next_call_times(agent, base_times):
     """
-    try:
-        return ZoneInfo(getattr(settings, "TIME_ZONE", "UTC"))
-    except Exception:
-        return ZoneInfo("UTC")
-
+    Bulk variant of calculate_next_call_time for many CallTasks of one agent.
 
-def _normalize_local_time(dt_local, tz):
-    """Normalize a settings-TZ aware datetime to handle DST edge cases.
+    Uses the agent's compiled dial calendar once for the whole batch, so the
+    cost is a bisect per datetime instead of a day-by-day walk.
 
-    - If ambiguous, prefer the later occurrence (fold=1)
-    - If nonexistent, roll forward minute by minute until round-trip stable
+    Returns:
+        list[datetime]: Next valid call times, in the order of `base_times`
     """
-    try:
-        # Detect ambiguity by comparing offsets of fold variants
-        try:
-            off0 = tz.utcoffset(dt_local.replace(fold=0))
-            off1 = tz.utcoffset(dt_local.replace(fold=1))
-            if off0 != off1:
-                dt_local = dt_local.replace(fold=1)
-        except Exception:
-            pass
-
-        # Resolve nonexistent by round-trip check
-        while True:
-            utc = dt_local.astimezone(timezone.utc)
-            back = timezone.localtime(utc, tz)
-            if (
-                back.year == dt_local.year
-                and back.month == dt_local.month
-                and back.day == dt_local.day
-                and back.hour == dt_local.hour
-                and back.minute == dt_local.minute
-            ):
-                return dt_local
-            dt_local = dt_local + timedelta(minutes=1)
-    except Exception:
-        return dt_local
+    offset = timedelta(minutes=max(getattr(agent, "retry_interval", 1), 1))
+    candidates = [_as_aware(base_time) + offset for base_time in base_times]
+    return dial_calendar_for(agent).next_open_many(candidates)
+
+
+def _as_aware(datetime_obj):
+    if timezone.is_naive(datetime_obj):
+        return timezone.make_aware(datetime_obj)
+    return datetime_obj
 
 
 def ensure_valid_call_time(agent, datetime_obj):
@@ -353,90 +303,10 @@ def ensure_valid_call_time(agent, datetime_obj):
         datetime_obj: Datetime to validate/adjust
 
     Returns:
-        datetime: Adjusted datetime that respects agent configuration
+        datetime: `datetime_obj` if calling is allowed, otherwise the start of
+        the next calling window (in the project TIME_ZONE)
     """
-    # Convert to local timezone if needed
-    if timezone.is_naive(datetime_obj):
-        datetime_obj = timezone.make_aware(datetime_obj)
-
-    max_iterations = 14  # Prevent infinite loops (2 weeks max)
-    iterations = 0
-
-    # Normalize workdays once to handle different capitalizations from DB
-    configured_workdays = {d.lower() for d in (agent.workdays or [])}
-
-    # Convert to the agent/workspace local timezone for comparisons
-    local_tz = _get_agent_local_tz(agent)
-    datetime_obj = timezone.localtime(datetime_obj, local_tz)
-
-    while iterations < max_iterations:
-        # Check if current day is a workday in local timezone
-        current_weekday = datetime_obj.strftime("%A").lower()
-
-        # Treat empty workdays as all days
-        if not configured_workdays:
-            configured_workdays = {
-                "monday",
-                "tuesday",
-                "wednesday",
-                "thursday",
-                "friday",
-                "saturday",
-                "sunday",
-            }
-
-        if current_weekday in configured_workdays:
-            # Check if time is within working hours (support overnight windows)
-            current_time = datetime_obj.time()
-
-            within_hours = False
-            if agent.call_from <= agent.call_to:
-                within_hours = agent.call_from <= current_time <= agent.call_to
-            else:
-                # Overnight window like 22:00–02:00
-                within_hours = (
-                    current_time >= agent.call_from or current_time <= agent.call_to
-                )
-
-            if within_hours:
-                # Perfect - within workday and working hours (keep in settings TZ)
-                return datetime_obj
-            elif agent.call_from <= agent.call_to and current_time < agent.call_from:
-                # Too early - move to start of working hours today
-                datetime_obj = datetime_obj.replace(
-                    hour=agent.call_from.hour,
-                    minute=agent.call_from.minute,
-                    second=0,
-                    microsecond=0,
-                )
-                datetime_obj = _normalize_local_time(datetime_obj, local_tz)
-                return datetime_obj
-            else:
-                # Too late (or in overnight case but before start window) - move to next day start
-                datetime_obj = datetime_obj.replace(
-                    hour=agent.call_from.hour,
-                    minute=agent.call_from.minute,
-                    second=0,
-                    microsecond=0,
-                ) + timedelta(days=1)
-                datetime_obj = _normalize_local_time(datetime_obj, local_tz)
-        else:
-            # Not a workday - advance to next day
-            datetime_obj = datetime_obj.replace(
-                hour=agent.call_from.hour,
-                minute=agent.call_from.minute,
-                second=0,
-                microsecond=0,
-            ) + timedelta(days=1)
-
-        iterations += 1
-
-    # Fallback - if we can't find a valid time, just use the original + retry_interval
-    logger.warning(
-        f"Could not find valid call time for agent {agent.agent_id}, using fallback"
-    )
-    # Return in configured TIME_ZONE (it was localized earlier)
-    return _normalize_local_time(datetime_obj, local_tz)
+    return dial_calendar_for(agent).next_open(_as_aware(datetime_obj))
 
 
 def is_valid_call_time(agent, datetime_obj):
@@ -450,36 +320,7 @@ def is_valid_call_time(agent, datetime_obj):
     Returns:
         bool: True if datetime is valid for calling
     """
-    # Check workday in local timezone (normalize configured days from DB)
-    configured_workdays = {d.lower() for d in (agent.workdays or [])}
-    local_tz = _get_agent_local_tz(agent)
-    datetime_obj = _normalize_local_time(
-        timezone.localtime(datetime_obj, local_tz), local_tz
-    )
-    current_weekday = datetime_obj.strftime("%A").lower()
-    if not configured_workdays:
-        configured_workdays = {
-            "monday",
-            "tuesday",
-            "wednesday",
-            "thursday",
-            "friday",
-            "saturday",
-            "sunday",
-        }
-    if current_weekday not in configured_workdays:
-        return False
-
-    # Check working hours (support overnight)
-    current_time = datetime_obj.time()
-    if agent.call_from <= agent.call_to:
-        if not (agent.call_from <= current_time <= agent.call_to):
-            return False
-    else:
-        if not (current_time >= agent.call_from or current_time <= agent.call_to):
-            return False
-
-    return True
+    return dial_calendar_for(agent).is_open(_as_aware(datetime_obj))
 
 
 # ==================
@@ -681,5 +522,6 @@ def create_call_task_safely(
             next_call=next_call,
             target_ref=target_ref,
         )
+        enqueue_due_call_task(call_task)
 
     return call_task
@@ -0,0 +1,295 @@
+"""
+Compiled per-agent dial calendars.
+
+An agent's calling hours (workdays + call_from/call_to, interpreted in the
+project TIME_ZONE) are compiled once into closed weekly intervals in
+seconds-of-week. Each local week is then materialized into absolute UTC
+windows, resolving DST gaps/folds with the zone's precomputed transitions,
+so that
+
+    is_open(dt)     → one bisect over that week's windows
+    next_open(dt)   → one bisect (plus the following week on wrap)
+    next_open_many  → same, for thousands of datetimes with shared windows
+    window(dt)      → (start, end) of the window a task becomes eligible in
+
+without per-call strftime/replace loops or minute-by-minute DST probing.
+
+Calendars are cached per agent and keyed by a signature of the fields they
+were compiled from, so a stale calendar is never used even if the Agent
+post_save invalidation ran in another process.
+"""
+from __future__ import annotations
+
+import bisect
+import datetime as dt
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+
+ALL_DAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+DAY_SECONDS = 86400
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+
+# ─────────────────────────────
+# DST transitions
+# ─────────────────────────────
+_transitions_cache: Dict[Tuple[str, int], List[Tuple[float, float, float]]] = {}
+_transitions_lock = threading.Lock()
+
+
+def _offset_at(tz: ZoneInfo, ts: float) -> float:
+    return dt.datetime.fromtimestamp(ts, tz).utcoffset().total_seconds()
+
+
+def tz_transitions(tz: ZoneInfo, year: int) -> List[Tuple[float, float, float]]:
+    """
+    UTC offset changes of `tz` during `year` as (utc_ts, offset_before,
+    offset_after), found once per zone/year by a daily scan plus bisection.
+    """
+    key = (str(tz.key), year)
+    cached = _transitions_cache.get(key)
+    if cached is not None:
+        return cached
+
+    start = dt.datetime(year, 1, 1, tzinfo=dt.timezone.utc).timestamp() - DAY_SECONDS
+    end = dt.datetime(year + 1, 1, 1, tzinfo=dt.timezone.utc).timestamp() + DAY_SECONDS
+    found: List[Tuple[float, float, float]] = []
+    lo_ts, lo_off = start, _offset_at(tz, start)
+    ts = start
+    while ts < end:
+        ts += DAY_SECONDS
+        off = _offset_at(tz, ts)
+        if off != lo_off:
+            # Bisect to the second in (lo_ts, ts]
+            a, b = lo_ts, ts
+            while b - a > 1:
+                mid = (a + b) // 2
+                if _offset_at(tz, mid) == lo_off:
+                    a = mid
+                else:
+                    b = mid
+            found.append((float(b), lo_off, off))
+        lo_ts, lo_off = ts, off
+
+    with _transitions_lock:
+        _transitions_cache[key] = found
+    return found
+
+
+def wall_to_utc(wall: dt.datetime, tz: ZoneInfo, fold: int = 1) -> float:
+    """
+    UTC timestamp for a naive local wall time. Ambiguous times (clocks back)
+    take the occurrence selected by `fold`; nonexistent times (spring-forward
+    gap) move to the end of the gap, as the legacy minute-by-minute roll did.
+    """
+    off0 = tz.utcoffset(wall.replace(fold=0)).total_seconds()
+    off1 = tz.utcoffset(wall.replace(fold=1)).total_seconds()
+    if off0 == off1:
+        return wall.replace(tzinfo=tz).timestamp()
+    if off0 > off1:
+        return wall.replace(tzinfo=tz, fold=fold).timestamp()
+
+    # Gap (clocks forward): the first valid instant is the transition itself
+    naive_ts = wall.replace(tzinfo=dt.timezone.utc).timestamp()
+    for utc_ts, before, after in tz_transitions(tz, wall.year):
+        if after > before and utc_ts + before <= naive_ts < utc_ts + after:
+            return utc_ts
+    # Not found (transition at a year boundary): fall back to fold=1 mapping
+    return wall.replace(tzinfo=tz, fold=1).timestamp()
+
+
+# ─────────────────────────────
+# Calendar
+# ─────────────────────────────
+class DialCalendar:
+    """
+    Weekly calling hours compiled to closed intervals in seconds-of-week
+    (Monday 00:00 local = 0). Overnight windows (call_from > call_to) open
+    on each workday from call_from to midnight and from midnight to call_to,
+    as the legacy day-by-day check did.
+    """
+
+    # Materialized weeks kept per calendar
+    MAX_WEEKS = 16
+
+    def __init__(self, workdays: Sequence[str], call_from: dt.time, call_to: dt.time, tz: ZoneInfo):
+        days = {str(d).lower() for d in (workdays or [])} or set(ALL_DAYS)
+        self.tz = tz
+        self.signature = (tuple(sorted(days)), call_from, call_to, str(tz.key))
+
+        start = _time_seconds(call_from)
+        end = _time_seconds(call_to)
+        intervals: List[Tuple[float, float]] = []
+        for index, day in enumerate(ALL_DAYS):
+            if day not in days:
+                continue
+            base = index * DAY_SECONDS
+            if start <= end:
+                intervals.append((base + start, base + end))
+            else:
+                intervals.append((base, base + end))
+                intervals.append((base + start, base + DAY_SECONDS))
+        self.weekly = _merge(intervals)
+        self._weeks: "OrderedDict[dt.date, Tuple[List[float], List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ── week materialization ────────────────────────────────────────────
+    def _week_windows(self, monday: dt.date) -> Tuple[List[float], List[float]]:
+        """UTC (starts, ends) of the open windows in the local week starting `monday`."""
+        with self._lock:
+            cached = self._weeks.get(monday)
+            if cached is not None:
+                self._weeks.move_to_end(monday)
+                return cached
+
+        week_start = dt.datetime.combine(monday, dt.time())
+        starts: List[float] = []
+        ends: List[float] = []
+        for open_s, close_s in self.weekly:
+            # Widest window on a repeated hour: open at the first occurrence, close at the last
+            starts.append(wall_to_utc(week_start + dt.timedelta(seconds=open_s), self.tz, fold=0))
+            ends.append(wall_to_utc(week_start + dt.timedelta(seconds=close_s), self.tz, fold=1))
+
+        with self._lock:
+            self._weeks[monday] = (starts, ends)
+            while len(self._weeks) > self.MAX_WEEKS:
+                self._weeks.popitem(last=False)
+        return starts, ends
+
+    def _local_monday(self, ts: float) -> dt.date:
+        local = dt.datetime.fromtimestamp(ts, self.tz)
+        return local.date() - dt.timedelta(days=local.weekday())
+
+    def _window_at(self, ts: float, monday: dt.date) -> Optional[Tuple[float, float]]:
+        """UTC (start, end) of the window containing ts, or else the next one."""
+        for _ in range(3):
+            starts, ends = self._week_windows(monday)
+            i = bisect.bisect_left(ends, ts)
+            if i < len(ends):
+                end = ends[i]
+                # A window running to Sunday midnight continues into next Monday
+                if i == len(ends) - 1 and self.weekly[-1][1] == WEEK_SECONDS and self.weekly[0][0] == 0:
+                    next_starts, next_ends = self._week_windows(monday + dt.timedelta(days=7))
+                    if next_starts and next_starts[0] <= end:
+                        end = next_ends[0]
+                return starts[i], end
+            monday = monday + dt.timedelta(days=7)
+        # Unreachable with at least one weekly interval
+        return None
+
+    def _next_open_ts(self, ts: float, monday: dt.date) -> Tuple[float, bool]:
+        """(timestamp, already_open) of the first open instant at or after ts."""
+        window = self._window_at(ts, monday)
+        if window is None:
+            return ts, False
+        if window[0] <= ts:
+            return ts, True
+        return window[0], False
+
+    # ── public API ──────────────────────────────────────────────────────
+    def is_open(self, when: dt.datetime) -> bool:
+        ts = when.timestamp()
+        starts, ends = self._week_windows(self._local_monday(ts))
+        i = bisect.bisect_left(ends, ts)
+        return i < len(ends) and starts[i] <= ts
+
+    def next_open(self, when: dt.datetime) -> dt.datetime:
+        """`when` itself if calling is allowed, else the next window start (local TZ)."""
+        ts = when.timestamp()
+        result, already_open = self._next_open_ts(ts, self._local_monday(ts))
+        if already_open:
+            return when.astimezone(self.tz)
+        return dt.datetime.fromtimestamp(result, self.tz)
+
+    def window(self, when: dt.datetime) -> Tuple[dt.datetime, dt.datetime]:
+        """(start, end) of the window open at `when`, or of the next one (local TZ)."""
+        ts = when.timestamp()
+        window = self._window_at(ts, self._local_monday(ts))
+        if window is None:
+            return when.astimezone(self.tz), when.astimezone(self.tz)
+        return dt.datetime.fromtimestamp(window[0], self.tz), dt.datetime.fromtimestamp(window[1], self.tz)
+
+    def next_change(self, when: dt.datetime) -> Tuple[bool, dt.datetime]:
+        """(open_now, instant the open/closed state next flips)."""
+        start, end = self.window(when)
+        if start <= when:
+            return True, end
+        return False, start
+
+    def next_open_many(self, whens: Sequence[dt.datetime]) -> List[dt.datetime]:
+        """
+        Vectorized next_open for bulk scheduling: timestamps are processed
+        in sorted order so each local week is materialized once and shared.
+        """
+        stamps = [w.timestamp() for w in whens]
+        out: List[Optional[dt.datetime]] = [None] * len(stamps)
+        monday: Optional[dt.date] = None
+        week_end = float("-inf")
+        for index in sorted(range(len(stamps)), key=stamps.__getitem__):
+            ts = stamps[index]
+            if ts >= week_end:
+                monday = self._local_monday(ts)
+                week_end = wall_to_utc(dt.datetime.combine(monday + dt.timedelta(days=7), dt.time()), self.tz)
+            result, already_open = self._next_open_ts(ts, monday)
+            out[index] = whens[index].astimezone(self.tz) if already_open else dt.datetime.fromtimestamp(result, self.tz)
+        return out
+
+
+def _time_seconds(value: dt.time) -> float:
+    return value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1_000_000
+
+
+def _merge(intervals: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    merged: List[Tuple[float, float]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+# ─────────────────────────────
+# Per-agent cache
+# ─────────────────────────────
+_calendars: "OrderedDict[str, DialCalendar]" = OrderedDict()
+_calendars_lock = threading.Lock()
+_MAX_CALENDARS = 4096
+
+
+def project_timezone() -> ZoneInfo:
+    """Agent hours are interpreted in the single project TIME_ZONE (UTC fallback)."""
+    try:
+        return ZoneInfo(getattr(settings, "TIME_ZONE", "UTC"))
+    except Exception:
+        return ZoneInfo("UTC")
+
+
+def dial_calendar_for(agent) -> DialCalendar:
+    """Compiled calendar for an Agent, rebuilt whenever its hours change."""
+    tz = project_timezone()
+    days = {str(d).lower() for d in (agent.workdays or [])} or set(ALL_DAYS)
+    signature = (tuple(sorted(days)), agent.call_from, agent.call_to, str(tz.key))
+    key = str(agent.agent_id)
+
+    with _calendars_lock:
+        calendar = _calendars.get(key)
+        if calendar is not None and calendar.signature == signature:
+            _calendars.move_to_end(key)
+            return calendar
+
+    calendar = DialCalendar(agent.workdays, agent.call_from, agent.call_to, tz)
+    with _calendars_lock:
+        _calendars[key] = calendar
+        while len(_calendars) > _MAX_CALENDARS:
+            _calendars.popitem(last=False)
+    return calendar
+
+
+def invalidate_dial_calendar(agent_id) -> None:
+    with _calendars_lock:
+        _calendars.pop(str(agent_id), None)
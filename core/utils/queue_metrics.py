@@ -0,0 +1,74 @@
+"""
+Per-queue Celery depth and wait-time metrics.
+
+Every published task carries a `published_at` header (hotcalls/celery.py);
+when a worker starts the task the time it spent in the broker is recorded
+in Redis:
+
+  celery:queue_wait:{queue}          list of the most recent waits (seconds)
+  celery:queue_wait:{queue}:totals   hash: count, sum
+
+Depth is the length of the broker list for the queue (Redis transport).
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict, Iterable, List
+
+from core.utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+WAIT_KEY = "celery:queue_wait:{queue}"
+TOTALS_KEY = "celery:queue_wait:{queue}:totals"
+# Recent waits kept per queue for percentiles
+RECENT_SAMPLES = 500
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def record_queue_wait(queue: str, seconds: float) -> None:
+    """Record how long one task waited in `queue` (never raises)."""
+    try:
+        seconds = max(float(seconds), 0.0)
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.lpush(WAIT_KEY.format(queue=queue), round(seconds, 4))
+        pipe.ltrim(WAIT_KEY.format(queue=queue), 0, RECENT_SAMPLES - 1)
+        pipe.hincrby(TOTALS_KEY.format(queue=queue), "count", 1)
+        pipe.hincrbyfloat(TOTALS_KEY.format(queue=queue), "sum", seconds)
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"Queue wait not recorded for {queue}: {e}")
+
+
+def queue_snapshot(queues: Iterable[str]) -> Dict[str, Dict[str, object]]:
+    """Depth and wait-time percentiles (recent tasks) for each queue."""
+    queues = list(queues)
+    redis_client = get_redis_client()
+    pipe = redis_client.pipeline(transaction=False)
+    for queue in queues:
+        pipe.llen(queue)
+        pipe.lrange(WAIT_KEY.format(queue=queue), 0, -1)
+        pipe.hgetall(TOTALS_KEY.format(queue=queue))
+    results = pipe.execute()
+
+    out: Dict[str, Dict[str, object]] = {}
+    for i, queue in enumerate(queues):
+        depth, recent, totals = results[3 * i: 3 * i + 3]
+        waits = sorted(float(v) for v in recent)
+        totals = {(k.decode() if isinstance(k, bytes) else k): v for k, v in (totals or {}).items()}
+        count = int(totals.get("count", 0))
+        out[queue] = {
+            "depth": int(depth or 0),
+            "wait_p50_seconds": round(_percentile(waits, 50), 4),
+            "wait_p95_seconds": round(_percentile(waits, 95), 4),
+            "wait_max_seconds": round(waits[-1], 4) if waits else 0.0,
+            "wait_mean_seconds": round(float(totals.get("sum", 0)) / count, 4) if count else 0.0,
+            "tasks_started": count,
+        }
+    return out
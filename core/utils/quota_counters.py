@@ -0,0 +1,478 @@
+"""
+Redis write-behind counters for plan quota enforcement.
+
+Metered operations check the limit and add their usage in one Lua call
+instead of locking the FeatureUsage row in Postgres:
+
+  quota:usage:{feature_usage_id}   hash: used, pending, in_flush (thousandths of a unit)
+  quota:usage_dirty                set of FeatureUsage ids with pending usage
+
+`used` is seeded from FeatureUsage.used_amount on first use and is what the
+limit is checked against; `pending` is the part not yet written to Postgres.
+`flush()` (core.tasks.flush_quota_counters, every few seconds) moves pending
+amounts to `in_flush`, folds them into FeatureUsage with one UPDATE per
+batch and clears `in_flush` once that committed. `reconcile()` runs once
+after a deploy (under a Redis lock): it flushes, then drops idle counters
+(nothing pending, in flush or reserved) so they are reseeded from Postgres,
+picking up manual corrections and missed writes.
+
+A new billing period gets new FeatureUsage rows, so counters roll over with
+the period; idle keys expire after QUOTA_COUNTER_TTL_SECONDS.
+
+In-flight calls hold a reservation of their estimated minutes in the same
+hash (`reserved` total plus one `r:{call_task_id}` field each, value
+"amount|expires_at"); limits are checked against used + reserved. A
+pointer key `quota:reservation:{call_task_id}` names the counter so the
+reservation can be committed (end_of_call) or released (reschedule,
+deletion, reaping) by task id; sweep_reservations() frees expired ones.
+
+Call minutes reported at end_of_call are not checked per call; they are
+added to one hash (CallMinutesAccumulator, `quota:call_minutes:pending`,
+workspace id → thousandths of a minute) and folded into the counters by
+core.tasks.fold_call_minutes.
+"""
+from __future__ import annotations
+
+import logging
+import time
+import uuid
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+# KEYS[1] = counter hash, KEYS[2] = dirty set
+# ARGV[1] = amount, ARGV[2] = limit (-1 = unlimited), ARGV[3] = seed for `used`
+# ('' = not loaded), ARGV[4] = TTL seconds, ARGV[5] = FeatureUsage id
+# Returns {1, used after} when recorded, {0, used} when the limit would be
+# exceeded, {-1, 0} when the counter needs a seed
+_CHECK_AND_RECORD_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if ARGV[3] == '' then
+        return {-1, 0}
+    end
+    redis.call('HSET', KEYS[1], 'used', ARGV[3], 'pending', 0)
+end
+local used = tonumber(redis.call('HGET', KEYS[1], 'used'))
+local reserved = tonumber(redis.call('HGET', KEYS[1], 'reserved') or '0')
+local amount = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+if limit >= 0 and used + reserved + amount > limit then
+    return {0, used}
+end
+if amount > 0 then
+    redis.call('HINCRBY', KEYS[1], 'used', amount)
+    redis.call('HINCRBY', KEYS[1], 'pending', amount)
+    redis.call('SADD', KEYS[2], ARGV[5])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {1, used + amount}
+"""
+
+# KEYS[1] = counter hash, KEYS[2] = reservation pointer, KEYS[3] = set of counters holding reservations
+# ARGV[1] = amount, ARGV[2] = limit (-1 = unlimited), ARGV[3] = seed ('' = not loaded),
+# ARGV[4] = counter TTL, ARGV[5] = FeatureUsage id, ARGV[6] = call task id,
+# ARGV[7] = now (epoch seconds), ARGV[8] = reservation TTL seconds
+# Returns {1, used + reserved after} reserved, {2, 0} already reserved,
+# {0, used + reserved} over the limit, {-1, 0} counter needs a seed
+_RESERVE_LUA = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return {2, 0}
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if ARGV[3] == '' then
+        return {-1, 0}
+    end
+    redis.call('HSET', KEYS[1], 'used', ARGV[3], 'pending', 0)
+end
+local used = tonumber(redis.call('HGET', KEYS[1], 'used'))
+local reserved = tonumber(redis.call('HGET', KEYS[1], 'reserved') or '0')
+local amount = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+if limit >= 0 and used + reserved + amount > limit then
+    return {0, used + reserved}
+end
+redis.call('HINCRBY', KEYS[1], 'reserved', amount)
+redis.call('HSET', KEYS[1], 'r:' .. ARGV[6], amount .. '|' .. (tonumber(ARGV[7]) + tonumber(ARGV[8])))
+redis.call('SET', KEYS[2], ARGV[5], 'EX', ARGV[8])
+redis.call('SADD', KEYS[3], ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {1, used + reserved + amount}
+"""
+
+# Drop a reservation and optionally record the actual amount on its counter
+# KEYS[1] = reservation pointer, KEYS[2] = counter hash it pointed to when read, KEYS[3] = dirty set
+# ARGV[1] = call task id, ARGV[2] = actual amount (0 = release only), ARGV[3] = FeatureUsage id of KEYS[2]
+# Returns 1 actual amount recorded, 0 released only, -1 no reservation (or it moved meanwhile)
+_SETTLE_LUA = """
+local feature_usage_id = redis.call('GET', KEYS[1])
+if feature_usage_id ~= ARGV[3] then
+    return -1
+end
+redis.call('DEL', KEYS[1])
+local counter = KEYS[2]
+local held = redis.call('HGET', counter, 'r:' .. ARGV[1])
+if held then
+    redis.call('HDEL', counter, 'r:' .. ARGV[1])
+    local amount = tonumber(string.match(held, '^[^|]+'))
+    if redis.call('HINCRBY', counter, 'reserved', -amount) < 0 then
+        redis.call('HSET', counter, 'reserved', 0)
+    end
+end
+local actual = tonumber(ARGV[2])
+if actual > 0 and redis.call('HEXISTS', counter, 'used') == 1 then
+    redis.call('HINCRBY', counter, 'used', actual)
+    redis.call('HINCRBY', counter, 'pending', actual)
+    redis.call('SADD', KEYS[3], feature_usage_id)
+    return 1
+end
+return 0
+"""
+
+# Free reservations past their expiry; returns {freed amount, reservations left}
+_SWEEP_LUA = """
+local fields = redis.call('HGETALL', KEYS[1])
+local now = tonumber(ARGV[1])
+local freed, left = 0, 0
+for i = 1, #fields, 2 do
+    if string.sub(fields[i], 1, 2) == 'r:' then
+        local amount, expires = string.match(fields[i + 1], '^([^|]+)|(.+)$')
+        if tonumber(expires) <= now then
+            redis.call('HDEL', KEYS[1], fields[i])
+            freed = freed + tonumber(amount)
+        else
+            left = left + 1
+        end
+    end
+end
+if freed > 0 and redis.call('HINCRBY', KEYS[1], 'reserved', -freed) < 0 then
+    redis.call('HSET', KEYS[1], 'reserved', 0)
+end
+return {freed, left}
+"""
+
+# Move the pending amount to in_flush (the caller writes it to Postgres)
+_TAKE_PENDING_LUA = """
+local pending = tonumber(redis.call('HGET', KEYS[1], 'pending') or '0')
+if pending ~= 0 then
+    redis.call('HINCRBY', KEYS[1], 'pending', -pending)
+    redis.call('HINCRBY', KEYS[1], 'in_flush', pending)
+end
+return pending
+"""
+
+# Settle an amount taken by _TAKE_PENDING_LUA: written (ARGV[2] = '0') or
+# put back to pending after a failed write (ARGV[2] = '1'); ARGV[1] = amount
+_END_FLUSH_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local amount = tonumber(ARGV[1])
+redis.call('HINCRBY', KEYS[1], 'in_flush', -amount)
+if ARGV[2] == '1' then
+    redis.call('HINCRBY', KEYS[1], 'pending', amount)
+end
+return 1
+"""
+
+# Drop a counter with nothing pending, in flush or reserved so it reseeds from Postgres
+_DROP_IDLE_LUA = """
+if tonumber(redis.call('HGET', KEYS[1], 'pending') or '0') == 0
+    and tonumber(redis.call('HGET', KEYS[1], 'in_flush') or '0') == 0
+    and tonumber(redis.call('HGET', KEYS[1], 'reserved') or '0') == 0 then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Return every accumulated amount and clear the hash in one step
+_TAKE_ALL_LUA = """
+local entries = redis.call('HGETALL', KEYS[1])
+if #entries > 0 then
+    redis.call('DEL', KEYS[1])
+end
+return entries
+"""
+
+_FLUSH_SQL = """
+UPDATE core_featureusage f
+SET used_amount = f.used_amount + d.delta / 1000.0,
+    updated_at = %(now)s
+FROM unnest(%(ids)s::uuid[], %(deltas)s::bigint[]) AS d(id, delta)
+WHERE f.id = d.id
+"""
+
+MILLI = Decimal("1000")
+
+
+def to_milli(amount) -> int:
+    return int((Decimal(str(amount)) * MILLI).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def from_milli(value) -> Decimal:
+    return Decimal(int(value)) / MILLI
+
+
+class QuotaCounters:
+    """Atomic check-and-increment of FeatureUsage amounts in Redis, flushed in batches."""
+
+    COUNTER_KEY = "quota:usage:{id}"
+    COUNTER_PATTERN = "quota:usage:*"
+    DIRTY_KEY = "quota:usage_dirty"
+    RESERVATION_KEY = "quota:reservation:{id}"
+    RESERVING_KEY = "quota:usage_reserving"
+    # reconcile(): one run at a time, one request per deploy wave of workers
+    RECONCILE_LOCK_KEY = "quota:reconcile_lock"
+    RECONCILE_REQUEST_KEY = "quota:reconcile_requested"
+    RECONCILE_LOCK_SECONDS = 300
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_redis_client()
+        self._check_and_record = self.redis.register_script(_CHECK_AND_RECORD_LUA)
+        self._take_pending = self.redis.register_script(_TAKE_PENDING_LUA)
+        self._end_flush = self.redis.register_script(_END_FLUSH_LUA)
+        self._drop_idle = self.redis.register_script(_DROP_IDLE_LUA)
+        self._reserve = self.redis.register_script(_RESERVE_LUA)
+        self._settle = self.redis.register_script(_SETTLE_LUA)
+        self._sweep = self.redis.register_script(_SWEEP_LUA)
+        self.ttl = int(getattr(settings, "QUOTA_COUNTER_TTL_SECONDS", 7 * 24 * 3600))
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(getattr(settings, "QUOTA_REDIS_COUNTERS", False))
+
+    # ── hot path ─────────────────────────────────────────────────────────
+    def check_and_record(
+        self, feature_usage_id, amount, limit: Optional[Decimal], load_used: Callable[[], Decimal]
+    ) -> Tuple[bool, Decimal]:
+        """
+        Add `amount` to the counter unless that would exceed `limit` (None =
+        unlimited). `load_used` returns FeatureUsage.used_amount and is only
+        called when the counter does not exist yet. Returns (recorded, used)
+        where `used` is the total after recording, or the current total when
+        refused.
+        """
+        keys = [self.COUNTER_KEY.format(id=feature_usage_id), self.DIRTY_KEY]
+        args = [
+            to_milli(amount),
+            -1 if limit is None else to_milli(limit),
+            "",
+            self.ttl,
+            str(feature_usage_id),
+        ]
+        recorded, used = self._check_and_record(keys=keys, args=args)
+        if int(recorded) == -1:
+            args[2] = to_milli(load_used() or 0)
+            recorded, used = self._check_and_record(keys=keys, args=args)
+        return int(recorded) == 1, from_milli(used)
+
+    # ── reservations ─────────────────────────────────────────────────────
+    def reserve(
+        self, feature_usage_id, call_task_id, amount, limit: Optional[Decimal],
+        load_used: Callable[[], Decimal], ttl_seconds: int,
+    ) -> Tuple[bool, Decimal]:
+        """
+        Hold `amount` for one call unless used + reserved + amount would exceed
+        `limit`. Idempotent per call task. Returns (reserved, used + reserved).
+        """
+        keys = [
+            self.COUNTER_KEY.format(id=feature_usage_id),
+            self.RESERVATION_KEY.format(id=call_task_id),
+            self.RESERVING_KEY,
+        ]
+        args = [
+            to_milli(amount),
+            -1 if limit is None else to_milli(limit),
+            "",
+            self.ttl,
+            str(feature_usage_id),
+            str(call_task_id),
+            int(time.time()),
+            max(int(ttl_seconds), 1),
+        ]
+        status, total = self._reserve(keys=keys, args=args)
+        if int(status) == -1:
+            args[2] = to_milli(load_used() or 0)
+            status, total = self._reserve(keys=keys, args=args)
+        return int(status) in (1, 2), from_milli(total)
+
+    def commit_reservation(self, call_task_id, actual) -> int:
+        """
+        Replace the call's reservation by its actual usage. Returns 1 when
+        recorded, 0 when only released (counter gone), -1 when the call held
+        no reservation; in the last two cases the caller records `actual`.
+        """
+        pointer = self.RESERVATION_KEY.format(id=call_task_id)
+        feature_usage_id = self.redis.get(pointer)
+        if feature_usage_id is None:
+            return -1
+        return int(self._settle_args(str(call_task_id), feature_usage_id, to_milli(actual)))
+
+    def release_reservations(self, call_task_ids: Iterable) -> int:
+        """Drop the reservations of calls that will not (or no longer) run."""
+        ids = [str(i) for i in call_task_ids if i]
+        if not ids:
+            return 0
+        # Read the pointers first so every key the script touches is declared in KEYS
+        pointers = self.redis.mget([self.RESERVATION_KEY.format(id=call_task_id) for call_task_id in ids])
+        held = [(call_task_id, fid) for call_task_id, fid in zip(ids, pointers) if fid is not None]
+        if not held:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        for call_task_id, feature_usage_id in held:
+            self._settle_args(call_task_id, feature_usage_id, 0, client=pipe)
+        return sum(1 for status in pipe.execute() if int(status) >= 0)
+
+    def _settle_args(self, call_task_id: str, feature_usage_id, actual: int, client=None):
+        feature_usage_id = feature_usage_id.decode() if isinstance(feature_usage_id, bytes) else str(feature_usage_id)
+        return self._settle(
+            keys=[
+                self.RESERVATION_KEY.format(id=call_task_id),
+                self.COUNTER_KEY.format(id=feature_usage_id),
+                self.DIRTY_KEY,
+            ],
+            args=[call_task_id, actual, feature_usage_id],
+            client=client,
+        )
+
+    def sweep_reservations(self) -> Dict[str, int]:
+        """Free reservations past their TTL (calls that never settled)."""
+        counts = {"counters": 0, "freed": 0}
+        now = int(time.time())
+        for raw in self.redis.smembers(self.RESERVING_KEY):
+            feature_usage_id = raw.decode() if isinstance(raw, bytes) else raw
+            freed, left = self._sweep(keys=[self.COUNTER_KEY.format(id=feature_usage_id)], args=[now])
+            counts["counters"] += 1
+            counts["freed"] += int(freed)
+            if not int(left):
+                self.redis.srem(self.RESERVING_KEY, feature_usage_id)
+        return counts
+
+    def used(self, feature_usage_id) -> Optional[Decimal]:
+        """Total usage including unflushed amounts, or None when the counter is not seeded."""
+        value = self.redis.hget(self.COUNTER_KEY.format(id=feature_usage_id), "used")
+        return None if value is None else from_milli(value)
+
+    def pending(self, feature_usage_id) -> Decimal:
+        """Usage recorded in Redis but not yet flushed to Postgres."""
+        value = self.redis.hget(self.COUNTER_KEY.format(id=feature_usage_id), "pending")
+        return from_milli(value or 0)
+
+    # ── write-behind ─────────────────────────────────────────────────────
+    def flush(self, batch_size: Optional[int] = None) -> Dict[str, int]:
+        """Fold pending usage into FeatureUsage, one UPDATE per batch of counters."""
+        batch_size = int(batch_size or getattr(settings, "QUOTA_COUNTER_FLUSH_BATCH", 500))
+        counts = {"flushed": 0, "batches": 0}
+        while True:
+            popped = self.redis.spop(self.DIRTY_KEY, batch_size) or []
+            ids = [i.decode() if isinstance(i, bytes) else i for i in popped]
+            if not ids:
+                break
+
+            pipe = self.redis.pipeline(transaction=False)
+            for feature_usage_id in ids:
+                self._take_pending(keys=[self.COUNTER_KEY.format(id=feature_usage_id)], client=pipe)
+            deltas = {fid: int(p) for fid, p in zip(ids, pipe.execute()) if int(p)}
+
+            if deltas:
+                try:
+                    with transaction.atomic():
+                        with connection.cursor() as cursor:
+                            cursor.execute(
+                                _FLUSH_SQL,
+                                {"now": timezone.now(), "ids": list(deltas), "deltas": list(deltas.values())},
+                            )
+                except Exception:
+                    self._end(deltas, restore=True)
+                    raise
+                self._end(deltas)
+                counts["flushed"] += len(deltas)
+            counts["batches"] += 1
+
+            if len(ids) < batch_size:
+                break
+        return counts
+
+    def _end(self, deltas: Dict[str, int], restore: bool = False) -> None:
+        """Clear in_flush for written deltas, or move them back to pending."""
+        pipe = self.redis.pipeline(transaction=False)
+        for feature_usage_id, delta in deltas.items():
+            self._end_flush(
+                keys=[self.COUNTER_KEY.format(id=feature_usage_id)],
+                args=[delta, "1" if restore else "0"],
+                client=pipe,
+            )
+            if restore:
+                pipe.sadd(self.DIRTY_KEY, feature_usage_id)
+        pipe.execute()
+
+    def request_reconcile(self) -> bool:
+        """True for the first caller within RECONCILE_LOCK_SECONDS (worker start dedup)."""
+        return bool(self.redis.set(self.RECONCILE_REQUEST_KEY, 1, nx=True, ex=self.RECONCILE_LOCK_SECONDS))
+
+    def reconcile(self) -> Optional[Dict[str, int]]:
+        """
+        Flush everything, then drop idle counters so they reseed from Postgres.
+        Counters with an amount in flight in a concurrent flush() are kept.
+        Returns None when another reconcile holds the lock.
+        """
+        token = uuid.uuid4().hex
+        if not self.redis.set(self.RECONCILE_LOCK_KEY, token, nx=True, ex=self.RECONCILE_LOCK_SECONDS):
+            return None
+        try:
+            counts = self.flush()
+            dropped = 0
+            for key in self.redis.scan_iter(match=self.COUNTER_PATTERN, count=500):
+                dropped += int(self._drop_idle(keys=[key]))
+            counts["dropped"] = dropped
+            return counts
+        finally:
+            value = self.redis.get(self.RECONCILE_LOCK_KEY)
+            if (value.decode() if isinstance(value, bytes) else value) == token:
+                self.redis.delete(self.RECONCILE_LOCK_KEY)
+
+
+class CallMinutesAccumulator:
+    """Per-workspace call minutes waiting to be folded into usage (one HINCRBY per call)."""
+
+    KEY = "quota:call_minutes:pending"
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_redis_client()
+        self._take_all = self.redis.register_script(_TAKE_ALL_LUA)
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(getattr(settings, "CALL_MINUTES_ACCUMULATOR", False))
+
+    def add(self, workspace_id, minutes) -> None:
+        amount = to_milli(minutes)
+        if amount > 0:
+            self.redis.hincrby(self.KEY, str(workspace_id), amount)
+
+    def touch(self, workspace_id) -> None:
+        """Include the workspace in the next fold (threshold check) without adding minutes."""
+        self.redis.hincrby(self.KEY, str(workspace_id), 0)
+
+    def take(self) -> Dict[str, Decimal]:
+        """Everything accumulated so far (workspace id → minutes); the hash is emptied."""
+        entries = self._take_all(keys=[self.KEY]) or []
+        out: Dict[str, Decimal] = {}
+        for field, value in zip(entries[::2], entries[1::2]):
+            workspace_id = field.decode() if isinstance(field, bytes) else field
+            out[workspace_id] = from_milli(value)
+        return out
+
+    def restore(self, amounts: Dict[str, Decimal]) -> None:
+        """Put amounts back after a failed fold."""
+        pipe = self.redis.pipeline(transaction=False)
+        for workspace_id, minutes in amounts.items():
+            pipe.hincrby(self.KEY, str(workspace_id), to_milli(minutes))
+        pipe.execute()
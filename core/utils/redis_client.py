@@ -0,0 +1,22 @@
+"""
+Shared Redis client for scheduler/dialer coordination state.
+
+Uses the same Redis instance as the Celery broker (like the scheduler locks in
+core.tasks) so that every worker, beat and scheduler process sees the same
+keys. The client is created lazily and reused per process.
+"""
+from typing import Optional
+
+import redis
+from django.conf import settings
+
+_client: Optional[redis.StrictRedis] = None
+
+
+def get_redis_client() -> redis.StrictRedis:
+    """Return the process-wide Redis client (created on first use)."""
+    global _client
+    if _client is None:
+        url = getattr(settings, "CELERY_BROKER_URL", "redis://localhost:6379/0")
+        _client = redis.StrictRedis.from_url(url)
+    return _client
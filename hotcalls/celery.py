@@ -1,6 +1,10 @@
+import time
+
 from celery import Celery
+from celery.signals import before_task_publish, task_prerun, worker_ready
 from django.conf import settings
 from celery.schedules import crontab
+from kombu import Queue
 
 # Create the Celery app
 app = Celery("hotcalls")
@@ -29,6 +33,139 @@ app.conf.worker_max_tasks_per_child = 100
 app.conf.worker_lost_wait = 30
 app.conf.broker_connection_timeout = 30
 
+# ─────────────────────────────
+# Queues per workload class
+# ─────────────────────────────
+# Each class runs in its own worker deployment (WORKER_PROFILES, started with
+# `manage.py run_celery_worker --profile <name>`), so a slow summary or Meta
+# sync never sits in front of call dispatch. A plain `celery worker` without
+# -Q still consumes every queue below.
+DISPATCH_QUEUE = "dispatch"  # scheduler tick + trigger_call(_batch) (latency-critical)
+FEEDBACK_QUEUE = "feedback"  # end-of-call CallTask updates
+AI_QUEUE = "ai"  # OpenAI call summaries
+MAINTENANCE_QUEUE = "maintenance"  # reconcilers, cleanups, token refreshes, Meta syncs
+DEFAULT_QUEUE = "celery"  # unrouted tasks and messages published before routing; served by maintenance
+
+QUEUE_NAMES = (DISPATCH_QUEUE, FEEDBACK_QUEUE, AI_QUEUE, MAINTENANCE_QUEUE, DEFAULT_QUEUE)
+
+app.conf.task_queues = tuple(Queue(name, routing_key=name) for name in QUEUE_NAMES)
+app.conf.task_default_queue = DEFAULT_QUEUE
+
+TASK_QUEUES = {
+    "core.tasks.schedule_agent_call": DISPATCH_QUEUE,
+    "core.tasks.trigger_call": DISPATCH_QUEUE,
+    "core.tasks.trigger_call_batch": DISPATCH_QUEUE,
+    "core.tasks.update_calltask_from_calllog": FEEDBACK_QUEUE,
+    "core.tasks.generate_call_summary": AI_QUEUE,
+    "core.tasks.hello_world_test": MAINTENANCE_QUEUE,
+    "core.tasks.cleanup_stuck_call_tasks": MAINTENANCE_QUEUE,
+    "core.tasks.reconcile_due_index": MAINTENANCE_QUEUE,
+    "core.tasks.reconcile_admission_counters": MAINTENANCE_QUEUE,
+    "core.tasks.rebuild_active_phone_index": MAINTENANCE_QUEUE,
+    "core.tasks.refresh_dial_windows": MAINTENANCE_QUEUE,
+    "core.tasks.flush_quota_counters": MAINTENANCE_QUEUE,
+    "core.tasks.fold_call_minutes": MAINTENANCE_QUEUE,
+    "core.tasks.sweep_quota_reservations": MAINTENANCE_QUEUE,
+    "core.tasks.reconcile_quota_counters": MAINTENANCE_QUEUE,
+    "core.tasks.cleanup_orphan_router_subaccounts": MAINTENANCE_QUEUE,
+    "core.tasks.refresh_google_calendar_connections": MAINTENANCE_QUEUE,
+    "core.tasks.refresh_microsoft_calendar_connections": MAINTENANCE_QUEUE,
+    "core.tasks.refresh_calendar_subaccounts": MAINTENANCE_QUEUE,
+    "core.tasks.refresh_meta_tokens": MAINTENANCE_QUEUE,
+    "core.tasks.cleanup_invalid_google_connections": MAINTENANCE_QUEUE,
+    "core.tasks.cleanup_invalid_outlook_connections": MAINTENANCE_QUEUE,
+    "core.tasks.cleanup_invalid_meta_integrations": MAINTENANCE_QUEUE,
+    "core.tasks.sync_meta_lead_forms": MAINTENANCE_QUEUE,
+    "core.tasks.daily_meta_sync": MAINTENANCE_QUEUE,
+}
+app.conf.task_routes = {task: {"queue": queue} for task, queue in TASK_QUEUES.items()}
+
+# (soft, hard) time limits per queue; unrouted tasks keep the global 50min/1h
+QUEUE_TIME_LIMITS = {
+    DISPATCH_QUEUE: (90, 120),
+    FEEDBACK_QUEUE: (240, 300),
+    AI_QUEUE: (600, 900),
+    MAINTENANCE_QUEUE: (3000, 3600),
+}
+app.conf.task_annotations = {
+    task: {"soft_time_limit": QUEUE_TIME_LIMITS[queue][0], "time_limit": QUEUE_TIME_LIMITS[queue][1]}
+    for task, queue in TASK_QUEUES.items()
+}
+# A batch holds up to DIALER_BATCH_SIZE calls, each of which may wait for a CPS token
+app.conf.task_annotations["core.tasks.trigger_call_batch"] = {"soft_time_limit": 240, "time_limit": 300}
+
+# Worker profile per workload class. The dispatch worker is I/O bound (DB,
+# Redis, LiveKit HTTP), so it runs many threads instead of a few processes;
+# the others autoscale prefork children. Concurrency/autoscale can be
+# overridden per deployment with WORKER_<PROFILE>_CONCURRENCY / _AUTOSCALE.
+# The global worker_* settings above stay the defaults for a plain `celery worker`.
+WORKER_PROFILES = {
+    "dispatch": {
+        "queues": [DISPATCH_QUEUE],
+        "pool": "threads",
+        "concurrency": 32,
+        "autoscale": None,
+        "prefetch_multiplier": 1,
+        "max_tasks_per_child": None,
+    },
+    "feedback": {
+        "queues": [FEEDBACK_QUEUE],
+        "pool": "prefork",
+        "concurrency": None,
+        "autoscale": "8,2",
+        "prefetch_multiplier": 4,
+        "max_tasks_per_child": 500,
+    },
+    "ai": {
+        "queues": [AI_QUEUE],
+        "pool": "prefork",
+        "concurrency": None,
+        "autoscale": "4,1",
+        "prefetch_multiplier": 1,
+        "max_tasks_per_child": 50,
+    },
+    "maintenance": {
+        "queues": [MAINTENANCE_QUEUE, DEFAULT_QUEUE],
+        "pool": "prefork",
+        "concurrency": None,
+        "autoscale": "4,1",
+        "prefetch_multiplier": 1,
+        "max_tasks_per_child": 100,
+    },
+}
+
+
+# Queue wait time: stamp the publish time, measure it when a worker starts the task
+@before_task_publish.connect
+def _stamp_publish_time(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def _record_queue_wait(task=None, **kwargs):
+    request = getattr(task, "request", None)
+    if request is None or request.is_eager:
+        return
+    published_at = getattr(request, "published_at", None) or (getattr(request, "headers", None) or {}).get("published_at")
+    queue = (request.delivery_info or {}).get("routing_key")
+    if published_at is None or not queue:
+        return
+    from core.utils.queue_metrics import record_queue_wait
+
+    record_queue_wait(queue, time.time() - float(published_at))
+
+
+# Fold Redis quota counters back into Postgres and reseed them after a restart,
+# once per deploy wave rather than once per worker
+@worker_ready.connect
+def _reconcile_quota_counters(sender=None, **kwargs):
+    from core.utils.quota_counters import QuotaCounters
+
+    if not QuotaCounters.enabled() or not QuotaCounters().request_reconcile():
+        return
+    app.send_task("core.tasks.reconcile_quota_counters")
+
 # Periodic task configuration
 app.conf.beat_schedule = {
     # Schedule agent calls, every 5 seconds. Expires after 2.5 seconds
@@ -36,7 +173,7 @@ app.conf.beat_schedule = {
         "task": "core.tasks.schedule_agent_call",
         "schedule": 5.0,
         "options": {
-            "queue": "celery",
+            "queue": DISPATCH_QUEUE,
             "expires": 2.5,
         },
     },
@@ -45,16 +182,79 @@ app.conf.beat_schedule = {
         "task": "core.tasks.cleanup_stuck_call_tasks",
         "schedule": 60.0,
         "options": {
-            "queue": "celery",
+            "queue": MAINTENANCE_QUEUE,
             "expires": 120,
         },
     },
+    # Re-sync the Redis due index with Postgres (sharded scheduler), every minute
+    "reconcile-due-index": {
+        "task": "core.tasks.reconcile_due_index",
+        "schedule": 60.0,
+        "options": {
+            "queue": MAINTENANCE_QUEUE,
+            "expires": 60,
+        },
+    },
+    # Rebuild admission in-flight counters from Postgres, every minute
+    "reconcile-admission-counters": {
+        "task": "core.tasks.reconcile_admission_counters",
+        "schedule": 60.0,
+        "options": {
+            "queue": MAINTENANCE_QUEUE,
+            "expires": 60,
+        },
+    },
+    # Re-sync the Redis active-phone set with Postgres, every minute
+    "rebuild-active-phone-index": {
+        "task": "core.tasks.rebuild_active_phone_index",
+        "schedule": 60.0,
+        "options": {
+            "queue": MAINTENANCE_QUEUE,
+            "expires": 60,
+        },
+    },
+    # Flip agent dial-window flags at boundaries and roll closed task windows, every 30 seconds
+    "refresh-dial-windows": {
+        "task": "core.tasks.refresh_dial_windows",
+        "schedule": 30.0,
+        "options": {
+            "queue": MAINTENANCE_QUEUE,
+            "expires": 30,
+        },
+    },
+    # Write Redis quota counters through to FeatureUsage, every 5 seconds
+    "flush-quota-counters": {
+        "task": "core.tasks.flush_quota_counters",
+        "schedule": 5.0,
+        "options": {
+            "queue": MAINTENANCE_QUEUE,
+            "expires": 5,
+        },
+    },
+    # Fold accumulated end-of-call minutes into usage, every 5 seconds
+    "fold-call-minutes": {
+        "task": "core.tasks.fold_call_minutes",
+        "schedule": 5.0,
+        "options": {
+            "queue": MAINTENANCE_QUEUE,
+            "expires": 5,
+        },
+    },
+    # Free expired call-minute reservations, every minute
+    "sweep-quota-reservations": {
+        "task": "core.tasks.sweep_quota_reservations",
+        "schedule": 60.0,
+        "options": {
+            "queue": MAINTENANCE_QUEUE,
+            "expires": 60,
+        },
+    },
     # Clean up router subaccounts, every 5 minutes. Expires after 5 minutes
     "cleanup-router-subaccounts": {
         "task": "core.tasks.cleanup_orphan_router_subaccounts",
         "schedule": 300.0,
         "options": {
-            "queue": "celery",
+            "queue": MAINTENANCE_QUEUE,
             "expires": 300,
         },
     },
@@ -62,48 +262,48 @@ app.conf.beat_schedule = {
     "daily-meta-sync": {
         "task": "core.tasks.daily_meta_sync",
         "schedule": crontab(hour=0, minute=0),
-        "options": {"queue": "celery"},
+        "options": {"queue": MAINTENANCE_QUEUE},
     },
     # Try to discover new sub-accounts, daily at 3:00 AM
     "refresh-calendar-subaccounts-daily": {
         "task": "core.tasks.refresh_calendar_subaccounts",
         "schedule": crontab(hour=3, minute=0),
-        "options": {"queue": "celery"},
+        "options": {"queue": MAINTENANCE_QUEUE},
     },
     # Try to refresh soon expiring Meta tokens weekly, sunday at 2:00 AM
     "refresh-meta-tokens-weekly": {
         "task": "core.tasks.refresh_meta_tokens",
         "schedule": crontab(hour=2, minute=0, day_of_week=0),
-        "options": {"queue": "celery"},
+        "options": {"queue": MAINTENANCE_QUEUE},
     },
     # Try to refresh soon expiring Google tokens weekly, sunday at 2:15 AM
     "refresh-google-tokens-weekly": {
         "task": "core.tasks.refresh_google_calendar_connections",
         "schedule": crontab(hour=2, minute=15, day_of_week=0),
-        "options": {"queue": "celery"},
+        "options": {"queue": MAINTENANCE_QUEUE},
     },
     # Try to refresh soon expiring Outlook tokens weekly, sunday at 2:30 AM
     "refresh-outlook-tokens-weekly": {
         "task": "core.tasks.refresh_microsoft_calendar_connections",
         "schedule": crontab(hour=2, minute=30, day_of_week=0),
-        "options": {"queue": "celery"},
+        "options": {"queue": MAINTENANCE_QUEUE},
     },
     # Clean up inactive google calendars weekly, sunday at 4:00 AM
     "cleanup-google-calendars-weekly": {
         "task": "core.tasks.cleanup_invalid_google_connections",
         "schedule": crontab(hour=4, minute=0, day_of_week=0),
-        "options": {"queue": "celery"},
+        "options": {"queue": MAINTENANCE_QUEUE},
     },
     # Clean up inactive outlook calendars weekly, sunday at 4:15 AM
     "cleanup-outlook-calendars-weekly": {
         "task": "core.tasks.cleanup_invalid_outlook_connections",
         "schedule": crontab(hour=4, minute=15, day_of_week=0),
-        "options": {"queue": "celery"},
+        "options": {"queue": MAINTENANCE_QUEUE},
     },
     # Clean up invalid meta integrations weekly, sunday at 4:30 AM
     "cleanup-invalid-meta-weekly": {
         "task": "core.tasks.cleanup_invalid_meta_integrations",
         "schedule": crontab(hour=4, minute=30, day_of_week=0),
-        "options": {"queue": "celery"},
+        "options": {"queue": MAINTENANCE_QUEUE},
     },
 }
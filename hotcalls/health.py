@@ -3,7 +3,7 @@ Baseline health checks for hotcalls django application.
 """
 
 import logging
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.db import connections
@@ -39,6 +39,8 @@ def readiness_check(request):
     Comprehensive readiness check endpoint.
 
     Checks database connectivity, cache availability, and redis connectivity.
+    Dialer circuit breakers that are not closed are reported for visibility;
+    they do not make the instance unready.
     """
     checks = {
         "database": False,
@@ -93,6 +95,15 @@ def readiness_check(request):
         logger.error(f"Redis check failed: {str(e)}")
         overall_status = "unhealthy"
 
+    circuit_breakers = {}
+    if checks["redis"]:
+        try:
+            from core.telephony.services.circuit_breaker import CircuitBreaker
+            circuit_breakers = CircuitBreaker().states()
+        except Exception as e:
+            logger.error(f"Circuit breaker check failed: {str(e)}")
+            circuit_breakers = {"error": str(e)}
+
     status_code = 200 if overall_status == "healthy" else 503
 
     return JsonResponse(
@@ -100,12 +111,83 @@ def readiness_check(request):
             "status": overall_status,
             "timestamp": time.time(),
             "checks": checks,
+            "circuit_breakers": circuit_breakers,
             "version": getattr(settings, "API_VERSION", "1.0.0"),
         },
         status=status_code,
     )
 
 
+@csrf_exempt
+@require_http_methods(["GET", "HEAD"])
+def metrics_check(request):
+    """
+    Runtime metrics endpoint.
+
+    Exposes cache hit/miss counters for this process and cluster-wide totals,
+    plus the dispatch pacing estimates, CPS throttling counts and the depth
+    and recent wait times of every Celery queue.
+    """
+    metrics = {}
+
+    try:
+        from core.services.knowledge_cache import knowledge_cache
+        metrics["knowledge_cache"] = knowledge_cache.stats()
+    except Exception as e:
+        logger.error(f"Knowledge cache metrics failed: {str(e)}")
+        metrics["knowledge_cache"] = {"error": str(e)}
+
+    try:
+        from core.telephony.services.pacing import PacingEngine
+        metrics["pacing"] = PacingEngine().snapshot()
+    except Exception as e:
+        logger.error(f"Pacing metrics failed: {str(e)}")
+        metrics["pacing"] = {"error": str(e)}
+
+    try:
+        from core.telephony.services.rate_limiter import CallRateLimiter
+        metrics["cps_throttled"] = CallRateLimiter().throttled_counts()
+    except Exception as e:
+        logger.error(f"CPS metrics failed: {str(e)}")
+        metrics["cps_throttled"] = {"error": str(e)}
+
+    try:
+        from core.utils.queue_metrics import queue_snapshot
+        from hotcalls.celery import QUEUE_NAMES
+        metrics["celery_queues"] = queue_snapshot(QUEUE_NAMES)
+    except Exception as e:
+        logger.error(f"Celery queue metrics failed: {str(e)}")
+        metrics["celery_queues"] = {"error": str(e)}
+
+    return JsonResponse(
+        {
+            "timestamp": time.time(),
+            "metrics": metrics,
+            "version": getattr(settings, "API_VERSION", "1.0.0"),
+        }
+    )
+
+
+@csrf_exempt
+@require_http_methods(["GET", "HEAD"])
+def prometheus_metrics(request):
+    """
+    Prometheus scrape endpoint for the call-dispatch stage histograms.
+
+    Only served when DISPATCH_METRICS_PROMETHEUS is enabled.
+    """
+    from core.telephony.services.dispatch_metrics import dispatch_metrics
+
+    if not dispatch_metrics.prometheus_enabled:
+        return HttpResponse("Prometheus metrics disabled\n", status=404, content_type="text/plain")
+    try:
+        body = dispatch_metrics.prometheus_text()
+    except Exception as e:
+        logger.error(f"Prometheus metrics failed: {str(e)}")
+        return HttpResponse(f"# error: {e}\n", status=503, content_type="text/plain")
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @csrf_exempt
 @require_http_methods(["GET", "HEAD"])
 def startup_check(request):
@@ -120,6 +120,107 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
 
+# Call scheduler configuration
+# "singleton": beat-driven schedule_agent_call behind a cluster-wide lock
+# "sharded":   N `manage.py run_scheduler` instances own workspace hash shards
+SCHEDULER_MODE = os.environ.get("SCHEDULER_MODE", "singleton")
+SCHEDULER_SHARD_COUNT = int(os.environ.get("SCHEDULER_SHARD_COUNT", "16"))
+SCHEDULER_LEASE_TTL_SECONDS = float(os.environ.get("SCHEDULER_LEASE_TTL_SECONDS", "15"))
+SCHEDULER_TICK_SECONDS = float(os.environ.get("SCHEDULER_TICK_SECONDS", "1"))
+# Due-index reconcile: incremental (updated_at watermark) between full passes
+DUE_INDEX_FULL_RECONCILE_SECONDS = float(os.environ.get("DUE_INDEX_FULL_RECONCILE_SECONDS", "3600"))
+# Busy-phone conflict check: "redis" = SMISMEMBER on the active-phone set,
+# "sql" = NOT EXISTS anti-join in the claim statement
+SCHEDULER_PHONE_INDEX = os.environ.get("SCHEDULER_PHONE_INDEX", "redis")
+
+# Dispatch admission control (0 = unlimited). Workspace limits come from the
+# plan feature `max_concurrent_calls`; the setting below is the fallback for
+# workspaces whose plan does not define it. Agent/trunk limits live on the models.
+DISPATCH_MAX_CONCURRENT_CALLS = int(os.environ.get("DISPATCH_MAX_CONCURRENT_CALLS", "100"))
+DISPATCH_WORKSPACE_MAX_CONCURRENT_CALLS = int(os.environ.get("DISPATCH_WORKSPACE_MAX_CONCURRENT_CALLS", "0"))
+# Admissions younger than this are kept by the reconciler even if their task
+# is not active in Postgres yet (promotion still committing)
+DISPATCH_ADMISSION_RECONCILE_GRACE_SECONDS = int(os.environ.get("DISPATCH_ADMISSION_RECONCILE_GRACE_SECONDS", "120"))
+
+# Dialer: "celery" = one trigger_call task per CallTask,
+# "batch" = one trigger_call_batch task per claimed chunk of DIALER_BATCH_SIZE,
+# "worker" = `manage.py run_dialer` asyncio process with a pooled LiveKit client
+DIALER_MODE = os.environ.get("DIALER_MODE", "celery")
+DIALER_CONCURRENCY = int(os.environ.get("DIALER_CONCURRENCY", "200"))
+DIALER_DB_THREADS = int(os.environ.get("DIALER_DB_THREADS", "32"))
+DIALER_BATCH_SIZE = int(os.environ.get("DIALER_BATCH_SIZE", "50"))
+DIALER_BATCH_CONCURRENCY = int(os.environ.get("DIALER_BATCH_CONCURRENCY", "50"))
+
+# Dial-time knowledge base text cache (in-process LRU byte budget + Redis TTL)
+KB_CACHE_MAX_BYTES = int(os.environ.get("KB_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+KB_CACHE_TTL_SECONDS = int(os.environ.get("KB_CACHE_TTL_SECONDS", str(24 * 3600)))
+# How KB text travels in dispatch metadata: "inline" (full text, legacy agents),
+# "reference" (sha256 ref to the content endpoint) or "auto" (reference + zlib
+# inline copy when the compressed text fits KB_INLINE_MAX_BYTES)
+KB_METADATA_MODE = os.environ.get("KB_METADATA_MODE", "inline")
+KB_INLINE_MAX_BYTES = int(os.environ.get("KB_INLINE_MAX_BYTES", str(16 * 1024)))
+
+# Answer-rate pacing: target concurrent *connected* calls (0 = off, promote up to free slots)
+DISPATCH_TARGET_CONNECTED_CALLS = int(os.environ.get("DISPATCH_TARGET_CONNECTED_CALLS", "0"))
+PACING_EWMA_ALPHA = float(os.environ.get("PACING_EWMA_ALPHA", "0.05"))
+PACING_MIN_SAMPLES = int(os.environ.get("PACING_MIN_SAMPLES", "20"))
+PACING_DEFAULT_RING_SECONDS = float(os.environ.get("PACING_DEFAULT_RING_SECONDS", "20"))
+
+# Per-agent dispatch snapshots in Redis (rebuilt on save; TTL bounds drift from bulk updates)
+DISPATCH_SNAPSHOT_TTL_SECONDS = int(os.environ.get("DISPATCH_SNAPSHOT_TTL_SECONDS", str(24 * 3600)))
+
+# Compiled Jinja script templates kept per process (LRU, keyed by template hash)
+SCRIPT_TEMPLATE_CACHE_SIZE = int(os.environ.get("SCRIPT_TEMPLATE_CACHE_SIZE", "512"))
+
+# Max CallTasks re-windowed per refresh_dial_windows run
+DIAL_WINDOW_ROLL_BATCH = int(os.environ.get("DIAL_WINDOW_ROLL_BATCH", "5000"))
+
+# Outbound calls-per-second limits (token buckets in Redis). SIPTrunk.max_calls_per_second
+# and .max_calls_per_second_per_number override these defaults (0 = unlimited).
+DIALER_DEFAULT_TRUNK_CPS = float(os.environ.get("DIALER_DEFAULT_TRUNK_CPS", "0"))
+DIALER_DEFAULT_CALLER_ID_CPS = float(os.environ.get("DIALER_DEFAULT_CALLER_ID_CPS", "0"))
+# Longest a call waits for a CPS token before it is rescheduled as "throttled"
+DIALER_CPS_MAX_WAIT_SECONDS = float(os.environ.get("DIALER_CPS_MAX_WAIT_SECONDS", "30"))
+
+# Shared circuit breakers around LiveKit dispatch and SIP participant creation
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_WINDOW_SECONDS = float(os.environ.get("CIRCUIT_BREAKER_WINDOW_SECONDS", "60"))
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = float(os.environ.get("CIRCUIT_BREAKER_COOLDOWN_SECONDS", "30"))
+CIRCUIT_BREAKER_PROBE_TIMEOUT_SECONDS = float(os.environ.get("CIRCUIT_BREAKER_PROBE_TIMEOUT_SECONDS", "60"))
+
+# Dispatch stage latency histograms; OpenTelemetry export is always on,
+# the Redis-aggregated Prometheus endpoint only when enabled
+DISPATCH_METRICS_PROMETHEUS = os.environ.get("DISPATCH_METRICS_PROMETHEUS", "False").lower() == "true"
+
+# Celery worker profiles (`manage.py run_celery_worker --profile <name>`); unset = profile default
+WORKER_DISPATCH_CONCURRENCY = os.environ.get("WORKER_DISPATCH_CONCURRENCY")
+WORKER_FEEDBACK_AUTOSCALE = os.environ.get("WORKER_FEEDBACK_AUTOSCALE")
+WORKER_AI_AUTOSCALE = os.environ.get("WORKER_AI_AUTOSCALE")
+WORKER_MAINTENANCE_AUTOSCALE = os.environ.get("WORKER_MAINTENANCE_AUTOSCALE")
+
+# Stuck call task reaper: rows deleted per statement, CALL_TRIGGERED timeout,
+# and how long ReapedCallTask audit rows are kept
+STUCK_REAPER_CHUNK_SIZE = int(os.environ.get("STUCK_REAPER_CHUNK_SIZE", "500"))
+STUCK_REAPER_TRIGGERED_MINUTES = int(os.environ.get("STUCK_REAPER_TRIGGERED_MINUTES", "10"))
+STUCK_REAPER_AUDIT_RETENTION_DAYS = int(os.environ.get("STUCK_REAPER_AUDIT_RETENTION_DAYS", "30"))
+
+# Plan quota checks/increments in Redis (Lua), written behind to FeatureUsage
+# by core.tasks.flush_quota_counters; False (default) = row lock per metered operation
+QUOTA_REDIS_COUNTERS = os.environ.get("QUOTA_REDIS_COUNTERS", "False").lower() == "true"
+QUOTA_COUNTER_FLUSH_BATCH = int(os.environ.get("QUOTA_COUNTER_FLUSH_BATCH", "500"))
+QUOTA_COUNTER_TTL_SECONDS = int(os.environ.get("QUOTA_COUNTER_TTL_SECONDS", str(7 * 24 * 3600)))
+# Upper bound for the cached per-workspace quota context; it is also dropped
+# on subscription/plan changes and rebuilt at billing period rollover
+QUOTA_CONTEXT_CACHE_TIMEOUT = int(os.environ.get("QUOTA_CONTEXT_CACHE_TIMEOUT", "3600"))
+# Call minutes from end_of_call go to a per-workspace Redis accumulator folded
+# into usage by core.tasks.fold_call_minutes; False (default) = record per call
+CALL_MINUTES_ACCUMULATOR = os.environ.get("CALL_MINUTES_ACCUMULATOR", "False").lower() == "true"
+# A call's minute reservation lives for its max duration plus this grace before
+# core.tasks.sweep_quota_reservations frees it (end_of_call never arrived)
+QUOTA_RESERVATION_GRACE_SECONDS = int(os.environ.get("QUOTA_RESERVATION_GRACE_SECONDS", "900"))
+# How often each process compares its EndpointFeature route table with the Redis version
+ENDPOINT_ROUTE_TABLE_CHECK_SECONDS = float(os.environ.get("ENDPOINT_ROUTE_TABLE_CHECK_SECONDS", "5"))
+
 # Google configuration
 GOOGLE_REDIRECT_URI = f"{BASE_URL}/api/google-calendar/auth/callback/"
 GOOGLE_SCOPES = [
@@ -14,7 +14,7 @@ from drf_spectacular.views import (
 )
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import permission_classes
-from .health import health_check, readiness_check, startup_check
+from .health import health_check, metrics_check, prometheus_metrics, readiness_check, startup_check
 from core.utils import CORSMediaView
 from core.views import invitation_detail, accept_invitation
 
@@ -76,6 +76,8 @@ urlpatterns = [
     path("health/", health_check, name="health_check"),
     path("health/readiness/", readiness_check, name="readiness_check"),
     path("health/startup/", startup_check, name="startup_check"),
+    path("health/metrics/", metrics_check, name="metrics_check"),
+    path("health/metrics/prometheus/", prometheus_metrics, name="prometheus_metrics"),
     path("api/", api_root, name="api-root"),
     path("api/schema/", PublicSpectacularAPIView.as_view(), name="schema"),
     path(